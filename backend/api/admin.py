@@ -8,6 +8,8 @@ from .models import (
     StorageBucket,
     SystemAlert,
     InstanceHeartbeat,
+    MediaUsageRollup,
+    QueryStatDelta,
 )
 
 
@@ -61,3 +63,17 @@ class SystemAlertAdmin(admin.ModelAdmin):
 class InstanceHeartbeatAdmin(admin.ModelAdmin):
     list_display = ('instance', 'is_valid', 'last_heartbeat_at', 'stale_alerted')
     list_filter = ('is_valid', 'stale_alerted')
+
+
+@admin.register(MediaUsageRollup)
+class MediaUsageRollupAdmin(admin.ModelAdmin):
+    list_display = ('bucket_name', 'product', 'granularity', 'period_start', 'requests', 'bytes', 'key_hash')
+    list_filter = ('granularity', 'product')
+    search_fields = ('bucket_name', 'key_hash')
+
+
+@admin.register(QueryStatDelta)
+class QueryStatDeltaAdmin(admin.ModelAdmin):
+    list_display = ('server', 'database', 'queryid', 'period_end', 'calls', 'total_ms', 'rows')
+    list_filter = ('server',)
+    search_fields = ('database', 'query')
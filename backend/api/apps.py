@@ -8,6 +8,10 @@ class ApiConfig(AppConfig):
     def ready(self):
         import os
         import sys
+        # Registers the StorageBucket save/delete hooks that invalidate the bucket/client cache.
+        from . import storage  # noqa: F401
+        # Same for DatabaseServer / DatabaseInstance and the Studio connection pool.
+        from . import studio_pool  # noqa: F401
         # Only start the monitor in the main web server process (avoid running in migrations or multiple times in runserver)
         if 'runserver' not in sys.argv and 'migrate' not in sys.argv and 'makemigrations' not in sys.argv:
             # For gunicorn or uwsgi, this runs once per worker. 
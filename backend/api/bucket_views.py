@@ -1,15 +1,30 @@
 import os
-from rest_framework.decorators import api_view, permission_classes
+import json
+import base64
+import binascii
+from itertools import islice
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from .models import StorageBucket, Product, EmployeeProductAssignment, DatabaseServer
+from django.http import StreamingHttpResponse
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import StorageBucket, Product, EmployeeProductAssignment, DatabaseServer, MediaUsageRollup, StorageJob, UploadSession, DirectUpload
+from . import storage_jobs, uploads, direct_uploads, object_index, zip_export
 from .permissions import IsFoundingEngineer
+from .storage import get_bucket_client, get_client
+from django.conf import settings
+from django.core import signing
 import secrets
 import string
 
 try:
     from minio import Minio
+    from minio.commonconfig import CopySource
     from minio.error import S3Error
 except ImportError:
     Minio = None
@@ -22,14 +37,7 @@ MINIO_ROOT_PASSWORD = os.environ.get('MINIO_ROOT_PASSWORD', 'secure_nidhi_minio_
 PUBLIC_MINIO_ENDPOINT = os.environ.get('PUBLIC_MINIO_ENDPOINT', 'localhost:9000')
 
 def get_minio_client():
-    if not Minio:
-        return None
-    return Minio(
-        MINIO_ENDPOINT,
-        access_key=MINIO_ROOT_USER,
-        secret_key=MINIO_ROOT_PASSWORD,
-        secure=False
-    )
+    return get_client(MINIO_ENDPOINT, MINIO_ROOT_USER, MINIO_ROOT_PASSWORD)
 
 def generate_random_string(length=20):
     alphabet = string.ascii_letters + string.digits
@@ -142,11 +150,83 @@ def reveal_bucket_credentials(request, bucket_id):
     }, status=status.HTTP_200_OK)
 
 
+# Object listing pagination. MinIO returns at most 1000 keys per ListObjectsV2 call, so a page
+# of `limit` keys costs ceil(limit/1000) round trips regardless of bucket size.
+LIST_DEFAULT_LIMIT = 1000
+LIST_MAX_LIMIT = 10000
+# Sorts after any real key character: resuming past a common prefix ("folder/") skips its contents.
+_PREFIX_END = '\U0010ffff'
+
+
+def _encode_cursor(start_after):
+    return base64.urlsafe_b64encode(start_after.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(token):
+    try:
+        return base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor.")
+
+
+def _object_entry(obj):
+    return {
+        "name": obj.object_name,
+        "size": obj.size,
+        "last_modified": obj.last_modified.isoformat() if obj.last_modified else None,
+        "is_dir": obj.is_dir,
+    }
+
+
+def _resume_key(entry):
+    return entry["name"] + _PREFIX_END if entry["is_dir"] else entry["name"]
+
+
+def _list_page(client, bucket_name, prefix, recursive, start_after, limit):
+    """One page of listing. Returns (entries, next_cursor or None). Reads at most limit+1 keys."""
+    objects = client.list_objects(bucket_name, prefix=prefix, recursive=recursive,
+                                  start_after=start_after or None)
+    entries = [_object_entry(obj) for obj in islice(objects, limit + 1)]
+    if len(entries) <= limit:
+        return entries, None
+    entries = entries[:limit]
+    return entries, _encode_cursor(_resume_key(entries[-1]))
+
+
+def _ndjson_listing(client, bucket_name, prefix, recursive, start_after, limit):
+    """NDJSON stream: one object per line, then {"next_cursor": ...} if a limit cut it short."""
+    emitted = 0
+    last = None
+    try:
+        objects = client.list_objects(bucket_name, prefix=prefix, recursive=recursive,
+                                      start_after=start_after or None)
+        for obj in objects:
+            if limit is not None and emitted == limit:
+                yield json.dumps({"next_cursor": _encode_cursor(_resume_key(last))}) + "\n"
+                return
+            last = _object_entry(obj)
+            emitted += 1
+            yield json.dumps(last) + "\n"
+        yield json.dumps({"next_cursor": None}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
 @api_view(['GET'])
 @permission_classes([IsFoundingEngineer])
 def list_bucket_objects(request, bucket_id):
     """Lists objects in a MinIO bucket with optional prefix for folder navigation.
-    Supports recursive=true to return full tree structure."""
+    Supports recursive=true to return full tree structure.
+
+    Pagination (any of limit / cursor / output=ndjson switches it on):
+      ?prefix=a/&limit=500[&cursor=<next_cursor>][&recursive=true]
+        -> {"objects": [...], "next_cursor": "..." | null, "prefix": "a/", "recursive": false}
+      Without recursive=true, listing is one level deep (delimiter "/"): sub-folders come back as
+      is_dir entries. recursive=true pages the flat key list instead of building a tree.
+      ?output=ndjson streams one JSON object per line (limit optional), ending with a
+      {"next_cursor": ...} line.
+    Without those params the legacy full list / tree response is returned unchanged.
+    """
     bucket = get_object_or_404(StorageBucket, id=bucket_id)
     
     sso_user_id = getattr(request, 'sso_user_id', None)
@@ -162,30 +242,46 @@ def list_bucket_objects(request, bucket_id):
     
     prefix = request.GET.get('prefix', '')
     recursive = request.GET.get('recursive', 'false').lower() == 'true'
-    
+    output_format = request.GET.get('output', 'json')
+    paginated = 'limit' in request.GET or 'cursor' in request.GET or output_format == 'ndjson'
+
+    if paginated:
+        try:
+            raw_limit = request.GET.get('limit')
+            limit = int(raw_limit) if raw_limit else None
+            if limit is not None and not 1 <= limit <= LIST_MAX_LIMIT:
+                raise ValueError(f"limit must be between 1 and {LIST_MAX_LIMIT}.")
+            start_after = _decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else ''
+            if start_after and not start_after.startswith(prefix):
+                raise ValueError("cursor does not belong to this prefix.")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        client = get_bucket_client(bucket)
+        if output_format == 'ndjson':
+            return StreamingHttpResponse(
+                _ndjson_listing(client, bucket.bucket_name, prefix, recursive, start_after, limit),
+                content_type='application/x-ndjson',
+            )
+        try:
+            entries, next_cursor = _list_page(client, bucket.bucket_name, prefix, recursive, start_after,
+                                              limit or LIST_DEFAULT_LIMIT)
+        except S3Error as e:
+            return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({
+            "objects": entries,
+            "next_cursor": next_cursor,
+            "prefix": prefix,
+            "recursive": recursive,
+        }, status=status.HTTP_200_OK)
+
     try:
-        # Map localhost to internal docker hostname for backend connection
-        internal_endpoint = bucket.endpoint
-        if internal_endpoint.startswith('localhost:'):
-            internal_endpoint = MINIO_ENDPOINT
-            
-        # Use internal endpoint but bucket's credentials
-        client = Minio(
-            internal_endpoint,
-            access_key=bucket.access_key,
-            secret_key=bucket.secret_key,
-            secure=False
-        )
+        client = get_bucket_client(bucket)
         
         objects = client.list_objects(bucket.bucket_name, prefix=prefix, recursive=recursive)
-        object_list = []
-        for obj in objects:
-            object_list.append({
-                "name": obj.object_name,
-                "size": obj.size,
-                "last_modified": obj.last_modified.isoformat() if obj.last_modified else None,
-                "is_dir": obj.is_dir
-            })
+        object_list = [_object_entry(obj) for obj in objects]
         
         if recursive:
             tree = build_tree(object_list)
@@ -201,7 +297,8 @@ def list_bucket_objects(request, bucket_id):
 @api_view(['POST'])
 @permission_classes([IsFoundingEngineer])
 def rename_object(request, bucket_id):
-    """Renames an object in a MinIO bucket by copying to new name and deleting original."""
+    """Renames an object in a MinIO bucket by copying to new name and deleting original.
+    Folders (object_name ending in "/") are moved by a background StorageJob: 202 + job."""
     bucket = get_object_or_404(StorageBucket, id=bucket_id)
 
     sso_user_id = getattr(request, 'sso_user_id', None)
@@ -221,30 +318,14 @@ def rename_object(request, bucket_id):
         return Response({"error": "object_name and new_object_name are required."}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        internal_endpoint = bucket.endpoint
-        if internal_endpoint.startswith('localhost:'):
-            internal_endpoint = MINIO_ENDPOINT
-
-        client = Minio(
-            internal_endpoint,
-            access_key=bucket.access_key,
-            secret_key=bucket.secret_key,
-            secure=False
-        )
+        client = get_bucket_client(bucket)
 
-        is_dir = object_name.endswith('/')
+        if object_name.endswith('/'):
+            return _start_folder_move(request, bucket, client, object_name, new_object_name)
 
-        if is_dir:
-            # Rename a folder: copy all objects under prefix, then remove originals
-            objects_to_move = list(client.list_objects(bucket.bucket_name, prefix=object_name, recursive=True))
-            for obj in objects_to_move:
-                new_key = obj.object_name.replace(object_name, new_object_name, 1)
-                client.copy_object(bucket.bucket_name, new_key, f"{bucket.bucket_name}/{obj.object_name}")
-                client.remove_object(bucket.bucket_name, obj.object_name)
-        else:
-            # Rename a single file
-            client.copy_object(bucket.bucket_name, new_object_name, f"{bucket.bucket_name}/{object_name}")
-            client.remove_object(bucket.bucket_name, object_name)
+        # Rename a single file
+        client.copy_object(bucket.bucket_name, new_object_name, CopySource(bucket.bucket_name, object_name))
+        client.remove_object(bucket.bucket_name, object_name)
 
         return Response({"message": "Renamed successfully"}, status=status.HTTP_200_OK)
     except S3Error as e:
@@ -253,10 +334,103 @@ def rename_object(request, bucket_id):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _start_folder_move(request, bucket, client, src, dst):
+    """Folder rename = background move job (api.storage_jobs). Returns 202 with the job."""
+    if not dst.endswith('/'):
+        dst += '/'
+    if dst == src or dst.startswith(src):
+        return Response({"error": "Cannot move a folder into itself."}, status=status.HTTP_400_BAD_REQUEST)
+    if next(iter(client.list_objects(bucket.bucket_name, prefix=dst, recursive=True)), None) is not None:
+        return Response({"error": f"Destination '{dst}' already exists."}, status=status.HTTP_409_CONFLICT)
+    busy = storage_jobs.overlapping_active_job(bucket, src, dst)
+    if busy:
+        return Response({"error": "Another job is still working on this folder.",
+                         "job": storage_jobs.job_payload(busy)}, status=status.HTTP_409_CONFLICT)
+
+    job = StorageJob.objects.create(bucket=bucket, kind='move', params={'src': src, 'dst': dst},
+                                    created_by_sso_id=_sso_user_id(request))
+    from .tasks import run_storage_job
+    run_storage_job.delay(str(job.id))
+    job.refresh_from_db()
+    return Response({"message": "Move started", "job": storage_jobs.job_payload(job)},
+                    status=status.HTTP_202_ACCEPTED)
+
+
+def _sso_user_id(request):
+    sso_user_id = getattr(request, 'sso_user_id', None)
+    if not sso_user_id and request.user and request.user.is_authenticated:
+        sso_user_id = request.user.username
+    return sso_user_id or 'unknown'
+
+
+def _bucket_access_error(request, bucket):
+    """Same product-assignment check as the Studio views above; a Response if access is denied."""
+    assignments = EmployeeProductAssignment.objects.filter(sso_user_id=_sso_user_id(request))
+    if assignments.exists() and not assignments.filter(product_id=bucket.product_id).exists():
+        return Response({"error": "Not authorized for this product."}, status=status.HTTP_403_FORBIDDEN)
+    return None
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def list_storage_jobs(request, bucket_id):
+    """Recent background jobs (moves, ...) for a bucket, newest first."""
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+    denied = _bucket_access_error(request, bucket)
+    if denied:
+        return denied
+    jobs = StorageJob.objects.filter(bucket=bucket)[:50]
+    return Response([storage_jobs.job_payload(job) for job in jobs], status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def storage_job_detail(request, bucket_id, job_id):
+    """Progress of one job: phase, processed/total, per-key failures."""
+    job = get_object_or_404(StorageJob.objects.select_related('bucket'), id=job_id, bucket_id=bucket_id)
+    denied = _bucket_access_error(request, job.bucket)
+    if denied:
+        return denied
+    payload = storage_jobs.job_payload(job)
+    payload["stalled"] = storage_jobs.is_stale(job)
+    return Response(payload, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def storage_job_resume(request, bucket_id, job_id):
+    """Continue a failed or stalled job from its journal cursor."""
+    return _transition_job(request, bucket_id, job_id, storage_jobs.prepare_resume)
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def storage_job_rollback(request, bucket_id, job_id):
+    """Undo a move that has not started deleting sources (removes the copies)."""
+    return _transition_job(request, bucket_id, job_id, storage_jobs.prepare_rollback)
+
+
+def _transition_job(request, bucket_id, job_id, prepare):
+    job = get_object_or_404(StorageJob.objects.select_related('bucket'), id=job_id, bucket_id=bucket_id)
+    denied = _bucket_access_error(request, job.bucket)
+    if denied:
+        return denied
+    try:
+        prepare(job)
+    except storage_jobs.JobConflict as e:
+        return Response({"error": str(e), "job": storage_jobs.job_payload(job)}, status=status.HTTP_409_CONFLICT)
+    from .tasks import run_storage_job
+    run_storage_job.delay(str(job.id))
+    job.refresh_from_db()
+    return Response({"job": storage_jobs.job_payload(job)}, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['POST'])
 @permission_classes([IsFoundingEngineer])
 def delete_multiple_objects(request, bucket_id):
-    """Deletes multiple objects from a MinIO bucket."""
+    """Deletes multiple objects from a MinIO bucket.
+    Files go out in DeleteObjects batches of 1000 keys; each folder becomes a background
+    'delete' StorageJob (202 + jobs) that reports per-key failures."""
     bucket = get_object_or_404(StorageBucket, id=bucket_id)
 
     sso_user_id = getattr(request, 'sso_user_id', None)
@@ -275,37 +449,35 @@ def delete_multiple_objects(request, bucket_id):
         return Response({"error": "object_names must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        internal_endpoint = bucket.endpoint
-        if internal_endpoint.startswith('localhost:'):
-            internal_endpoint = MINIO_ENDPOINT
-
-        client = Minio(
-            internal_endpoint,
-            access_key=bucket.access_key,
-            secret_key=bucket.secret_key,
-            secure=False
-        )
+        client = get_bucket_client(bucket)
+
+        files = [name for name in object_names if not name.endswith('/')]
+        folders = [name for name in object_names if name.endswith('/')]
+        busy = storage_jobs.overlapping_active_job(bucket, *folders) if folders else None
+        if busy:
+            return Response({"error": "Another job is still working on this folder.",
+                             "job": storage_jobs.job_payload(busy)}, status=status.HTTP_409_CONFLICT)
+
+        errors = [{"object": key, "error": error}
+                  for key, error in storage_jobs.delete_keys(client, bucket.bucket_name, files)]
+        failed = {e["object"] for e in errors}
+        deleted = [name for name in files if name not in failed]
 
-        errors = []
-        deleted = []
-        for object_name in object_names:
-            try:
-                if object_name.endswith('/'):
-                    # Delete folder recursively
-                    objects_in_folder = list(client.list_objects(bucket.bucket_name, prefix=object_name, recursive=True))
-                    for obj in objects_in_folder:
-                        client.remove_object(bucket.bucket_name, obj.object_name)
-                    deleted.append(object_name)
-                else:
-                    client.remove_object(bucket.bucket_name, object_name)
-                    deleted.append(object_name)
-            except Exception as e:
-                errors.append({"object": object_name, "error": str(e)})
+        # Folders can hold any number of keys: delete them in tracked background jobs.
+        from .tasks import run_storage_job
+        jobs = []
+        for prefix in folders:
+            job = StorageJob.objects.create(bucket=bucket, kind='delete', phase='delete',
+                                            params={'prefix': prefix}, created_by_sso_id=_sso_user_id(request))
+            run_storage_job.delay(str(job.id))
+            job.refresh_from_db()
+            jobs.append(storage_jobs.job_payload(job))
 
         return Response({
             "deleted": deleted,
-            "errors": errors
-        }, status=status.HTTP_200_OK)
+            "errors": errors,
+            "jobs": jobs,
+        }, status=status.HTTP_202_ACCEPTED if jobs else status.HTTP_200_OK)
     except S3Error as e:
         return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except Exception as e:
@@ -313,41 +485,274 @@ def delete_multiple_objects(request, bucket_id):
 
 
 def build_tree(objects):
-    """Build a nested tree structure from a flat list of MinIO objects."""
+    """Build a nested tree structure from a flat list of MinIO objects.
+
+    Nodes are found through a dict keyed by full path (directories end in "/"), so building is
+    linear in the total number of path components instead of scanning each folder's children.
+    """
     root = {"name": "", "type": "directory", "children": []}
-    
+    index = {"": root}
+
     for obj in objects:
         path = obj["name"]
         is_dir = obj.get("is_dir", False) or path.endswith("/")
         parts = [p for p in path.split("/") if p]
-        
+
         current = root
+        walked = ""
         for i, part in enumerate(parts):
             is_last = (i == len(parts) - 1)
-            existing = None
-            for child in current["children"]:
-                if child["name"] == part:
-                    existing = child
-                    break
-            
-            if existing:
-                current = existing
-            elif is_last and not is_dir:
-                current["children"].append({
-                    "name": part,
-                    "type": "file",
-                    "size": obj["size"],
-                    "last_modified": obj["last_modified"],
-                    "path": path
-                })
-            else:
+            if is_last and not is_dir:
+                key = walked + part
+                if key not in index:
+                    node = {
+                        "name": part,
+                        "type": "file",
+                        "size": obj["size"],
+                        "last_modified": obj["last_modified"],
+                        "path": path
+                    }
+                    index[key] = node
+                    current["children"].append(node)
+                break
+            walked += part + "/"
+            node = index.get(walked)
+            if node is None:
                 node = {"name": part, "type": "directory", "children": []}
+                index[walked] = node
                 current["children"].append(node)
-                current = node
-    
+            current = node
+
     return root
 
 
+# Lazy tree: one level per request. Sub-folder counts / sizes come from the object index only.
+TREE_FILE_LIMIT = 1000
+TREE_SCAN_LIMIT = int(os.environ.get('NIDHI_TREE_SCAN_LIMIT', '200000'))
+
+
+def tree_level(objects, prefix, file_limit=TREE_FILE_LIMIT, scan_limit=TREE_SCAN_LIMIT):
+    """Summarise a one-level (delimiter "/") listing under `prefix` into ONE tree level.
+
+    Returns a directory node whose children are the immediate sub-folders (children=None until
+    expanded) followed by up to `file_limit` files. Nothing beneath a sub-folder is listed, so
+    object_count / total_size are None on the sub-folders and count only this level's files on
+    the node. If the level has more than `scan_limit` entries the rest are left out (truncated=True).
+    """
+    folders = []
+    files = []
+    object_count = total_size = scanned = 0
+    truncated = files_truncated = False
+
+    for obj in objects:
+        scanned += 1
+        if scanned > scan_limit:
+            truncated = True
+            break
+        name = obj["name"]
+        head = name[len(prefix):].rstrip("/")
+        if not head:
+            continue  # the zero-byte "prefix/" placeholder from create_folder
+        if obj["is_dir"] or name.endswith("/"):
+            folders.append({"name": head, "type": "directory", "path": f"{prefix}{head}/",
+                            "object_count": None, "total_size": None, "children": None})
+            continue
+        object_count += 1
+        total_size += obj["size"] or 0
+        if len(files) < file_limit:
+            files.append({
+                "name": head,
+                "type": "file",
+                "size": obj["size"],
+                "last_modified": obj["last_modified"],
+                "path": name,
+            })
+        else:
+            files_truncated = True
+
+    return {
+        "name": prefix.rstrip("/").rsplit("/", 1)[-1],
+        "type": "directory",
+        "path": prefix,
+        "object_count": object_count,
+        "total_size": total_size,
+        "truncated": truncated,
+        "files_truncated": files_truncated,
+        "children": folders + files,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def bucket_tree(request, bucket_id):
+    """One level of the Studio folder tree, expanded on demand.
+
+    GET /api/buckets/<id>/tree/?prefix=docs/
+    Sub-folders carry `children: null` (fetch them with ?prefix=<path>); up to 1000 files of this
+    level are listed inline. Served from the object index when the bucket has one, with
+    object_count / total_size of each sub-folder's whole subtree. Otherwise (or with
+    ?source=minio) each expand is one delimiter listing of this level: the subtree aggregates
+    would need a recursive scan, so they are null.
+    """
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+
+    sso_user_id = getattr(request, 'sso_user_id', None)
+    if not sso_user_id and request.user and request.user.is_authenticated:
+        sso_user_id = request.user.username
+
+    assignments = EmployeeProductAssignment.objects.filter(sso_user_id=sso_user_id)
+    if assignments.exists() and not assignments.filter(product_id=bucket.product_id).exists():
+        return Response({"error": "Not authorized for this product."}, status=status.HTTP_403_FORBIDDEN)
+
+    if not Minio:
+        return Response({"error": "MinIO SDK not installed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    prefix = request.GET.get('prefix', '')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+
+    if request.GET.get('source') != 'minio' and object_index.usable_index(bucket):
+        return Response(object_index.tree_level(bucket, prefix, TREE_FILE_LIMIT), status=status.HTTP_200_OK)
+
+    try:
+        client = get_bucket_client(bucket)
+        objects = (_object_entry(obj) for obj in
+                   client.list_objects(bucket.bucket_name, prefix=prefix, recursive=False))
+        return Response(tree_level(objects, prefix), status=status.HTTP_200_OK)
+    except S3Error as e:
+        return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'POST', 'DELETE'])
+@permission_classes([IsFoundingEngineer])
+def bucket_object_index(request, bucket_id):
+    """
+    The bucket's Postgres object index (api.object_index).
+    GET: usage totals from the index. POST: enable it — subscribe the bucket to MinIO events and
+    build it with a full reconciliation (also re-runs one on demand). DELETE: drop the index.
+    """
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+    denied = _bucket_access_error(request, bucket)
+    if denied:
+        return denied
+
+    if request.method == 'GET':
+        index = object_index.ObjectIndex.objects.filter(bucket=bucket).first()
+        if not index:
+            return Response({"error": "Object index is not enabled for this bucket."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(object_index.usage_payload(index), status=status.HTTP_200_OK)
+
+    if request.method == 'DELETE':
+        object_index.ObjectIndex.objects.filter(bucket=bucket).delete()
+        object_index.StorageObject.objects.filter(bucket=bucket).delete()
+        return Response({"message": "Object index removed"}, status=status.HTTP_200_OK)
+
+    if not Minio:
+        return Response({"error": "MinIO SDK not installed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    index, _ = object_index.ObjectIndex.objects.get_or_create(bucket=bucket)
+    index.enabled = True
+    index.notifications_error = object_index.enable_notifications(bucket, get_bucket_client(bucket))
+    index.save()
+    from .tasks import reconcile_object_index
+    reconcile_object_index.delay(str(bucket.id))
+    index.refresh_from_db()
+    return Response(object_index.usage_payload(index), status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def search_bucket_objects(request, bucket_id):
+    """
+    Prefix / substring search over the object index.
+    GET /api/buckets/<id>/search/?prefix=img/&q=logo&limit=100&after=<last key of previous page>
+    """
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+    denied = _bucket_access_error(request, bucket)
+    if denied:
+        return denied
+    if not object_index.usable_index(bucket):
+        return Response({"error": "Object index is not enabled or not built yet for this bucket."},
+                        status=status.HTTP_409_CONFLICT)
+    try:
+        limit = min(max(int(request.GET.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = object_index.search(bucket, prefix=request.GET.get('prefix', ''), contains=request.GET.get('q', ''),
+                               after=request.GET.get('after', ''), limit=limit)
+    return Response({
+        "objects": [object_index.object_entry(row) for row in rows],
+        "next_after": rows[-1].key if len(rows) == limit else None,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def minio_bucket_events(request):
+    """MinIO webhook target for bucket notifications; authenticated with NIDHI_MINIO_WEBHOOK_TOKEN."""
+    token = getattr(settings, 'NIDHI_MINIO_WEBHOOK_TOKEN', '')
+    auth = request.headers.get('Authorization', '')
+    if not token or auth not in (token, f"Bearer {token}"):
+        return Response({"error": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    changed = object_index.handle_notification(request.data if isinstance(request.data, dict) else {})
+    return Response({"changed": changed}, status=status.HTTP_200_OK)
+
+
+ARCHIVE_LINK_MAX_AGE = 300  # seconds a folder-download link stays valid
+_ARCHIVE_SALT = 'nidhi.bucket-archive'
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def create_folder_archive_link(request, bucket_id):
+    """
+    Returns a short-lived link that downloads a folder as a ZIP streamed from MinIO.
+    Body: {prefix, compress?}. The link carries a signed token instead of the SSO header, so the
+    browser can navigate to it and save the archive to disk as it arrives.
+    """
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+    denied = _bucket_access_error(request, bucket)
+    if denied:
+        return denied
+    prefix = request.data.get('prefix', '')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    token = signing.dumps({'b': str(bucket.id), 'p': prefix, 'z': bool(request.data.get('compress'))},
+                          salt=_ARCHIVE_SALT)
+    # Relative to the API root (the frontend reaches it as /nidhi-api/<path>).
+    return Response({"path": f"buckets/archive/{token}/", "expires_in": ARCHIVE_LINK_MAX_AGE},
+                    status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def download_folder_archive(request, token):
+    """Streams the ZIP for a link from create_folder_archive_link (api.zip_export)."""
+    try:
+        claims = signing.loads(token, salt=_ARCHIVE_SALT, max_age=ARCHIVE_LINK_MAX_AGE)
+    except signing.SignatureExpired:
+        return Response({"error": "Download link expired."}, status=status.HTTP_410_GONE)
+    except signing.BadSignature:
+        return Response({"error": "Invalid download link."}, status=status.HTTP_403_FORBIDDEN)
+    bucket = get_object_or_404(StorageBucket, id=claims['b'])
+    if not Minio:
+        return Response({"error": "MinIO SDK not installed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    prefix = claims['p']
+    name = (prefix.rstrip('/').rsplit('/', 1)[-1] or bucket.bucket_name).replace('"', '')
+    response = StreamingHttpResponse(
+        zip_export.stream_zip(get_bucket_client(bucket), bucket.bucket_name, prefix, compress=claims['z']),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}.zip"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsFoundingEngineer])
 def upload_object(request, bucket_id):
@@ -372,16 +777,7 @@ def upload_object(request, bucket_id):
     object_name = request.data.get('object_name', file_obj.name)
     
     try:
-        internal_endpoint = bucket.endpoint
-        if internal_endpoint.startswith('localhost:'):
-            internal_endpoint = MINIO_ENDPOINT
-            
-        client = Minio(
-            internal_endpoint,
-            access_key=bucket.access_key,
-            secret_key=bucket.secret_key,
-            secure=False
-        )
+        client = get_bucket_client(bucket)
         
         client.put_object(
             bucket.bucket_name,
@@ -398,6 +794,176 @@ def upload_object(request, bucket_id):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _int_or_none(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise uploads.UploadError(f"{name} must be an integer.")
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def create_upload_session(request, bucket_id):
+    """
+    Starts a resumable upload (MinIO multipart upload) — see api.uploads.
+    Body: {object_name, content_type?, total_size?, part_size?}
+    Then PUT each part's raw bytes to .../uploads/<id>/parts/<n>/ and POST .../complete/.
+    """
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+    denied = _bucket_access_error(request, bucket)
+    if denied:
+        return denied
+    if not Minio:
+        return Response({"error": "MinIO SDK not installed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    object_name = request.data.get('object_name')
+    if not object_name or object_name.endswith('/'):
+        return Response({"error": "object_name is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        session = uploads.initiate(
+            bucket, get_bucket_client(bucket), object_name,
+            content_type=request.data.get('content_type'),
+            total_size=_int_or_none(request.data.get('total_size'), 'total_size'),
+            part_size=_int_or_none(request.data.get('part_size'), 'part_size'),
+            created_by=_sso_user_id(request),
+        )
+        return Response(uploads.session_payload(session), status=status.HTTP_201_CREATED)
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except S3Error as e:
+        return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _upload_session(request, bucket_id, session_id):
+    session = get_object_or_404(UploadSession.objects.select_related('bucket'), id=session_id, bucket_id=bucket_id)
+    return session, _bucket_access_error(request, session.bucket)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsFoundingEngineer])
+def upload_session_detail(request, bucket_id, session_id):
+    """GET: session state + parts already received (to resume). DELETE: abort the upload."""
+    session, denied = _upload_session(request, bucket_id, session_id)
+    if denied:
+        return denied
+    if request.method == 'GET':
+        return Response(uploads.session_payload(session), status=status.HTTP_200_OK)
+    try:
+        uploads.abort(session, get_bucket_client(session.bucket))
+        return Response(uploads.session_payload(session, parts=False), status=status.HTTP_200_OK)
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except S3Error as e:
+        return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['PUT'])
+@permission_classes([IsFoundingEngineer])
+def upload_session_part(request, bucket_id, session_id, part_number):
+    """
+    Uploads one part. The body is the part's raw bytes (not multipart/form-data) and is streamed
+    to MinIO as it arrives. Optional headers: Content-MD5 (base64), X-Content-SHA256 (hex).
+    """
+    session, denied = _upload_session(request, bucket_id, session_id)
+    if denied:
+        return denied
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return Response({"error": "Content-Length is required."}, status=status.HTTP_411_LENGTH_REQUIRED)
+
+    try:
+        # request.stream is the undecoded body; request.data is never touched, so nothing is spooled.
+        part = uploads.upload_part(
+            session, get_bucket_client(session.bucket), part_number, request.stream, length,
+            content_md5=request.META.get('HTTP_CONTENT_MD5'),
+            expected_sha256=request.META.get('HTTP_X_CONTENT_SHA256'),
+        )
+        return Response({"part_number": part.part_number, "size": part.size, "etag": part.etag,
+                         "sha256": part.sha256}, status=status.HTTP_200_OK)
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except S3Error as e:
+        return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def complete_upload_session(request, bucket_id, session_id):
+    """Assembles the uploaded parts into the final object."""
+    session, denied = _upload_session(request, bucket_id, session_id)
+    if denied:
+        return denied
+    try:
+        session = uploads.complete(session, get_bucket_client(session.bucket))
+        return Response(uploads.session_payload(session, parts=False), status=status.HTTP_200_OK)
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except S3Error as e:
+        return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def issue_presigned_post(request, bucket, created_by):
+    """Shared by the Studio and app endpoints: validate the body and sign a POST policy."""
+    try:
+        grant, form = direct_uploads.issue(
+            bucket, get_bucket_client(bucket),
+            key_prefix=request.data.get('key_prefix'),
+            max_size=_int_or_none(request.data.get('max_size'), 'max_size'),
+            content_type=request.data.get('content_type'),
+            ttl_seconds=_int_or_none(request.data.get('expires_in'), 'expires_in'),
+            created_by=created_by,
+        )
+        return Response(direct_uploads.grant_payload(grant, form), status=status.HTTP_201_CREATED)
+    except (uploads.UploadError, direct_uploads.DirectUploadError) as e:
+        return Response({"error": str(e)}, status=e.status)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def create_presigned_post(request, bucket_id):
+    """
+    Issues a presigned POST policy so the browser uploads straight to MinIO (api.direct_uploads).
+    Body: {key_prefix?, max_size?, content_type? ("image/png" or "image/"), expires_in? (seconds)}
+    The grant's keys live under `<key_prefix><grant id>/` (the returned key_prefix).
+    Afterwards POST {object_name} to /api/direct-uploads/<id>/complete/.
+    """
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+    denied = _bucket_access_error(request, bucket)
+    if denied:
+        return denied
+    if not Minio:
+        return Response({"error": "MinIO SDK not installed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return issue_presigned_post(request, bucket, _sso_user_id(request))
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def complete_direct_upload(request, grant_id):
+    """
+    Completion callback for a presigned POST upload. The grant id (returned only to whoever was
+    issued the policy) is the credential; the object is verified in MinIO before it is recorded.
+    """
+    grant = get_object_or_404(DirectUpload.objects.select_related('bucket'), id=grant_id)
+    try:
+        grant = direct_uploads.complete(grant, get_bucket_client(grant.bucket), request.data.get('object_name'))
+        return Response(direct_uploads.grant_payload(grant), status=status.HTTP_200_OK)
+    except direct_uploads.DirectUploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except S3Error as e:
+        return Response({"error": f"MinIO error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['DELETE'])
 @permission_classes([IsFoundingEngineer])
 def delete_object(request, bucket_id):
@@ -420,16 +986,7 @@ def delete_object(request, bucket_id):
         return Response({"error": "object_name is required."}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        internal_endpoint = bucket.endpoint
-        if internal_endpoint.startswith('localhost:'):
-            internal_endpoint = MINIO_ENDPOINT
-            
-        client = Minio(
-            internal_endpoint,
-            access_key=bucket.access_key,
-            secret_key=bucket.secret_key,
-            secure=False
-        )
+        client = get_bucket_client(bucket)
         
         client.remove_object(bucket.bucket_name, object_name)
         
@@ -475,16 +1032,7 @@ def create_folder(request, bucket_id):
     try:
         from io import BytesIO
         
-        internal_endpoint = bucket.endpoint
-        if internal_endpoint.startswith('localhost:'):
-            internal_endpoint = MINIO_ENDPOINT
-            
-        client = Minio(
-            internal_endpoint,
-            access_key=bucket.access_key,
-            secret_key=bucket.secret_key,
-            secure=False
-        )
+        client = get_bucket_client(bucket)
         
         # Create empty object with trailing slash to represent folder
         client.put_object(
@@ -509,8 +1057,11 @@ def relocate_bucket(request, bucket_id):
     """SCRUM-287: dynamically relocate a bucket by updating its endpoint / server.
 
     Updates the MINIO endpoint (and optionally the owning DatabaseServer) that apps receive on
-    their next auto-provision/restart. Does NOT copy objects — that is an infra operation; this
-    changes where Nidhi points apps for the given bucket.
+    their next auto-provision/restart. By default this does NOT copy objects.
+
+    With {"copy_objects": true} (requires 'endpoint') a 'relocate' StorageJob copies every object
+    to the new endpoint in parallel, verifies them, runs a final incremental sync and only then
+    switches the endpoint — 202 + job; progress/resume under /buckets/<id>/jobs/.
     """
     bucket = get_object_or_404(StorageBucket, id=bucket_id)
 
@@ -523,6 +1074,9 @@ def relocate_bucket(request, bucket_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    if request.data.get('copy_objects') in (True, 'true', '1', 1):
+        return _start_relocation(request, bucket, new_endpoint, new_server_id)
+
     if new_endpoint:
         bucket.endpoint = new_endpoint
 
@@ -541,3 +1095,90 @@ def relocate_bucket(request, bucket_id):
         "endpoint": bucket.endpoint,
         "server_id": str(bucket.server.id) if bucket.server else None,
     }, status=status.HTTP_200_OK)
+
+
+def _start_relocation(request, bucket, new_endpoint, new_server_id):
+    if not new_endpoint:
+        return Response({"error": "copy_objects requires the new 'endpoint'."}, status=status.HTTP_400_BAD_REQUEST)
+    if new_endpoint == bucket.endpoint:
+        return Response({"error": "Bucket is already on that endpoint."}, status=status.HTTP_400_BAD_REQUEST)
+    if not Minio:
+        return Response({"error": "MinIO SDK not installed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    params = {'source_endpoint': bucket.endpoint, 'target_endpoint': new_endpoint}
+    if new_server_id is not None:
+        params['target_server_id'] = None if new_server_id in ('', 'null') else str(
+            get_object_or_404(DatabaseServer, id=new_server_id).id)
+    busy = StorageJob.objects.filter(bucket=bucket, status__in=storage_jobs.ACTIVE_STATUSES).first()
+    if busy:
+        return Response({"error": "Another job is running on this bucket.",
+                         "job": storage_jobs.job_payload(busy)}, status=status.HTTP_409_CONFLICT)
+
+    job = StorageJob(bucket=bucket, kind='relocate', params=params, created_by_sso_id=_sso_user_id(request))
+    try:
+        target = storage_jobs.target_client(job)
+        if not request.data.get('allow_existing') and target.bucket_exists(bucket.bucket_name) and \
+                next(iter(target.list_objects(bucket.bucket_name, recursive=True)), None) is not None:
+            return Response({"error": "Target bucket already has objects; pass allow_existing to mirror over them "
+                                      "(target-only objects are deleted in the final sync)."},
+                            status=status.HTTP_409_CONFLICT)
+    except Exception as e:
+        return Response({"error": f"Cannot reach target MinIO: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
+    job.save()
+
+    from .tasks import run_storage_job
+    run_storage_job.delay(str(job.id))
+    job.refresh_from_db()
+    return Response({"message": "Relocation started", "job": storage_jobs.job_payload(job)},
+                    status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def product_bandwidth(request, product_id):
+    """Media gateway usage for a product, from the MediaUsageRollup table (api.metering).
+
+    GET /api/products/<id>/bandwidth/?granularity=day|hour&since=<iso>&until=<iso>
+    Defaults: daily for the last 30 days, or hourly for the last 48 hours.
+    Counters are flushed by each gateway process about once a minute, so the current period lags.
+    """
+    product = get_object_or_404(Product, id=product_id)
+
+    sso_user_id = getattr(request, 'sso_user_id', None)
+    if not sso_user_id and request.user and request.user.is_authenticated:
+        sso_user_id = request.user.username
+
+    assignments = EmployeeProductAssignment.objects.filter(sso_user_id=sso_user_id)
+    if assignments.exists() and not assignments.filter(product_id=product.id).exists():
+        return Response({"error": "Not authorized for this product."}, status=status.HTTP_403_FORBIDDEN)
+
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in ('day', 'hour'):
+        return Response({"error": "granularity must be 'day' or 'hour'."}, status=status.HTTP_400_BAD_REQUEST)
+    until = parse_datetime(request.GET.get('until', '')) if request.GET.get('until') else timezone.now()
+    default_window = timedelta(days=30) if granularity == 'day' else timedelta(hours=48)
+    since = parse_datetime(request.GET.get('since', '')) if request.GET.get('since') else until - default_window
+    if since is None or until is None:
+        return Response({"error": "since/until must be ISO-8601 datetimes."}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = MediaUsageRollup.objects.filter(
+        product=product, granularity=granularity, period_start__gte=since, period_start__lte=until,
+    )
+    metrics = {name: Sum(name) for name in
+               ('requests', 'bytes', 'status_2xx', 'status_3xx', 'status_4xx', 'status_5xx')}
+    totals = {k: v or 0 for k, v in rows.aggregate(**metrics).items()}
+    series = [
+        {"period_start": r['period_start'].isoformat(), **{k: r[k] for k in metrics}}
+        for r in rows.values('period_start').annotate(**metrics).order_by('period_start')
+    ]
+    buckets = list(rows.values('bucket_name').annotate(**metrics).order_by('-bytes'))
+
+    return Response({
+        "product_id": product.id,
+        "product_name": product.name,
+        "granularity": granularity,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "totals": totals,
+        "series": series,
+        "buckets": buckets,
+    }, status=status.HTTP_200_OK)
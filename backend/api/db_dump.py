@@ -0,0 +1,177 @@
+"""Streaming pg_dump for the Studio's "Download Backup".
+
+The download used to set os.environ['PGPASSWORD'] (process-wide: concurrent requests for
+different servers raced on it), run pg_dump into a fixed /tmp/dump_<db>.sql (two people
+downloading the same database overwrote each other's file, which was never deleted) and only
+then send the file. A Dump instead runs
+
+    pg_dump -h <host> -p <port> -U <user> -d <db> -F p|c -Z <level> --no-password
+
+with the password, PGCONNECT_TIMEOUT and PGAPPNAME in the child's own environment, and
+relays its stdout to the response CHUNK_SIZE bytes at a time: no temp file, and the first bytes
+leave as soon as pg_dump writes them. Formats:
+
+  * plain   SQL script (psql -f). Compression none, gzip or zstd;
+  * custom  pg_restore archive (selective / parallel restore). Compression gzip (default) or
+            none, applied by pg_dump per table inside the archive.
+
+gzip is pg_dump's own -Z (a separate process, so it costs the web worker nothing and works on
+every server version); zstd (pg_dump only has it from 16 on) compresses the plain stream here
+and needs the optional zstandard package (501 without it).
+
+start() reads the first chunk before the response is committed, so a connection or permission
+failure is still a JSON error. A failure after that is logged and aborts the stream (the browser
+reports a failed download instead of saving a truncated script). A client that goes away
+kills pg_dump. stderr is drained by a thread (a full stderr pipe would block pg_dump) keeping
+only its tail for the error message.
+"""
+import os
+import logging
+import threading
+import subprocess
+
+from . import studio_export
+
+logger = logging.getLogger(__name__)
+
+PG_DUMP = os.environ.get('NIDHI_PG_DUMP', 'pg_dump')
+CHUNK_SIZE = 1024 * 1024
+CONNECT_TIMEOUT = os.environ.get('NIDHI_DUMP_CONNECT_TIMEOUT', '10')
+GZIP_LEVEL = 6
+STDERR_TAIL = 8 * 1024
+
+# format -> (pg_dump -F, content type, extension, allowed compressions; first is the default)
+FORMATS = {
+    'plain': ('p', 'application/sql', '.sql', ('none', 'gzip', 'zstd')),
+    'custom': ('c', 'application/octet-stream', '.dump', ('gzip', 'none')),
+}
+_SUFFIX = {'gzip': '.gz', 'zstd': '.zst'}
+_CONTENT_TYPE = {'gzip': 'application/gzip', 'zstd': 'application/zstd'}
+
+
+class DumpError(Exception):
+    """Rejected or failed dump; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def validate(fmt, compression=None):
+    """(format, compression) with defaults applied; DumpError if unknown or unavailable."""
+    fmt = (fmt or 'plain').lower()
+    if fmt not in FORMATS:
+        raise DumpError(f"format must be one of {', '.join(FORMATS)}.")
+    allowed = FORMATS[fmt][3]
+    compression = (compression or allowed[0]).lower()
+    if compression not in allowed:
+        raise DumpError(f"compression for {fmt} must be one of {', '.join(allowed)}.")
+    if compression == 'zstd' and studio_export.zstandard is None:
+        raise DumpError("zstd compression needs the zstandard package on the server.", status=501)
+    return fmt, compression
+
+
+def filename(db_name, fmt, compression):
+    name = f"{db_name}_backup{FORMATS[fmt][2]}"
+    return name + _SUFFIX.get(compression, '') if fmt == 'plain' else name
+
+
+def content_type(fmt, compression):
+    return _CONTENT_TYPE.get(compression, FORMATS[fmt][1]) if fmt == 'plain' else FORMATS[fmt][1]
+
+
+class Dump:
+    """One pg_dump run of an instance's database, streamed from its stdout."""
+
+    def __init__(self, instance, fmt='plain', compression='none'):
+        self.instance = instance
+        self.fmt = fmt
+        self.compression = compression
+        self.byte_count = 0
+        self.proc = None
+        self._first = b''
+        self._stderr = b''
+        self._stderr_thread = None
+
+    def command(self):
+        server = self.instance.server
+        level = GZIP_LEVEL if self.compression == 'gzip' else 0
+        return [
+            PG_DUMP,
+            '-h', server.host,
+            '-p', str(server.port),
+            '-U', server.root_user,
+            '-d', self.instance.db_name,
+            '-F', FORMATS[self.fmt][0],
+            '-Z', str(level),
+            '--no-password',
+        ]
+
+    def environment(self):
+        """The child's environment: the credentials never touch this process's os.environ."""
+        return dict(
+            os.environ,
+            PGPASSWORD=self.instance.server.root_password or '',
+            PGCONNECT_TIMEOUT=CONNECT_TIMEOUT,
+            PGAPPNAME='nidhi-studio-dump',
+        )
+
+    def start(self):
+        """Spawn pg_dump and wait for its first output. DumpError (502) if it produced none."""
+        try:
+            self.proc = subprocess.Popen(
+                self.command(), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, env=self.environment(), bufsize=0,
+            )
+        except OSError as e:
+            raise DumpError(f"Could not run pg_dump: {e}", status=500)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, name='nidhi-dump-stderr', daemon=True)
+        self._stderr_thread.start()
+        self._first = self.proc.stdout.read(CHUNK_SIZE)
+        if not self._first:
+            self._finish()
+            raise DumpError(f"Dump failed: {self.error() or f'pg_dump exited with {self.proc.returncode}'}",
+                            status=502)
+
+    def _drain_stderr(self):
+        for line in iter(self.proc.stderr.readline, b''):
+            self._stderr = (self._stderr + line)[-STDERR_TAIL:]
+
+    def error(self):
+        return self._stderr.decode('utf-8', 'replace').strip()
+
+    def _finish(self):
+        returncode = self.proc.wait()
+        self._stderr_thread.join()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        return returncode
+
+    def chunks(self):
+        """The dump's bytes; call start() first."""
+        compressor = studio_export._compressor('zstd' if self.compression == 'zstd' else 'none')
+        completed = False
+        try:
+            chunk = self._first
+            self._first = b''
+            while chunk:
+                data = compressor.compress(chunk)
+                if data:
+                    self.byte_count += len(data)
+                    yield data
+                chunk = self.proc.stdout.read(CHUNK_SIZE)
+            returncode = self._finish()
+            if returncode != 0:
+                logger.error("pg_dump of %s failed mid-stream (exit %s): %s",
+                             self.instance.db_name, returncode, self.error())
+                raise DumpError(f"Dump failed: {self.error()}", status=502)
+            tail = compressor.flush()
+            if tail:
+                self.byte_count += len(tail)
+                yield tail
+            completed = True
+        finally:
+            if not completed and self.proc.poll() is None:
+                # Client went away (or the stream failed): stop pg_dump and reap it.
+                self.proc.kill()
+                self._finish()
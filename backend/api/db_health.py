@@ -0,0 +1,270 @@
+"""Table and index health report of a tenant database for the Database Studio.
+
+The starting point for "why is my app slow": one query (HEALTH_SQL, aggregated into JSON
+server-side, like the schema catalog) reads pg_stat_database, pg_stat_user_tables /
+pg_statio_user_tables, pg_stat_user_indexes / pg_statio_user_indexes, the size functions and
+the column widths in pg_stats. report() then estimates bloat and ranks findings:
+
+  * invalid_index    an index left invalid by a failed CREATE INDEX CONCURRENTLY: maintained on
+                     every write, never used;
+  * table_bloat      table / btree index at least BLOAT_MIN_BYTES and BLOAT_RATIO larger than its
+  * index_bloat      rows need (see below): VACUUM FULL / pg_repack, REINDEX CONCURRENTLY;
+  * dead_tuples      dead tuples above DEAD_TUPLE_RATIO of the live ones (and DEAD_TUPLE_MIN):
+                     autovacuum is not keeping up;
+  * seq_scan_heavy   tables of NIDHI_PROFILE_LARGE_TABLE_ROWS rows or more read mostly by
+                     sequential scans, each reading that many rows on average: a missing index;
+  * unused_index     non-unique, non-constraint indexes of UNUSED_INDEX_MIN_BYTES or more never
+                     scanned since the statistics were reset: pure write overhead;
+  * low_cache_hit    database (or table heap) buffer cache hit ratio below CACHE_HIT_MIN once
+                     enough blocks were read to judge: the working set does not fit in memory;
+  * never_analyzed   tables with rows but no ANALYZE yet: the planner (and the bloat estimate)
+                     works blind.
+
+Findings are ranked critical > warning > info, then by the size of the object.
+
+Bloat is an estimate, the usual statistics-based one: the bytes the rows would take when packed
+(reltuples x (tuple header + line pointer + MAXALIGNed pg_stats.avg_width sum), pages filled to
+the fillfactor) against the relation's actual size. It is only computed for analyzed tables
+whose columns all have statistics, and for btree indexes on plain columns.
+
+Everything comes from cumulative statistics, so counters (scans, hit ratios) cover the time since
+`stats_reset`, returned with the report.
+"""
+import os
+import math
+
+from . import studio_pool
+from .query_profile import LARGE_TABLE_ROWS
+
+BLOAT_MIN_BYTES = int(os.environ.get('NIDHI_HEALTH_BLOAT_MIN_BYTES', str(10 * 1024 * 1024)))
+BLOAT_RATIO = 0.3
+DEAD_TUPLE_RATIO = 0.2
+DEAD_TUPLE_MIN = 10000
+UNUSED_INDEX_MIN_BYTES = 1024 * 1024
+CACHE_HIT_MIN = 0.99
+TABLE_CACHE_HIT_MIN = 0.9
+CACHE_MIN_BLOCKS = 10000
+
+# Page layout constants (bytes): page header, heap tuple header, btree special space, index
+# tuple header, line pointer, MAXALIGN.
+PAGE_HEADER = 24
+HEAP_TUPLE_HEADER = 24
+BTREE_SPECIAL = 16
+INDEX_TUPLE_HEADER = 8
+ITEM_ID = 4
+MAXALIGN = 8
+
+SEVERITIES = ('critical', 'warning', 'info')
+
+HEALTH_SQL = """
+    SELECT current_setting('block_size')::int AS block_size,
+    (SELECT json_build_object(
+            'size_bytes', pg_database_size(d.oid),
+            'blks_read', s.blks_read,
+            'blks_hit', s.blks_hit,
+            'xact_commit', s.xact_commit,
+            'xact_rollback', s.xact_rollback,
+            'temp_files', s.temp_files,
+            'temp_bytes', s.temp_bytes,
+            'deadlocks', s.deadlocks,
+            'stats_reset', s.stats_reset)
+       FROM pg_database d JOIN pg_stat_database s ON s.datid = d.oid
+      WHERE d.datname = current_database()) AS database,
+    coalesce((SELECT json_agg(t ORDER BY t.total_bytes DESC) FROM (
+        SELECT st.schemaname AS schema, st.relname AS name,
+               c.reltuples::bigint AS row_estimate, c.relpages AS pages,
+               st.n_live_tup AS live_tuples, st.n_dead_tup AS dead_tuples,
+               st.seq_scan, st.seq_tup_read, coalesce(st.idx_scan, 0) AS idx_scan,
+               st.n_tup_ins AS inserts, st.n_tup_upd AS updates, st.n_tup_hot_upd AS hot_updates,
+               st.n_tup_del AS deletes, st.n_mod_since_analyze AS modified_since_analyze,
+               st.last_vacuum, st.last_autovacuum, st.last_analyze, st.last_autoanalyze,
+               io.heap_blks_read, io.heap_blks_hit, io.idx_blks_read, io.idx_blks_hit,
+               pg_total_relation_size(c.oid) AS total_bytes,
+               pg_relation_size(c.oid) AS table_bytes,
+               pg_indexes_size(c.oid) AS index_bytes,
+               coalesce((SELECT o.option_value::int FROM pg_options_to_table(c.reloptions) o
+                          WHERE o.option_name = 'fillfactor'), 100) AS fillfactor,
+               (SELECT count(*) FROM pg_attribute a
+                 WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped) AS column_count,
+               (SELECT count(*) FROM pg_stats s
+                 WHERE s.schemaname = st.schemaname AND s.tablename = st.relname) AS stats_columns,
+               (SELECT sum(s.avg_width) FROM pg_stats s
+                 WHERE s.schemaname = st.schemaname AND s.tablename = st.relname) AS row_width
+          FROM pg_stat_user_tables st
+          JOIN pg_class c ON c.oid = st.relid
+          LEFT JOIN pg_statio_user_tables io ON io.relid = st.relid
+    ) t), '[]') AS tables,
+    coalesce((SELECT json_agg(i ORDER BY i.bytes DESC) FROM (
+        SELECT si.schemaname AS schema, si.relname AS "table", si.indexrelname AS name,
+               si.idx_scan, si.idx_tup_read, si.idx_tup_fetch,
+               io.idx_blks_read, io.idx_blks_hit,
+               pg_relation_size(si.indexrelid) AS bytes,
+               ic.reltuples::bigint AS tuples,
+               am.amname AS method,
+               x.indisunique AS "unique", x.indisprimary AS "primary", x.indisvalid AS valid,
+               EXISTS (SELECT 1 FROM pg_constraint con
+                        WHERE con.conindid = si.indexrelid AND con.conrelid = si.relid
+                          AND con.contype IN ('p', 'u', 'x')) AS backs_constraint,
+               coalesce((SELECT o.option_value::int FROM pg_options_to_table(ic.reloptions) o
+                          WHERE o.option_name = 'fillfactor'), 90) AS fillfactor,
+               x.indexprs IS NULL AND NOT (0 = ANY (x.indkey::int2[])) AS plain_columns,
+               (SELECT sum(s.avg_width)
+                  FROM unnest(x.indkey::int2[]) k(attnum)
+                  JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = k.attnum
+                  JOIN pg_stats s ON s.schemaname = si.schemaname AND s.tablename = si.relname
+                                 AND s.attname = a.attname) AS key_width,
+               (SELECT count(*) FROM unnest(x.indkey::int2[]) k(attnum)
+                  JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = k.attnum
+                  JOIN pg_stats s ON s.schemaname = si.schemaname AND s.tablename = si.relname
+                                 AND s.attname = a.attname) AS stats_columns,
+               x.indnatts AS column_count,
+               pg_get_indexdef(si.indexrelid) AS definition
+          FROM pg_stat_user_indexes si
+          JOIN pg_index x ON x.indexrelid = si.indexrelid
+          JOIN pg_class ic ON ic.oid = si.indexrelid
+          JOIN pg_am am ON am.oid = ic.relam
+          LEFT JOIN pg_statio_user_indexes io ON io.indexrelid = si.indexrelid
+    ) i), '[]') AS indexes
+"""
+
+
+def _align(n):
+    return int(math.ceil(n / MAXALIGN) * MAXALIGN)
+
+
+def _ratio(hit, read):
+    hit, read = hit or 0, read or 0
+    return round(hit / (hit + read), 4) if hit + read else None
+
+
+def _bloat(actual_bytes, expected_pages, block_size):
+    expected = expected_pages * block_size
+    bloat = max(actual_bytes - expected, 0)
+    return {
+        "expected_bytes": expected,
+        "bloat_bytes": bloat,
+        "bloat_ratio": round(bloat / actual_bytes, 3) if actual_bytes else 0.0,
+    }
+
+
+def table_bloat(table, block_size):
+    """{expected_bytes, bloat_bytes, bloat_ratio} of the heap, or None without usable statistics."""
+    if table['row_estimate'] is None or table['row_estimate'] < 0 or table['row_width'] is None \
+            or table['stats_columns'] < table['column_count']:
+        return None
+    tuple_bytes = HEAP_TUPLE_HEADER + _align(table['row_width']) + ITEM_ID
+    usable = (block_size - PAGE_HEADER) * table['fillfactor'] / 100
+    return _bloat(table['table_bytes'], math.ceil(table['row_estimate'] * tuple_bytes / usable), block_size)
+
+
+def index_bloat(index, block_size):
+    """{expected_bytes, bloat_bytes, bloat_ratio} of a btree index, or None."""
+    if index['method'] != 'btree' or not index['plain_columns'] or index['key_width'] is None \
+            or index['stats_columns'] < index['column_count'] or index['tuples'] is None or index['tuples'] < 0:
+        return None
+    tuple_bytes = INDEX_TUPLE_HEADER + _align(index['key_width']) + ITEM_ID
+    usable = (block_size - PAGE_HEADER - BTREE_SPECIAL) * index['fillfactor'] / 100
+    return _bloat(index['bytes'], math.ceil(index['tuples'] * tuple_bytes / usable) + 1, block_size)  # + metapage
+
+
+def _mib(n):
+    return f"{n / (1024 * 1024):.1f} MiB"
+
+
+def _table_findings(table):
+    name = table['name'] if table['schema'] == 'public' else f"{table['schema']}.{table['name']}"
+    bloat = table['bloat']
+    if bloat and bloat['bloat_bytes'] >= BLOAT_MIN_BYTES and bloat['bloat_ratio'] >= BLOAT_RATIO:
+        yield 'table_bloat', 'warning', name, (
+            f"~{_mib(bloat['bloat_bytes'])} ({bloat['bloat_ratio']:.0%}) of {_mib(table['table_bytes'])} is free "
+            f"space; VACUUM FULL or pg_repack would return it.")
+    live, dead = table['live_tuples'] or 0, table['dead_tuples'] or 0
+    if dead >= DEAD_TUPLE_MIN and dead >= DEAD_TUPLE_RATIO * max(live, 1):
+        last = table['last_autovacuum'] or table['last_vacuum'] or 'never'
+        yield 'dead_tuples', 'warning', name, (
+            f"{dead} dead vs {live} live tuples (last vacuum: {last}); autovacuum is not keeping up, "
+            f"lower autovacuum_vacuum_scale_factor for this table.")
+    seq_scan, idx_scan = table['seq_scan'] or 0, table['idx_scan'] or 0
+    if live >= LARGE_TABLE_ROWS and seq_scan > idx_scan and table['seq_tup_read'] / seq_scan >= LARGE_TABLE_ROWS:
+        yield 'seq_scan_heavy', 'warning', name, (
+            f"{seq_scan} sequential scans (vs {idx_scan} index scans) reading {table['seq_tup_read'] // seq_scan} "
+            f"rows each on average; an index on the filtered columns would avoid them.")
+    hit_ratio = table['heap_hit_ratio']
+    if hit_ratio is not None and hit_ratio < TABLE_CACHE_HIT_MIN and (table['heap_blks_read'] or 0) >= CACHE_MIN_BLOCKS:
+        yield 'low_cache_hit', 'info', name, (
+            f"Heap cache hit ratio {hit_ratio:.1%} ({table['heap_blks_read']} blocks read from disk).")
+    if live and not (table['last_analyze'] or table['last_autoanalyze']):
+        yield 'never_analyzed', 'info', name, "Never analyzed: the planner has no statistics; run ANALYZE."
+
+
+def _index_findings(index):
+    name = index['name']
+    if not index['valid']:
+        yield 'invalid_index', 'critical', name, (
+            f"Invalid (failed concurrent build?): maintained on every write to {index['table']}, never used. "
+            f"DROP INDEX CONCURRENTLY and rebuild it.")
+        return
+    bloat = index['bloat']
+    if bloat and bloat['bloat_bytes'] >= BLOAT_MIN_BYTES and bloat['bloat_ratio'] >= BLOAT_RATIO:
+        yield 'index_bloat', 'warning', name, (
+            f"~{_mib(bloat['bloat_bytes'])} ({bloat['bloat_ratio']:.0%}) of {_mib(index['bytes'])} is bloat; "
+            f"REINDEX INDEX CONCURRENTLY {name}.")
+    if not index['idx_scan'] and not (index['unique'] or index['primary'] or index['backs_constraint']) \
+            and index['bytes'] >= UNUSED_INDEX_MIN_BYTES:
+        yield 'unused_index', 'info', name, (
+            f"Never scanned since the statistics were reset, yet {_mib(index['bytes'])} updated on every write "
+            f"to {index['table']}; consider dropping it.")
+
+
+def collect(cursor):
+    """The raw HEALTH_SQL row (one query)."""
+    cursor.execute(HEALTH_SQL)
+    return cursor.fetchone()
+
+
+def report(row):
+    """HEALTH_SQL's row -> {database, tables, indexes, findings}."""
+    block_size = row['block_size']
+    database = dict(row['database'] or {})
+    database['cache_hit_ratio'] = _ratio(database.get('blks_hit'), database.get('blks_read'))
+    tables, indexes = row['tables'], row['indexes']
+    for table in tables:
+        table['bloat'] = table_bloat(table, block_size)
+        table['heap_hit_ratio'] = _ratio(table['heap_blks_hit'], table['heap_blks_read'])
+        table['dead_tuple_ratio'] = round(table['dead_tuples'] / table['live_tuples'], 3) if table['live_tuples'] else None
+    for index in indexes:
+        index['bloat'] = index_bloat(index, block_size)
+
+    ranked = []  # (size of the object, finding)
+    for table in tables:
+        for kind, severity, name, message in _table_findings(table):
+            ranked.append((table['total_bytes'], {"kind": kind, "severity": severity, "object": name, "message": message}))
+    for index in indexes:
+        for kind, severity, name, message in _index_findings(index):
+            ranked.append((index['bytes'], {"kind": kind, "severity": severity, "object": name,
+                                            "table": index['table'], "message": message}))
+    ratio = database['cache_hit_ratio']
+    if ratio is not None and ratio < CACHE_HIT_MIN and (database.get('blks_read') or 0) >= CACHE_MIN_BLOCKS:
+        ranked.append((database.get('size_bytes') or 0, {"kind": 'low_cache_hit', "severity": 'warning', "object": None,
+                                                         "message": (
+            f"Database cache hit ratio {ratio:.2%} ({database['blks_read']} blocks read from disk); the working "
+            f"set does not fit in shared_buffers / RAM.")}))
+    ranked.sort(key=lambda r: (SEVERITIES.index(r[1]['severity']), -r[0]))
+
+    return {
+        "database": database,
+        "tables": tables,
+        "indexes": indexes,
+        "findings": [finding for _, finding in ranked],
+    }
+
+
+def get_report(instance):
+    """The instance's health report. Uses the Studio pool."""
+    with studio_pool.connection(instance) as conn:
+        cursor = conn.cursor()
+        try:
+            row = collect(cursor)
+        finally:
+            cursor.close()
+    return report(row)
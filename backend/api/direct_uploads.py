@@ -0,0 +1,172 @@
+"""Direct-to-MinIO uploads with presigned POST policies (DirectUpload grants).
+
+Every other upload path relays the bytes through a Django worker. Here Nidhi only signs:
+
+  issue      a POST policy for the bucket limited to the grant's own key prefix
+             (`<key_prefix><grant id>/`, default `uploads/<grant id>/`), a size range and a content
+             type (exact, or a prefix such as "image/"), valid for a few minutes. The browser or
+             app POSTs the file as multipart/form-data to `url` with `fields` + key + file;
+  complete   the uploader reports the key it used. Nidhi stats the object, checks it against the
+             grant (prefix, written after the grant was issued, size, type) and records it on the
+             DirectUpload row; an object that breaks the grant is deleted. Completing twice is a
+             no-op for the same key.
+
+The grant id is unguessable and only ever in its own prefix, so the completion endpoint (which
+is unauthenticated) can only claim, or delete, an object this grant's policy could have written.
+
+The policy is signed with the bucket's own credentials; it does not depend on the host, so the
+internal client signs and the browser posts to the bucket's public endpoint (or
+NIDHI_MINIO_PUBLIC_URL when MinIO is published behind a proxy).
+"""
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DirectUpload
+
+try:
+    from minio.datatypes import PostPolicy
+except ImportError:
+    PostPolicy = None
+
+DEFAULT_TTL = timedelta(minutes=15)
+MAX_TTL = timedelta(hours=1)
+COMPLETION_GRACE = timedelta(hours=1)   # the upload may finish right at expiry; allow reporting it late
+CLOCK_SKEW = timedelta(seconds=5)      # MinIO's Last-Modified vs this host's clock
+MAX_SIZE = int(os.environ.get('NIDHI_DIRECT_UPLOAD_MAX_SIZE', str(5 * 1024 ** 3)))  # S3 POST limit: 5 GiB
+
+
+class DirectUploadError(Exception):
+    """Rejected grant request / completion; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_url(bucket):
+    public = getattr(settings, 'NIDHI_MINIO_PUBLIC_URL', '')
+    if public:
+        return f"{public.rstrip('/')}/{bucket.bucket_name}"
+    return f"http://{bucket.endpoint}/{bucket.bucket_name}"
+
+
+def grant_payload(grant, form=None):
+    payload = {
+        "id": str(grant.id),
+        "bucket_id": str(grant.bucket_id),
+        "key_prefix": grant.key_prefix,
+        "max_size": grant.max_size,
+        "content_type": grant.content_type or None,
+        "expires_at": grant.expires_at.isoformat(),
+        "status": grant.status,
+        "object_name": grant.object_name or None,
+        "size": grant.size,
+        "etag": grant.etag or None,
+        "error": grant.error or None,
+    }
+    if form:
+        payload.update(form)
+    return payload
+
+
+def _clean_prefix(key_prefix, grant_id):
+    """The grant's own prefix: `<key_prefix><grant_id>/`, so no two grants share keys."""
+    if not key_prefix:
+        return f"uploads/{grant_id}/"
+    key_prefix = key_prefix.lstrip('/')
+    if not key_prefix:
+        # An empty starts-with condition would let the form write any key in the bucket.
+        raise DirectUploadError("key_prefix must name a folder; omit it for a per-grant uploads/<id>/ prefix.")
+    if '..' in key_prefix.split('/') or '\\' in key_prefix:
+        raise DirectUploadError("key_prefix must not contain '..' segments or backslashes.")
+    return f"{key_prefix}{grant_id}/"
+
+
+def _type_allowed(grant, content_type):
+    if not grant.content_type:
+        return True
+    if grant.content_type.endswith('/'):
+        return (content_type or '').startswith(grant.content_type)
+    return (content_type or '').split(';')[0].strip() == grant.content_type
+
+
+def issue(bucket, client, key_prefix=None, max_size=None, content_type=None, ttl_seconds=None, created_by=''):
+    """Create a DirectUpload grant and its signed POST form. Returns (grant, form)."""
+    max_size = MAX_SIZE if max_size is None else max_size
+    if not 0 < max_size <= MAX_SIZE:
+        raise DirectUploadError(f"max_size must be between 1 and {MAX_SIZE} bytes.")
+    ttl = DEFAULT_TTL if ttl_seconds is None else timedelta(seconds=ttl_seconds)
+    if not timedelta(seconds=30) <= ttl <= MAX_TTL:
+        raise DirectUploadError(f"expires_in must be between 30 and {int(MAX_TTL.total_seconds())} seconds.")
+
+    grant_id = uuid.uuid4()
+    grant = DirectUpload(
+        id=grant_id, bucket=bucket, key_prefix=_clean_prefix(key_prefix, grant_id), max_size=max_size,
+        content_type=content_type or '', expires_at=timezone.now() + ttl, created_by=created_by or '',
+    )
+
+    policy = PostPolicy(bucket.bucket_name, grant.expires_at)
+    policy.add_starts_with_condition("key", grant.key_prefix)
+    policy.add_content_length_range_condition(1, max_size)
+    if grant.content_type.endswith('/'):
+        policy.add_starts_with_condition("Content-Type", grant.content_type)
+    elif grant.content_type:
+        policy.add_equals_condition("Content-Type", grant.content_type)
+    fields = client.presigned_post_policy(policy)
+    grant.save()
+
+    form = {
+        "url": upload_url(bucket),
+        "fields": fields,
+        # The uploader adds `key` (starting with key_prefix) and, if constrained, `Content-Type`.
+        "required_fields": ["key", "file"] + (["Content-Type"] if grant.content_type else []),
+    }
+    return grant, form
+
+
+def complete(grant, client, object_name):
+    """Verify the uploaded object against the grant and record it. Returns the grant."""
+    if grant.status == 'completed':
+        if grant.object_name == object_name:
+            return grant
+        raise DirectUploadError("This upload grant was already completed for another object.", status=409)
+    if grant.status == 'rejected':
+        raise DirectUploadError(f"This upload grant was rejected: {grant.error}", status=409)
+    if timezone.now() > grant.expires_at + COMPLETION_GRACE:
+        raise DirectUploadError("Upload grant expired.", status=410)
+    if not object_name or not object_name.startswith(grant.key_prefix):
+        raise DirectUploadError(f"object_name must start with '{grant.key_prefix}'.")
+
+    try:
+        stat = client.stat_object(grant.bucket.bucket_name, object_name)
+    except Exception as e:
+        if 'NoSuchKey' in str(e) or 'NoSuchKey' in type(e).__name__ or 'NotFound' in str(e):
+            raise DirectUploadError("Object not found; upload it before completing.", status=404)
+        raise
+    if stat.last_modified and stat.last_modified < grant.created_at - CLOCK_SKEW:
+        # Not this grant's upload: never claim or delete it.
+        raise DirectUploadError("Object was written before this upload grant was issued.", status=409)
+
+    problem = None
+    if stat.size > grant.max_size:
+        problem = f"object is {stat.size} bytes, grant allows {grant.max_size}"
+    elif not _type_allowed(grant, stat.content_type):
+        problem = f"content type {stat.content_type!r} is not allowed by the grant"
+    if problem:
+        # MinIO enforces the policy, so this should not happen — but never keep an out-of-policy object.
+        client.remove_object(grant.bucket.bucket_name, object_name)
+        grant.status, grant.object_name, grant.error = 'rejected', object_name, problem
+        grant.save()
+        raise DirectUploadError(f"Upload rejected: {problem}.", status=422)
+
+    grant.status = 'completed'
+    grant.object_name = object_name
+    grant.size = stat.size
+    grant.etag = (stat.etag or '').strip('"')
+    grant.completed_at = timezone.now()
+    grant.save()
+    return grant
@@ -0,0 +1,242 @@
+"""On-the-fly image derivatives for the media gateway.
+
+    GET /api/media/<bucket>/<key>?...&w=320&h=240&fit=cover&fmt=webp&q=80
+
+The first request for a given (object version, transform) generates the derivative in a small
+process-wide worker pool and stores it in NIDHI_DERIVATIVE_BUCKET (default `nidhi-derivatives`)
+on the control-plane MinIO, e.g. `reader-media/w320-h240-cover-q80/<source etag>/books/p1.png.webp`.
+Every later hit is a source HEAD plus a plain fetch of the derivative. Concurrent requests for the
+same derivative share one generation (single-flight), so a cold thumbnail grid does not resize
+the same page N times.
+
+Derivatives never land in the tenant's bucket, so its listings, object index, usage, ZIP exports
+and relocations only ever see the tenant's own objects. The source's ETag is part of the key: an
+object overwritten in place gets a new derivative on its next request. Derivatives of old
+versions are left behind and expire after NIDHI_DERIVATIVE_TTL_DAYS (a lifecycle rule on the
+bucket); a later request simply renders them again.
+
+Sources over MAX_SOURCE_BYTES, or whose header claims more pixels than Pillow's decompression-bomb
+limit, are rejected with ValueError (400). A render that outlives DERIVATIVE_TIMEOUT raises
+DerivativeTimeout (504); it keeps running, and the retry joins it or finds the stored result.
+"""
+import io
+import os
+import threading
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+try:
+    from minio.commonconfig import ENABLED, Filter
+    from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
+except ImportError:
+    LifecycleConfig = None
+
+from .storage import MINIO_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_TTL_DAYS = int(os.environ.get('NIDHI_DERIVATIVE_TTL_DAYS', '30'))
+DERIVATIVE_WORKERS = int(os.environ.get('NIDHI_DERIVATIVE_WORKERS', '2'))
+DERIVATIVE_TIMEOUT = int(os.environ.get('NIDHI_DERIVATIVE_TIMEOUT', '30'))
+MAX_SOURCE_BYTES = int(os.environ.get('NIDHI_DERIVATIVE_MAX_SOURCE_BYTES', str(50 * 1024 * 1024)))
+MAX_DIMENSION = 4096
+
+FITS = ('inside', 'contain', 'cover', 'fill')
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'avif': ('AVIF', 'image/avif'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+# Where derivatives are kept: an internal bucket on the control-plane MinIO, root credentials.
+DerivativeStore = namedtuple('DerivativeStore', ['endpoint', 'bucket_name', 'access_key', 'secret_key'])
+STORE = DerivativeStore(
+    endpoint=MINIO_ENDPOINT,
+    bucket_name=os.environ.get('NIDHI_DERIVATIVE_BUCKET', 'nidhi-derivatives'),
+    access_key=os.environ.get('MINIO_ROOT_USER', 'admin_nidhi_minio'),
+    secret_key=os.environ.get('MINIO_ROOT_PASSWORD', 'secure_nidhi_minio_password'),
+)
+
+_executor = None
+_inflight = {}
+_lock = threading.Lock()
+_store_ready = False
+
+
+class DerivativeTimeout(Exception):
+    """Generation did not finish within DERIVATIVE_TIMEOUT. Deliberately not an OSError (which
+    the builtin TimeoutError is), so the gateway does not report it as a bad image."""
+
+
+class TransformSpec:
+    """Validated transform parameters. `slug` is the stable, human-readable cache-key segment."""
+
+    def __init__(self, width=None, height=None, fit='inside', fmt=None, quality=80):
+        self.width = width
+        self.height = height
+        self.fit = fit
+        self.fmt = fmt
+        self.quality = quality
+
+    @property
+    def slug(self):
+        return f"w{self.width or 0}-h{self.height or 0}-{self.fit}-q{self.quality}"
+
+    def derivative_key(self, bucket_name, object_key, version):
+        """Key in STORE.bucket_name; `version` (the source's ETag) changes when it is overwritten."""
+        suffix = f".{self.fmt}" if self.fmt else ''
+        return f"{bucket_name}/{self.slug}/{version}/{object_key}{suffix}"
+
+
+def _int_param(params, name, low, high):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def parse_transform(params):
+    """Build a TransformSpec from query params, or None when no transform was requested.
+    Raises ValueError on invalid input (the gateway maps it to HTTP 400)."""
+    if not any(params.get(p) for p in ('w', 'h', 'fit', 'fmt', 'q')):
+        return None
+    width = _int_param(params, 'w', 1, MAX_DIMENSION)
+    height = _int_param(params, 'h', 1, MAX_DIMENSION)
+    quality = _int_param(params, 'q', 1, 100) or 80
+    fit = (params.get('fit') or 'inside').lower()
+    if fit not in FITS:
+        raise ValueError(f"fit must be one of {', '.join(FITS)}")
+    if fit in ('cover', 'fill') and not (width and height):
+        raise ValueError(f"fit={fit} needs both w and h")
+    fmt = (params.get('fmt') or '').lower() or None
+    if fmt and fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(FORMATS)}")
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    return TransformSpec(width=width, height=height, fit=fit, fmt=fmt, quality=quality)
+
+
+def render(source_bytes, spec):
+    """Resize/re-encode image bytes according to spec. Returns (bytes, content_type)."""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed; image transforms are unavailable.")
+    try:
+        image = Image.open(io.BytesIO(source_bytes))
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"source image has too many pixels to transform ({e})")
+    image = ImageOps.exif_transpose(image)
+    pil_format, content_type = FORMATS.get(spec.fmt) or (image.format or 'PNG', None)
+    if pil_format in ('WEBP', 'AVIF') and not features.check(pil_format.lower()):
+        raise ValueError(f"{spec.fmt} encoding is not supported by this Pillow build")
+
+    width = spec.width or image.width
+    height = spec.height or image.height
+    if spec.fit == 'cover':
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    elif spec.fit == 'fill':
+        image = image.resize((width, height), Image.LANCZOS)
+    elif spec.fit == 'contain':
+        image = ImageOps.contain(image, (width, height), Image.LANCZOS)
+    else:  # inside: like contain, but never upscale
+        image.thumbnail((width, height), Image.LANCZOS)
+
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    save_kwargs = {'quality': spec.quality} if pil_format in ('JPEG', 'WEBP', 'AVIF') else {'optimize': True}
+    image.save(out, format=pil_format, **save_kwargs)
+    return out.getvalue(), content_type or Image.MIME.get(pil_format, 'application/octet-stream')
+
+
+def _ensure_store(store):
+    """Create the derivative bucket (with its expiry rule) on first use in this process."""
+    global _store_ready
+    if _store_ready:
+        return
+    if not store.bucket_exists(STORE.bucket_name):
+        store.make_bucket(STORE.bucket_name)
+        if LifecycleConfig is not None and DERIVATIVE_TTL_DAYS > 0:
+            store.set_bucket_lifecycle(STORE.bucket_name, LifecycleConfig([
+                Rule(ENABLED, rule_filter=Filter(prefix=''), rule_id='expire-derivatives',
+                     expiration=Expiration(days=DERIVATIVE_TTL_DAYS)),
+            ]))
+    _store_ready = True
+
+
+def _generate(client, store, bucket_name, object_key, spec, derivative_key):
+    source = client.get_object(bucket_name, object_key)
+    try:
+        size = int(source.headers.get('Content-Length') or 0)
+        if size > MAX_SOURCE_BYTES:
+            raise ValueError(f"source image is too large to transform ({size} bytes)")
+        data = source.read()
+    finally:
+        source.close()
+        source.release_conn()
+    rendered, content_type = render(data, spec)
+    _ensure_store(store)
+    store.put_object(STORE.bucket_name, derivative_key, io.BytesIO(rendered), length=len(rendered),
+                     content_type=content_type)
+    logger.info("Media derivative created: %s/%s (%d -> %d bytes)",
+                STORE.bucket_name, derivative_key, len(data), len(rendered))
+    return derivative_key
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS,
+                                           thread_name_prefix='nidhi-derivative')
+        return _executor
+
+
+def ensure_derivative(client, bucket_name, object_key, spec, store):
+    """Return the key (in STORE.bucket_name) of the derivative of the source's current version,
+    generating it (once) if missing. `client` reads the source; `store` is a client for STORE."""
+    source = client.stat_object(bucket_name, object_key)  # NoSuchKey: the gateway's 404
+    version = (source.etag or '').strip('"') or \
+        (source.last_modified.strftime('%Y%m%dT%H%M%S%f') if source.last_modified else 'unversioned')
+    derivative_key = spec.derivative_key(bucket_name, object_key, version)
+    try:
+        store.stat_object(STORE.bucket_name, derivative_key)
+        return derivative_key
+    except Exception as e:
+        if 'NoSuchKey' not in str(e) and 'NoSuchKey' not in type(e).__name__ \
+                and getattr(e, 'code', '') not in ('NoSuchKey', 'NoSuchObject'):
+            raise
+
+    flight_key = derivative_key
+    executor = _get_executor()
+    with _lock:
+        future = _inflight.get(flight_key)
+        created = future is None
+        if created:
+            future = executor.submit(_generate, client, store, bucket_name, object_key, spec, derivative_key)
+            _inflight[flight_key] = future
+    if created:
+        # Outside the lock: the callback runs inline if the future has already finished.
+        future.add_done_callback(lambda _f: _drop_inflight(flight_key))
+    try:
+        return future.result(timeout=DERIVATIVE_TIMEOUT)
+    except FutureTimeoutError:
+        raise DerivativeTimeout(f"image transform did not finish within {DERIVATIVE_TIMEOUT}s; retry shortly")
+
+
+def _drop_inflight(flight_key):
+    with _lock:
+        _inflight.pop(flight_key, None)
@@ -0,0 +1,83 @@
+"""Stateless HMAC-signed media URLs for the media gateway.
+
+A signed URL looks like:
+
+    /api/media/<bucket>/<key>?expires=<unix-ts>[&range=<start>-<end>]&sig=<b64url-hmac>
+
+The signature is HMAC-SHA256 over "<bucket>\\n<key>\\n<expires>\\n<range>" with the media signing
+key (NIDHI_MEDIA_SIGNING_KEY, falling back to NIDHI_APP_API_KEY — the secret apps already hold).
+Apps mint URLs offline with the SDK (nidhi_sdk.media.sign_media_url, same algorithm) and the
+gateway verifies them without touching the database. Because the secret is no longer in the URL,
+signed URLs can be shared with browsers/CDNs and cached until they expire.
+
+Image transform params (w/h/fit/fmt/q, see api.image_derivatives) are signed too: when any is
+present, "\\n<transform>" is appended to the message, where <transform> is canonical_transform()
+of the query ("w=320&fit=cover", fixed order, values as sent). Otherwise anyone holding one signed
+URL could make the gateway render and store arbitrarily many derivatives of the object.
+"""
+import re
+import time
+import hmac
+import base64
+import hashlib
+
+from django.conf import settings
+
+_RANGE_RE = re.compile(r'^(\d+)-(\d+)$')
+
+TRANSFORM_PARAMS = ('w', 'h', 'fit', 'fmt', 'q')
+
+
+def media_signing_key():
+    key = getattr(settings, 'NIDHI_MEDIA_SIGNING_KEY', '') or getattr(
+        settings, 'NIDHI_APP_API_KEY', 'super_secret_app_api_key_123')
+    return key.encode()
+
+
+def canonical_transform(params):
+    """The signed form of a request's transform params: 'w=320&fit=cover' ('' when none)."""
+    return '&'.join(f"{name}={params.get(name)}" for name in TRANSFORM_PARAMS
+                    if params.get(name) not in (None, ''))
+
+
+def compute_media_signature(bucket_name, object_key, expires, byte_range='', key=None, transform=''):
+    message = f"{bucket_name}\n{object_key}\n{expires}\n{byte_range or ''}"
+    if transform:
+        message += f"\n{transform}"
+    message = message.encode()
+    digest = hmac.new(key or media_signing_key(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def parse_byte_range(byte_range):
+    """'start-end' (inclusive) -> (offset, length); None if empty; raises ValueError if malformed."""
+    if not byte_range:
+        return None
+    match = _RANGE_RE.match(byte_range)
+    if not match:
+        raise ValueError("range must be '<start>-<end>'")
+    start, end = int(match.group(1)), int(match.group(2))
+    if end < start:
+        raise ValueError("range end must be >= start")
+    return start, end - start + 1
+
+
+def verify_media_signature(bucket_name, object_key, expires, byte_range, signature, now=None, transform=''):
+    """Returns (ok, reason). Constant-time comparison; no DB access. `transform` is the request's
+    canonical_transform()."""
+    if not expires or not signature:
+        return False, "missing expires/sig"
+    try:
+        expires_at = int(expires)
+    except (TypeError, ValueError):
+        return False, "malformed expires"
+    if expires_at < int(now if now is not None else time.time()):
+        return False, "expired"
+    try:
+        parse_byte_range(byte_range)
+    except ValueError as e:
+        return False, str(e)
+    expected = compute_media_signature(bucket_name, object_key, expires, byte_range, transform=transform)
+    if not hmac.compare_digest(expected, signature):
+        return False, "bad signature"
+    return True, ""
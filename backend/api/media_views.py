@@ -0,0 +1,238 @@
+"""Async media gateway (ASGI).
+
+`views.serve_media` is a sync DRF view: under runserver/gunicorn every download holds a worker
+thread until the last byte reaches the client, so a few hundred slow mobile clients exhaust the
+pool. This gateway serves the same URLs with the same auth, ownership checks, transforms, cache
+headers and access log, but streams MinIO -> client on the event loop:
+
+  * the object is fetched with httpx.AsyncClient from a presigned GET minted by the pooled MinIO
+    client (signing is local; nothing extra is exposed), one chunk at a time;
+  * the next chunk is only read from MinIO after the previous one was handed to the ASGI server,
+    which blocks `send` while the client's socket buffer is full — a slow client slows its own
+    upstream read instead of buffering the object in memory (backpressure);
+  * concurrent streams per process are capped (NIDHI_ASYNC_MEDIA_MAX_STREAMS) -> 503 beyond it.
+
+Run it with uvicorn (`nidhi_backend.asgi:application`, see docker-compose `media-gateway`).
+With NIDHI_ASYNC_MEDIA_GATEWAY=1 that process routes /api/media/ here; /api/media-stream/ is
+always available. Under WSGI the view still works, but Django buffers the async stream.
+In NIDHI_MEDIA_GATEWAY_MODE=accel the bytes are handed to nginx instead, as in views.serve_media.
+"""
+import asyncio
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .storage import MINIO_ENDPOINT, get_bucket_config, peek_bucket_config, get_client
+from .image_derivatives import parse_transform, ensure_derivative, DerivativeTimeout, STORE as DERIVATIVE_STORE
+from . import metering
+from .views import (_authenticate_media_request, _media_cache_control, _media_accel_enabled,
+                    _media_accel_response)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.environ.get('NIDHI_ASYNC_MEDIA_CHUNK_SIZE', str(64 * 1024)))
+MAX_STREAMS = int(os.environ.get('NIDHI_ASYNC_MEDIA_MAX_STREAMS', '4000'))
+UPSTREAM_TIMEOUT = float(os.environ.get('NIDHI_ASYNC_MEDIA_UPSTREAM_TIMEOUT', '30'))
+PRESIGN_TTL = timedelta(minutes=5)
+
+# Headers copied from MinIO's response to the client.
+_PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'ETag', 'Last-Modified')
+
+_http = None            # (event loop, httpx.AsyncClient) — one client per worker loop
+_active_streams = 0
+_streams_lock = threading.Lock()
+
+
+def _http_client():
+    """Shared AsyncClient for the running loop (connection pool reused across requests)."""
+    global _http
+    loop = asyncio.get_running_loop()
+    if _http is None or _http[0] is not loop:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=MAX_STREAMS, max_keepalive_connections=100),
+        )
+        _http = (loop, client)
+    return _http[1]
+
+
+def _acquire_stream_slot():
+    global _active_streams
+    with _streams_lock:
+        if _active_streams >= MAX_STREAMS:
+            return False
+        _active_streams += 1
+        return True
+
+
+def _release_stream_slot():
+    global _active_streams
+    with _streams_lock:
+        _active_streams -= 1
+
+
+def _error(message, http_status):
+    return JsonResponse({"error": message}, status=http_status)
+
+
+class _UpstreamBody:
+    """Async iterable over MinIO's response body.
+
+    Django calls close() (from a worker thread) once the response is finished or the client went
+    away; that frees the stream slot, meters the bytes actually sent and returns the upstream
+    connection to the pool.
+    """
+
+    def __init__(self, upstream, meter_key):
+        self._upstream = upstream
+        self._meter_key = meter_key
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        self.sent = 0
+
+    async def _chunks(self):
+        async for chunk in self._upstream.aiter_raw(CHUNK_SIZE):
+            self.sent += len(chunk)
+            yield chunk
+
+    def __aiter__(self):
+        return self._chunks()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        _release_stream_slot()
+        metering.record(*self._meter_key, nbytes=self.sent)
+        try:
+            self._loop.call_soon_threadsafe(asyncio.ensure_future, self._upstream.aclose())
+        except RuntimeError:
+            pass  # loop already gone (WSGI / tests): the body was fully read and closed by httpx
+
+
+async def serve_media_async(request, bucket_name, object_key):
+    """
+    Async twin of views.serve_media. Same URL contract and responses:
+
+    GET /api/media-stream/<bucket_name>/<object_key>?expires=<ts>[&range=<a>-<b>]&sig=<hmac>
+    GET /api/media-stream/<bucket_name>/<object_key>?api_key=<key>   (legacy)
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return _error("Method not allowed", 405)
+    if httpx is None:
+        return _error("httpx not installed; async media gateway unavailable.", 500)
+
+    key_hash, byte_range, expires_at, auth_error = _authenticate_media_request(request, bucket_name, object_key)
+    if auth_error:
+        return _error(*auth_error)
+
+    bucket = peek_bucket_config(bucket_name) or await sync_to_async(get_bucket_config)(bucket_name)
+    if bucket is None or bucket.status != 'available':
+        logger.warning("Media gateway: bucket not found: %s", bucket_name)
+        return _error("Bucket not found", 404)
+    if not bucket.product_name:
+        logger.warning("Media gateway: orphaned bucket %s (no product)", bucket_name)
+        return _error("Bucket has no associated product", 403)
+
+    response = await _fetch_media(request, bucket, bucket_name, object_key, key_hash, byte_range, expires_at)
+    if not isinstance(response, StreamingHttpResponse):
+        # Streams are metered by _UpstreamBody.close() with the bytes actually sent.
+        metering.record(bucket_name, bucket.product_id, key_hash, response.status_code, 0)
+    return response
+
+
+async def _fetch_media(request, bucket, bucket_name, object_key, key_hash, byte_range, expires_at):
+    try:
+        transform = parse_transform(request.GET)
+    except ValueError as e:
+        return _error(str(e), 400)
+    if transform and byte_range:
+        return _error("range cannot be combined with image transforms", 400)
+
+    client = get_client(MINIO_ENDPOINT, bucket.access_key, bucket.secret_key)
+    if not client:
+        return _error("MinIO not available", 500)
+
+    ip = request.META.get('HTTP_X_FORWARDED_FOR', request.META.get('REMOTE_ADDR', ''))
+    fetch_from, fetch_bucket, fetch_key = bucket, bucket_name, object_key
+    try:
+        if transform:
+            store = get_client(DERIVATIVE_STORE.endpoint, DERIVATIVE_STORE.access_key, DERIVATIVE_STORE.secret_key)
+            # Resizing is CPU/IO bound — keep it off the event loop (single-flight inside).
+            try:
+                fetch_key = await sync_to_async(ensure_derivative, thread_sensitive=False)(
+                    client, bucket_name, object_key, transform, store)
+                client, fetch_from, fetch_bucket = store, DERIVATIVE_STORE, DERIVATIVE_STORE.bucket_name
+            except DerivativeTimeout as e:
+                return _error(str(e), 504)
+            except (ValueError, OSError) as e:
+                return _error(f"Cannot transform image: {e}", 400)
+        if _media_accel_enabled(request):
+            if metering.should_log():
+                logger.info(
+                    "Media access: key=%s bucket=%s object=%s product=%s ip=%s size=accel",
+                    key_hash, bucket_name, object_key, bucket.product_name, ip,
+                )
+            return await sync_to_async(_media_accel_response, thread_sensitive=False)(
+                fetch_from, fetch_bucket, fetch_key, byte_range, expires_at)
+        # Signing is local, but may do a one-off bucket-location lookup per bucket.
+        url = await sync_to_async(client.get_presigned_url, thread_sensitive=False)(
+            request.method, fetch_bucket, fetch_key, expires=PRESIGN_TTL)
+    except Exception as e:
+        if 'NoSuchKey' in str(e) or 'NoSuchKey' in type(e).__name__:
+            return _error("Object not found", 404)
+        logger.error("Media gateway: fetch failed for %s/%s: %s", bucket_name, object_key, e)
+        return _error(f"Media fetch failed: {e}", 500)
+
+    if not _acquire_stream_slot():
+        logger.warning("Media gateway: stream limit (%d) reached, shedding %s/%s",
+                       MAX_STREAMS, bucket_name, object_key)
+        return _error("Media gateway busy, retry shortly", 503)
+
+    headers = {}
+    if byte_range:
+        headers['Range'] = f"bytes={byte_range[0]}-{byte_range[0] + byte_range[1] - 1}"
+    http = _http_client()
+    try:
+        upstream = await http.send(http.build_request(request.method, url, headers=headers), stream=True)
+    except httpx.HTTPError as e:
+        _release_stream_slot()
+        logger.error("Media gateway: fetch failed for %s/%s: %s", bucket_name, object_key, e)
+        return _error(f"Media fetch failed: {e}", 502)
+
+    if upstream.status_code not in (200, 206):
+        _release_stream_slot()
+        await upstream.aclose()
+        if upstream.status_code == 404:
+            return _error("Object not found", 404)
+        logger.error("Media gateway: MinIO returned %d for %s/%s",
+                     upstream.status_code, bucket_name, fetch_key)
+        return _error(f"Media fetch failed: upstream status {upstream.status_code}", 502)
+
+    if metering.should_log():
+        logger.info(
+            "Media access: key=%s bucket=%s object=%s product=%s ip=%s size=%s",
+            key_hash, bucket_name, object_key, bucket.product_name, ip,
+            upstream.headers.get('Content-Length', '-'),
+        )
+
+    status_code = 206 if byte_range else 200
+    response = StreamingHttpResponse(
+        _UpstreamBody(upstream, (bucket_name, bucket.product_id, key_hash, status_code)),
+        content_type=upstream.headers.get('Content-Type', 'application/octet-stream'),
+        status=status_code,
+    )
+    for name in _PASSTHROUGH_HEADERS[1:]:
+        if name in upstream.headers and (byte_range or name != 'Content-Range'):
+            response[name] = upstream.headers[name]
+    response['Cache-Control'] = _media_cache_control(expires_at)
+    return response
@@ -0,0 +1,163 @@
+"""Aggregated media-gateway metering.
+
+The gateway used to write one INFO line per object fetched, which was both our only usage record
+and a growing log bill. Instead, each worker process keeps counters per (bucket, key hash, hour
+the request was served in):
+
+    requests, bytes, and responses by status class (2xx/3xx/4xx/5xx)
+
+and flushes them every NIDHI_MEDIA_METER_FLUSH_SECONDS (default 60) — and at exit — into
+MediaUsageRollup rows at hour and day granularity, using F() increments so any number of
+gateway processes can add to the same row. Flushing runs on a per-process timer thread, started
+by the first record(), so neither the sync view nor the event loop waits on Postgres, and a
+worker that goes quiet still writes its counts within a flush interval. The hour is taken when
+the request is counted, not when it is flushed, so counts never slide into the next hour or day.
+
+Per-request access lines are still available, sampled: NIDHI_MEDIA_LOG_SAMPLE_RATE (0.0-1.0,
+default 0) of requests are logged in full.
+
+Bytes are what the gateway sent; in X-Accel-Redirect mode nginx sends the body, so those requests
+are counted with 0 bytes (nginx's access log has the size).
+"""
+import os
+import atexit
+import random
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = int(os.environ.get('NIDHI_MEDIA_METER_FLUSH_SECONDS', '60'))
+LOG_SAMPLE_RATE = float(os.environ.get('NIDHI_MEDIA_LOG_SAMPLE_RATE', '0'))
+
+_lock = threading.Lock()
+# (bucket, product_id, key_hash, hour as a unix timestamp) -> see _FIELDS
+_counters = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+_FIELDS = ('requests', 'bytes', 'status_2xx', 'status_3xx', 'status_4xx', 'status_5xx')
+_flusher_pid = None  # process the timer thread runs in (a forked worker starts its own)
+
+
+@lru_cache(maxsize=64)
+def api_key_hash(api_key):
+    """Short, stable identifier for an API key (memoised: the same few keys hit every request)."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def should_log():
+    """True for the sampled fraction of requests that get a detailed access log line."""
+    return LOG_SAMPLE_RATE > 0 and random.random() < LOG_SAMPLE_RATE
+
+
+def record(bucket_name, product_id, key_hash, status_code, nbytes=0):
+    """Count one gateway response. Cheap: a dict update under a lock."""
+    status_class = min(max(int(status_code) // 100, 2), 5)
+    hour = int(time.time()) // 3600 * 3600
+    with _lock:
+        row = _counters[(bucket_name, product_id, key_hash or '-', hour)]
+        row[0] += 1
+        row[1] += int(nbytes or 0)
+        row[status_class] += 1
+    _ensure_flusher()
+
+
+def _ensure_flusher():
+    """Start this process's flush timer thread unless it is already running."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name='nidhi-media-meter', daemon=True).start()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            logger.error("Media metering: periodic flush failed: %s", e)
+        finally:
+            close_old_connections()
+
+
+def _take_counters():
+    with _lock:
+        pending = dict(_counters)
+        _counters.clear()
+    return pending
+
+
+def _restore_counters(pending):
+    with _lock:
+        for key, values in pending.items():
+            row = _counters[key]
+            for i, value in enumerate(values):
+                row[i] += value
+
+
+def _upsert(model, lookup, product_id, values):
+    increments = {name: F(name) + value for name, value in zip(_FIELDS, values) if value}
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(product_id=product_id, **lookup, **dict(zip(_FIELDS, values)))
+    except IntegrityError:
+        # Another process created the row between our UPDATE and INSERT.
+        model.objects.filter(**lookup).update(**increments)
+
+
+def flush():
+    """Write pending counters into MediaUsageRollup (hour + day rows of the hour each request was
+    counted in). Returns rows touched. On a DB error the counters are put back and retried on the
+    next flush."""
+    from .models import MediaUsageRollup
+
+    pending = _take_counters()
+    if not pending:
+        return 0
+    touched = 0
+    try:
+        # One transaction: on failure nothing was written, so restoring the counters can't double count.
+        with transaction.atomic():
+            for (bucket_name, product_id, key_hash, hour_ts), values in pending.items():
+                hour = datetime.fromtimestamp(hour_ts, dt_timezone.utc)
+                for granularity, period_start in (('hour', hour), ('day', hour.replace(hour=0))):
+                    _upsert(MediaUsageRollup, {
+                        'bucket_name': bucket_name, 'key_hash': key_hash,
+                        'granularity': granularity, 'period_start': period_start,
+                    }, product_id, values)
+                    touched += 1
+    except Exception as e:
+        logger.error("Media metering: flush failed, will retry: %s", e)
+        _restore_counters(pending)
+        return 0
+    return touched
+
+
+def prune_hourly(retention_days):
+    """Delete hourly rollups older than retention_days (daily rows are kept)."""
+    from .models import MediaUsageRollup
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = MediaUsageRollup.objects.filter(granularity='hour', period_start__lt=cutoff).delete()
+    return deleted
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception as e:  # interpreter shutdown: DB may already be gone
+        logger.warning("Media metering: final flush failed: %s", e)
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_add_audit_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_name', models.CharField(max_length=63)),
+                ('key_hash', models.CharField(help_text="sha256(api_key)[:12], 'signed' or '-'", max_length=16)),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('requests', models.BigIntegerField(default=0)),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('status_2xx', models.BigIntegerField(default=0)),
+                ('status_3xx', models.BigIntegerField(default=0)),
+                ('status_4xx', models.BigIntegerField(default=0)),
+                ('status_5xx', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='media_usage', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'granularity', 'period_start'], name='api_mediaus_product_8a0d2a_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mediausagerollup',
+            constraint=models.UniqueConstraint(fields=('bucket_name', 'key_hash', 'granularity', 'period_start'), name='uniq_media_usage_period'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_media_usage_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('move', 'Move Folder')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('rolled_back', 'Rolled Back')], default='pending', max_length=20)),
+                ('phase', models.CharField(choices=[('copy', 'Copy'), ('delete', 'Delete Source'), ('rollback', 'Rollback'), ('done', 'Done')], default='copy', max_length=20)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('cursor', models.CharField(blank=True, default='', max_length=1024)),
+                ('total', models.BigIntegerField(default=0, help_text='Objects seen so far in the current phase')),
+                ('processed', models.BigIntegerField(default=0)),
+                ('failed', models.BigIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list, help_text='[{key, error}], capped')),
+                ('created_by_sso_id', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('bucket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='api.storagebucket')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
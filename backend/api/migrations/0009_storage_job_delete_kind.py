@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_storage_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storagejob',
+            name='kind',
+            field=models.CharField(choices=[('move', 'Move Folder'), ('delete', 'Delete Folder')], max_length=20),
+        ),
+    ]
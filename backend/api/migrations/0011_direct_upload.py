@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('key_prefix', models.CharField(max_length=1024)),
+                ('max_size', models.BigIntegerField()),
+                ('content_type', models.CharField(blank=True, default='', help_text="Exact type, or a prefix ending in '/' (e.g. image/); blank = any", max_length=255)),
+                ('expires_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('issued', 'Issued'), ('completed', 'Completed'), ('rejected', 'Rejected')], default='issued', max_length=20)),
+                ('object_name', models.CharField(blank=True, default='', max_length=1024)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, default='', max_length=255)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_by', models.CharField(blank=True, default='', help_text="SSO user id or 'app'", max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('bucket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='direct_uploads', to='api.storagebucket')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_direct_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storagejob',
+            name='kind',
+            field=models.CharField(choices=[('move', 'Move Folder'), ('delete', 'Delete Folder'), ('relocate', 'Relocate Bucket')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='storagejob',
+            name='phase',
+            field=models.CharField(choices=[('copy', 'Copy'), ('delete', 'Delete Source'), ('rollback', 'Rollback'), ('sync', 'Final Sync'), ('switch', 'Switch Endpoint'), ('done', 'Done')], default='copy', max_length=20),
+        ),
+    ]
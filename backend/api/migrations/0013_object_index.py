@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_storage_job_relocate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObjectIndex',
+            fields=[
+                ('bucket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='object_index', serialize=False, to='api.storagebucket')),
+                ('enabled', models.BooleanField(default=True)),
+                ('object_count', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, help_text='Last full listing pass; null = not usable yet', null=True)),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+                ('notifications_error', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StorageObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_collation='C', max_length=1024)),
+                ('size', models.BigIntegerField(default=0)),
+                ('etag', models.CharField(blank=True, default='', max_length=255)),
+                ('last_modified', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.CharField(blank=True, default='', max_length=255)),
+                ('sequencer', models.CharField(blank=True, default='', help_text='MinIO event sequencer (hex)', max_length=32)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bucket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indexed_objects', to='api.storagebucket')),
+            ],
+            options={
+                'unique_together': {('bucket', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_object_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('query', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('cancelled', 'Cancelled'), ('expired', 'Results Expired')], default='queued', max_length=20)),
+                ('timeout_ms', models.IntegerField(help_text='statement_timeout applied to the query')),
+                ('backend_pid', models.IntegerField(blank=True, help_text='Tenant backend running the query', null=True)),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('columns', models.JSONField(blank=True, default=list)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('truncated_by', models.CharField(blank=True, default='', help_text="'rows' / 'bytes' cap hit", max_length=10)),
+                ('page_rows', models.IntegerField(default=0)),
+                ('page_count', models.IntegerField(default=0)),
+                ('result_bytes', models.BigIntegerField(default=0, help_text='Compressed size of the spooled pages')),
+                ('error', models.TextField(blank=True, default='')),
+                ('submitted_by', models.CharField(blank=True, default='', max_length=255)),
+                ('role', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='query_jobs', to='api.databaseinstance')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_query_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryStatSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('stats_reset', models.DateTimeField(blank=True, null=True)),
+                ('counters', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='', help_text='Why the last collection failed, if it did')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('server', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='query_stat_snapshot', to='api.databaseserver')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QueryStatDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('database', models.CharField(max_length=63)),
+                ('username', models.CharField(blank=True, default='', max_length=63)),
+                ('queryid', models.BigIntegerField(blank=True, help_text="Null: the database's other statements", null=True)),
+                ('query', models.TextField(blank=True, default='')),
+                ('period_start', models.DateTimeField()),
+                ('period_end', models.DateTimeField()),
+                ('calls', models.BigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('shared_blks_hit', models.BigIntegerField(default=0)),
+                ('shared_blks_read', models.BigIntegerField(default=0)),
+                ('instance', models.ForeignKey(blank=True, help_text='Nidhi instance owning `database`, if any', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='query_stats', to='api.databaseinstance')),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='query_stats', to='api.databaseserver')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['server', 'period_end'], name='api_queryst_server__dbd2a9_idx'), models.Index(fields=['instance', 'period_end'], name='api_queryst_instanc_a92495_idx')],
+            },
+        ),
+    ]
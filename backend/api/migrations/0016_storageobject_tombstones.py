@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_query_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storageobject',
+            name='deleted',
+            field=models.BooleanField(default=False, help_text='Tombstone: removed, kept for its sequencer until the next reconcile'),
+        ),
+    ]
@@ -195,6 +195,304 @@ class StorageBucket(models.Model):
         return f"Bucket {self.bucket_name} ({self.status})"
 
 
+class StorageJob(models.Model):
+    """A long-running bucket operation (folder move / delete, relocation) executed by a Celery worker.
+
+    The row is the job's journal: `phase` + `cursor` (last key fully handled, in listing order)
+    are saved after every batch, so a job interrupted by a timeout / worker restart can be resumed
+    from where it stopped, or — while no source object has been deleted yet — rolled back.
+    """
+    KIND_CHOICES = [('move', 'Move Folder'), ('delete', 'Delete Folder'), ('relocate', 'Relocate Bucket')]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('rolled_back', 'Rolled Back'),
+    ]
+    PHASE_CHOICES = [
+        ('copy', 'Copy'), ('delete', 'Delete Source'), ('rollback', 'Rollback'),
+        ('sync', 'Final Sync'), ('switch', 'Switch Endpoint'), ('done', 'Done'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    bucket = models.ForeignKey(StorageBucket, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    phase = models.CharField(max_length=20, choices=PHASE_CHOICES, default='copy')
+    params = models.JSONField(default=dict, blank=True)
+    cursor = models.CharField(max_length=1024, blank=True, default='')
+
+    total = models.BigIntegerField(default=0, help_text="Objects seen so far in the current phase")
+    processed = models.BigIntegerField(default=0)
+    failed = models.BigIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True, help_text="[{key, error}], capped")
+
+    created_by_sso_id = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} {self.bucket_id} [{self.status}/{self.phase}] {self.processed}/{self.total}"
+
+
+class UploadSession(models.Model):
+    """A resumable upload, backed by one MinIO multipart upload (api.uploads).
+
+    Parts are streamed from the request body straight to MinIO's UploadPart — Django never spools
+    the file — and recorded as UploadPart rows, so a client that lost its connection asks for the
+    session and re-sends only the missing parts. Sessions not completed within
+    NIDHI_UPLOAD_SESSION_TTL_HOURS are aborted by `abort_stale_upload_sessions`.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    bucket = models.ForeignKey(StorageBucket, on_delete=models.CASCADE, related_name='upload_sessions')
+    object_name = models.CharField(max_length=1024)
+    content_type = models.CharField(max_length=255, default='application/octet-stream')
+    upload_id = models.CharField(max_length=255, help_text="MinIO multipart upload id")
+    part_size = models.BigIntegerField()
+    total_size = models.BigIntegerField(null=True, blank=True, help_text="Declared by the client, if known")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    etag = models.CharField(max_length=255, blank=True, default='', help_text="Final object ETag")
+
+    created_by_sso_id = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.bucket_id}/{self.object_name} [{self.status}]"
+
+
+class UploadPart(models.Model):
+    """One part of an UploadSession as acknowledged by MinIO (re-uploading a part replaces it)."""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='parts')
+    part_number = models.PositiveIntegerField()
+    size = models.BigIntegerField()
+    etag = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64)
+    uploaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('session', 'part_number')
+        ordering = ['part_number']
+
+
+class DirectUpload(models.Model):
+    """A presigned POST grant: one browser/app upload straight to MinIO (api.direct_uploads).
+
+    The policy pins the key prefix, size range and content type, so the backend is out of the data
+    path. The uploader calls the completion endpoint afterwards; Nidhi stats the object, checks it
+    against the grant and records it here (objects that break the grant are deleted).
+    """
+    STATUS_CHOICES = [
+        ('issued', 'Issued'),
+        ('completed', 'Completed'),
+        ('rejected', 'Rejected'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    bucket = models.ForeignKey(StorageBucket, on_delete=models.CASCADE, related_name='direct_uploads')
+    key_prefix = models.CharField(max_length=1024)
+    max_size = models.BigIntegerField()
+    content_type = models.CharField(max_length=255, blank=True, default='',
+                                    help_text="Exact type, or a prefix ending in '/' (e.g. image/); blank = any")
+    expires_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='issued')
+
+    object_name = models.CharField(max_length=1024, blank=True, default='')
+    size = models.BigIntegerField(null=True, blank=True)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    created_by = models.CharField(max_length=255, blank=True, default='', help_text="SSO user id or 'app'")
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.bucket_id}/{self.key_prefix}* [{self.status}]"
+
+
+class ObjectIndex(models.Model):
+    """Per-bucket state of the Postgres object index (api.object_index): whether it is kept, and
+    the running usage totals (folder "x/" markers excluded) so usage never needs a bucket listing.
+    Totals move with each MinIO event and are recomputed exactly by every reconciliation."""
+    bucket = models.OneToOneField(StorageBucket, on_delete=models.CASCADE, primary_key=True, related_name='object_index')
+    enabled = models.BooleanField(default=True)
+    object_count = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True, help_text="Last full listing pass; null = not usable yet")
+    last_event_at = models.DateTimeField(null=True, blank=True)
+    notifications_error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Index {self.bucket_id}: {self.object_count} objects / {self.total_size} bytes"
+
+
+class StorageObject(models.Model):
+    """One object of an indexed bucket. `key` uses the "C" collation so ORDER BY matches S3's
+    byte-wise listing order (reconciliation merge-joins the two) and LIKE 'prefix%' can use
+    the (bucket, key) unique index. Removed objects stay as `deleted` tombstones (never listed
+    or counted) so an older ObjectCreated delivered late cannot bring them back."""
+    bucket = models.ForeignKey(StorageBucket, on_delete=models.CASCADE, related_name='indexed_objects')
+    key = models.CharField(max_length=1024, db_collation='C')
+    size = models.BigIntegerField(default=0)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_modified = models.DateTimeField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    sequencer = models.CharField(max_length=32, blank=True, default='', help_text="MinIO event sequencer (hex)")
+    deleted = models.BooleanField(default=False, help_text="Tombstone: removed, kept for its sequencer until the next reconcile")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('bucket', 'key')
+
+    def __str__(self):
+        return f"{self.bucket_id}:{self.key}"
+
+
+class MediaUsageRollup(models.Model):
+    """Media gateway usage per bucket / API-key hash, rolled up per hour and per day.
+    Written by api.metering (counter flushes from every gateway process); read by the
+    per-product bandwidth API. Replaces grepping per-request access log lines."""
+    GRANULARITY_CHOICES = [('hour', 'Hour'), ('day', 'Day')]
+
+    bucket_name = models.CharField(max_length=63)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, related_name='media_usage', null=True, blank=True)
+    key_hash = models.CharField(max_length=16, help_text="sha256(api_key)[:12], 'signed' or '-'")
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    period_start = models.DateTimeField()
+
+    requests = models.BigIntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+    status_2xx = models.BigIntegerField(default=0)
+    status_3xx = models.BigIntegerField(default=0)
+    status_4xx = models.BigIntegerField(default=0)
+    status_5xx = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket_name', 'key_hash', 'granularity', 'period_start'],
+                                    name='uniq_media_usage_period'),
+        ]
+        indexes = [models.Index(fields=['product', 'granularity', 'period_start'])]
+
+    def __str__(self):
+        return f"{self.bucket_name} {self.granularity} {self.period_start:%Y-%m-%d %H:00}: {self.bytes} bytes"
+
+
+class QueryJob(models.Model):
+    """An asynchronous Studio query, executed by the `run_query_job` Celery task (api.query_jobs).
+
+    The worker records the Postgres backend pid it runs on, so the query can be cancelled with
+    pg_cancel_backend from any process, and runs it under a statement_timeout chosen by the
+    submitter's role. Rows are spooled to MinIO as compressed column-major pages
+    (`page_count` pages of up to `page_rows` rows), fetched page by page and purged after
+    NIDHI_QUERY_RESULT_TTL_HOURS.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Results Expired'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    instance = models.ForeignKey(DatabaseInstance, on_delete=models.CASCADE, related_name='query_jobs')
+    query = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    timeout_ms = models.IntegerField(help_text="statement_timeout applied to the query")
+    backend_pid = models.IntegerField(null=True, blank=True, help_text="Tenant backend running the query")
+    cancel_requested = models.BooleanField(default=False)
+
+    columns = models.JSONField(default=list, blank=True)
+    row_count = models.BigIntegerField(default=0)
+    truncated_by = models.CharField(max_length=10, blank=True, default='', help_text="'rows' / 'bytes' cap hit")
+    page_rows = models.IntegerField(default=0)
+    page_count = models.IntegerField(default=0)
+    result_bytes = models.BigIntegerField(default=0, help_text="Compressed size of the spooled pages")
+    error = models.TextField(blank=True, default='')
+
+    submitted_by = models.CharField(max_length=255, blank=True, default='')
+    role = models.CharField(max_length=50, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Query job {self.id} on {self.instance_id} [{self.status}] {self.row_count} rows"
+
+
+class QueryStatSnapshot(models.Model):
+    """The last pg_stat_statements counters collected from a server (api.query_stats): the baseline
+    the next collection is diffed against. `counters` maps "dbid:userid:queryid" to cumulative
+    [calls, total_ms, rows, shared_blks_hit, shared_blks_read]; `stats_reset` detects a
+    pg_stat_statements_reset() between collections."""
+    server = models.OneToOneField(DatabaseServer, on_delete=models.CASCADE, related_name='query_stat_snapshot')
+    taken_at = models.DateTimeField()
+    stats_reset = models.DateTimeField(null=True, blank=True)
+    counters = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='', help_text="Why the last collection failed, if it did")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"pg_stat_statements snapshot of {self.server.name} at {self.taken_at}"
+
+
+class QueryStatDelta(models.Model):
+    """What one statement cost a server between two collections (period_start, period_end].
+
+    Only the NIDHI_QUERY_STATS_TOP statements with the most execution time per interval are
+    kept one by one; the rest of each database's statements are folded into one row with a null
+    `queryid`, so per-database totals stay exact. Pruned after NIDHI_QUERY_STATS_RETENTION_DAYS.
+    """
+    server = models.ForeignKey(DatabaseServer, on_delete=models.CASCADE, related_name='query_stats')
+    instance = models.ForeignKey(DatabaseInstance, on_delete=models.SET_NULL, related_name='query_stats',
+                                 null=True, blank=True, help_text="Nidhi instance owning `database`, if any")
+    database = models.CharField(max_length=63)
+    username = models.CharField(max_length=63, blank=True, default='')
+    queryid = models.BigIntegerField(null=True, blank=True, help_text="Null: the database's other statements")
+    query = models.TextField(blank=True, default='')
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+
+    calls = models.BigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    rows = models.BigIntegerField(default=0)
+    shared_blks_hit = models.BigIntegerField(default=0)
+    shared_blks_read = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['server', 'period_end']),
+            models.Index(fields=['instance', 'period_end']),
+        ]
+
+    def __str__(self):
+        return f"{self.database} {self.queryid} {self.period_end:%Y-%m-%d %H:%M}: {self.calls} calls, {self.total_ms:.0f} ms"
+
+
 class AuditLog(models.Model):
     """Nidhi Audit Trail (SCRUM data-safety): every provision / delete / backup / restore /
     replicate / liveness-change action is recorded here so an operator can always trace WHO did
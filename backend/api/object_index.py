@@ -0,0 +1,304 @@
+"""Postgres index of bucket objects (StorageObject rows + ObjectIndex totals).
+
+Object counts, bucket size and folder aggregates used to need a full ListObjects walk. With the
+index enabled for a bucket:
+
+  * MinIO publishes ObjectCreated / ObjectRemoved events to its `nidhi` webhook target
+    (MINIO_NOTIFY_WEBHOOK_*_NIDHI, see docker-compose) which posts them to /api/storage/events/;
+    each event upserts one row (or turns it into a `deleted` tombstone) and moves the bucket
+    totals. Events carry a per-object sequencer, so a late, older event never overwrites a newer
+    one; the tombstone keeps the removal's sequencer for that;
+  * `reconcile` (Celery beat, and right after enabling) merge-joins a full listing with the rows
+    in key order, fixing whatever notifications missed (MinIO down, webhook unreachable) and
+    purging tombstones, then recomputes the totals exactly;
+  * usage, prefix search and the Studio tree are answered with indexed SQL.
+"""
+import os
+import logging
+from urllib.parse import unquote_plus
+
+from django.db import transaction
+from django.db.models import Count, Sum, Q, F, Value, Func, CharField
+from django.db.models.functions import Substr
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import StorageObject, ObjectIndex
+
+try:
+    from minio.notificationconfig import NotificationConfig, QueueConfig
+except ImportError:
+    NotificationConfig = QueueConfig = None
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ARN = os.environ.get('NIDHI_MINIO_WEBHOOK_ARN', 'arn:minio:sqs::NIDHI:webhook')
+EVENTS = ['s3:ObjectCreated:*', 's3:ObjectRemoved:*']
+RECONCILE_BATCH = 1000
+
+
+def _is_marker(key):
+    return key.endswith('/')
+
+
+def _seq(value):
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _adjust_totals(bucket_id, count, size, event_time=None):
+    changes = {}
+    if count:
+        changes['object_count'] = F('object_count') + count
+    if size:
+        changes['total_size'] = F('total_size') + size
+    if event_time:
+        changes['last_event_at'] = event_time
+    if changes:
+        ObjectIndex.objects.filter(bucket_id=bucket_id).update(**changes)
+
+
+# ---------------------------------------------------------------------------
+# Notifications
+# ---------------------------------------------------------------------------
+def enable_notifications(bucket, client):
+    """Point the bucket's object events at the Nidhi webhook target. Returns an error or ''."""
+    try:
+        config = NotificationConfig(queue_config_list=[
+            QueueConfig(queue=WEBHOOK_ARN, events=EVENTS, config_id='nidhi-object-index'),
+        ])
+        client.set_bucket_notification(bucket.bucket_name, config)
+        return ''
+    except Exception as e:
+        logger.warning("Object index: cannot configure notifications for %s: %s", bucket.bucket_name, e)
+        return str(e)
+
+
+def apply_event(bucket_id, record):
+    """Apply one S3 event record to the index. Returns True if the index changed."""
+    event = record.get('eventName', '')
+    s3 = record.get('s3', {})
+    obj = s3.get('object', {})
+    key = unquote_plus(obj.get('key', ''))
+    if not key:
+        return False
+    sequencer = obj.get('sequencer', '')
+    event_time = parse_datetime(record.get('eventTime', '') or '') or timezone.now()
+
+    with transaction.atomic():
+        row = StorageObject.objects.select_for_update().filter(bucket_id=bucket_id, key=key).first()
+        if row is not None and row.sequencer and _seq(sequencer) <= _seq(row.sequencer):
+            return False  # out-of-order delivery: we already have a newer state
+        counted = 0 if _is_marker(key) else 1
+
+        if event.startswith('s3:ObjectRemoved'):
+            if row is None:
+                # Removed before its (delayed) creation arrived: the tombstone will ignore it.
+                StorageObject.objects.create(bucket_id=bucket_id, key=key, sequencer=sequencer, deleted=True)
+                return False
+            live = not row.deleted
+            old_size = row.size
+            row.deleted, row.size, row.sequencer = True, 0, sequencer
+            row.save()
+            if live:
+                _adjust_totals(bucket_id, -counted, -old_size, event_time)
+            return live
+
+        if not event.startswith('s3:ObjectCreated'):
+            return False
+        size = int(obj.get('size') or 0)
+        fields = {
+            'size': size,
+            'etag': (obj.get('eTag') or '').strip('"'),
+            'content_type': obj.get('contentType') or '',
+            'last_modified': event_time,
+            'sequencer': sequencer,
+            'deleted': False,
+        }
+        if row is None:
+            StorageObject.objects.create(bucket_id=bucket_id, key=key, **fields)
+            _adjust_totals(bucket_id, counted, size, event_time)
+        else:
+            revived = row.deleted
+            old_size = row.size
+            for name, value in fields.items():
+                setattr(row, name, value)
+            row.save()
+            _adjust_totals(bucket_id, counted if revived else 0, size - old_size, event_time)
+        return True
+
+
+def handle_notification(payload):
+    """Webhook body from MinIO ({"EventName", "Key", "Records": [...]}). Returns rows changed."""
+    changed = 0
+    buckets = {}
+    for record in payload.get('Records') or []:
+        name = record.get('s3', {}).get('bucket', {}).get('name')
+        if name not in buckets:
+            buckets[name] = ObjectIndex.objects.filter(bucket__bucket_name=name, enabled=True) \
+                .values_list('bucket_id', flat=True).first()
+        if buckets[name]:
+            changed += apply_event(buckets[name], record)
+    return changed
+
+
+# ---------------------------------------------------------------------------
+# Reconciliation
+# ---------------------------------------------------------------------------
+def _listing_fields(obj):
+    metadata = obj.metadata or {}
+    content_type = metadata.get('content-type') or metadata.get('Content-Type') or ''
+    return {
+        'size': obj.size or 0,
+        'etag': (obj.etag or '').strip('"'),
+        'last_modified': obj.last_modified,
+        'content_type': content_type,
+    }
+
+
+def _differs(row, fields):
+    return (row.deleted or row.size != fields['size'] or row.etag != fields['etag'] or
+            (fields['content_type'] and row.content_type != fields['content_type']))
+
+
+def reconcile(bucket, client):
+    """Bring the index in line with a full listing. Returns {'upserted', 'deleted', 'objects'}."""
+    started = timezone.now()
+    index, _ = ObjectIndex.objects.get_or_create(bucket=bucket)
+    upserts, deletes = [], []
+    stats = {'upserted': 0, 'deleted': 0}
+
+    def flush():
+        if upserts:
+            StorageObject.objects.bulk_create(
+                upserts, update_conflicts=True, unique_fields=['bucket', 'key'],
+                update_fields=['size', 'etag', 'last_modified', 'content_type', 'sequencer', 'deleted',
+                               'updated_at'],
+            )
+            stats['upserted'] += len(upserts)
+            upserts.clear()
+        if deletes:
+            # Rows touched by an event since this pass started are newer than the listing.
+            # Tombstones of keys the listing no longer has are purged here too.
+            StorageObject.objects.filter(id__in=deletes, updated_at__lt=started).delete()
+            stats['deleted'] += len(deletes)
+            deletes.clear()
+
+    def upsert(obj, row=None):
+        if row is not None and row.updated_at >= started:
+            return
+        fields = _listing_fields(obj)
+        if row is not None:
+            fields['content_type'] = fields['content_type'] or row.content_type
+        upserts.append(StorageObject(bucket=bucket, key=obj.object_name, sequencer='', **fields))
+
+    listing = iter(client.list_objects(bucket.bucket_name, recursive=True, include_user_meta=True))
+    rows = StorageObject.objects.filter(bucket=bucket).order_by('key').iterator(chunk_size=2000)
+    obj, row = next(listing, None), next(rows, None)
+    while obj is not None or row is not None:
+        if row is None or (obj is not None and obj.object_name < row.key):
+            upsert(obj)
+            obj = next(listing, None)
+        elif obj is None or row.key < obj.object_name:
+            deletes.append(row.id)
+            row = next(rows, None)
+        else:
+            if _differs(row, _listing_fields(obj)):
+                upsert(obj, row)
+            obj, row = next(listing, None), next(rows, None)
+        if len(upserts) >= RECONCILE_BATCH or len(deletes) >= RECONCILE_BATCH:
+            flush()
+    flush()
+
+    totals = StorageObject.objects.filter(bucket=bucket, deleted=False).exclude(key__endswith='/') \
+        .aggregate(count=Count('id'), size=Sum('size'))
+    index.object_count = totals['count'] or 0
+    index.total_size = totals['size'] or 0
+    index.reconciled_at = timezone.now()
+    index.save()
+    stats['objects'] = index.object_count
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+def usable_index(bucket):
+    """The bucket's ObjectIndex if it is enabled and has been reconciled at least once."""
+    index = ObjectIndex.objects.filter(bucket=bucket, enabled=True).first()
+    return index if index and index.reconciled_at else None
+
+
+def usage_payload(index):
+    return {
+        "bucket_id": str(index.bucket_id),
+        "object_count": index.object_count,
+        "total_size": index.total_size,
+        "reconciled_at": index.reconciled_at.isoformat() if index.reconciled_at else None,
+        "last_event_at": index.last_event_at.isoformat() if index.last_event_at else None,
+        "notifications_error": index.notifications_error or None,
+    }
+
+
+def search(bucket, prefix='', contains='', after='', limit=100):
+    """Objects under `prefix` (index range scan), optionally containing `contains`, in key order."""
+    qs = StorageObject.objects.filter(bucket=bucket, deleted=False)
+    if prefix:
+        qs = qs.filter(key__startswith=prefix)
+    if contains:
+        qs = qs.filter(key__icontains=contains)
+    if after:
+        qs = qs.filter(key__gt=after)
+    return list(qs.order_by('key')[:limit])
+
+
+def object_entry(row):
+    return {
+        "name": row.key,
+        "size": row.size,
+        "last_modified": row.last_modified.isoformat() if row.last_modified else None,
+        "etag": row.etag,
+        "content_type": row.content_type or None,
+        "is_dir": row.key.endswith('/'),
+    }
+
+
+def tree_level(bucket, prefix, file_limit):
+    """Same shape as bucket_views.tree_level, computed with GROUP BY over the index."""
+    start = len(prefix) + 1
+    under = StorageObject.objects.filter(bucket=bucket, key__startswith=prefix, deleted=False).exclude(key=prefix) \
+        .annotate(rest=Substr('key', start))
+    counted = ~Q(key__endswith='/')
+
+    folders = under.filter(rest__contains='/') \
+        .annotate(head=Func(F('rest'), Value('/'), Value(1), function='split_part', output_field=CharField())) \
+        .values('head') \
+        .annotate(object_count=Count('id', filter=counted), total_size=Sum('size', filter=counted)) \
+        .order_by('head')
+    files_qs = under.exclude(rest__contains='/').order_by('key')
+    files = list(files_qs[:file_limit + 1])
+    totals = under.aggregate(count=Count('id', filter=counted), size=Sum('size', filter=counted))
+
+    children = [
+        {"name": f['head'], "type": "directory", "path": f"{prefix}{f['head']}/",
+         "object_count": f['object_count'], "total_size": f['total_size'] or 0, "children": None}
+        for f in folders
+    ]
+    children += [
+        {"name": row.key[len(prefix):], "type": "file", "size": row.size,
+         "last_modified": row.last_modified.isoformat() if row.last_modified else None, "path": row.key}
+        for row in files[:file_limit]
+    ]
+    return {
+        "name": prefix.rstrip("/").rsplit("/", 1)[-1],
+        "type": "directory",
+        "path": prefix,
+        "object_count": totals['count'] or 0,
+        "total_size": totals['size'] or 0,
+        "truncated": False,
+        "files_truncated": len(files) > file_limit,
+        "children": children,
+        "source": "index",
+    }
@@ -0,0 +1,319 @@
+"""Asynchronous Studio queries (QueryJob rows, run by the `run_query_job` Celery task).
+
+An interactive execute_query holds a web worker and a tenant backend for as long as the query
+runs. A query job instead:
+
+  submit   validates the SQL like execute_query, picks the statement_timeout for the submitter's
+           role (NIDHI_QUERY_JOB_TIMEOUTS, "role=seconds,...,default=seconds"; a smaller `timeout`
+           may be asked for), stores the job and queues it. Every submission, cancellation and
+           outcome is written to AuditLog;
+  run      the worker claims the job, records pg_backend_pid() of its pooled connection, runs the
+           query through studio_query.QueryResult (READ ONLY, server-side cursor, row / byte caps)
+           and spools the rows to MinIO as they arrive: NIDHI_QUERY_RESULTS_BUCKET /
+           query-jobs/<job id>/<page>.json.gz, each page {"columns": [...], "data": [[column
+           values], ...]} of up to PAGE_ROWS rows, gzip-compressed;
+  cancel   a queued job is simply marked cancelled; for a running one, pg_cancel_backend(pid) is
+           sent from another connection and the worker records the cancellation. A
+           QueryCanceled without a cancel request means the statement_timeout fired;
+  results  one page at a time, decompressed into row objects;
+  purge    pages of jobs finished more than NIDHI_QUERY_RESULT_TTL_HOURS ago are deleted
+           (status 'expired').
+
+Pages are column-major JSON rather than Parquet / Arrow. The results API serves exactly what
+execute_query would (studio_query.dumps of the psycopg2 values), and Arrow's type inference over
+those values is not lossless: jsonb objects become structs padded with nulls, timestamptz offsets
+are normalised to UTC, and a column's type can differ from page to page. pyarrow also stays
+optional (exports needing it answer 501), while query jobs must work without it. Clients follow
+a job with the bounded long-poll of studio_views.query_job_detail.
+"""
+import io
+import os
+import gzip
+import json
+import logging
+from datetime import timedelta
+
+import psycopg2
+import psycopg2.errors
+from django.utils import timezone
+
+from . import studio_pool, studio_query
+from .models import QueryJob, AuditLog
+from .storage import MINIO_ENDPOINT, get_client
+
+try:
+    from minio.deleteobjects import DeleteObject
+except ImportError:
+    DeleteObject = None
+
+logger = logging.getLogger(__name__)
+
+RESULTS_BUCKET = os.environ.get('NIDHI_QUERY_RESULTS_BUCKET', 'nidhi-query-results')
+MINIO_ROOT_USER = os.environ.get('MINIO_ROOT_USER', 'admin_nidhi_minio')
+MINIO_ROOT_PASSWORD = os.environ.get('MINIO_ROOT_PASSWORD', 'secure_nidhi_minio_password')
+PAGE_ROWS = int(os.environ.get('NIDHI_QUERY_JOB_PAGE_ROWS', '10000'))
+MAX_ROWS = int(os.environ.get('NIDHI_QUERY_JOB_MAX_ROWS', '5000000'))
+MAX_BYTES = int(os.environ.get('NIDHI_QUERY_JOB_MAX_BYTES', str(2 * 1024 ** 3)))
+RESULT_TTL = timedelta(hours=int(os.environ.get('NIDHI_QUERY_RESULT_TTL_HOURS', '24')))
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class QueryJobError(Exception):
+    """Rejected job request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_timeouts(raw):
+    timeouts = {}
+    for item in raw.split(','):
+        role, _, seconds = item.partition('=')
+        if role.strip() and seconds.strip():
+            timeouts[role.strip()] = int(float(seconds) * 1000)
+    return timeouts
+
+
+ROLE_TIMEOUTS_MS = _parse_timeouts(os.environ.get(
+    'NIDHI_QUERY_JOB_TIMEOUTS', 'founding_engineer=900,default=120'))
+
+
+def timeout_for(role, requested_seconds=None):
+    """statement_timeout (ms) for `role`, lowered to `requested_seconds` if that is smaller."""
+    limit = ROLE_TIMEOUTS_MS.get(role or '', ROLE_TIMEOUTS_MS.get('default', 120000))
+    if requested_seconds is None:
+        return limit
+    try:
+        requested = int(float(requested_seconds) * 1000)
+    except (TypeError, ValueError):
+        raise QueryJobError("timeout must be a number of seconds.")
+    if requested <= 0:
+        raise QueryJobError("timeout must be positive.")
+    return min(requested, limit)
+
+
+def job_payload(job):
+    return {
+        "id": str(job.id),
+        "instance_id": str(job.instance_id),
+        "query": job.query,
+        "status": job.status,
+        "timeout_ms": job.timeout_ms,
+        "cancel_requested": job.cancel_requested,
+        "columns": job.columns,
+        "row_count": job.row_count,
+        "truncated": bool(job.truncated_by),
+        "truncated_by": job.truncated_by or None,
+        "page_rows": job.page_rows,
+        "page_count": job.page_count,
+        "result_bytes": job.result_bytes,
+        "error": job.error or None,
+        "submitted_by": job.submitted_by,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _audit(job, detail, success=True, actor_type='founding_engineer'):
+    AuditLog.objects.create(
+        actor_type=actor_type,
+        actor=job.submitted_by or 'unknown',
+        action='execute_query',
+        target=job.instance.db_name,
+        server=job.instance.server.name,
+        detail=f"QUERY JOB {job.id} {detail}",
+        success=success,
+    )
+
+
+def _spool_client():
+    client = get_client(MINIO_ENDPOINT, MINIO_ROOT_USER, MINIO_ROOT_PASSWORD)
+    if not client.bucket_exists(RESULTS_BUCKET):
+        client.make_bucket(RESULTS_BUCKET)
+    return client
+
+
+def page_key(job, page):
+    return f"query-jobs/{job.id}/{page:05d}.json.gz"
+
+
+# ---------------------------------------------------------------------------
+# Submit / cancel
+# ---------------------------------------------------------------------------
+def submit(instance, query, submitted_by='', role='', timeout=None):
+    job = QueryJob.objects.create(
+        instance=instance, query=query, timeout_ms=timeout_for(role, timeout),
+        submitted_by=submitted_by or '', role=role or '',
+    )
+    _audit(job, f"submitted (timeout {job.timeout_ms} ms): {query[:300]}")
+    from .tasks import run_query_job
+    run_query_job.delay(str(job.id))
+    job.refresh_from_db()  # eager Celery (tests / dev) has already run it
+    return job
+
+
+def cancel(job, actor=''):
+    """Cancel a queued or running job. Returns the job (unchanged if it already finished)."""
+    if job.status not in ACTIVE_STATUSES:
+        return job
+    QueryJob.objects.filter(id=job.id).update(cancel_requested=True)
+    cancelled_queued = QueryJob.objects.filter(id=job.id, status='queued').update(
+        status='cancelled', finished_at=timezone.now())
+    job.refresh_from_db()
+    if not cancelled_queued and job.status == 'running' and job.backend_pid:
+        # Another connection: the job's own is busy running the query.
+        with studio_pool.connection(job.instance) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT pg_cancel_backend(pid) AS cancelled FROM pg_stat_activity WHERE pid = %s AND datname = %s",
+                (job.backend_pid, job.instance.db_name),
+            )
+            cursor.fetchall()
+            cursor.close()
+    # A running job whose pid is not recorded yet checks cancel_requested before it starts.
+    _audit(job, f"cancel requested by {actor or 'unknown'} ({job.status})")
+    return job
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+class _Spooler:
+    """Collects rows into PAGE_ROWS-row column-major pages and uploads each one gzip-compressed."""
+
+    def __init__(self, job, client, columns):
+        self.job, self.client, self.columns = job, client, columns
+        self.rows = []
+        self.pages = 0
+        self.bytes = 0
+
+    def add(self, batch):
+        for row, _ in batch:
+            self.rows.append(row)
+            if len(self.rows) >= PAGE_ROWS:
+                self.flush()
+
+    def flush(self):
+        if not self.rows and self.pages:
+            return
+        data = [list(column) for column in zip(*self.rows)] if self.rows else [[] for _ in self.columns]
+        body = gzip.compress(studio_query.dumps({"columns": self.columns, "data": data}).encode())
+        self.pages += 1
+        self.client.put_object(RESULTS_BUCKET, page_key(self.job, self.pages), io.BytesIO(body), len(body),
+                               content_type='application/gzip')
+        self.bytes += len(body)
+        self.rows = []
+
+
+def _finish(job, status, error='', **fields):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save()
+    _audit(job, f"{status}: {job.row_count} rows" + (f" ({error})" if error else ''),
+           success=status == 'succeeded', actor_type='system')
+    return job
+
+
+def run(job_id):
+    job = QueryJob.objects.select_related('instance__server').get(id=job_id)
+    if not QueryJob.objects.filter(id=job.id, status='queued').update(status='running', started_at=timezone.now()):
+        return job.status  # cancelled while queued, or picked up twice
+    job.refresh_from_db()
+
+    try:
+        pooled = studio_pool.acquire(job.instance)
+    except Exception as e:
+        return _finish(job, 'failed', str(e)).status
+
+    error = None
+    spooler = None
+    result = studio_query.QueryResult(pooled.conn, job.query, max_rows=MAX_ROWS, max_bytes=MAX_BYTES,
+                                      timeout_ms=job.timeout_ms)
+
+    def cancel_requested():
+        return QueryJob.objects.filter(id=job.id, cancel_requested=True).exists()
+
+    def spooled():
+        return {'row_count': result.row_count, 'page_count': spooler.pages if spooler else 0}
+
+    try:
+        cursor = pooled.conn.cursor()
+        cursor.execute('SELECT pg_backend_pid() AS pid')
+        job.backend_pid = cursor.fetchall()[0]['pid']
+        cursor.close()
+        pooled.conn.rollback()  # QueryResult's READ ONLY must open the next transaction
+        job.save(update_fields=['backend_pid'])
+        if cancel_requested():
+            return _finish(job, 'cancelled').status
+
+        result.execute()
+        spooler = _Spooler(job, _spool_client(), result.columns)
+        for batch in result.batches():
+            pages = spooler.pages
+            spooler.add(batch)
+            # A cancel that reached the backend between statements did nothing; catch it here.
+            if spooler.pages != pages and cancel_requested():
+                return _finish(job, 'cancelled', **spooled()).status
+        spooler.flush()
+        return _finish(job, 'succeeded', columns=result.columns, truncated_by=result.truncated_by or '',
+                       page_rows=PAGE_ROWS, result_bytes=spooler.bytes, **spooled()).status
+    except psycopg2.errors.QueryCanceled as e:
+        error = e
+        if cancel_requested():
+            return _finish(job, 'cancelled', **spooled()).status
+        return _finish(job, 'failed', f"statement timeout ({job.timeout_ms} ms) exceeded", **spooled()).status
+    except Exception as e:
+        error = e
+        logger.warning("Query job %s failed: %s", job.id, e)
+        return _finish(job, 'failed', str(e).strip(), **spooled()).status
+    finally:
+        result.close()
+        studio_pool.release(pooled, reset_session=True,
+                            discard=isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)))
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+def read_page(job, page):
+    """Rows of result page `page` (1-based) as {column: value} objects."""
+    if job.status == 'expired':
+        raise QueryJobError("Results of this job have expired.", status=410)
+    if job.status != 'succeeded':
+        raise QueryJobError(f"Query job is {job.status}; results are available once it succeeded.", status=409)
+    if not 1 <= page <= max(job.page_count, 1):
+        raise QueryJobError(f"page must be between 1 and {job.page_count}.", status=404)
+    response = _spool_client().get_object(RESULTS_BUCKET, page_key(job, page))
+    try:
+        payload = json.loads(gzip.decompress(response.read()))
+    finally:
+        response.close()
+        response.release_conn()
+    return [dict(zip(payload["columns"], values)) for values in zip(*payload["data"])]
+
+
+def purge_expired():
+    """Delete spooled pages of jobs finished more than RESULT_TTL ago (including the partial
+    pages of failed / cancelled jobs). Returns jobs purged."""
+    cutoff = timezone.now() - RESULT_TTL
+    purged = 0
+    jobs = QueryJob.objects.filter(status__in=('succeeded', 'failed', 'cancelled'), page_count__gt=0,
+                                   finished_at__lt=cutoff)
+    if not jobs.exists():
+        return 0
+    client = _spool_client()
+    for job in jobs:
+        keys = [DeleteObject(page_key(job, page)) for page in range(1, job.page_count + 1)]
+        errors = list(client.remove_objects(RESULTS_BUCKET, keys))
+        if errors:
+            logger.warning("Query job %s: %d result page(s) not deleted", job.id, len(errors))
+            continue
+        QueryJob.objects.filter(id=job.id).update(
+            page_count=0, status='expired' if job.status == 'succeeded' else job.status)
+        purged += 1
+    return purged
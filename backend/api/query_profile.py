@@ -0,0 +1,194 @@
+"""EXPLAIN (ANALYZE, BUFFERS) profiler for Studio queries.
+
+execute_query shows rows, not why they were slow. explain() runs
+
+    EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) <query>
+
+on a pooled connection inside a READ ONLY transaction that is always rolled back (ANALYZE
+really executes the statement), under the interactive statement_timeout, and turns the JSON plan
+into a tree of nodes with per-node timings and buffer counts plus a ranked list of findings:
+
+  * hottest nodes  the HOT_NODES nodes with the most exclusive time (own time, children
+                   subtracted; "Actual Total Time" is per loop, so times are multiplied by loops,
+                   and divided by the processes running them in parallel below a Gather);
+  * misestimates   actual rows off from the planner's estimate by MISESTIMATE_FACTOR or more
+                   (either way) on nodes handling at least MISESTIMATE_MIN_ROWS rows: stale
+                   statistics or correlated predicates, and the usual cause of a bad join order;
+  * seq scans      sequential scans of tables with at least NIDHI_PROFILE_LARGE_TABLE_ROWS rows
+                   (pg_class.reltuples from the schema catalog, else the rows the scan read);
+  * disk spills    sorts that went to disk, hash joins / aggregates split into batches, and any
+                   other node that wrote temp blocks: work_mem was too small for it.
+
+The raw EXPLAIN JSON is returned alongside, for external plan viewers.
+"""
+import os
+import json
+import itertools
+
+import psycopg2.extensions
+
+from . import studio_query
+
+HOT_NODES = 5
+MISESTIMATE_FACTOR = 10
+MISESTIMATE_MIN_ROWS = 100
+LARGE_TABLE_ROWS = int(os.environ.get('NIDHI_PROFILE_LARGE_TABLE_ROWS', '100000'))
+
+
+class ProfileError(Exception):
+    """Rejected profile request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def explain(conn, query, timeout_ms=None):
+    """Run EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) read-only and roll back. Returns the JSON document."""
+    query = query.strip().rstrip(';').strip()
+    if not studio_query.streamable(query):
+        raise ProfileError("Only SELECT / WITH / VALUES / TABLE statements can be profiled.")
+    timeout_ms = studio_query.TIMEOUT_MS if timeout_ms is None else timeout_ms
+    conn.autocommit = False
+    cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    try:
+        cursor.execute('SET TRANSACTION READ ONLY')
+        cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(timeout_ms)),))
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + query)
+        document = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.rollback()
+    return json.loads(document) if isinstance(document, str) else document
+
+
+def _node(plan, counter, processes=1):
+    """`processes`: how many backends run this node concurrently (workers + leader below a Gather),
+    whose loops overlap in wall-clock time."""
+    loops = plan.get('Actual Loops', 0)
+    node = {
+        "id": next(counter),
+        "node_type": plan.get('Node Type'),
+        "parallel": plan.get('Parallel Aware', False),
+        "relation": plan.get('Relation Name'),
+        "schema": plan.get('Schema'),
+        "alias": plan.get('Alias'),
+        "index": plan.get('Index Name'),
+        "join_type": plan.get('Join Type'),
+        "strategy": plan.get('Strategy'),
+        "parent_relationship": plan.get('Parent Relationship'),
+        "estimated_rows": plan.get('Plan Rows'),
+        "actual_rows": plan.get('Actual Rows'),
+        "loops": loops,
+        "total_cost": plan.get('Total Cost'),
+        "total_ms": round(plan.get('Actual Total Time', 0) * loops / max(min(processes, loops), 1), 3),
+        "filter": plan.get('Filter') or plan.get('Index Cond') or plan.get('Hash Cond'),
+        "rows_removed_by_filter": plan.get('Rows Removed by Filter', 0),
+        "buffers": {
+            "shared_hit": plan.get('Shared Hit Blocks', 0),
+            "shared_read": plan.get('Shared Read Blocks', 0),
+            "temp_read": plan.get('Temp Read Blocks', 0),
+            "temp_written": plan.get('Temp Written Blocks', 0),
+        },
+        "findings": [],
+        "children": [],
+    }
+    if node["node_type"] in ('Gather', 'Gather Merge'):
+        processes = plan.get('Workers Launched', 0) + 1
+    node["children"] = [_node(child, counter, processes) for child in plan.get('Plans', [])]
+    node["self_ms"] = round(max(node["total_ms"] - sum(c["total_ms"] for c in node["children"]), 0), 3)
+    # Buffer counts include the children's; spills are judged on the node's own temp writes.
+    node["_temp_written"] = node["buffers"]["temp_written"] - sum(c["buffers"]["temp_written"] for c in node["children"])
+    node["_plan"] = plan
+    return node
+
+
+def _walk(node):
+    yield node
+    for child in node["children"]:
+        yield from _walk(child)
+
+
+def _misestimate(node):
+    if not node["loops"] or node["estimated_rows"] is None:
+        return None
+    estimated, actual = node["estimated_rows"], node["actual_rows"]
+    if max(estimated, actual) < MISESTIMATE_MIN_ROWS:
+        return None
+    factor = max(actual, 1) / max(estimated, 1)
+    if factor >= MISESTIMATE_FACTOR:
+        return f"Planner expected {estimated} rows, got {actual} ({factor:.0f}x more); check ANALYZE / statistics."
+    if factor <= 1 / MISESTIMATE_FACTOR:
+        return f"Planner expected {estimated} rows, got {actual} ({1 / factor:.0f}x fewer); check ANALYZE / statistics."
+    return None
+
+
+def _seq_scan(node, row_estimates):
+    if node["node_type"] != 'Seq Scan' or not node["loops"]:
+        return None
+    table_rows = None
+    if node["schema"] in (None, 'public'):
+        table_rows = row_estimates.get(node["relation"])
+    if table_rows is None:
+        table_rows = (node["actual_rows"] + node["rows_removed_by_filter"]) * node["loops"]
+    if table_rows < LARGE_TABLE_ROWS:
+        return None
+    message = f"Sequential scan of {node['relation']} (~{table_rows} rows)"
+    if node["filter"]:
+        return message + (f": {node['rows_removed_by_filter'] * node['loops']} rows read and discarded by "
+                          f"{node['filter']}; an index on the filtered columns would avoid it.")
+    return message + " with no filter; fine for a full-table aggregate, otherwise narrow the query."
+
+
+def _spill(node):
+    plan = node["_plan"]
+    if plan.get('Sort Space Type') == 'Disk':
+        return f"Sort spilled {plan.get('Sort Space Used')} kB to disk ({plan.get('Sort Method')}); raise work_mem or sort fewer rows."
+    if plan.get('Hash Batches', 1) > 1:
+        return f"Hash split into {plan['Hash Batches']} batches ({plan.get('Peak Memory Usage')} kB in memory); raise work_mem."
+    if plan.get('HashAgg Batches', 1) > 1 or plan.get('Disk Usage', 0) > 0:
+        return f"Hash aggregate spilled {plan.get('Disk Usage', 0)} kB to disk; raise work_mem."
+    if node["_temp_written"] > 0:
+        return f"Wrote {node['_temp_written']} temp blocks to disk; raise work_mem."
+    return None
+
+
+def analyze(document, row_estimates=None):
+    """The EXPLAIN JSON document -> {planning_ms, execution_ms, plan, hottest, findings, raw}.
+    `row_estimates` maps public table names to pg_class.reltuples."""
+    row_estimates = row_estimates or {}
+    top = document[0]
+    counter = itertools.count(1)
+    root = _node(top['Plan'], counter)
+    execution_ms = top.get('Execution Time', root["total_ms"])
+    nodes = list(_walk(root))
+
+    findings = []
+    for node in nodes:
+        for kind, message in (('seq_scan', _seq_scan(node, row_estimates)),
+                              ('disk_spill', _spill(node)),
+                              ('misestimate', _misestimate(node))):
+            if message:
+                node["findings"].append(kind)
+                findings.append({"node": node["id"], "kind": kind, "node_type": node["node_type"],
+                                 "total_ms": node["total_ms"], "message": message})
+    findings.sort(key=lambda f: -f["total_ms"])
+
+    hottest = sorted(nodes, key=lambda n: -n["self_ms"])[:HOT_NODES]
+    for node in nodes:
+        node["self_percent"] = round(100 * node["self_ms"] / execution_ms, 1) if execution_ms else 0.0
+        node["hot"] = any(node is h for h in hottest) and node["self_ms"] > 0
+        del node["_plan"], node["_temp_written"]
+
+    return {
+        "planning_ms": top.get('Planning Time'),
+        "execution_ms": execution_ms,
+        "plan": root,
+        "hottest": [
+            {"node": n["id"], "node_type": n["node_type"], "relation": n["relation"],
+             "self_ms": n["self_ms"], "self_percent": n["self_percent"]}
+            for n in hottest if n["self_ms"] > 0
+        ],
+        "findings": findings,
+        "raw": document,
+    }
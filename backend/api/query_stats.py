@@ -0,0 +1,219 @@
+"""Fleet-wide slow-query insights from pg_stat_statements.
+
+pg_stat_statements keeps cumulative counters per (database, role, normalized statement) for the
+whole cluster, so one connection per DatabaseServer (as root, to the `postgres` database) sees
+every tenant. The `collect_query_stats` beat task fans out `collect_server_query_stats` per
+active server every few minutes; collect() then
+
+  1. reads the counters, without statement texts: calls, execution time, rows and shared
+     block hits / reads of every top-level statement (total_time before Postgres 13);
+  2. diffs them against the server's QueryStatSnapshot into per-interval deltas. A statement
+     that is new, or whose calls went down (evicted and re-added), counts from zero; a changed
+     pg_stat_statements_info.stats_reset (Postgres 14+) means everything does. The very first
+     collection only records the baseline;
+  3. keeps the TOP_PER_INTERVAL deltas with the most execution time one by one, fetching only
+     their texts (up to QUERY_TEXT_MAX characters), and folds the rest into one row per
+     database (null queryid), so per-database totals stay exact;
+  4. stores the QueryStatDelta rows, mapped to the DatabaseInstance owning the database, and
+     the new snapshot, in one transaction (the snapshot row is locked, so overlapping runs for
+     one server serialize).
+
+The extension is created in the `postgres` database when missing; it still needs
+`shared_preload_libraries = 'pg_stat_statements'`, and the failure is kept on the snapshot
+(`error`) until it is. Deltas older than NIDHI_QUERY_STATS_RETENTION_DAYS are pruned daily.
+
+top() ranks statements and databases over a time window for the per-server and per-instance
+APIs: which product to talk to when a server is hot.
+"""
+import os
+import logging
+from datetime import timedelta
+
+import psycopg2
+from django.db import transaction
+from django.db.models import Sum, Max, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TOP_PER_INTERVAL = int(os.environ.get('NIDHI_QUERY_STATS_TOP', '100'))
+RETENTION_DAYS = int(os.environ.get('NIDHI_QUERY_STATS_RETENTION_DAYS', '14'))
+QUERY_TEXT_MAX = 2000
+CONNECT_TIMEOUT = 8
+STATEMENT_TIMEOUT_MS = 15000
+
+METRICS = ('calls', 'total_ms', 'rows', 'shared_blks_hit', 'shared_blks_read')
+
+COUNTERS_SQL = """
+    SELECT s.dbid, s.userid, s.queryid, d.datname, r.rolname,
+           s.calls, s.{total_time} AS total_ms, s.rows, s.shared_blks_hit, s.shared_blks_read
+      FROM pg_stat_statements(false) s
+      LEFT JOIN pg_database d ON d.oid = s.dbid
+      LEFT JOIN pg_roles r ON r.oid = s.userid
+     WHERE s.queryid IS NOT NULL{toplevel}
+"""
+TEXTS_SQL = """
+    SELECT DISTINCT ON (s.queryid) s.queryid, left(s.query, %s) AS query
+      FROM pg_stat_statements s
+     WHERE s.queryid = ANY(%s)
+"""
+STATS_RESET_SQL = "SELECT stats_reset FROM pg_stat_statements_info"
+
+
+class QueryStatsError(Exception):
+    """Rejected query-stats request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _connect(server):
+    conn = psycopg2.connect(
+        dbname='postgres', user=server.root_user, password=server.root_password,
+        host=server.host, port=server.port, connect_timeout=CONNECT_TIMEOUT,
+        options=f'-c statement_timeout={STATEMENT_TIMEOUT_MS}', application_name='nidhi-query-stats',
+    )
+    conn.autocommit = True
+    return conn
+
+
+def read_counters(conn):
+    """(stats_reset or None, {"dbid:userid:queryid": row}) of the server's pg_stat_statements."""
+    with conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+        cur.execute("SELECT current_setting('server_version_num')::int")
+        version = cur.fetchone()[0]
+        stats_reset = None
+        if version >= 140000:
+            cur.execute(STATS_RESET_SQL)
+            stats_reset = cur.fetchone()[0]
+        cur.execute(COUNTERS_SQL.format(
+            total_time='total_exec_time' if version >= 130000 else 'total_time',
+            toplevel=' AND s.toplevel' if version >= 140000 else '',
+        ))
+        counters = {}
+        for dbid, userid, queryid, datname, rolname, *values in cur.fetchall():
+            counters[f'{dbid}:{userid}:{queryid}'] = {
+                "queryid": queryid, "database": datname or str(dbid), "username": rolname or str(userid),
+                **dict(zip(METRICS, values)),
+            }
+    return stats_reset, counters
+
+
+def read_texts(conn, queryids):
+    if not queryids:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(TEXTS_SQL, (QUERY_TEXT_MAX, list(queryids)))
+        return dict(cur.fetchall())
+
+
+def diff(previous, counters, reset=False):
+    """Deltas of `counters` against `previous` ({key: [calls, total_ms, ...]}); statements with
+    no new calls are left out."""
+    deltas = []
+    for key, row in counters.items():
+        before = previous.get(key)
+        if reset or before is None or row['calls'] < before[0]:
+            before = [0] * len(METRICS)
+        delta = {name: row[name] - before[i] for i, name in enumerate(METRICS)}
+        if delta['calls'] > 0:
+            deltas.append({"queryid": row['queryid'], "database": row['database'], "username": row['username'], **delta})
+    return deltas
+
+
+def _fold(deltas, top_n):
+    """The top_n deltas by execution time, plus one remainder row per database for the rest."""
+    deltas = sorted(deltas, key=lambda d: -d['total_ms'])
+    kept, rest = deltas[:top_n], {}
+    for delta in deltas[top_n:]:
+        other = rest.setdefault(delta['database'], {"queryid": None, "database": delta['database'], "username": '',
+                                                    **{name: 0 for name in METRICS}})
+        for name in METRICS:
+            other[name] += delta[name]
+    return kept, list(rest.values())
+
+
+def collect(server):
+    """Collect one server's pg_stat_statements into QueryStatDelta rows. Returns rows stored."""
+    from .models import DatabaseInstance, QueryStatDelta, QueryStatSnapshot
+
+    now = timezone.now()
+    with transaction.atomic():
+        snapshot, created = QueryStatSnapshot.objects.get_or_create(server=server, defaults={"taken_at": now})
+        snapshot = QueryStatSnapshot.objects.select_for_update().get(pk=snapshot.pk)
+        # No successful collection yet: the counters hold everything since the server started.
+        first = created or (not snapshot.counters and bool(snapshot.error))
+        try:
+            conn = _connect(server)
+            try:
+                stats_reset, counters = read_counters(conn)
+                deltas = [] if first else diff(snapshot.counters, counters,
+                                               reset=stats_reset is not None and stats_reset != snapshot.stats_reset)
+                kept, rest = _fold(deltas, TOP_PER_INTERVAL)
+                texts = read_texts(conn, {d['queryid'] for d in kept})
+            finally:
+                conn.close()
+        except psycopg2.Error as e:
+            snapshot.error = str(e).strip()[:1000]
+            snapshot.save(update_fields=['error', 'updated_at'])
+            logger.warning("Query stats: %s failed: %s", server.name, snapshot.error)
+            return 0
+
+        instances = {i.db_name: i for i in DatabaseInstance.objects.filter(
+            server=server, is_deleted=False, db_name__in={d['database'] for d in deltas})}
+        QueryStatDelta.objects.bulk_create([
+            QueryStatDelta(
+                server=server, instance=instances.get(d['database']), database=d['database'][:63],
+                username=d['username'][:63], queryid=d['queryid'], query=texts.get(d['queryid'], ''),
+                period_start=snapshot.taken_at, period_end=now, **{name: d[name] for name in METRICS},
+            )
+            for d in kept + rest
+        ])
+        snapshot.taken_at = now
+        snapshot.stats_reset = stats_reset
+        snapshot.counters = {key: [row[name] for name in METRICS] for key, row in counters.items()}
+        snapshot.error = ''
+        snapshot.save()
+    return len(kept) + len(rest)
+
+
+def prune(retention_days=None):
+    """Delete deltas older than retention_days (default RETENTION_DAYS)."""
+    from .models import QueryStatDelta
+    cutoff = timezone.now() - timedelta(days=RETENTION_DAYS if retention_days is None else retention_days)
+    deleted, _ = QueryStatDelta.objects.filter(period_end__lt=cutoff).delete()
+    return deleted
+
+
+def top(deltas, order_by='total_ms', limit=20):
+    """Rank a QueryStatDelta queryset: {totals, databases, statements}. Statements are grouped
+    by (database, role, queryid) across intervals; shares are of the queryset's execution time."""
+    if order_by not in METRICS:
+        raise QueryStatsError(f"order_by must be one of {', '.join(METRICS)}.")
+    sums = {name: Sum(name) for name in METRICS}
+    totals = {name: value or 0 for name, value in deltas.aggregate(**sums).items()}
+
+    def _share(total_ms):
+        return round(total_ms / totals['total_ms'], 4) if totals['total_ms'] else 0.0
+
+    databases = [
+        {"database": d['database'], "instance_id": d['instance_id'], "product": d['instance__product__name'],
+         **{name: d[name] or 0 for name in METRICS}, "share": _share(d['total_ms'] or 0)}
+        for d in deltas.values('database', 'instance_id', 'instance__product__name').annotate(**sums)
+                       .order_by(f'-{order_by}')[:limit]
+    ]
+    statements = []
+    for s in (deltas.filter(~Q(queryid=None)).values('database', 'instance_id', 'username', 'queryid')
+                    .annotate(query_text=Max('query'), **sums).order_by(f'-{order_by}')[:limit]):
+        statements.append({
+            "queryid": s['queryid'], "database": s['database'], "instance_id": s['instance_id'],
+            "username": s['username'], "query": s['query_text'],
+            **{name: s[name] for name in METRICS},
+            "mean_ms": round(s['total_ms'] / s['calls'], 3) if s['calls'] else None,
+            "hit_ratio": round(s['shared_blks_hit'] / (s['shared_blks_hit'] + s['shared_blks_read']), 4)
+            if s['shared_blks_hit'] + s['shared_blks_read'] else None,
+            "share": _share(s['total_ms']),
+        })
+    return {"totals": totals, "databases": databases, "statements": statements}
@@ -0,0 +1,175 @@
+"""Cached schema catalog of a tenant database for the Database Studio.
+
+Opening a table used to query information_schema (slow on large schemas: every view there is a
+stack of joins and privilege checks) plus a pg_index / pg_attribute join, on every click. The
+catalog is built instead from pg_catalog in ONE round trip (CATALOG_SQL aggregates everything
+into JSON server-side):
+
+    tables: [{name, kind, row_estimate, total_bytes, table_bytes,
+              columns: [{name, type, category, not_null, default, pk_position, indexed}],
+              primary_key, foreign_keys, indexes}]
+
+and kept in the Django cache (Redis) under the instance id, stamped with a catalog version.
+
+Invalidation is a version check, not an event trigger: an event trigger would mean installing a
+function and a version table into every tenant database (owned by us, visible in their dumps,
+lost on restore). VERSION_SQL instead fingerprints the `public` schema's rows in pg_class,
+pg_attribute and pg_constraint (count and xmin sum). Any DDL inserts, deletes or rewrites one of
+those rows, so it changes the fingerprint; ANALYZE and autovacuum update reltuples in place and
+do not. Per request:
+
+  * a catalog checked less than NIDHI_CATALOG_TRUST_SECONDS ago is returned as is (no
+    connection at all), so bursts of UI calls cost nothing;
+  * otherwise VERSION_SQL runs (a few index scans on the catalogs); an unchanged version keeps
+    the cached catalog, unless it is older than NIDHI_CATALOG_STATS_MAX_AGE, after which it is
+    rebuilt anyway to refresh row estimates and sizes;
+  * a changed version rebuilds.
+
+A cache outage never fails a request: the catalog is then built per call, as before.
+"""
+import os
+import time
+import logging
+
+from django.core.cache import cache
+
+from . import studio_pool
+
+logger = logging.getLogger(__name__)
+
+TRUST_SECONDS = float(os.environ.get('NIDHI_CATALOG_TRUST_SECONDS', '10'))
+STATS_MAX_AGE = float(os.environ.get('NIDHI_CATALOG_STATS_MAX_AGE', '300'))
+CACHE_TTL = int(os.environ.get('NIDHI_CATALOG_CACHE_TTL', str(24 * 3600)))
+CACHE_PREFIX = 'nidhi:studio:catalog:'
+
+VERSION_SQL = """
+    SELECT concat_ws('/',
+        (SELECT count(*) || ':' || coalesce(sum(c.xmin::text::bigint), 0)
+           FROM pg_class c WHERE c.relnamespace = 'public'::regnamespace),
+        (SELECT count(*) || ':' || coalesce(sum(a.xmin::text::bigint), 0)
+           FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+          WHERE c.relnamespace = 'public'::regnamespace AND a.attnum > 0),
+        (SELECT count(*) || ':' || coalesce(sum(con.xmin::text::bigint), 0)
+           FROM pg_constraint con WHERE con.connamespace = 'public'::regnamespace)
+    ) AS version
+"""
+
+CATALOG_SQL = """
+    SELECT (%s) AS version,
+    coalesce((SELECT json_agg(t ORDER BY t.name) FROM (
+        SELECT c.relname AS name,
+               CASE c.relkind WHEN 'r' THEN 'table' WHEN 'p' THEN 'partitioned table' WHEN 'v' THEN 'view'
+                              WHEN 'm' THEN 'materialized view' ELSE 'foreign table' END AS kind,
+               CASE WHEN c.reltuples >= 0 AND c.relkind IN ('r', 'p', 'm') THEN c.reltuples::bigint END AS row_estimate,
+               CASE WHEN c.relkind IN ('r', 'p', 'm') THEN pg_total_relation_size(c.oid) END AS total_bytes,
+               CASE WHEN c.relkind IN ('r', 'p', 'm') THEN pg_relation_size(c.oid) END AS table_bytes,
+               coalesce((SELECT json_agg(json_build_object(
+                        'name', a.attname,
+                        'type', format_type(a.atttypid, a.atttypmod),
+                        'category', ty.typcategory,
+                        'not_null', a.attnotnull,
+                        'default', pg_get_expr(d.adbin, d.adrelid),
+                        'pk_position', (SELECT k.ord FROM pg_index i, unnest(i.indkey::int2[]) WITH ORDINALITY k(attnum, ord)
+                                         WHERE i.indrelid = c.oid AND i.indisprimary AND k.attnum = a.attnum),
+                        'indexed', EXISTS (SELECT 1 FROM pg_index i WHERE i.indrelid = c.oid AND i.indkey[0] = a.attnum)
+                    ) ORDER BY a.attnum)
+                  FROM pg_attribute a
+                  JOIN pg_type ty ON ty.oid = a.atttypid
+                  LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+                 WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped), '[]') AS columns,
+               coalesce((SELECT json_agg(json_build_object(
+                        'name', ic.relname,
+                        'unique', i.indisunique,
+                        'primary', i.indisprimary,
+                        'bytes', pg_relation_size(i.indexrelid),
+                        'definition', pg_get_indexdef(i.indexrelid)
+                    ) ORDER BY ic.relname)
+                  FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid
+                 WHERE i.indrelid = c.oid), '[]') AS indexes,
+               coalesce((SELECT json_agg(json_build_object(
+                        'name', con.conname,
+                        'columns', (SELECT array_agg(att.attname ORDER BY k.ord)
+                                      FROM unnest(con.conkey) WITH ORDINALITY k(attnum, ord)
+                                      JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = k.attnum),
+                        'references', con.confrelid::regclass::text,
+                        'referenced_columns', (SELECT array_agg(att.attname ORDER BY k.ord)
+                                                 FROM unnest(con.confkey) WITH ORDINALITY k(attnum, ord)
+                                                 JOIN pg_attribute att ON att.attrelid = con.confrelid AND att.attnum = k.attnum),
+                        'definition', pg_get_constraintdef(con.oid)
+                    ) ORDER BY con.conname)
+                  FROM pg_constraint con
+                 WHERE con.conrelid = c.oid AND con.contype = 'f'), '[]') AS foreign_keys
+          FROM pg_class c
+         WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+    ) t), '[]') AS tables
+""" % VERSION_SQL
+
+
+def _key(instance):
+    return f'{CACHE_PREFIX}{instance.id}'
+
+
+def _cache_get(key):
+    try:
+        return cache.get(key)
+    except Exception as e:
+        logger.warning("Schema catalog cache unavailable: %s", e)
+        return None
+
+
+def _cache_set(key, value):
+    try:
+        cache.set(key, value, CACHE_TTL)
+    except Exception as e:
+        logger.warning("Schema catalog cache unavailable: %s", e)
+
+
+def build(cursor):
+    """The catalog of the cursor's database (one query)."""
+    cursor.execute(CATALOG_SQL)
+    row = cursor.fetchone()
+    tables = row['tables']
+    for table in tables:
+        table['primary_key'] = [
+            c['name'] for c in sorted((c for c in table['columns'] if c['pk_position']), key=lambda c: c['pk_position'])
+        ]
+    now = time.time()
+    return {"version": row['version'], "built_at": now, "checked_at": now, "tables": tables}
+
+
+def version(cursor):
+    cursor.execute(VERSION_SQL)
+    return cursor.fetchone()['version']
+
+
+def get_catalog(instance, refresh=False):
+    """The instance's catalog, from the cache when its version still matches. Uses the Studio pool."""
+    key = _key(instance)
+    catalog = None if refresh else _cache_get(key)
+    now = time.time()
+    if catalog is not None and now - catalog['checked_at'] < TRUST_SECONDS:
+        return catalog
+
+    with studio_pool.connection(instance) as conn:
+        cursor = conn.cursor()
+        try:
+            if catalog is not None and now - catalog['built_at'] < STATS_MAX_AGE and version(cursor) == catalog['version']:
+                catalog['checked_at'] = now
+            else:
+                catalog = build(cursor)
+        finally:
+            cursor.close()
+    _cache_set(key, catalog)
+    return catalog
+
+
+def invalidate(instance):
+    try:
+        cache.delete(_key(instance))
+    except Exception as e:
+        logger.warning("Schema catalog cache unavailable: %s", e)
+
+
+def table(catalog, name):
+    """The catalog entry of table `name`, or None."""
+    return next((t for t in catalog['tables'] if t['name'] == name), None)
@@ -0,0 +1,156 @@
+"""Process-wide StorageBucket cache + pooled MinIO clients.
+
+The media gateway and the bucket views used to hit Postgres (StorageBucket + product join),
+decrypt `secret_key` (Fernet) and build a brand-new Minio client on every request. This module
+keeps, per worker process:
+
+  * bucket_name -> resolved BucketConfig (plaintext creds, endpoints, product), TTL-bounded
+    (NIDHI_BUCKET_CACHE_TTL seconds, default 60);
+  * (endpoint, access_key, secret_key) -> one shared Minio client. Minio clients are thread-safe
+    and keep their own urllib3 connection pool, so reusing them also reuses TCP connections.
+
+Entries are dropped immediately when a StorageBucket is saved (relocation, credential change,
+status flip) or deleted in THIS process; the TTL bounds staleness for the other workers. So are
+the clients built with a bucket's credentials once it no longer uses them (rotated credentials,
+another endpoint, deleted bucket); otherwise every rotation would leave a client and its
+connection pool behind for the life of the worker.
+"""
+import os
+import time
+import threading
+import logging
+from collections import namedtuple
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import StorageBucket
+
+try:
+    from minio import Minio
+except ImportError:
+    Minio = None
+
+logger = logging.getLogger(__name__)
+
+# Internal Docker hostname of the control-plane MinIO (never the public endpoint).
+MINIO_ENDPOINT = os.environ.get('MINIO_ENDPOINT', 'minio:9000')
+BUCKET_CACHE_TTL = int(os.environ.get('NIDHI_BUCKET_CACHE_TTL', '60'))
+
+BucketConfig = namedtuple('BucketConfig', [
+    'id', 'bucket_name', 'status', 'product_id', 'product_name',
+    'access_key', 'secret_key', 'endpoint', 'internal_endpoint',
+])
+
+_lock = threading.Lock()
+_configs = {}   # bucket_name -> (BucketConfig, expires_at)
+_clients = {}   # (endpoint, access_key, secret_key) -> Minio
+_client_creds = {}  # bucket id -> {(access_key, secret_key)} handed out for it
+
+
+def internal_endpoint_for(endpoint):
+    """Map a bucket's public endpoint to the one the backend should dial.
+    `localhost:` endpoints are only reachable from the host, so use the Docker hostname."""
+    if not endpoint or endpoint.startswith('localhost:'):
+        return MINIO_ENDPOINT
+    return endpoint
+
+
+def _config_from_bucket(bucket):
+    product = bucket.product if bucket.product_id else None
+    return BucketConfig(
+        id=bucket.id,
+        bucket_name=bucket.bucket_name,
+        status=bucket.status,
+        product_id=bucket.product_id,
+        product_name=product.name if product else None,
+        access_key=bucket.access_key,
+        secret_key=bucket.secret_key,
+        endpoint=bucket.endpoint,
+        internal_endpoint=internal_endpoint_for(bucket.endpoint),
+    )
+
+
+def get_bucket_config(bucket_name):
+    """Resolved config for bucket_name, or None if no such bucket. Cached for BUCKET_CACHE_TTL."""
+    now = time.monotonic()
+    with _lock:
+        hit = _configs.get(bucket_name)
+        if hit and hit[1] > now:
+            return hit[0]
+
+    bucket = StorageBucket.objects.select_related('product').filter(bucket_name=bucket_name).first()
+    if bucket is None:
+        return None
+    config = _config_from_bucket(bucket)
+    with _lock:
+        _configs[bucket_name] = (config, now + BUCKET_CACHE_TTL)
+        _client_creds.setdefault(str(config.id), set()).add((config.access_key, config.secret_key))
+    return config
+
+
+def peek_bucket_config(bucket_name):
+    """Cached config for bucket_name without falling back to the DB (None on a miss).
+    Lets the async gateway skip the thread hop a DB lookup needs when the entry is warm."""
+    with _lock:
+        hit = _configs.get(bucket_name)
+        if hit and hit[1] > time.monotonic():
+            return hit[0]
+    return None
+
+
+def get_client(endpoint, access_key, secret_key):
+    """Shared Minio client for the given endpoint/credentials (created once per process)."""
+    if not Minio:
+        return None
+    key = (endpoint, access_key, secret_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=False)
+            _clients[key] = client
+        return client
+
+
+def get_bucket_client(bucket):
+    """Pooled client for a StorageBucket (or BucketConfig) on its internal endpoint."""
+    with _lock:
+        _client_creds.setdefault(str(bucket.id), set()).add((bucket.access_key, bucket.secret_key))
+    return get_client(internal_endpoint_for(bucket.endpoint), bucket.access_key, bucket.secret_key)
+
+
+def invalidate_bucket(bucket_id=None, bucket_name=None):
+    """Drop cached config for a bucket (by id and/or name). With no arguments, clear everything."""
+    with _lock:
+        if bucket_id is None and bucket_name is None:
+            _configs.clear()
+            return
+        for name, (config, _expires) in list(_configs.items()):
+            if name == bucket_name or (bucket_id is not None and str(config.id) == str(bucket_id)):
+                del _configs[name]
+
+
+def evict_clients(bucket, deleted=False):
+    """Drop pooled clients built with credentials `bucket` no longer uses, or for an endpoint it
+    no longer uses; all of its clients when it was deleted."""
+    current = (bucket.access_key, bucket.secret_key)
+    endpoints = {internal_endpoint_for(bucket.endpoint), MINIO_ENDPOINT}
+    with _lock:
+        creds = _client_creds.pop(str(bucket.id), set()) | {current}
+        for key in list(_clients):
+            if key[1:] in creds and (deleted or key[1:] != current or key[0] not in endpoints):
+                del _clients[key]
+        if not deleted:
+            _client_creds[str(bucket.id)] = {current}
+
+
+@receiver(post_save, sender=StorageBucket)
+def _bucket_saved(sender, instance, **kwargs):
+    invalidate_bucket(bucket_id=instance.id, bucket_name=instance.bucket_name)
+    evict_clients(instance)
+
+
+@receiver(post_delete, sender=StorageBucket)
+def _bucket_deleted(sender, instance, **kwargs):
+    invalidate_bucket(bucket_id=instance.id, bucket_name=instance.bucket_name)
+    evict_clients(instance, deleted=True)
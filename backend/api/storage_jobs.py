@@ -0,0 +1,477 @@
+"""Background bucket jobs (StorageJob rows, run by the `run_storage_job` Celery task).
+
+Folder move ("rename folder"), in phases:
+
+  copy      server-side copy of every key under `src` to `dst`, NIDHI_STORAGE_JOB_WORKERS at a
+            time, in listing order, checkpointing `cursor` after every batch of 1000 keys;
+  delete    only once every copy succeeded: walk the source and destination listings together
+            and remove the sources whose copy exists and is current (see _in_sync) with the
+            multi-object delete API (1000 keys per request), again checkpointing `cursor`. Keys
+            written or overwritten under `src` after they were copied are left in place and
+            counted in params['left_in_source'];
+  done.
+
+Folder delete: the `delete` phase alone, over `prefix`.
+
+Bucket relocation (every object to the same bucket on another MinIO, then repoint the bucket):
+
+  copy      merge the sorted source and target listings; stream each object that is missing or
+            stale on the target (GET -> PUT, NIDHI_RELOCATE_WORKERS at a time) and verify it:
+            size always, and the MD5 of the streamed bytes against the source ETag for
+            single-part objects (multipart ETags are not content hashes);
+  sync      the same pass again over the whole bucket, also removing target-only keys, to pick
+            up writes made while `copy` ran;
+  switch    set bucket.endpoint / server to the target; done.
+
+Resuming a relocation skips objects already on the target, so it is also how to re-run `sync`.
+
+Nothing is deleted before all copies exist, so a move that fails or dies during `copy` leaves the
+source intact: it can be resumed (failed keys are retried first, then the listing continues after
+`cursor`) or rolled back (the copies under `dst` are deleted — `dst` must be empty when the move
+is created, so everything there belongs to the job). Once `delete` has started, the only way is
+forward: resume.
+"""
+import os
+import hashlib
+import logging
+from itertools import islice
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.utils import timezone
+
+from .models import StorageJob, DatabaseServer
+from .storage import get_bucket_client, get_client, internal_endpoint_for
+
+try:
+    from minio.commonconfig import CopySource, ComposeSource
+    from minio.deleteobjects import DeleteObject
+except ImportError:
+    CopySource = ComposeSource = DeleteObject = None
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('NIDHI_STORAGE_JOB_WORKERS', '16'))
+BATCH_SIZE = 1000       # keys per checkpoint; also the S3 DeleteObjects per-request maximum
+MAX_ERRORS = 1000       # per-key failures kept on the job row
+STALE_AFTER = timedelta(minutes=10)  # a 'running' job not checkpointed for this long is presumed dead
+RELOCATE_WORKERS = int(os.environ.get('NIDHI_RELOCATE_WORKERS', '8'))
+RELOCATE_PART_SIZE = 16 * 1024 * 1024  # put_object buffers one part per worker
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+class JobConflict(Exception):
+    """The job cannot be resumed / rolled back in its current state."""
+
+
+def job_payload(job):
+    return {
+        "id": str(job.id),
+        "bucket_id": str(job.bucket_id),
+        "kind": job.kind,
+        "status": job.status,
+        "phase": job.phase,
+        "params": job.params,
+        "total": job.total,
+        "processed": job.processed,
+        "failed": job.failed,
+        "errors": job.errors[:100],
+        "created_by": job.created_by_sso_id,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def is_stale(job):
+    return job.status == 'running' and job.updated_at < timezone.now() - STALE_AFTER
+
+
+def _batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _keys(client, bucket_name, prefix, after=''):
+    for obj in client.list_objects(bucket_name, prefix=prefix, recursive=True, start_after=after or None):
+        yield obj.object_name
+
+
+def _record_errors(job, failures):
+    job.failed += len(failures)
+    room = MAX_ERRORS - len(job.errors)
+    if len(failures) > room:
+        job.params = {**job.params, 'errors_truncated': True}
+    job.errors = job.errors + [{"key": key, "error": error} for key, error in failures[:max(room, 0)]]
+
+
+def _checkpoint(job, cursor=None):
+    if cursor is not None:
+        job.cursor = cursor
+    job.save()
+
+
+def _finish(job, status):
+    job.status = status
+    job.phase = 'done' if status in ('completed', 'rolled_back') else job.phase
+    job.finished_at = timezone.now()
+    job.save()
+
+
+# ---------------------------------------------------------------------------
+# Primitives
+# ---------------------------------------------------------------------------
+def copy_one(client, bucket_name, src_key, dst_key):
+    """Server-side copy; objects over the 5 GiB single-copy limit go through compose_object."""
+    try:
+        client.copy_object(bucket_name, dst_key, CopySource(bucket_name, src_key))
+    except ValueError:
+        client.compose_object(bucket_name, dst_key, [ComposeSource(bucket_name, src_key)])
+
+
+def copy_batch(pool, client, bucket_name, keys, src, dst):
+    """Copy keys (under src) to dst concurrently. Returns [(key, error)] for failures."""
+    def run(key):
+        try:
+            copy_one(client, bucket_name, key, dst + key[len(src):])
+            return None
+        except Exception as e:
+            return key, str(e)
+    return [failure for failure in pool.map(run, keys) if failure]
+
+
+def delete_batch(client, bucket_name, keys):
+    """One DeleteObjects request for up to 1000 keys. Returns [(key, error)] for failures."""
+    errors = client.remove_objects(bucket_name, [DeleteObject(key) for key in keys])
+    return [(err.name, f"{err.code}: {err.message}") for err in errors]
+
+
+def delete_keys(client, bucket_name, keys):
+    """delete_batch over any number of keys. Returns [(key, error)] for failures."""
+    return [failure for batch in _batches(keys) for failure in delete_batch(client, bucket_name, batch)]
+
+
+def count_keys(client, bucket_name, prefix):
+    return sum(1 for _ in _keys(client, bucket_name, prefix))
+
+
+# ---------------------------------------------------------------------------
+# Move
+# ---------------------------------------------------------------------------
+def _move(job, client):
+    bucket_name = job.bucket.bucket_name
+    src, dst = job.params['src'], job.params['dst']
+
+    if job.phase == 'copy':
+        if not job.total:
+            job.total = count_keys(client, bucket_name, src)
+            _checkpoint(job)
+        retry = [e['key'] for e in job.errors if e.get('key')]
+        if job.params.get('errors_truncated'):
+            # Not every failed key was journaled: re-copy from the start (copies are idempotent).
+            retry, job.cursor, job.processed = [], '', 0
+            job.params = {k: v for k, v in job.params.items() if k != 'errors_truncated'}
+        job.errors, job.failed = [], 0
+
+        with ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='nidhi-storage-job') as pool:
+            if retry:
+                failures = copy_batch(pool, client, bucket_name, retry, src, dst)
+                job.processed += len(retry) - len(failures)
+                _record_errors(job, failures)
+                _checkpoint(job)
+            for batch in _batches(_keys(client, bucket_name, src, job.cursor)):
+                failures = copy_batch(pool, client, bucket_name, batch, src, dst)
+                job.processed += len(batch) - len(failures)
+                _record_errors(job, failures)
+                _checkpoint(job, cursor=batch[-1])
+
+        if job.failed:
+            logger.warning("Storage job %s: %d copy failure(s); source left intact", job.id, job.failed)
+            return _finish(job, 'failed')
+        job.phase, job.cursor, job.processed = 'delete', '', 0
+        _checkpoint(job)
+
+    if job.phase == 'delete':
+        return _delete_phase(job, client, lambda after: _copied_keys(job, client, src, dst, after))
+
+    if job.phase == 'rollback':
+        _rollback_move(job, client)
+
+
+def _copied_keys(job, client, src, dst, after=''):
+    """Source keys under src (after `after`) whose copy under dst is current, by merge-joining
+    the two listings (same order: only the prefix differs). Anything else — written after the
+    copy phase listed past it, or overwritten since it was copied — is counted, not yielded."""
+    bucket_name = job.bucket.bucket_name
+    copies = iter(client.list_objects(bucket_name, prefix=dst, recursive=True,
+                                      start_after=dst + after[len(src):] if after else None))
+    copy = next(copies, None)
+    for obj in client.list_objects(bucket_name, prefix=src, recursive=True, start_after=after or None):
+        name = obj.object_name[len(src):]
+        while copy is not None and copy.object_name[len(dst):] < name:
+            copy = next(copies, None)
+        if copy is not None and copy.object_name[len(dst):] == name and _in_sync(obj, copy):
+            yield obj.object_name
+        else:
+            job.params = {**job.params, 'left_in_source': job.params.get('left_in_source', 0) + 1}
+
+
+def _delete_phase(job, client, listing):
+    """Remove the keys listing(after) yields, 1000 per DeleteObjects request. Keys that failed on a
+    previous run sit before `cursor` in listing order, so they are retried first."""
+    bucket_name = job.bucket.bucket_name
+    retry = [e['key'] for e in job.errors if e.get('key')]
+    if job.params.get('errors_truncated'):
+        retry, job.cursor = [], ''
+        job.params = {k: v for k, v in job.params.items() if k != 'errors_truncated'}
+    job.errors, job.failed = [], 0
+    for batch in _batches(retry):
+        failures = delete_batch(client, bucket_name, batch)
+        job.processed += len(batch) - len(failures)
+        _record_errors(job, failures)
+        _checkpoint(job)
+    for batch in _batches(listing(job.cursor)):
+        failures = delete_batch(client, bucket_name, batch)
+        job.processed += len(batch) - len(failures)
+        _record_errors(job, failures)
+        _checkpoint(job, cursor=batch[-1])
+    if job.params.get('left_in_source'):
+        logger.warning("Storage job %s: %d source key(s) changed after being copied; left in place",
+                       job.id, job.params['left_in_source'])
+    return _finish(job, 'failed' if job.failed else 'completed')
+
+
+def _rollback_move(job, client):
+    bucket_name = job.bucket.bucket_name
+    job.errors, job.failed = [], 0
+    # dst was empty when the move was created: everything under it is a copy made by this job.
+    for batch in _batches(_keys(client, bucket_name, job.params['dst'], job.cursor)):
+        failures = delete_batch(client, bucket_name, batch)
+        _record_errors(job, failures)
+        _checkpoint(job, cursor=batch[-1])
+    return _finish(job, 'failed' if job.failed else 'rolled_back')
+
+
+# ---------------------------------------------------------------------------
+# Delete folder
+# ---------------------------------------------------------------------------
+def _delete(job, client):
+    if not job.total:
+        job.total = count_keys(client, job.bucket.bucket_name, job.params['prefix'])
+        _checkpoint(job)
+    bucket_name, prefix = job.bucket.bucket_name, job.params['prefix']
+    return _delete_phase(job, client, lambda after: _keys(client, bucket_name, prefix, after))
+
+
+# ---------------------------------------------------------------------------
+# Relocate bucket
+# ---------------------------------------------------------------------------
+def target_client(job):
+    """Client for the relocation target; buckets use the same (root) credentials on every MinIO."""
+    bucket = job.bucket
+    return get_client(internal_endpoint_for(job.params['target_endpoint']), bucket.access_key, bucket.secret_key)
+
+
+def _etag(value):
+    return (value or '').strip('"')
+
+
+class _HashingReader:
+    """File-like wrapper for put_object that MD5s the bytes streamed from the source."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        chunk = self._raw.read(size)
+        self.md5.update(chunk)
+        return chunk
+
+
+def transfer_one(src_client, dst_client, bucket_name, obj):
+    """Stream one object from src to dst and verify it. Raises on mismatch."""
+    response = src_client.get_object(bucket_name, obj.object_name)
+    try:
+        reader = _HashingReader(response)
+        dst_client.put_object(
+            bucket_name, obj.object_name, reader, length=obj.size, part_size=RELOCATE_PART_SIZE,
+            content_type=response.headers.get('Content-Type', 'application/octet-stream'),
+        )
+    finally:
+        response.close()
+        response.release_conn()
+    stat = dst_client.stat_object(bucket_name, obj.object_name)
+    problem = None
+    source_etag = _etag(obj.etag)
+    if stat.size != obj.size:
+        problem = f"size mismatch after copy: source {obj.size}, target {stat.size}"
+    elif source_etag and '-' not in source_etag and reader.md5.hexdigest() != source_etag:
+        problem = f"checksum mismatch: source ETag {source_etag}, streamed {reader.md5.hexdigest()}"
+    if problem:
+        # A bad copy newer than the source would look current to the next pass: drop it.
+        dst_client.remove_object(bucket_name, obj.object_name)
+        raise ValueError(problem)
+
+
+def _in_sync(src, dst):
+    if dst.size != src.size:
+        return False
+    if _etag(dst.etag) == _etag(src.etag):
+        return True
+    # Copied as multipart (or vice versa): ETags differ. A copy newer than the source is current.
+    return bool(dst.last_modified and src.last_modified and dst.last_modified >= src.last_modified)
+
+
+def diff_listings(src_client, dst_client, bucket_name, after=''):
+    """Merge-join the two sorted recursive listings. Yields (key, action, source object) with
+    action 'copy', 'skip' or 'extra' (only on the target). Memory use is constant."""
+    def listing(client):
+        return iter(client.list_objects(bucket_name, recursive=True, start_after=after or None))
+    src_iter, dst_iter = listing(src_client), listing(dst_client)
+    src, dst = next(src_iter, None), next(dst_iter, None)
+    while src is not None or dst is not None:
+        if dst is None or (src is not None and src.object_name < dst.object_name):
+            yield src.object_name, 'copy', src
+            src = next(src_iter, None)
+        elif src is None or dst.object_name < src.object_name:
+            yield dst.object_name, 'extra', None
+            dst = next(dst_iter, None)
+        else:
+            yield src.object_name, 'skip' if _in_sync(src, dst) else 'copy', src
+            src, dst = next(src_iter, None), next(dst_iter, None)
+
+
+def _sync_pass(job, src_client, dst_client, remove_extra):
+    bucket_name = job.bucket.bucket_name
+    retry = {e['key'] for e in job.errors if e.get('key')}
+    if job.params.get('errors_truncated'):
+        job.cursor = ''
+        job.params = {k: v for k, v in job.params.items() if k != 'errors_truncated'}
+    job.errors, job.failed = [], 0
+
+    def run(obj):
+        try:
+            transfer_one(src_client, dst_client, bucket_name, obj)
+            return None
+        except Exception as e:
+            return obj.object_name, str(e)
+
+    with ThreadPoolExecutor(max_workers=RELOCATE_WORKERS, thread_name_prefix='nidhi-relocate') as pool:
+        if retry:
+            # Failed keys sit before `cursor`: re-diff just those.
+            objs = [o for k, action, o in diff_listings(src_client, dst_client, bucket_name)
+                    if k in retry and action == 'copy']
+            failures = [f for f in pool.map(run, objs) if f]
+            job.processed += len(objs) - len(failures)
+            _record_errors(job, failures)
+            _checkpoint(job)
+        for batch in _batches(diff_listings(src_client, dst_client, bucket_name, job.cursor)):
+            to_copy = [obj for _, action, obj in batch if action == 'copy']
+            extra = [key for key, action, _ in batch if action == 'extra']
+            failures = [f for f in pool.map(run, to_copy) if f]
+            if remove_extra and extra:
+                failures += delete_batch(dst_client, bucket_name, extra)
+            job.processed += sum(1 for _, action, _ in batch if action != 'extra') - len(failures)
+            _record_errors(job, failures)
+            _checkpoint(job, cursor=batch[-1][0])
+    return not job.failed
+
+
+def _relocate(job, client):
+    dst_client = target_client(job)
+    bucket_name = job.bucket.bucket_name
+
+    if job.phase == 'copy':
+        if not dst_client.bucket_exists(bucket_name):
+            dst_client.make_bucket(bucket_name)
+        if not job.total:
+            job.total = count_keys(client, bucket_name, '')
+            _checkpoint(job)
+        if not _sync_pass(job, client, dst_client, remove_extra=False):
+            logger.warning("Relocation %s: %d object(s) failed to copy; endpoint unchanged", job.id, job.failed)
+            return _finish(job, 'failed')
+        job.phase, job.cursor, job.processed = 'sync', '', 0
+        _checkpoint(job)
+
+    if job.phase == 'sync':
+        if not _sync_pass(job, client, dst_client, remove_extra=True):
+            return _finish(job, 'failed')
+        job.phase = 'switch'
+        _checkpoint(job)
+
+    if job.phase == 'switch':
+        bucket = job.bucket
+        bucket.endpoint = job.params['target_endpoint']
+        if 'target_server_id' in job.params:
+            server_id = job.params['target_server_id']
+            bucket.server = DatabaseServer.objects.get(id=server_id) if server_id else None
+        bucket.save()  # post_save invalidates the cached config / clients
+        return _finish(job, 'completed')
+
+
+RUNNERS = {
+    'move': _move,
+    'delete': _delete,
+    'relocate': _relocate,
+}
+
+
+def run_job(job_id):
+    """Claim a pending job and run it to completion / failure. Returns the final status."""
+    claimed = StorageJob.objects.filter(id=job_id, status='pending').update(
+        status='running', updated_at=timezone.now())
+    if not claimed:
+        return None  # already running elsewhere, finished, or unknown
+    job = StorageJob.objects.select_related('bucket').get(id=job_id)
+    try:
+        RUNNERS[job.kind](job, get_bucket_client(job.bucket))
+    except Exception as e:
+        logger.exception("Storage job %s (%s) crashed in phase %s", job.id, job.kind, job.phase)
+        _record_errors(job, [("", str(e))])
+        job.status = 'failed'
+        job.save()
+    return job.status
+
+
+# ---------------------------------------------------------------------------
+# State transitions requested by the API
+# ---------------------------------------------------------------------------
+def prepare_resume(job):
+    if job.status == 'running' and not is_stale(job):
+        raise JobConflict("Job is still running.")
+    if job.status not in ('failed', 'running'):
+        raise JobConflict(f"Job is {job.status}; only failed or stalled jobs can be resumed.")
+    job.status = 'pending'
+    job.save(update_fields=['status', 'updated_at'])
+
+
+def prepare_rollback(job):
+    if job.kind != 'move':
+        raise JobConflict("Only move jobs can be rolled back.")
+    if job.status == 'running' and not is_stale(job):
+        raise JobConflict("Job is still running.")
+    if job.phase not in ('copy', 'rollback') or job.status in ('completed', 'rolled_back'):
+        raise JobConflict("Source objects are already being deleted; resume the job to finish the move.")
+    job.status, job.phase, job.cursor = 'pending', 'rollback', ''
+    job.save(update_fields=['status', 'phase', 'cursor', 'updated_at'])
+
+
+def overlapping_active_job(bucket, *prefixes):
+    """An unfinished job on this bucket touching any of the given prefixes, if any."""
+    # Failed jobs count too: their prefixes are half-moved until resumed or rolled back.
+    for job in StorageJob.objects.filter(bucket=bucket, status__in=ACTIVE_STATUSES + ('failed',)):
+        if job.kind == 'relocate':
+            if job.status in ACTIVE_STATUSES:
+                return job  # touches the whole bucket; a failed one left the source as it was
+            continue
+        touched = [p for p in (job.params.get('src'), job.params.get('dst'), job.params.get('prefix')) if p]
+        for mine in prefixes:
+            if any(mine.startswith(t) or t.startswith(mine) for t in touched):
+                return job
+    return None
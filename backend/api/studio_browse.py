@@ -0,0 +1,232 @@
+"""Table browsing for the Database Studio: keyset pages, sorting and typed filters.
+
+`get_table_data` used to return the first 100 rows and nothing else, so people hand-wrote
+OFFSET queries that read and throw away every earlier row. Here a page is
+
+    SELECT * FROM t WHERE <filters> AND (sort, key) > (last sort, last key)
+    ORDER BY sort, key LIMIT n + 1
+
+where `key` is the primary key (in index order) or, for tables without one, ctid (TID range
+scan). The extra row tells whether there is a next page. Page N therefore costs the same as
+page 1: an index range scan from the cursor position.
+
+Views and foreign tables have no ctid, and a partitioned table's ctid repeats across partitions,
+so without a primary key they get the first page only (`has_more`, no cursor): narrow them down
+with filters.
+
+  * sort      `sort=col` / `sort=-col`, only on the primary key or the leading column of an
+              index (anything else would be a full sort of the table on every page). NULLs keep
+              Postgres' default placement (last ascending, first descending) and are paged
+              through explicitly, since a row comparison with NULL matches nothing;
+  * filters   `filter=col:op:value` (repeatable), op in FILTER_OPS. Columns are checked against
+              the schema catalog (schema_catalog), identifiers quoted with psycopg2.sql and
+              values passed as parameters cast to the column's own type, so Postgres parses
+              them (a bad value is a 400);
+  * cursor    the last row's keyset values, read back as text (exact round trip through the
+              type's I/O functions), signed with django.core.signing together with the table,
+              sort and filters it belongs to. Clients treat it as opaque.
+"""
+import os
+import hashlib
+
+from django.core import signing
+from psycopg2 import sql
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.environ.get('NIDHI_STUDIO_MAX_PAGE_SIZE', '1000'))
+CURSOR_SALT = 'nidhi.studio.table-cursor'
+KEY_PREFIX = '__nidhi_k'  # keyset columns appended to the page query, stripped before returning
+ROW_ID_KINDS = ('table', 'materialized view')  # schema_catalog kinds with a unique ctid
+
+FILTER_OPS = {
+    'eq': '=', 'ne': '<>', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>=',
+    'like': 'LIKE', 'ilike': 'ILIKE', 'in': 'IN', 'is_null': 'IS NULL', 'not_null': 'IS NOT NULL',
+}
+
+class BrowseError(Exception):
+    """Rejected browse request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def primary_key(columns):
+    return [c['name'] for c in sorted((c for c in columns if c['pk_position']), key=lambda c: c['pk_position'])]
+
+
+def _page_size(value):
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise BrowseError("limit must be an integer.")
+    if not 1 <= size <= MAX_PAGE_SIZE:
+        raise BrowseError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return size
+
+
+def parse_sort(value, columns):
+    """`col` / `-col` -> (column dict, descending). None when unsorted (primary key order)."""
+    if not value:
+        return None, False
+    descending = value.startswith('-')
+    name = value.lstrip('-')
+    column = next((c for c in columns if c['name'] == name), None)
+    if column is None:
+        raise BrowseError(f"Unknown sort column '{name}'.")
+    if not (column['indexed'] or column['pk_position']):
+        raise BrowseError(f"Column '{name}' is not indexed; sort by the primary key or an indexed column.")
+    return column, descending
+
+
+def parse_filters(values, columns):
+    """`col:op:value` strings -> [(column dict, op, value)]."""
+    by_name = {c['name']: c for c in columns}
+    filters = []
+    for raw in values:
+        parts = raw.split(':', 2)
+        if len(parts) < 2:
+            raise BrowseError(f"Filter '{raw}' must look like column:op:value.")
+        name, op = parts[0], parts[1]
+        value = parts[2] if len(parts) == 3 else None
+        column = by_name.get(name)
+        if column is None:
+            raise BrowseError(f"Unknown filter column '{name}'.")
+        if op not in FILTER_OPS:
+            raise BrowseError(f"Unknown filter operator '{op}' (use one of {', '.join(FILTER_OPS)}).")
+        if op in ('like', 'ilike') and column['category'] != 'S':
+            raise BrowseError(f"'{op}' only applies to text columns; '{name}' is {column['type']}.")
+        if op not in ('is_null', 'not_null') and value is None:
+            raise BrowseError(f"Filter '{raw}' needs a value.")
+        filters.append((column, op, value))
+    return filters
+
+
+def _cast(type_name):
+    # The type comes from format_type() in the tenant's own catalog, not from the request.
+    return sql.SQL('%s::' + type_name)
+
+
+def _filter_clause(column, op, value):
+    ident = sql.Identifier(column['name'])
+    if op in ('is_null', 'not_null'):
+        return sql.SQL('{} ' + FILTER_OPS[op]).format(ident), []
+    if op == 'in':
+        return sql.SQL('{} = ANY({})').format(ident, _cast(column['type'] + '[]')), [value.split(',')]
+    return sql.SQL('{} ' + FILTER_OPS[op] + ' {}').format(ident, _cast(column['type'])), [value]
+
+
+def _fingerprint(table_name, sort, filters):
+    raw = repr((table_name, sort, sorted(filters)))
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint, values):
+    return signing.dumps({'f': fingerprint, 'v': values}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, fingerprint):
+    try:
+        payload = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise BrowseError("Invalid cursor.")
+    if payload.get('f') != fingerprint:
+        raise BrowseError("Cursor does not belong to this table / sort / filter combination.")
+    return payload['v']
+
+
+def _keyset(sort_column, key):
+    """[(sql expression, cast type)] of the ordering columns: sort column first, then the key."""
+    columns = [] if sort_column is None else [(sql.Identifier(sort_column['name']), sort_column['type'])]
+    for name, type_name in key:
+        if sort_column is None or name != sort_column['name']:
+            columns.append((sql.Identifier(name) if name != 'ctid' else sql.SQL('ctid'), type_name))
+    return columns
+
+
+def _after(keyset, values, descending, nullable):
+    """WHERE clause selecting rows strictly after the cursor position in ORDER BY order."""
+    comparison = '<' if descending else '>'
+    exprs = [e for e, _ in keyset]
+    casts = [_cast(t) for _, t in keyset]
+
+    def row_after(exprs, casts, params):
+        if len(exprs) == 1:
+            clause = sql.SQL('{} ' + comparison + ' {}').format(exprs[0], casts[0])
+        else:
+            clause = sql.SQL('({}) ' + comparison + ' ({})').format(sql.SQL(', ').join(exprs), sql.SQL(', ').join(casts))
+        return clause, list(params)
+
+    if not nullable:
+        return row_after(exprs, casts, values)
+
+    # Nullable sort column: ascending puts NULLs last, descending first (Postgres defaults).
+    head, rest = exprs[0], exprs[1:]
+    if values[0] is None:
+        tail, params = row_after(rest, casts[1:], values[1:])
+        clause = sql.SQL('({} IS NULL AND {})').format(head, tail)
+        if descending:
+            clause = sql.SQL('({} OR {} IS NOT NULL)').format(clause, head)
+        return clause, params
+    clause, params = row_after(exprs, casts, values)
+    if not descending:
+        clause = sql.SQL('({} OR {} IS NULL)').format(clause, head)
+    return clause, params
+
+
+def fetch_page(cursor, table_name, columns, sort=None, filters=(), after=None, limit=None, kind='table'):
+    """One page of `table_name` (a schema_catalog relation of `kind`).
+    Returns (rows, next_cursor or None, sort spec, has_more)."""
+    limit = _page_size(limit)
+    sort_column, descending = parse_sort(sort, columns)
+    parsed = parse_filters(list(filters), columns)
+    pk = primary_key(columns)
+    by_name = {c['name']: c for c in columns}
+    key = [(name, by_name[name]['type']) for name in pk] or ([('ctid', 'tid')] if kind in ROW_ID_KINDS else [])
+    keyset = _keyset(sort_column, key)
+    nullable = sort_column is not None and not sort_column['not_null'] and not sort_column['pk_position']
+    fingerprint = _fingerprint(table_name, sort or '', list(filters))
+
+    where, params = [], []
+    for column, op, value in parsed:
+        clause, values = _filter_clause(column, op, value)
+        where.append(clause)
+        params += values
+    if after:
+        if not key:
+            raise BrowseError(f"'{table_name}' has no primary key or row id to page by; narrow it down with filters.")
+        values = decode_cursor(after, fingerprint)
+        if len(values) != len(keyset):
+            raise BrowseError("Invalid cursor.")
+        clause, values = _after(keyset, values, descending, nullable)
+        where.append(clause)
+        params += values
+
+    direction = sql.SQL(' DESC' if descending else '')
+    query = sql.SQL('SELECT *{keys} FROM {table}{where}{order} LIMIT {limit}').format(
+        keys=sql.SQL('').join(
+            sql.SQL(', {}::text AS {}').format(expr, sql.Identifier(f'{KEY_PREFIX}{i}'))
+            for i, (expr, _) in enumerate(keyset)
+        ) if key else sql.SQL(''),
+        table=sql.Identifier(table_name),
+        where=sql.SQL(' WHERE ') + sql.SQL(' AND ').join(where) if where else sql.SQL(''),
+        order=sql.SQL(' ORDER BY ') + sql.SQL(', ').join(expr + direction for expr, _ in keyset)
+        if keyset else sql.SQL(''),
+        limit=sql.Literal(limit + 1),
+    )
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+
+    has_more, next_cursor = len(rows) > limit, None
+    if has_more:
+        rows = rows[:limit]
+        if key:
+            last = rows[-1]
+            next_cursor = encode_cursor(fingerprint, [last[f'{KEY_PREFIX}{i}'] for i in range(len(keyset))])
+    if key:
+        for row in rows:
+            for i in range(len(keyset)):
+                row.pop(f'{KEY_PREFIX}{i}', None)
+    return rows, next_cursor, sort or None, has_more
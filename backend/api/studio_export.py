@@ -0,0 +1,446 @@
+"""Streaming export of a table or query result: CSV via COPY, or Parquet / Arrow IPC.
+
+Exporting used to mean a whole-database dump or copy-pasting Studio rows. An export is
+
+  * csv      `COPY (<query>) TO STDOUT WITH (FORMAT csv, HEADER true)`: Postgres formats the
+             rows itself, the fastest path out of the server. psycopg2 only offers COPY into a
+             file object, so a worker thread runs copy_expert() into a bounded queue of
+             CHUNK_SIZE chunks that the response generator drains (a slow client stalls the COPY
+             instead of filling memory). Optional whole-stream gzip or zstd;
+  * parquet  the same COPY output, parsed by pyarrow's streaming CSV reader (C++, column types
+  * arrow    from the result's OIDs, so Postgres does the formatting and Python never touches a
+             value) into record batches of BLOCK_SIZE bytes of CSV, each written as one Parquet
+             row group / one Arrow IPC stream message. Codec: Parquet snappy (default), gzip,
+             zstd or none; Arrow IPC lz4, zstd or none.
+
+Values Arrow's text parsers reject (±infinity, BC or 5-digit years, 24:00:00) would stop a
+columnar export half-way, after the 200 went out. So timestamp, timestamptz, date and time
+columns leave Postgres as integers (microseconds / days since the epoch; ±infinity as the
+int64 / int32 extremes, Postgres' own encoding) that are cast to the Arrow type per batch, and
+numeric is exported as its exact text (Arrow decimals have no NaN). A value that still fails
+to convert raises ExportError (422): an upload is aborted, a download is cut off without the
+Parquet footer / IPC end-of-stream, and both are logged.
+
+Memory is bounded by a few chunks / one batch whatever the row count. Every export runs in a
+READ ONLY transaction under NIDHI_STUDIO_EXPORT_TIMEOUT (TimeZone UTC, DateStyle ISO), after a
+`SELECT ... LIMIT 0` probe, so a bad query is an error response, not a truncated file. Output goes to the client (through a
+signed link, like folder archives) or into a MinIO bucket (multipart put_object from the same
+stream). pyarrow and zstandard are optional: a format needing a missing one answers 501.
+"""
+import os
+import zlib
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+from psycopg2 import sql
+import psycopg2.extensions
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pa_csv = None
+    pq = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import studio_pool, studio_query
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+QUEUE_CHUNKS = 8
+BLOCK_SIZE = int(os.environ.get('NIDHI_STUDIO_EXPORT_BLOCK', str(16 * 1024 * 1024)))
+TIMEOUT_MS = int(float(os.environ.get('NIDHI_STUDIO_EXPORT_TIMEOUT', '600')) * 1000)
+UPLOAD_PART_SIZE = 16 * 1024 * 1024
+
+# format -> (content type, file extension, allowed compressions; first is the default)
+FORMATS = {
+    'csv': ('text/csv', '.csv', ('none', 'gzip', 'zstd')),
+    'parquet': ('application/vnd.apache.parquet', '.parquet', ('snappy', 'gzip', 'zstd', 'none')),
+    'arrow': ('application/vnd.apache.arrow.stream', '.arrows', ('none', 'lz4', 'zstd')),
+}
+_CSV_SUFFIX = {'gzip': '.gz', 'zstd': '.zst'}
+_CSV_CONTENT_TYPE = {'gzip': 'application/gzip', 'zstd': 'application/zstd'}
+_DONE = object()
+
+
+class ExportError(Exception):
+    """Rejected export request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def validate(fmt, compression=None):
+    """(format, compression) with defaults applied; ExportError if unknown or unavailable."""
+    fmt = (fmt or 'csv').lower()
+    if fmt not in FORMATS:
+        raise ExportError(f"format must be one of {', '.join(FORMATS)}.")
+    allowed = FORMATS[fmt][2]
+    compression = (compression or allowed[0]).lower()
+    if compression not in allowed:
+        raise ExportError(f"{fmt} compression must be one of {', '.join(allowed)}.")
+    if fmt != 'csv' and pa is None:
+        raise ExportError(f"{fmt} export needs pyarrow, which is not installed.", status=501)
+    if fmt == 'csv' and compression == 'zstd' and zstandard is None:
+        raise ExportError("zstd compression needs the zstandard package, which is not installed.", status=501)
+    return fmt, compression
+
+
+def source(table=None, query=None):
+    """The SELECT to export: a whole table, or a single row-returning query."""
+    if table:
+        return sql.SQL('SELECT * FROM {}').format(sql.Identifier(table))
+    query = (query or '').strip().rstrip(';').strip()
+    if not studio_query.streamable(query):
+        raise ExportError("Only SELECT / WITH / VALUES / TABLE statements can be exported.")
+    return sql.SQL(query)
+
+
+def filename(base, fmt, compression):
+    name = base + FORMATS[fmt][1]
+    return name + _CSV_SUFFIX.get(compression, '') if fmt == 'csv' else name
+
+
+def content_type(fmt, compression):
+    if fmt == 'csv' and compression in _CSV_CONTENT_TYPE:
+        return _CSV_CONTENT_TYPE[compression]
+    return FORMATS[fmt][0]
+
+
+class Export:
+    """One export on a pooled connection: prepare() (errors surface here), then iterate chunks().
+    The connection goes back to the pool when chunks() ends, fails or is closed."""
+
+    def __init__(self, instance, select, fmt, compression, timeout_ms=None):
+        self.instance = instance
+        self.select = select
+        self.fmt = fmt
+        self.compression = compression
+        self.timeout_ms = TIMEOUT_MS if timeout_ms is None else timeout_ms
+        self.columns = []
+        self.row_count = 0
+        self.byte_count = 0
+        self._pooled = None
+        self._description = None
+
+    def prepare(self):
+        self._pooled = studio_pool.acquire(self.instance)
+        conn = self._pooled.conn
+        try:
+            conn.autocommit = False
+            cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            cursor.execute('SET TRANSACTION READ ONLY')
+            cursor.execute(
+                "SELECT set_config('statement_timeout', %s, true), set_config('TimeZone', 'UTC', true), "
+                "set_config('DateStyle', 'ISO', true)", (str(int(self.timeout_ms)),))
+            cursor.execute(sql.SQL('SELECT * FROM ({}) AS nidhi_export LIMIT 0').format(self.select))
+            self._description = cursor.description
+            self.columns = [d.name for d in cursor.description]
+            cursor.close()
+        except Exception as e:
+            self._release(discard=isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)))
+            raise
+
+    def _release(self, discard=False):
+        if self._pooled is not None:
+            # reset_session: the query may have SET things the next borrower must not inherit.
+            studio_pool.release(self._pooled, discard=discard, reset_session=True)
+            self._pooled = None
+
+    def chunks(self):
+        error = None
+        body = self._csv() if self.fmt == 'csv' else self._arrow()
+        try:
+            for chunk in body:
+                self.byte_count += len(chunk)
+                yield chunk
+        except GeneratorExit:
+            error = GeneratorExit()
+            logger.info("Export from %s: client went away after %s bytes", self.instance.db_name, self.byte_count)
+            raise
+        except Exception as e:
+            # Headers are long gone: all we can do is cut the file short.
+            error = e
+            logger.error("Export from %s failed after %s bytes: %s", self.instance.db_name, self.byte_count, e)
+            raise
+        finally:
+            body.close()  # stops the COPY worker before the connection goes back
+            # An export cut short may leave the connection mid-COPY: close it rather than pool it.
+            self._release(discard=error is not None)
+
+    @contextmanager
+    def _copying(self, select=None):
+        """Run `COPY (select) TO STDOUT (FORMAT csv, HEADER true)` in a worker thread; yields the
+        _CopyPipe its output arrives in. Leaving early stops the worker and cancels the COPY on
+        the server."""
+        conn = self._pooled.conn
+        pipe = _CopyPipe()
+        copy = sql.SQL('COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)').format(select or self.select)
+
+        def run():
+            cursor = conn.cursor()
+            try:
+                cursor.copy_expert(copy, pipe, size=CHUNK_SIZE)
+                pipe.flush()
+                self.row_count = cursor.rowcount
+                pipe.put(_DONE)
+            except Exception as e:
+                pipe.put(e)
+            finally:
+                cursor.close()
+
+        worker = threading.Thread(target=run, name='nidhi-studio-export', daemon=True)
+        worker.start()
+        try:
+            yield pipe
+        finally:
+            if not pipe.finished:
+                pipe.stop.set()
+                conn.cancel()
+            worker.join(timeout=30)
+
+    def _csv(self):
+        compressor = _compressor(self.compression)
+        with self._copying() as pipe:
+            for chunk in pipe:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+    def _arrow_select(self):
+        """self.select with the _ENCODED columns replaced by their integer form (positional
+        aliases: a query result may repeat a column name). Unchanged when there are none."""
+        if not any(d.type_code in _ENCODED for d in self._description):
+            return self.select
+        names = [sql.Identifier(f'c{i}') for i in range(len(self._description))]
+        return sql.SQL('SELECT {} FROM ({}) AS nidhi_export ({})').format(
+            sql.SQL(', ').join(
+                sql.SQL(_ENCODED[d.type_code][0]).format(c=name) if d.type_code in _ENCODED else name
+                for d, name in zip(self._description, names)
+            ),
+            self.select,
+            sql.SQL(', ').join(names),
+        )
+
+    def _arrow(self):
+        """COPY's CSV parsed by pyarrow (C++, typed from the column OIDs) into record batches of
+        about BLOCK_SIZE bytes of CSV each; one Parquet row group / IPC message per batch."""
+        schema = pa.schema([pa.field(d.name, _arrow_type(d)) for d in self._description])
+        parse_types = [getattr(pa, _ENCODED[d.type_code][1])() if d.type_code in _ENCODED else t
+                       for d, t in zip(self._description, schema.types)]
+        sink = _Sink()
+        if self.fmt == 'parquet':
+            writer = pq.ParquetWriter(sink, schema, compression=self.compression)
+        else:
+            codec = None if self.compression == 'none' else self.compression
+            writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+        # Parsed under positional names (COPY's header is skipped), so repeated names are fine.
+        parse_names = [f'c{i}' for i in range(len(schema))]
+        with self._copying(self._arrow_select()) as pipe:
+            try:
+                # pyarrow reads ahead on its own thread: it only ever touches the (thread-safe) queue.
+                reader = pa_csv.open_csv(
+                    _ChunkReader(pipe),
+                    read_options=pa_csv.ReadOptions(column_names=parse_names, skip_rows=1, block_size=BLOCK_SIZE),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=dict(zip(parse_names, parse_types)),
+                        true_values=['t'], false_values=['f'],
+                        # COPY writes NULL as an unquoted empty field and '' as "": keep them apart.
+                        null_values=[''], strings_can_be_null=True, quoted_strings_can_be_null=False,
+                    ),
+                )
+                for batch in reader:
+                    writer.write_batch(pa.RecordBatch.from_arrays(
+                        [column if column.type == target else column.cast(target)
+                         for column, target in zip(batch.columns, schema.types)],
+                        schema=schema,
+                    ))
+                    data = sink.drain()
+                    if data:
+                        yield data
+            except pa.ArrowInvalid as e:
+                # Nothing more is written: no Parquet footer / IPC end-of-stream marks it complete.
+                raise ExportError(f"Cannot convert the result to {self.fmt}: {e}. "
+                                  "Cast the column to text in a query export, or export as CSV.", status=422)
+            writer.close()
+        yield sink.drain()
+
+
+class _CopyPipe:
+    """File object copy_expert() writes into (worker thread), read as chunks by the response.
+    Rows are gathered into CHUNK_SIZE chunks; at most QUEUE_CHUNKS wait in the queue."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+        self.stop = threading.Event()
+        self.finished = False
+        self._parts = []
+        self._size = 0
+
+    def write(self, data):
+        if self.stop.is_set():
+            raise IOError("export cancelled")
+        self._parts.append(data if isinstance(data, bytes) else data.encode())
+        self._size += len(data)
+        if self._size >= CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._parts:
+            self.put(b''.join(self._parts))
+            self._parts, self._size = [], 0
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        if item is not _DONE and not isinstance(item, Exception):
+            raise IOError("export cancelled")
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                self.finished = True
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class _Sink:
+    """Write-only file object collecting pyarrow writer output between yields."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._offset = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class _Identity:
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+def _compressor(compression):
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return _Identity()
+
+
+# Postgres type OID -> Arrow type; anything else (text, json, uuid, numeric, arrays, bytea as \x hex,
+# ...) is exported as its Postgres text form.
+_ARROW_TYPES = {
+    16: 'bool_', 21: 'int16', 23: 'int32', 20: 'int64', 26: 'int64', 700: 'float32', 701: 'float64',
+    1082: 'date32',
+}
+
+_EPOCH_US = "CASE WHEN isfinite({c}) THEN (extract(epoch FROM {c}) * 1000000)::int8 " \
+            "WHEN {c} = 'infinity' THEN 9223372036854775807 WHEN {c} = '-infinity' THEN -9223372036854775808 END"
+# OID -> (SQL sending the column as an integer, Arrow type it is parsed as before the cast).
+_ENCODED = {
+    1114: (_EPOCH_US, 'int64'),
+    1184: (_EPOCH_US, 'int64'),
+    1082: ("CASE WHEN isfinite({c}) THEN {c} - DATE '1970-01-01' "
+           "WHEN {c} = 'infinity' THEN 2147483647 WHEN {c} = '-infinity' THEN -2147483648 END",
+           'int32'),
+    1083: ("(extract(epoch FROM {c}) * 1000000)::int8", 'int64'),
+}
+
+
+def _arrow_type(description):
+    oid = description.type_code
+    if oid == 1114:
+        return pa.timestamp('us')
+    if oid == 1184:
+        return pa.timestamp('us', tz='UTC')
+    if oid == 1083:
+        return pa.time64('us')
+    name = _ARROW_TYPES.get(oid)
+    return getattr(pa, name)() if name else pa.string()
+
+
+class _ChunkReader:
+    """Readable file object over an iterator of byte chunks (minio's put_object(length=-1),
+    pyarrow's CSV reader)."""
+
+    closed = False
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._parts = []
+        self._size = 0
+
+    def read(self, size=-1):
+        while size < 0 or self._size < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._parts.append(chunk)
+            self._size += len(chunk)
+        data = b''.join(self._parts)
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+            self._parts, self._size = [rest], len(rest)
+        else:
+            self._parts, self._size = [], 0
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+def upload(export, client, bucket_name, key):
+    """Stream a prepared export into MinIO (multipart). Returns the object's etag."""
+    result = client.put_object(
+        bucket_name, key, _ChunkReader(export.chunks()), length=-1, part_size=UPLOAD_PART_SIZE,
+        content_type=content_type(export.fmt, export.compression),
+    )
+    return result.etag
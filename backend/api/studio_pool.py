@@ -0,0 +1,291 @@
+"""Process-wide pool of Studio connections to tenant databases, keyed by DatabaseInstance.
+
+The Studio views used to open a fresh psycopg2 connection (TCP + SCRAM auth + backend fork on
+the tenant server) for every call, and the UI fires several calls per click. This module keeps,
+per worker process:
+
+  * instance id -> idle connections (LIFO, so a quiet instance sheds its extras to the reaper);
+  * (host, port) -> connections open to that server, capped at NIDHI_STUDIO_MAX_PER_SERVER. At
+    the cap, an idle connection of another instance on the same server is closed to make room;
+    otherwise the checkout waits NIDHI_STUDIO_CHECKOUT_TIMEOUT seconds, then PoolExhausted;
+  * idle connections are closed after NIDHI_STUDIO_IDLE_TIMEOUT seconds (swept on every
+    checkout / checkin and by a daemon reaper thread, so a quiet worker still lets them go);
+  * a connection idle for more than NIDHI_STUDIO_PING_AFTER seconds gets a `SELECT 1` on
+    checkout; a dead one is replaced transparently.
+
+Every connection remembers the (host, port, user, password, db_name) it was opened with and is
+only handed out for an instance that still resolves to the same values, so a credential or
+server change is picked up by every worker on its next request. Saving / deleting a
+DatabaseServer or DatabaseInstance in THIS process also closes the idle connections at once and
+retires the checked-out ones when they come back.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import DatabaseServer, DatabaseInstance
+
+logger = logging.getLogger(__name__)
+
+MAX_PER_SERVER = int(os.environ.get('NIDHI_STUDIO_MAX_PER_SERVER', '10'))
+IDLE_TIMEOUT = float(os.environ.get('NIDHI_STUDIO_IDLE_TIMEOUT', '300'))
+PING_AFTER = float(os.environ.get('NIDHI_STUDIO_PING_AFTER', '30'))
+CHECKOUT_TIMEOUT = float(os.environ.get('NIDHI_STUDIO_CHECKOUT_TIMEOUT', '10'))
+CONNECT_TIMEOUT = int(os.environ.get('NIDHI_STUDIO_CONNECT_TIMEOUT', '5'))
+
+_cond = threading.Condition()
+_idle = {}         # instance id -> [_Pooled], most recently used last
+_open = {}         # (host, port) -> connections open (idle + checked out)
+_generation = {}   # instance id / server id -> bumped by invalidate()
+_reaper = None
+
+
+class PoolExhausted(Exception):
+    """Every connection allowed for the instance's server is in use."""
+
+
+class _Pooled:
+    __slots__ = ('conn', 'instance_id', 'server_id', 'server_key', 'signature', 'generation', 'last_used')
+
+    def __init__(self, conn, instance, signature):
+        self.conn = conn
+        self.instance_id = str(instance.id)
+        self.server_id = instance.server_id
+        self.server_key = signature[:2]
+        self.signature = signature
+        self.generation = _generations_for(self.instance_id, self.server_id)
+        self.last_used = time.monotonic()
+
+
+def _signature(instance):
+    server = instance.server
+    return (server.host, int(server.port), server.root_user, server.root_password, instance.db_name)
+
+
+def _generations_for(instance_id, server_id):
+    return _generation.get(('instance', instance_id), 0), _generation.get(('server', server_id), 0)
+
+
+def _current(pooled):
+    return pooled.generation == _generations_for(pooled.instance_id, pooled.server_id)
+
+
+def _connect(signature):
+    host, port, user, password, db_name = signature
+    return psycopg2.connect(
+        dbname=db_name, user=user, password=password, host=host, port=port,
+        cursor_factory=RealDictCursor, connect_timeout=CONNECT_TIMEOUT, application_name='nidhi-studio',
+    )
+
+
+def _close(pooled):
+    """Close a connection and give its slot back. Caller holds _cond."""
+    try:
+        pooled.conn.close()
+    except Exception:
+        pass
+    _open[pooled.server_key] = max(_open.get(pooled.server_key, 1) - 1, 0)
+    _cond.notify_all()
+
+
+def _evict_idle_locked(now):
+    for instance_id, conns in list(_idle.items()):
+        keep = []
+        for pooled in conns:
+            if now - pooled.last_used > IDLE_TIMEOUT:
+                _close(pooled)
+            else:
+                keep.append(pooled)
+        if keep:
+            _idle[instance_id] = keep
+        else:
+            del _idle[instance_id]
+
+
+def _take_idle_locked(instance_id, signature):
+    conns = _idle.get(instance_id) or []
+    while conns:
+        pooled = conns.pop()
+        if pooled.signature == signature and _current(pooled):
+            return pooled
+        _close(pooled)  # credentials / server / db_name changed since it was opened
+    return None
+
+
+def _steal_idle_locked(server_key):
+    """Close the least recently used idle connection to server_key (any instance)."""
+    victim = None
+    for conns in _idle.values():
+        for pooled in conns:
+            if pooled.server_key == server_key and (victim is None or pooled.last_used < victim.last_used):
+                victim = pooled
+    if victim is None:
+        return False
+    _idle[victim.instance_id].remove(victim)
+    _close(victim)
+    return True
+
+
+def _healthy(pooled):
+    if pooled.conn.closed:
+        return False
+    if time.monotonic() - pooled.last_used <= PING_AFTER:
+        return True
+    try:
+        cursor = pooled.conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.close()
+        pooled.conn.rollback()
+        return True
+    except Exception as e:
+        logger.info("Studio pool: dropping dead connection to %s: %s", pooled.signature[4], e)
+        return False
+
+
+def _reap():
+    while True:
+        time.sleep(max(IDLE_TIMEOUT / 2, 5))
+        with _cond:
+            _evict_idle_locked(time.monotonic())
+
+
+def _start_reaper():
+    global _reaper
+    if _reaper is None or not _reaper.is_alive():
+        _reaper = threading.Thread(target=_reap, name='nidhi-studio-pool-reaper', daemon=True)
+        _reaper.start()
+
+
+def acquire(instance, timeout=None):
+    """Check out a connection to `instance` (health-checked). Pair with release()."""
+    signature = _signature(instance)
+    instance_id = str(instance.id)
+    deadline = time.monotonic() + (CHECKOUT_TIMEOUT if timeout is None else timeout)
+    with _cond:
+        _start_reaper()
+        while True:
+            now = time.monotonic()
+            _evict_idle_locked(now)
+            pooled = _take_idle_locked(instance_id, signature)
+            if pooled is not None:
+                break
+            if _open.get(signature[:2], 0) < MAX_PER_SERVER:
+                _open[signature[:2]] = _open.get(signature[:2], 0) + 1
+                break
+            if _steal_idle_locked(signature[:2]):
+                continue
+            if now >= deadline:
+                raise PoolExhausted(
+                    f"All {MAX_PER_SERVER} Studio connections to {signature[0]}:{signature[1]} are busy; retry shortly."
+                )
+            _cond.wait(deadline - now)
+
+    if pooled is not None:
+        if _healthy(pooled):
+            pooled.last_used = time.monotonic()
+            return pooled
+        with _cond:
+            _close(pooled)
+            _open[pooled.server_key] = _open.get(pooled.server_key, 0) + 1  # keep the slot for the reconnect
+    try:
+        return _Pooled(_connect(signature), instance, signature)
+    except Exception:
+        with _cond:
+            _open[signature[:2]] = max(_open.get(signature[:2], 1) - 1, 0)
+            _cond.notify_all()
+        raise
+
+
+def release(pooled, discard=False, reset_session=False):
+    """Return a connection: rolled back (and DISCARD ALL-ed if asked) or, if broken, closed."""
+    conn = pooled.conn
+    if not discard and not conn.closed:
+        try:
+            conn.rollback()
+            if reset_session:
+                # Arbitrary SQL may have SET / PREPARE'd things the next borrower must not inherit.
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute('DISCARD ALL')
+                cursor.close()
+            if conn.autocommit:
+                conn.autocommit = False
+        except Exception as e:
+            logger.info("Studio pool: connection reset failed, closing it: %s", e)
+            discard = True
+    with _cond:
+        if discard or conn.closed or not _current(pooled):
+            _close(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        _idle.setdefault(pooled.instance_id, []).append(pooled)
+        _cond.notify_all()
+
+
+@contextmanager
+def connection(instance, reset_session=False):
+    """`with studio_pool.connection(instance) as conn:` — a pooled RealDictCursor connection.
+
+    Connection-level failures (OperationalError / InterfaceError) close it instead of pooling it.
+    """
+    pooled = acquire(instance)
+    discard = False
+    try:
+        yield pooled.conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    finally:
+        release(pooled, discard=discard, reset_session=reset_session)
+
+
+def invalidate(instance_id=None, server_id=None):
+    """Close idle connections of an instance and/or server and retire the checked-out ones.
+    With no arguments, empty the pool."""
+    with _cond:
+        if instance_id is not None:
+            _generation[('instance', str(instance_id))] = _generation.get(('instance', str(instance_id)), 0) + 1
+        if server_id is not None:
+            _generation[('server', server_id)] = _generation.get(('server', server_id), 0) + 1
+        everything = instance_id is None and server_id is None
+        for key, conns in list(_idle.items()):
+            keep = []
+            for pooled in conns:
+                if everything or not _current(pooled):
+                    _close(pooled)
+                else:
+                    keep.append(pooled)
+            if keep:
+                _idle[key] = keep
+            else:
+                del _idle[key]
+
+
+def stats():
+    """{"host:port": {"open": n, "idle": n}} for this process."""
+    with _cond:
+        result = {f"{host}:{port}": {"open": count, "idle": 0} for (host, port), count in _open.items()}
+        for conns in _idle.values():
+            for pooled in conns:
+                entry = result.setdefault("%s:%s" % pooled.server_key, {"open": 0, "idle": 0})
+                entry["idle"] += 1
+        return result
+
+
+@receiver(post_save, sender=DatabaseServer)
+@receiver(post_delete, sender=DatabaseServer)
+def _server_changed(sender, instance, **kwargs):
+    invalidate(server_id=instance.pk)
+
+
+@receiver(post_save, sender=DatabaseInstance)
+@receiver(post_delete, sender=DatabaseInstance)
+def _instance_changed(sender, instance, **kwargs):
+    invalidate(instance_id=instance.pk)
@@ -0,0 +1,151 @@
+"""Bounded, streamed execution of Studio SQL (execute_query).
+
+execute_query used to fetchall() whatever the user sent and build one JSON response from it, so a
+careless `SELECT * FROM events` could take the worker down. Now:
+
+  * the query runs in a READ ONLY transaction under a statement_timeout (NIDHI_STUDIO_QUERY_TIMEOUT
+    seconds for interactive queries; query jobs pass their own). SELECT / WITH / VALUES / TABLE statements go
+    through a named (server-side) cursor and are fetched BATCH_SIZE rows at a time; anything
+    else (SHOW, EXPLAIN, ...) through a plain cursor, whose results are small;
+  * rows stop at NIDHI_STUDIO_QUERY_MAX_ROWS or once their JSON encoding reaches
+    NIDHI_STUDIO_QUERY_MAX_BYTES, and the result says which cap cut it (`truncated_by`);
+  * output=ndjson streams a {"columns": [...]} line, one JSON array per row, then a trailer
+    {"done": true, "row_count", "truncated", "truncated_by"}; output=columnar streams the same
+    header, then one {"data": [[column values], ...]} line per batch. Memory stays at one batch.
+    A failure mid-stream ends it with an {"error": ...} line.
+"""
+import os
+import re
+import json
+import uuid
+import logging
+
+import psycopg2.extensions
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get('NIDHI_STUDIO_QUERY_BATCH', '1000'))
+MAX_ROWS = int(os.environ.get('NIDHI_STUDIO_QUERY_MAX_ROWS', '10000'))
+MAX_BYTES = int(os.environ.get('NIDHI_STUDIO_QUERY_MAX_BYTES', str(50 * 1024 * 1024)))
+TIMEOUT_MS = int(float(os.environ.get('NIDHI_STUDIO_QUERY_TIMEOUT', '30')) * 1000)
+OUTPUTS = ('json', 'ndjson', 'columnar')
+
+_ROW_QUERY = re.compile(r'^\s*\(*\s*(SELECT|WITH|VALUES|TABLE)\b', re.IGNORECASE)
+
+
+class _Encoder(JSONEncoder):
+    """DRF's encoder (dates, Decimal, UUID, ...) plus bytea, rendered like Postgres' hex output."""
+
+    def default(self, obj):
+        if isinstance(obj, memoryview):
+            return '\\x' + obj.hex()
+        return super().default(obj)
+
+
+def dumps(value):
+    return json.dumps(value, cls=_Encoder, separators=(',', ':'))
+
+
+def streamable(query):
+    """True if the statement can run behind DECLARE ... CURSOR (a single row-returning query)."""
+    return bool(_ROW_QUERY.match(query))
+
+
+class QueryResult:
+    """One Studio query on a pooled connection: execute(), then iterate rows(), then close()."""
+
+    def __init__(self, conn, query, max_rows=None, max_bytes=None, batch_size=None, timeout_ms=None):
+        self.conn = conn
+        self.timeout_ms = TIMEOUT_MS if timeout_ms is None else timeout_ms
+        self.query = query.strip().rstrip(';').strip()
+        self.max_rows = MAX_ROWS if max_rows is None else max_rows
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self.batch_size = batch_size or BATCH_SIZE
+        self.columns = []
+        self.row_count = 0
+        self.byte_count = 0
+        self.truncated_by = None
+        self._cursor = None
+        self._batch = []
+
+    @property
+    def truncated(self):
+        return self.truncated_by is not None
+
+    def execute(self):
+        """Run the statement and fetch the first batch (so errors surface before any streaming)."""
+        self.conn.autocommit = False
+        setup = self.conn.cursor()
+        setup.execute('SET TRANSACTION READ ONLY')
+        setup.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(self.timeout_ms)),))
+        setup.close()
+        tuples = psycopg2.extensions.cursor
+        if streamable(self.query):
+            self._cursor = self.conn.cursor(name=f'nidhi_studio_{uuid.uuid4().hex}', cursor_factory=tuples)
+            self._cursor.execute(self.query)
+            self._batch = self._cursor.fetchmany(self.batch_size)
+        else:
+            self._cursor = self.conn.cursor(cursor_factory=tuples)
+            self._cursor.execute(self.query)
+            self._batch = self._cursor.fetchmany(self.batch_size) if self._cursor.description else []
+        self.columns = [desc.name for desc in self._cursor.description or []]
+
+    def batches(self):
+        """Yield lists of (row tuple, encoded row) until the result or a cap runs out."""
+        while self._batch:
+            out = []
+            for row in self._batch:
+                if self.row_count >= self.max_rows:
+                    self.truncated_by = 'rows'
+                    break
+                encoded = dumps(row)
+                if self.byte_count + len(encoded) > self.max_bytes:
+                    self.truncated_by = 'bytes'
+                    break
+                self.row_count += 1
+                self.byte_count += len(encoded) + 1
+                out.append((row, encoded))
+            if out:
+                yield out
+            if self.truncated:
+                return
+            self._batch = self._cursor.fetchmany(self.batch_size)
+
+    def rows(self):
+        for batch in self.batches():
+            for row, _ in batch:
+                yield row
+
+    def summary(self):
+        return {"row_count": self.row_count, "truncated": self.truncated, "truncated_by": self.truncated_by}
+
+    def close(self):
+        if self._cursor is not None:
+            try:
+                self._cursor.close()
+            except Exception:
+                pass  # aborted transaction / dropped connection: the pool's rollback deals with it
+            self._cursor = None
+
+
+def stream(result, output, on_close):
+    """NDJSON lines of an executed QueryResult (`output` is 'ndjson' or 'columnar').
+    `on_close(error)` runs when the stream ends, fails or the client goes away."""
+    error = None
+    try:
+        yield dumps({"columns": result.columns}) + "\n"
+        for batch in result.batches():
+            if output == 'columnar':
+                values = list(zip(*(row for row, _ in batch)))
+                yield dumps({"data": [list(column) for column in values]}) + "\n"
+            else:
+                yield "".join(encoded + "\n" for _, encoded in batch)
+        yield dumps(dict(result.summary(), done=True)) + "\n"
+    except Exception as e:
+        error = e
+        logger.warning("Studio query stream failed after %s rows: %s", result.row_count, e)
+        yield dumps({"error": str(e).strip(), "row_count": result.row_count}) + "\n"
+    finally:
+        result.close()
+        on_close(error)
@@ -1,100 +1,156 @@
+import re
+import time
+
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from rest_framework.decorators import api_view, permission_classes
+import psycopg2.errors
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from .models import DatabaseInstance
+from django.http import StreamingHttpResponse
+from django.core import signing
+from django.utils import timezone
+from .models import DatabaseInstance, QueryJob, StorageBucket
 from .permissions import IsFoundingEngineer
+from . import studio_pool, studio_browse, studio_query, schema_catalog, query_profile, studio_export, db_dump, db_health
+from .storage import get_bucket_client
+from . import query_jobs as query_jobs_module
 
-def get_connection(instance):
-    """Helper to get a dict cursor connection to a specific database instance."""
-    conn = psycopg2.connect(
-        dbname=instance.db_name,
-        user=instance.server.root_user,
-        password=instance.server.root_password,
-        host=instance.server.host,
-        port=instance.server.port,
-        cursor_factory=RealDictCursor
-    )
-    return conn
+LONG_POLL_SECONDS = 25
 
 @api_view(['GET'])
 @permission_classes([IsFoundingEngineer])
 def get_tables(request, instance_id):
-    """Retrieve all user tables in the database."""
+    """Retrieve all user tables in the database (from the cached schema catalog)."""
     instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
     
-    conn = None
-    try:
-        conn = get_connection(instance)
-        cursor = conn.cursor()
-        query = """
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            ORDER BY table_name;
-        """
-        cursor.execute(query)
-        tables = [row['table_name'] for row in cursor.fetchall()]
-        cursor.close()
-        return Response({"tables": tables}, status=status.HTTP_200_OK)
+    try:
+        catalog = schema_catalog.get_catalog(instance)
+        return Response({"tables": [t['name'] for t in catalog['tables']]}, status=status.HTTP_200_OK)
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def get_schema(request, instance_id):
+    """The instance's schema catalog: tables with columns, keys, indexes, row estimates and sizes.
+
+    Served from the cache while the catalog version is unchanged; `?refresh=1` rebuilds it.
+    """
+    instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
+
+    try:
+        catalog = schema_catalog.get_catalog(instance, refresh=request.query_params.get('refresh') in ('1', 'true'))
+        return Response({
+            "version": catalog['version'],
+            "built_at": catalog['built_at'],
+            "tables": catalog['tables'],
+        }, status=status.HTTP_200_OK)
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def get_health(request, instance_id):
+    """Table and index health: dead tuples, bloat estimates, scan mix, unused / invalid indexes and
+    cache hit ratios, with ranked findings; see db_health. One round trip to the database."""
+    instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
+
+    try:
+        return Response(db_health.get_report(instance), status=status.HTTP_200_OK)
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    finally:
-        if conn:
-            conn.close()
 
 @api_view(['GET'])
 @permission_classes([IsFoundingEngineer])
 def get_table_data(request, instance_id, table_name):
-    """Retrieve up to 100 rows from a specific table."""
+    """One keyset page of a table (see studio_browse).
+
+    Query params: limit (default 100), sort (`col` / `-col`, indexed columns only),
+    filter (`col:op:value`, repeatable) and cursor (the previous page's `next_cursor`).
+    """
     instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
     
     # Very basic protection against SQL injection on table_name
     if not table_name.isidentifier():
         return Response({"error": "Invalid table name"}, status=status.HTTP_400_BAD_REQUEST)
         
-    conn = None
     try:
-        conn = get_connection(instance)
-        cursor = conn.cursor()
-        
-        # Get column names first
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema='public' AND table_name=%s ORDER BY ordinal_position;", (table_name,))
-        columns = [row['column_name'] for row in cursor.fetchall()]
-        
-        # Get primary keys
-        cursor.execute("""
-            SELECT a.attname
-            FROM   pg_index i
-            JOIN   pg_attribute a ON a.attrelid = i.indrelid
-                                 AND a.attnum = ANY(i.indkey)
-            WHERE  i.indrelid = %s::regclass
-            AND    i.indisprimary;
-        """, (table_name,))
-        primary_keys = [row['attname'] for row in cursor.fetchall()]
-        
-        # Get data
-        # psycopg2 sql composition is safer but for this simple explorer we'll construct the query
-        # Since we checked isidentifier() we have basic protection
-        cursor.execute(f'SELECT * FROM "{table_name}" LIMIT 100;')
-        rows = cursor.fetchall()
-        
-        cursor.close()
-        
+        table = schema_catalog.table(schema_catalog.get_catalog(instance), table_name)
+        if table is None:
+            return Response({"error": f"Table '{table_name}' not found."}, status=status.HTTP_404_NOT_FOUND)
+        columns = table['columns']
+        with studio_pool.connection(instance) as conn:
+            cursor = conn.cursor()
+            rows, next_cursor, sort, has_more = studio_browse.fetch_page(
+                cursor, table_name, columns,
+                sort=request.query_params.get('sort'),
+                filters=request.query_params.getlist('filter'),
+                after=request.query_params.get('cursor'),
+                limit=request.query_params.get('limit'),
+                kind=table.get('kind', 'table'),
+            )
+            cursor.close()
+
         return Response({
             "table": table_name,
-            "columns": columns,
-            "primary_keys": primary_keys,
-            "rows": rows
+            "columns": [c['name'] for c in columns],
+            "column_types": {c['name']: c['type'] for c in columns},
+            "primary_keys": studio_browse.primary_key(columns),
+            "sortable": [c['name'] for c in columns if c['indexed'] or c['pk_position']],
+            "sort": sort,
+            "rows": rows,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
         }, status=status.HTTP_200_OK)
-        
+
+    except studio_browse.BrowseError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except psycopg2.DataError as e:
+        # A filter value Postgres cannot parse as the column's type.
+        return Response({"error": str(e).strip()}, status=status.HTTP_400_BAD_REQUEST)
+    except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedColumn):
+        # DDL landed within the catalog's trust window: drop it so the next call rebuilds.
+        schema_catalog.invalidate(instance)
+        return Response({"error": f"The schema of '{table_name}' changed; reload the table."}, status=status.HTTP_409_CONFLICT)
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    finally:
-        if conn:
-            conn.close()
+
+# Reject any destructive / mutating statement.
+FORBIDDEN_SQL = re.compile(
+    r"\b(DROP|TRUNCATE|DELETE|ALTER|CREATE|INSERT|UPDATE|RENAME|GRANT|REVOKE|COMMENT)\b",
+    re.IGNORECASE,
+)
+
+
+def _reject_mutating_sql(request, instance, query):
+    """403 (audited) for SQL the data-safety guard blocks, else None."""
+    from .models import AuditLog
+    if not FORBIDDEN_SQL.search(query):
+        return None
+    AuditLog.objects.create(
+        actor_type='founding_engineer',
+        actor=getattr(request.user, 'username', 'unknown'),
+        action='execute_query',
+        target=instance.db_name,
+        server=instance.server.name,
+        detail='REJECTED destructive SQL (guarded): ' + query[:500],
+        success=False,
+    )
+    return Response(
+        {"error": "Mutating/DDL statements are blocked by the data-safety guard. "
+                  "Use migrations for schema changes."},
+        status=status.HTTP_403_FORBIDDEN,
+    )
 
 @api_view(['POST'])
 @permission_classes([IsFoundingEngineer])
@@ -104,6 +160,10 @@ def execute_query(request, instance_id):
     NOTE (2026-07-18 data-safety hardening): this runner is READ-ONLY. DROP / TRUNCATE / DELETE /
     ALTER / CREATE / UPDATE / INSERT are rejected. Schema changes must go through migrations, not
     the Studio. Every execution is written to AuditLog for traceability.
+
+    Results are fetched in batches through a server-side cursor and capped (see studio_query);
+    `output` = json (default, one response with row_count / truncated / truncated_by), ndjson or
+    columnar (streamed).
     """
     from .models import AuditLog, is_production_environment
     instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
@@ -111,103 +171,384 @@ def execute_query(request, instance_id):
     query = (request.data.get('query') or '').strip()
     if not query:
         return Response({"error": "Query string is required."}, status=status.HTTP_400_BAD_REQUEST)
+    rejected = _reject_mutating_sql(request, instance, query)
+    if rejected:
+        return rejected
+
+    output = (request.data.get('output') or request.query_params.get('output') or 'json').lower()
+    if output not in studio_query.OUTPUTS:
+        return Response({"error": f"output must be one of {', '.join(studio_query.OUTPUTS)}."},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        pooled = studio_pool.acquire(instance)
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def release(error=None):
+        # reset_session: arbitrary SQL may SET things the connection's next borrower must not inherit.
+        studio_pool.release(pooled, reset_session=True,
+                            discard=isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)))
 
-    # Reject any destructive / mutating statement.
-    forbidden = re.compile(
-        r"(DROP|TRUNCATE|DELETE|ALTER|CREATE|INSERT|UPDATE|RENAME|GRANT|REVOKE|COMMENT)",
-        re.IGNORECASE,
+    result = studio_query.QueryResult(pooled.conn, query)
+    try:
+        result.execute()
+    except Exception as e:
+        result.close()
+        release(e)
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    AuditLog.objects.create(
+        actor_type='founding_engineer',
+        actor=getattr(request.user, 'username', 'unknown'),
+        action='execute_query',
+        target=instance.db_name,
+        server=instance.server.name,
+        detail='SELECT executed: ' + query[:300],
+        success=True,
     )
-    if forbidden.search(query):
-        AuditLog.objects.create(
-            actor_type='founding_engineer',
-            actor=getattr(request.user, 'username', 'unknown'),
-            action='execute_query',
-            target=instance.db_name,
-            server=instance.server.name,
-            detail='REJECTED destructive SQL (guarded): ' + query[:500],
-            success=False,
-        )
-        return Response(
-            {"error": "Mutating/DDL statements are blocked by the data-safety guard. "
-                      "Use migrations for schema changes."},
-            status=status.HTTP_403_FORBIDDEN,
-        )
+    if output != 'json':
+        # The stream owns the connection from here and hands it back when it ends.
+        return StreamingHttpResponse(studio_query.stream(result, output, on_close=release),
+                                     content_type='application/x-ndjson')
 
-    conn = None
-    try:
-        conn = get_connection(instance)
-        conn.autocommit = True
-        cursor = conn.cursor()
-        cursor.execute(query)
-        rows = []
-        columns = []
-        if cursor.description:
-            columns = [desc.name for desc in cursor.description]
-            rows = cursor.fetchall()
-        cursor.close()
-        AuditLog.objects.create(
-            actor_type='founding_engineer',
-            actor=getattr(request.user, 'username', 'unknown'),
-            action='execute_query',
-            target=instance.db_name,
-            server=instance.server.name,
-            detail='SELECT executed: ' + query[:300],
-            success=True,
-        )
-        return Response({
-            "columns": columns,
-            "rows": rows,
-            "message": "Query executed successfully."
-        }, status=status.HTTP_200_OK)
+    error = None
+    try:
+        rows = [dict(zip(result.columns, row)) for row in result.rows()]
     except Exception as e:
+        error = e
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     finally:
-        if conn:
-            conn.close()
+        result.close()
+        release(error)
+    return Response(dict(
+        result.summary(),
+        columns=result.columns,
+        rows=rows,
+        message="Query executed successfully." if not result.truncated else
+                f"Query executed; result truncated at {result.row_count} rows ({result.truncated_by} limit).",
+    ), status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def explain_query(request, instance_id):
+    """Profile a query with EXPLAIN (ANALYZE, BUFFERS) in a rolled-back READ ONLY transaction.
+
+    Returns the parsed plan tree, the hottest nodes and findings (misestimates, sequential scans
+    of large tables, disk spills); see query_profile. ANALYZE runs the query for real, so the
+    same data-safety guard and audit trail as execute_query apply.
+    """
+    from .models import AuditLog
+    instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
+
+    query = (request.data.get('query') or '').strip()
+    if not query:
+        return Response({"error": "Query string is required."}, status=status.HTTP_400_BAD_REQUEST)
+    rejected = _reject_mutating_sql(request, instance, query)
+    if rejected:
+        return rejected
+
+    try:
+        # Table sizes for the seq-scan findings come from the (cached) schema catalog.
+        row_estimates = {t['name']: t['row_estimate'] for t in schema_catalog.get_catalog(instance)['tables']}
+        with studio_pool.connection(instance, reset_session=True) as conn:
+            document = query_profile.explain(conn, query)
+    except query_profile.ProfileError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({"error": str(e).strip()}, status=status.HTTP_400_BAD_REQUEST)
+
+    AuditLog.objects.create(
+        actor_type='founding_engineer',
+        actor=getattr(request.user, 'username', 'unknown'),
+        action='execute_query',
+        target=instance.db_name,
+        server=instance.server.name,
+        detail='EXPLAIN ANALYZE executed: ' + query[:300],
+        success=True,
+    )
+    return Response(query_profile.analyze(document, row_estimates), status=status.HTTP_200_OK)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsFoundingEngineer])
+def query_jobs(request, instance_id):
+    """GET: recent query jobs of the instance. POST {"query", "timeout"?}: submit an async query
+    (202). It runs on a Celery worker under the role's statement_timeout; see api.query_jobs."""
+    instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
+    if request.method == 'GET':
+        jobs = QueryJob.objects.filter(instance=instance)[:50]
+        return Response({"jobs": [query_jobs_module.job_payload(job) for job in jobs]}, status=status.HTTP_200_OK)
+
+    query = (request.data.get('query') or '').strip()
+    if not query:
+        return Response({"error": "Query string is required."}, status=status.HTTP_400_BAD_REQUEST)
+    rejected = _reject_mutating_sql(request, instance, query)
+    if rejected:
+        return rejected
+    try:
+        job = query_jobs_module.submit(
+            instance, query, submitted_by=getattr(request.user, 'username', 'unknown'),
+            role=getattr(request.user, 'role', ''), timeout=request.data.get('timeout'),
+        )
+    except query_jobs_module.QueryJobError as e:
+        return Response({"error": str(e)}, status=e.status)
+    return Response(query_jobs_module.job_payload(job), status=status.HTTP_202_ACCEPTED)
+
 
+def _wait_for_change(job, seen_status, wait):
+    """The job once its status is no longer `seen_status` (it is re-read once a second), or as
+    it is after `wait` seconds. Bounded, so a watcher holds a worker for one poll, not the run."""
+    deadline = time.monotonic() + wait
+    while job.status == seen_status and job.status in query_jobs_module.ACTIVE_STATUSES \
+            and time.monotonic() < deadline:
+        time.sleep(1)
+        job.refresh_from_db()
+    return job
 
-import os
-import subprocess
-from django.http import FileResponse
 
 @api_view(['GET'])
 @permission_classes([IsFoundingEngineer])
-def download_database_dump(request, instance_id):
-    """Generates a pg_dump file for the given instance and returns it as a download."""
+def query_job_detail(request, instance_id, job_id):
+    """Status of a query job. Long-poll with ?status=<last seen status>&wait=<seconds> (at most
+    LONG_POLL_SECONDS): the answer comes as soon as the status changes, or when the wait is over."""
+    job = get_object_or_404(QueryJob, id=job_id, instance_id=instance_id)
+    seen_status = request.query_params.get('status')
+    if seen_status:
+        try:
+            wait = min(max(float(request.query_params.get('wait', LONG_POLL_SECONDS)), 0), LONG_POLL_SECONDS)
+        except ValueError:
+            return Response({"error": "wait must be a number of seconds."}, status=status.HTTP_400_BAD_REQUEST)
+        job = _wait_for_change(job, seen_status, wait)
+    return Response(query_jobs_module.job_payload(job), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def cancel_query_job(request, instance_id, job_id):
+    """Cancel a queued job, or pg_cancel_backend() the one running it."""
+    job = get_object_or_404(QueryJob.objects.select_related('instance__server'), id=job_id, instance_id=instance_id)
+    try:
+        job = query_jobs_module.cancel(job, actor=getattr(request.user, 'username', 'unknown'))
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({"error": f"Cancel failed: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
+    return Response(query_jobs_module.job_payload(job), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def query_job_results(request, instance_id, job_id):
+    """One spooled result page: ?page=N (1-based)."""
+    job = get_object_or_404(QueryJob, id=job_id, instance_id=instance_id)
+    try:
+        page = int(request.query_params.get('page') or 1)
+    except ValueError:
+        return Response({"error": "page must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        rows = query_jobs_module.read_page(job, page)
+    except query_jobs_module.QueryJobError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except Exception as e:
+        return Response({"error": f"Could not read results: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
+    return Response({
+        "job_id": str(job.id),
+        "columns": job.columns,
+        "rows": rows,
+        "page": page,
+        "page_count": job.page_count,
+        "next_page": page + 1 if page < job.page_count else None,
+        "row_count": job.row_count,
+        "truncated_by": job.truncated_by or None,
+    }, status=status.HTTP_200_OK)
+
+
+EXPORT_LINK_MAX_AGE = 300  # seconds an export download link stays valid
+_EXPORT_SALT = 'nidhi.studio.export'
+
+
+def _export_from_claims(instance, claims):
+    select = studio_export.source(table=claims.get('t'), query=claims.get('q'))
+    return studio_export.Export(instance, select, claims['f'], claims['c'])
+
+
+@api_view(['POST'])
+@permission_classes([IsFoundingEngineer])
+def create_export(request, instance_id):
+    """Export a table or query result as CSV (COPY), Parquet or Arrow IPC; see studio_export.
+
+    Body: {table | query, format (csv / parquet / arrow), compression?, bucket_id?, key?}.
+    Without bucket_id the answer is a short-lived signed link the browser navigates to (like
+    folder archives), so the file streams to disk. With bucket_id the export streams into that
+    MinIO bucket under `key` and the answer describes the object.
+    """
+    from .models import AuditLog
+    from .bucket_views import _bucket_access_error
     instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
-    server = instance.server
-    
+
+    table = (request.data.get('table') or '').strip()
+    query = (request.data.get('query') or '').strip()
+    if bool(table) == bool(query):
+        return Response({"error": "Provide either table or query."}, status=status.HTTP_400_BAD_REQUEST)
+    if table and not table.isidentifier():
+        return Response({"error": "Invalid table name"}, status=status.HTTP_400_BAD_REQUEST)
+    if query:
+        rejected = _reject_mutating_sql(request, instance, query)
+        if rejected:
+            return rejected
     try:
-        dump_path = os.path.join('/tmp', f"dump_{instance.db_name}.sql")
-        
-        # Use PGPASSWORD to bypass prompt
-        os.environ['PGPASSWORD'] = server.root_password
-        
-        # Dump to plain-text SQL format
-        dump_cmd = [
-            'pg_dump',
-            '-h', server.host,
-            '-p', str(server.port),
-            '-U', server.root_user,
-            '-d', instance.db_name,
-            '-F', 'p',  # plain text SQL
-            '-f', dump_path
-        ]
-        
-        result = subprocess.run(dump_cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            return Response({"error": f"Dump failed: {result.stderr}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-        if not os.path.exists(dump_path):
-            return Response({"error": "Dump file not generated."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-        # Stream the file back
-        response = FileResponse(open(dump_path, 'rb'), as_attachment=True, filename=f"{instance.db_name}_backup.sql")
-        return response
-        
+        fmt, compression = studio_export.validate(request.data.get('format'), request.data.get('compression'))
+        studio_export.source(table=table, query=query)
+    except studio_export.ExportError as e:
+        return Response({"error": str(e)}, status=e.status)
+
+    claims = {'i': str(instance.id), 't': table, 'q': query, 'f': fmt, 'c': compression}
+    name = studio_export.filename(table or f"{instance.db_name}-query", fmt, compression)
+    AuditLog.objects.create(
+        actor_type='founding_engineer',
+        actor=getattr(request.user, 'username', 'unknown'),
+        action='execute_query',
+        target=instance.db_name,
+        server=instance.server.name,
+        detail=f"EXPORT {fmt}/{compression}: " + (f"table {table}" if table else query[:300]),
+        success=True,
+    )
+
+    bucket_id = request.data.get('bucket_id')
+    if not bucket_id:
+        token = signing.dumps(claims, salt=_EXPORT_SALT, compress=True)
+        # Relative to the API root (the frontend reaches it as /nidhi-api/<path>).
+        return Response({"path": f"studio/exports/{token}/", "filename": name, "expires_in": EXPORT_LINK_MAX_AGE},
+                        status=status.HTTP_201_CREATED)
+
+    bucket = get_object_or_404(StorageBucket, id=bucket_id)
+    denied = _bucket_access_error(request, bucket)
+    if denied:
+        return denied
+    key = (request.data.get('key') or '').lstrip('/') or \
+        f"exports/{instance.db_name}/{timezone.now():%Y%m%d-%H%M%S}-{name}"
+    export = _export_from_claims(instance, claims)
+    try:
+        export.prepare()
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({"error": str(e).strip()}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        etag = studio_export.upload(export, get_bucket_client(bucket), bucket.bucket_name, key)
+    except studio_export.ExportError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except Exception as e:
+        return Response({"error": f"Export failed: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
+    return Response({
+        "bucket": bucket.bucket_name,
+        "key": key,
+        "etag": etag,
+        "size": export.byte_count,
+        "row_count": export.row_count,
+        "columns": export.columns,
+        "format": fmt,
+        "compression": compression,
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def download_export(request, token):
+    """Streams the export for a link from create_export."""
+    try:
+        claims = signing.loads(token, salt=_EXPORT_SALT, max_age=EXPORT_LINK_MAX_AGE)
+    except signing.SignatureExpired:
+        return Response({"error": "Download link expired."}, status=status.HTTP_410_GONE)
+    except signing.BadSignature:
+        return Response({"error": "Invalid download link."}, status=status.HTTP_403_FORBIDDEN)
+    instance = get_object_or_404(DatabaseInstance, id=claims['i'], is_deleted=False)
+
+    export = _export_from_claims(instance, claims)
+    try:
+        export.prepare()
+    except studio_export.ExportError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except studio_pool.PoolExhausted as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({"error": str(e).strip()}, status=status.HTTP_400_BAD_REQUEST)
+
+    name = studio_export.filename(claims['t'] or f"{instance.db_name}-query", claims['f'], claims['c'])
+    response = StreamingHttpResponse(export.chunks(), content_type=studio_export.content_type(claims['f'], claims['c']))
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+_DUMP_SALT = 'nidhi.studio.dump'
+
+
+def _stream_dump(instance, fmt, compression):
+    dump = db_dump.Dump(instance, fmt, compression)
+    try:
+        dump.start()
+    except db_dump.DumpError as e:
+        return Response({"error": str(e)}, status=e.status)
+    response = StreamingHttpResponse(dump.chunks(), content_type=db_dump.content_type(fmt, compression))
+    response['Content-Disposition'] = f'attachment; filename="{db_dump.filename(instance.db_name, fmt, compression)}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsFoundingEngineer])
+def download_database_dump(request, instance_id):
+    """pg_dump of the instance, streamed as it is produced; see db_dump.
+
+    POST {format (plain / custom), compression?} answers a short-lived signed link the browser
+    navigates to (like exports), so the dump streams to disk. GET streams it directly to API
+    clients (?dump_format=&compression=; `format` is DRF's renderer override).
+    """
+    from .models import AuditLog
+    instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
+    params = request.data if request.method == 'POST' else request.query_params
+    try:
+        fmt, compression = db_dump.validate(
+            params.get('format') if request.method == 'POST' else params.get('dump_format'),
+            params.get('compression'),
+        )
+    except db_dump.DumpError as e:
+        return Response({"error": str(e)}, status=e.status)
+
+    AuditLog.objects.create(
+        actor_type='founding_engineer',
+        actor=getattr(request.user, 'username', 'unknown'),
+        action='backup_db',
+        target=instance.db_name,
+        server=instance.server.name,
+        detail=f"Studio download ({fmt}/{compression})",
+        success=True,
+    )
+    if request.method == 'GET':
+        return _stream_dump(instance, fmt, compression)
+    token = signing.dumps({'i': str(instance.id), 'f': fmt, 'c': compression}, salt=_DUMP_SALT)
+    return Response({"path": f"studio/dumps/{token}/", "filename": db_dump.filename(instance.db_name, fmt, compression),
+                     "expires_in": EXPORT_LINK_MAX_AGE}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def download_dump_link(request, token):
+    """Streams the dump for a link from download_database_dump."""
+    try:
+        claims = signing.loads(token, salt=_DUMP_SALT, max_age=EXPORT_LINK_MAX_AGE)
+    except signing.SignatureExpired:
+        return Response({"error": "Download link expired."}, status=status.HTTP_410_GONE)
+    except signing.BadSignature:
+        return Response({"error": "Invalid download link."}, status=status.HTTP_403_FORBIDDEN)
+    instance = get_object_or_404(DatabaseInstance, id=claims['i'], is_deleted=False)
+    return _stream_dump(instance, claims['f'], claims['c'])
 
 from .tasks import external_db_migration_task
 
@@ -811,3 +811,94 @@ def external_db_migration_task(instance_id, source_uri):
     except Exception as e:
         print(f"Migration failed: {str(e)}")
         return None
+
+
+@shared_task
+def prune_media_usage_rollups():
+    """Drop hourly media-usage rollups past NIDHI_MEDIA_HOURLY_RETENTION_DAYS (default 30).
+    Daily rows are kept indefinitely — they are the per-product bandwidth history."""
+    from .metering import prune_hourly
+    deleted = prune_hourly(int(os.environ.get('NIDHI_MEDIA_HOURLY_RETENTION_DAYS', '30')))
+    logger.info(f"Media usage prune: removed {deleted} hourly rollup row(s).")
+    return deleted
+
+
+@shared_task
+def run_storage_job(job_id):
+    """Runs a StorageJob (folder move, ...) — see api.storage_jobs for phases and resume rules."""
+    from .storage_jobs import run_job
+    return run_job(job_id)
+
+
+@shared_task
+def abort_stale_upload_sessions():
+    """Abort multipart uploads whose session saw no part for NIDHI_UPLOAD_SESSION_TTL_HOURS (default 24),
+    so MinIO frees the orphaned parts."""
+    from .uploads import abort_stale
+    aborted = abort_stale()
+    logger.info(f"Upload sessions: aborted {aborted} stale session(s).")
+    return aborted
+
+
+@shared_task
+def reconcile_object_index(bucket_id):
+    """Full listing pass for one bucket's object index (see api.object_index)."""
+    from .models import StorageBucket
+    from .object_index import reconcile
+    from .storage import get_bucket_client
+    bucket = StorageBucket.objects.get(id=bucket_id)
+    stats = reconcile(bucket, get_bucket_client(bucket))
+    logger.info(f"Object index {bucket.bucket_name}: {stats}")
+    return stats
+
+
+@shared_task
+def reconcile_object_indexes():
+    """Periodic safety net for missed MinIO notifications: reconcile every enabled index."""
+    from .models import ObjectIndex
+    for bucket_id in ObjectIndex.objects.filter(enabled=True).values_list('bucket_id', flat=True):
+        reconcile_object_index.delay(str(bucket_id))
+
+
+@shared_task
+def run_query_job(job_id):
+    """Runs a Studio QueryJob and spools its rows to MinIO (see api.query_jobs)."""
+    from .query_jobs import run
+    return run(job_id)
+
+
+@shared_task
+def purge_query_results():
+    """Delete spooled query-job results older than NIDHI_QUERY_RESULT_TTL_HOURS (default 24)."""
+    from .query_jobs import purge_expired
+    purged = purge_expired()
+    logger.info(f"Query jobs: purged results of {purged} job(s).")
+    return purged
+
+
+@shared_task
+def collect_query_stats():
+    """Fan out a pg_stat_statements collection to every active server (see api.query_stats)."""
+    from .models import DatabaseServer
+    for server_id in DatabaseServer.objects.filter(is_active=True).values_list('id', flat=True):
+        collect_server_query_stats.delay(server_id)
+
+
+@shared_task
+def collect_server_query_stats(server_id):
+    """Diff one server's pg_stat_statements against its last snapshot into QueryStatDelta rows."""
+    from .models import DatabaseServer
+    from .query_stats import collect
+    server = DatabaseServer.objects.get(id=server_id)
+    stored = collect(server)
+    logger.info(f"Query stats {server.name}: stored {stored} delta row(s).")
+    return stored
+
+
+@shared_task
+def prune_query_stats():
+    """Drop QueryStatDelta rows older than NIDHI_QUERY_STATS_RETENTION_DAYS (default 14)."""
+    from .query_stats import prune
+    deleted = prune()
+    logger.info(f"Query stats prune: removed {deleted} row(s).")
+    return deleted
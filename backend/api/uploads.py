@@ -0,0 +1,238 @@
+"""Resumable uploads (UploadSession), mapped onto MinIO multipart uploads.
+
+`bucket_views.upload_object` takes the file through request.FILES: Django spools it to memory or
+a temp file, then put_object reads it again, and a dropped connection means starting over. Here:
+
+  initiate   CreateMultipartUpload; the session fixes the part size (5 MiB .. 5 GiB);
+  part       the raw request body is piped to a presigned UploadPart URL in 1 MiB chunks
+             (constant memory, no temp file) while its SHA-256 is computed. A Content-MD5 sent
+             by the client is forwarded, so MinIO rejects a corrupted part itself; an
+             X-Content-SHA256 header is checked against the digest of what was streamed;
+  complete   CompleteMultipartUpload over the recorded parts (1..N, no gaps);
+  abort      AbortMultipartUpload.
+
+The minio SDK's own part upload needs the whole part in memory (it hashes and sizes the body),
+hence the presigned URL + httpx. Resuming = GET the session and send the parts it lacks.
+
+The SDK has no public Create/Complete/AbortMultipartUpload: Minio's private _*_multipart_upload
+methods are reached through _Multipart only, requirements.txt pins minio to the tested range, and
+test_buckets fails if their signatures change.
+"""
+import os
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession, UploadPart
+from .storage import get_bucket_client
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from minio.datatypes import Part
+except ImportError:
+    Part = None
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 5 * 1024 * 1024            # S3 minimum for every part but the last
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024     # S3 maximum part size
+MAX_PARTS = 10000
+DEFAULT_PART_SIZE = int(os.environ.get('NIDHI_UPLOAD_PART_SIZE', str(16 * 1024 * 1024)))
+STREAM_CHUNK = 1024 * 1024
+PART_URL_TTL = timedelta(minutes=30)
+SESSION_TTL = timedelta(hours=int(os.environ.get('NIDHI_UPLOAD_SESSION_TTL_HOURS', '24')))
+
+_http = None
+
+
+class UploadError(Exception):
+    """Rejected upload request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _Multipart:
+    """The multipart calls of one Minio client (private SDK methods; see the module docstring)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, bucket_name, object_name, content_type):
+        """The new upload's id."""
+        return self.client._create_multipart_upload(bucket_name, object_name, {"Content-Type": content_type})
+
+    def complete(self, bucket_name, object_name, upload_id, parts):
+        """The object's ETag; `parts` are (part_number, etag) pairs in order."""
+        result = self.client._complete_multipart_upload(
+            bucket_name, object_name, upload_id, [Part(number, etag) for number, etag in parts])
+        return (getattr(result, 'etag', '') or '').strip('"')
+
+    def abort(self, bucket_name, object_name, upload_id):
+        self.client._abort_multipart_upload(bucket_name, object_name, upload_id)
+
+
+def _http_client():
+    global _http
+    if _http is None:
+        _http = httpx.Client(timeout=httpx.Timeout(300.0, connect=5.0))
+    return _http
+
+
+def session_payload(session, parts=True):
+    payload = {
+        "id": str(session.id),
+        "bucket_id": str(session.bucket_id),
+        "object_name": session.object_name,
+        "content_type": session.content_type,
+        "part_size": session.part_size,
+        "total_size": session.total_size,
+        "status": session.status,
+        "etag": session.etag or None,
+        "created_at": session.created_at.isoformat() if session.created_at else None,
+        "completed_at": session.completed_at.isoformat() if session.completed_at else None,
+    }
+    if parts:
+        payload["parts"] = [
+            {"part_number": p.part_number, "size": p.size, "etag": p.etag, "sha256": p.sha256}
+            for p in session.parts.all()
+        ]
+    return payload
+
+
+def choose_part_size(total_size=None, requested=None):
+    """Requested part size, or the default grown until total_size fits in MAX_PARTS parts."""
+    if requested is not None:
+        if not MIN_PART_SIZE <= requested <= MAX_PART_SIZE:
+            raise UploadError(f"part_size must be between {MIN_PART_SIZE} and {MAX_PART_SIZE} bytes.")
+        part_size = requested
+    else:
+        part_size = DEFAULT_PART_SIZE
+        while total_size and -(-total_size // part_size) > MAX_PARTS:
+            part_size *= 2
+    if total_size and -(-total_size // part_size) > MAX_PARTS:
+        raise UploadError(f"part_size too small: more than {MAX_PARTS} parts needed.")
+    return part_size
+
+
+def initiate(bucket, client, object_name, content_type=None, total_size=None, part_size=None, created_by=''):
+    if total_size is not None and (total_size < 0 or total_size > MAX_PART_SIZE * MAX_PARTS):
+        raise UploadError("total_size out of range.")
+    part_size = choose_part_size(total_size, part_size)
+    content_type = content_type or 'application/octet-stream'
+    upload_id = _Multipart(client).create(bucket.bucket_name, object_name, content_type)
+    return UploadSession.objects.create(
+        bucket=bucket, object_name=object_name, content_type=content_type, upload_id=upload_id,
+        part_size=part_size, total_size=total_size, created_by_sso_id=created_by or '',
+    )
+
+
+def _body(stream, length, digest):
+    """Read exactly `length` bytes from the request in STREAM_CHUNK pieces, hashing as we go."""
+    remaining = length
+    while remaining:
+        chunk = stream.read(min(STREAM_CHUNK, remaining))
+        if not chunk:
+            raise UploadError("Request body ended before Content-Length bytes were received.")
+        digest.update(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def upload_part(session, client, part_number, stream, length, content_md5=None, expected_sha256=None):
+    """Stream one part to MinIO. Returns the UploadPart row (replacing an earlier upload of it)."""
+    if session.status != 'active':
+        raise UploadError(f"Upload session is {session.status}.", status=409)
+    if not 1 <= part_number <= MAX_PARTS:
+        raise UploadError(f"part_number must be between 1 and {MAX_PARTS}.")
+    if not 0 < length <= session.part_size:
+        raise UploadError(f"Part must be 1..{session.part_size} bytes.")
+
+    url = client.get_presigned_url(
+        "PUT", session.bucket.bucket_name, session.object_name, expires=PART_URL_TTL,
+        extra_query_params={"partNumber": str(part_number), "uploadId": session.upload_id},
+    )
+    headers = {"Content-Length": str(length)}
+    if content_md5:
+        headers["Content-MD5"] = content_md5
+    digest = hashlib.sha256()
+    try:
+        response = _http_client().put(url, content=_body(stream, length, digest), headers=headers)
+    except httpx.HTTPError as e:
+        raise UploadError(f"Part upload to MinIO failed: {e}", status=502)
+    if response.status_code != 200:
+        if b"BadDigest" in response.content or b"InvalidDigest" in response.content:
+            raise UploadError("Part checksum mismatch (Content-MD5); re-send the part.")
+        raise UploadError(f"MinIO rejected the part (HTTP {response.status_code}).", status=502)
+
+    sha256 = digest.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        # MinIO now holds the bad bytes under this part number: forget any earlier good upload of it.
+        UploadPart.objects.filter(session=session, part_number=part_number).delete()
+        raise UploadError("Part checksum mismatch (X-Content-SHA256); re-send the part.")
+    part, _ = UploadPart.objects.update_or_create(
+        session=session, part_number=part_number,
+        defaults={"size": length, "etag": response.headers.get("ETag", "").strip('"'), "sha256": sha256},
+    )
+    session.save(update_fields=['updated_at'])
+    return part
+
+
+def complete(session, client):
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'active':
+            raise UploadError(f"Upload session is {session.status}.", status=409)
+        parts = list(session.parts.all())
+        if not parts:
+            raise UploadError("No parts uploaded.")
+        missing = sorted(set(range(1, parts[-1].part_number + 1)) - {p.part_number for p in parts})
+        if missing:
+            raise UploadError(f"Missing part(s): {missing[:20]}")
+        undersized = [p.part_number for p in parts[:-1] if p.size < MIN_PART_SIZE]
+        if undersized:
+            raise UploadError(f"Only the last part may be smaller than {MIN_PART_SIZE} bytes: {undersized[:20]}")
+        received = sum(p.size for p in parts)
+        if session.total_size is not None and received != session.total_size:
+            raise UploadError(f"Received {received} bytes, expected total_size {session.total_size}.")
+
+        etag = _Multipart(client).complete(
+            session.bucket.bucket_name, session.object_name, session.upload_id,
+            [(p.part_number, p.etag) for p in parts],
+        )
+        session.status = 'completed'
+        session.etag = etag
+        session.completed_at = timezone.now()
+        session.save()
+    return session
+
+
+def abort(session, client):
+    if session.status == 'completed':
+        raise UploadError("Upload session is already completed.", status=409)
+    if session.status == 'active':
+        _Multipart(client).abort(session.bucket.bucket_name, session.object_name, session.upload_id)
+        session.status = 'aborted'
+        session.save(update_fields=['status', 'updated_at'])
+    return session
+
+
+def abort_stale():
+    """Abort active sessions idle for longer than SESSION_TTL. Returns how many were aborted."""
+    cutoff = timezone.now() - SESSION_TTL
+    aborted = 0
+    for session in UploadSession.objects.filter(status='active', updated_at__lt=cutoff).select_related('bucket'):
+        try:
+            abort(session, get_bucket_client(session.bucket))
+            aborted += 1
+        except Exception as e:
+            logger.warning("Upload session %s: abort failed: %s", session.id, e)
+    return aborted
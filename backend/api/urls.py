@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+from . import media_views
 from . import studio_views
 from . import bucket_views
 
@@ -7,17 +9,29 @@ urlpatterns = [
     path('instances/auto-provision/', views.auto_provision_instance, name='auto_provision_instance'),
     path('servers/auto-register/', views.auto_register_server, name='auto_register_server'),
     path('servers/', views.server_list_create, name='server_list_create'),
+    path('servers/<int:server_id>/query-stats/', views.server_query_stats, name='server_query_stats'),
     path('products/', views.product_list_create, name='product_list_create'),
     path('instances/', views.database_instance_list_create, name='database_instance_list_create'),
     path('instances/<uuid:instance_id>/delete/', views.delete_database, name='delete_database'),
     path('instances/<uuid:instance_id>/reveal/', views.reveal_credentials, name='reveal_credentials'),
     path('instances/<uuid:instance_id>/replicate/', views.replicate_to_dev, name='replicate_to_dev'),
+    path('instances/<uuid:instance_id>/query-stats/', views.instance_query_stats, name='instance_query_stats'),
     
     # Studio Endpoints
     path('instances/<uuid:instance_id>/studio/tables/', studio_views.get_tables, name='studio_get_tables'),
+    path('instances/<uuid:instance_id>/studio/schema/', studio_views.get_schema, name='studio_get_schema'),
+    path('instances/<uuid:instance_id>/studio/health/', studio_views.get_health, name='studio_get_health'),
     path('instances/<uuid:instance_id>/studio/tables/<str:table_name>/', studio_views.get_table_data, name='studio_get_table_data'),
     path('instances/<uuid:instance_id>/studio/query/', studio_views.execute_query, name='studio_execute_query'),
+    path('instances/<uuid:instance_id>/studio/explain/', studio_views.explain_query, name='studio_explain_query'),
+    path('instances/<uuid:instance_id>/studio/export/', studio_views.create_export, name='studio_create_export'),
+    path('studio/exports/<str:token>/', studio_views.download_export, name='studio_download_export'),
+    path('instances/<uuid:instance_id>/studio/query-jobs/', studio_views.query_jobs, name='studio_query_jobs'),
+    path('instances/<uuid:instance_id>/studio/query-jobs/<uuid:job_id>/', studio_views.query_job_detail, name='studio_query_job_detail'),
+    path('instances/<uuid:instance_id>/studio/query-jobs/<uuid:job_id>/cancel/', studio_views.cancel_query_job, name='studio_query_job_cancel'),
+    path('instances/<uuid:instance_id>/studio/query-jobs/<uuid:job_id>/results/', studio_views.query_job_results, name='studio_query_job_results'),
     path('instances/<uuid:instance_id>/studio/download/', studio_views.download_database_dump, name='studio_download_dump'),
+    path('studio/dumps/<str:token>/', studio_views.download_dump_link, name='studio_download_dump_link'),
     path('instances/<uuid:instance_id>/studio/migrate/', studio_views.migrate_database, name='studio_migrate_database'),
 
     # Bucket Endpoints
@@ -26,11 +40,29 @@ urlpatterns = [
     path('buckets/<uuid:bucket_id>/reveal/', bucket_views.reveal_bucket_credentials, name='reveal_bucket_credentials'),
     path('buckets/<uuid:bucket_id>/relocate/', bucket_views.relocate_bucket, name='relocate_bucket'),
     path('buckets/<uuid:bucket_id>/objects/', bucket_views.list_bucket_objects, name='list_bucket_objects'),
+    path('buckets/<uuid:bucket_id>/tree/', bucket_views.bucket_tree, name='bucket_tree'),
+    path('buckets/<uuid:bucket_id>/index/', bucket_views.bucket_object_index, name='bucket_object_index'),
+    path('buckets/<uuid:bucket_id>/search/', bucket_views.search_bucket_objects, name='search_bucket_objects'),
+    path('buckets/<uuid:bucket_id>/archive/', bucket_views.create_folder_archive_link, name='create_folder_archive_link'),
+    path('buckets/archive/<str:token>/', bucket_views.download_folder_archive, name='download_folder_archive'),
+    path('storage/events/', bucket_views.minio_bucket_events, name='minio_bucket_events'),
     path('buckets/<uuid:bucket_id>/upload/', bucket_views.upload_object, name='upload_object'),
+    path('buckets/<uuid:bucket_id>/uploads/', bucket_views.create_upload_session, name='create_upload_session'),
+    path('buckets/<uuid:bucket_id>/uploads/<uuid:session_id>/', bucket_views.upload_session_detail, name='upload_session_detail'),
+    path('buckets/<uuid:bucket_id>/uploads/<uuid:session_id>/parts/<int:part_number>/', bucket_views.upload_session_part, name='upload_session_part'),
+    path('buckets/<uuid:bucket_id>/uploads/<uuid:session_id>/complete/', bucket_views.complete_upload_session, name='complete_upload_session'),
+    path('buckets/<uuid:bucket_id>/presigned-post/', bucket_views.create_presigned_post, name='create_presigned_post'),
+    path('direct-uploads/<uuid:grant_id>/complete/', bucket_views.complete_direct_upload, name='complete_direct_upload'),
+    path('storage/presigned-post/', views.app_presigned_post, name='app_presigned_post'),
     path('buckets/<uuid:bucket_id>/delete/', bucket_views.delete_object, name='delete_object'),
     path('buckets/<uuid:bucket_id>/create-folder/', bucket_views.create_folder, name='create_folder'),
     path('buckets/<uuid:bucket_id>/rename/', bucket_views.rename_object, name='rename_object'),
     path('buckets/<uuid:bucket_id>/delete-multiple/', bucket_views.delete_multiple_objects, name='delete_multiple_objects'),
+    path('buckets/<uuid:bucket_id>/jobs/', bucket_views.list_storage_jobs, name='list_storage_jobs'),
+    path('buckets/<uuid:bucket_id>/jobs/<uuid:job_id>/', bucket_views.storage_job_detail, name='storage_job_detail'),
+    path('buckets/<uuid:bucket_id>/jobs/<uuid:job_id>/resume/', bucket_views.storage_job_resume, name='storage_job_resume'),
+    path('buckets/<uuid:bucket_id>/jobs/<uuid:job_id>/rollback/', bucket_views.storage_job_rollback, name='storage_job_rollback'),
+    path('products/<int:product_id>/bandwidth/', bucket_views.product_bandwidth, name='product_bandwidth'),
 
     path('sso/callback/', views.sso_callback, name='sso_callback'),
     path('me/', views.me, name='me'),
@@ -49,5 +81,10 @@ urlpatterns = [
     path('alerts/read-all/', views.alert_mark_all_read, name='alert_mark_all_read'),
 
     # Media Gateway — authenticated media proxy (MinIO never exposed directly)
-    path('media/<str:bucket_name>/<path:object_key>', views.serve_media, name='serve_media'),
+    # The ASGI media-gateway process (NIDHI_ASYNC_MEDIA_GATEWAY=1) serves the same URLs asynchronously.
+    path('media/<str:bucket_name>/<path:object_key>',
+         media_views.serve_media_async if settings.NIDHI_ASYNC_MEDIA_GATEWAY else views.serve_media,
+         name='serve_media'),
+    path('media-stream/<str:bucket_name>/<path:object_key>', media_views.serve_media_async,
+         name='serve_media_async'),
 ]
\ No newline at end of file
@@ -8,19 +8,27 @@ import secrets
 import string
 import subprocess
 import tempfile
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
 from psycopg2 import sql
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from django.http import StreamingHttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.conf import settings
 import hashlib
 from .models import DatabaseServer, Product, DatabaseInstance, DatabaseBackup, EmployeeProductAssignment, StorageBucket, InstanceHeartbeat, SystemAlert, AuditLog
 from .serializers import DatabaseServerSerializer, ProductSerializer, DatabaseInstanceSerializer, DatabaseBackupSerializer
 from .permissions import IsFoundingEngineer, IsProductionDestructiveOp
+from .storage import get_bucket_config, get_client
+from .media_signing import verify_media_signature, parse_byte_range, canonical_transform
+from .image_derivatives import parse_transform, ensure_derivative, DerivativeTimeout, STORE as DERIVATIVE_STORE
+from . import metering, query_stats
 
 try:
     from minio import Minio
@@ -408,6 +416,52 @@ def replicate_to_dev(request, instance_id):
         "target_db": new_db_name
     }, status=status.HTTP_202_ACCEPTED)
 
+def _query_stats_response(request, deltas, **context):
+    """?since=<iso>&until=<iso> (default: the last 24 hours), ?order_by=, ?limit= (default 20)."""
+    until = parse_datetime(request.GET.get('until', '')) if request.GET.get('until') else timezone.now()
+    since = parse_datetime(request.GET.get('since', '')) if request.GET.get('since') else \
+        (until - timedelta(hours=24) if until else None)
+    if since is None or until is None:
+        return Response({"error": "since/until must be ISO-8601 datetimes."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 200)
+        ranked = query_stats.top(deltas.filter(period_end__gt=since, period_end__lte=until),
+                                 order_by=request.GET.get('order_by', 'total_ms'), limit=limit)
+    except ValueError:
+        return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    except query_stats.QueryStatsError as e:
+        return Response({"error": str(e)}, status=e.status)
+    return Response({**context, "since": since.isoformat(), "until": until.isoformat(), **ranked},
+                    status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def server_query_stats(request, server_id):
+    """Top statements and databases of a server by execution time (or calls / rows / blocks),
+    from the pg_stat_statements deltas collected by api.query_stats."""
+    from .models import QueryStatDelta, QueryStatSnapshot
+    server = get_object_or_404(DatabaseServer, id=server_id)
+    snapshot = QueryStatSnapshot.objects.filter(server=server).first()
+    return _query_stats_response(
+        request, QueryStatDelta.objects.filter(server=server),
+        server=server.name,
+        collected_at=snapshot.taken_at.isoformat() if snapshot and snapshot.counters else None,
+        collection_error=snapshot.error if snapshot else None,
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsFoundingEngineer])
+def instance_query_stats(request, instance_id):
+    """Top statements of one instance's database; `share` is of the instance's own execution time."""
+    from .models import QueryStatDelta
+    instance = get_object_or_404(DatabaseInstance, id=instance_id, is_deleted=False)
+    return _query_stats_response(
+        request, QueryStatDelta.objects.filter(instance=instance),
+        instance=instance.db_name, server=instance.server.name,
+    )
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def me(request):
@@ -593,13 +647,104 @@ MINIO_ROOT_USER = os.environ.get('MINIO_ROOT_USER', 'admin_nidhi_minio')
 MINIO_ROOT_PASSWORD = os.environ.get('MINIO_ROOT_PASSWORD', 'secure_nidhi_minio_password')
 
 
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def app_presigned_post(request):
+    """
+    App-side presigned POST upload (see bucket_views.create_presigned_post), protected by
+    NIDHI_APP_API_KEY. Body: {bucket_name, key_prefix?, max_size?, content_type?, expires_in?}
+    """
+    from .bucket_views import issue_presigned_post
+
+    token = request.headers.get('Authorization', '')
+    expected_token = f"Bearer {getattr(settings, 'NIDHI_APP_API_KEY', 'super_secret_app_api_key_123')}"
+    if token != expected_token:
+        return Response({"error": "Unauthorized API key"}, status=status.HTTP_401_UNAUTHORIZED)
+
+    bucket = StorageBucket.objects.filter(bucket_name=request.data.get('bucket_name', ''), status='available').first()
+    if not bucket:
+        return Response({"error": "Bucket not found"}, status=status.HTTP_404_NOT_FOUND)
+    return issue_presigned_post(request, bucket, 'app')
+
+
 def _get_minio_client_for_bucket(bucket):
-    """Returns a Minio client configured for the given bucket's internal endpoint."""
-    if not Minio:
-        return None
+    """Returns the pooled Minio client for the given bucket's internal endpoint."""
     # Use internal Docker hostname — NEVER the public endpoint
     endpoint = os.environ.get('MINIO_ENDPOINT', 'minio:9000')
-    return Minio(endpoint, access_key=bucket.access_key, secret_key=bucket.secret_key, secure=False)
+    return get_client(endpoint, bucket.access_key, bucket.secret_key)
+
+
+def _authenticate_media_request(request, bucket_name, object_key):
+    """Authenticates a gateway request. Returns (key_hash, byte_range, expires_at, error).
+
+    Two schemes are accepted:
+      * signed URL (?expires=&range=&sig=, plus any transform params) — HMAC verified offline,
+        no DB access;
+      * legacy NIDHI_APP_API_KEY in ?api_key= or `Authorization: Bearer`.
+    `error` is a (message, http_status) tuple when authentication fails.
+    """
+    signature = request.GET.get('sig')
+    if signature:
+        expires = request.GET.get('expires', '')
+        byte_range = request.GET.get('range', '')
+        ok, reason = verify_media_signature(bucket_name, object_key, expires, byte_range, signature,
+                                            transform=canonical_transform(request.GET))
+        if not ok:
+            logger.warning("Media gateway: rejected signed URL for %s/%s: %s", bucket_name, object_key, reason)
+            return None, None, None, ("Invalid or expired signature", status.HTTP_403_FORBIDDEN)
+        return 'signed', parse_byte_range(byte_range), int(expires), None
+
+    api_key = request.GET.get('api_key', '') or request.headers.get('Authorization', '').replace('Bearer ', '')
+    expected_key = getattr(settings, 'NIDHI_APP_API_KEY', 'super_secret_app_api_key_123')
+    if not api_key or api_key != expected_key:
+        logger.warning("Media gateway: unauthorized access attempt for %s/%s", bucket_name, object_key)
+        return None, None, None, ("Unauthorized", status.HTTP_401_UNAUTHORIZED)
+    return metering.api_key_hash(api_key), None, None, None
+
+
+def _media_cache_control(expires_at):
+    """Cache-Control for a gateway response (shared by the sync and async gateways)."""
+    if expires_at:
+        # Signed URLs are safe for shared caches/CDNs, but only until they expire.
+        max_age = max(0, min(86400, expires_at - int(time.time())))
+        return f'public, max-age={max_age}'
+    # Cache for 1 day — browsers cache, reducing proxy load
+    return 'public, max-age=86400'
+
+
+def _media_accel_enabled(request):
+    """Offload mode is on AND the request came through nginx, which sends the shared secret
+    NIDHI_MEDIA_ACCEL_SECRET in X-Nidhi-Accel (and blanks the header everywhere else).
+    Direct callers (apps dialing :8001) keep getting the bytes from Django: an accel response
+    carries a presigned MinIO URL, which must never reach a client. No secret = accel is off."""
+    secret = getattr(settings, 'NIDHI_MEDIA_ACCEL_SECRET', '')
+    return (getattr(settings, 'NIDHI_MEDIA_GATEWAY_MODE', 'proxy') == 'accel' and bool(secret)
+            and secrets.compare_digest(request.headers.get('X-Nidhi-Accel', '').encode(), secret.encode()))
+
+
+def _media_accel_response(bucket, bucket_name, fetch_key, byte_range, expires_at):
+    """Hand the transfer to nginx: X-Accel-Redirect to the internal MinIO location.
+    `bucket` supplies the signing credentials (a BucketConfig, or the derivative store).
+
+    Django presigns a short-lived GET for the endpoint nginx dials (NIDHI_MEDIA_ACCEL_MINIO_ENDPOINT)
+    and passes its exact path+query in X-Nidhi-Upstream-Uri; nginx replays it against MinIO and
+    streams the body itself. Status, Content-Type/Length/Range and ETag come from MinIO; our
+    Cache-Control is kept. Upstream-* headers never reach the client (nginx drops them).
+    """
+    endpoint = getattr(settings, 'NIDHI_MEDIA_ACCEL_MINIO_ENDPOINT', '') or \
+        os.environ.get('MINIO_ENDPOINT', 'minio:9000')
+    client = get_client(endpoint, bucket.access_key, bucket.secret_key)
+    url = urlsplit(client.get_presigned_url('GET', bucket_name, fetch_key, expires=timedelta(minutes=5)))
+
+    response = HttpResponse()
+    del response['Content-Type']  # let nginx use MinIO's
+    response['X-Accel-Redirect'] = getattr(settings, 'NIDHI_MEDIA_ACCEL_LOCATION', '/_nidhi_media/')
+    response['X-Nidhi-Upstream-Uri'] = f"{url.path}?{url.query}"
+    if byte_range:
+        response['X-Nidhi-Upstream-Range'] = f"bytes={byte_range[0]}-{byte_range[0] + byte_range[1] - 1}"
+    response['Cache-Control'] = _media_cache_control(expires_at)
+    return response
 
 
 @api_view(['GET'])
@@ -607,62 +752,106 @@ def _get_minio_client_for_bucket(bucket):
 @permission_classes([AllowAny])
 def serve_media(request, bucket_name, object_key):
     """
-    Secure media proxy. Authenticates via NIDHI_APP_API_KEY (query param or header),
-    validates bucket ownership, streams from MinIO. Never exposes MinIO directly.
+    Secure media proxy. Authenticates via a signed URL or NIDHI_APP_API_KEY (query param or
+    header), validates bucket ownership, streams from MinIO. Never exposes MinIO directly.
+
+    Usage: GET /api/media/<bucket_name>/<object_key>?expires=<ts>[&range=<a>-<b>]&sig=<hmac>
+       or: GET /api/media/<bucket_name>/<object_key>?api_key=<key>   (legacy)
 
-    Usage: GET /api/media/<bucket_name>/<object_key>?api_key=<key>
+    Images accept w/h/fit/fmt/q transform params (see api.image_derivatives).
+    With NIDHI_MEDIA_GATEWAY_MODE=accel, requests arriving via nginx are authenticated here and the
+    bytes are sent by nginx (X-Accel-Redirect, see _media_accel_response).
 
     MinIO is NEVER exposed directly. This is the only way to access media.
     """
     if not Minio:
         return Response({"error": "MinIO SDK not installed."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    # Authenticate: check API key from query param or Authorization header
-    api_key = request.GET.get('api_key', '') or request.headers.get('Authorization', '').replace('Bearer ', '')
-    expected_key = getattr(settings, 'NIDHI_APP_API_KEY', 'super_secret_app_api_key_123')
-    if not api_key or api_key != expected_key:
-        logger.warning("Media gateway: unauthorized access attempt for %s/%s", bucket_name, object_key)
-        return Response({"error": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    key_hash, byte_range, expires_at, auth_error = _authenticate_media_request(request, bucket_name, object_key)
+    if auth_error:
+        return Response({"error": auth_error[0]}, status=auth_error[1])
 
-    # Look up bucket
-    try:
-        bucket = StorageBucket.objects.select_related('product').get(bucket_name=bucket_name, status='available')
-    except StorageBucket.DoesNotExist:
+    # Look up bucket (process-wide cache: no DB round trip / Fernet decrypt on the hot path)
+    bucket = get_bucket_config(bucket_name)
+    if bucket is None or bucket.status != 'available':
         logger.warning("Media gateway: bucket not found: %s", bucket_name)
         return Response({"error": "Bucket not found"}, status=status.HTTP_404_NOT_FOUND)
 
     # Ownership check: bucket must belong to an active product
-    if not bucket.product:
+    if not bucket.product_name:
         logger.warning("Media gateway: orphaned bucket %s (no product)", bucket_name)
         return Response({"error": "Bucket has no associated product"}, status=status.HTTP_403_FORBIDDEN)
 
+    response = _fetch_media(request, bucket, bucket_name, object_key, key_hash, byte_range, expires_at)
+    # Usage is metered in aggregate (api.metering) instead of one log line per request.
+    metering.record(bucket_name, bucket.product_id, key_hash, response.status_code,
+                    response.get('Content-Length') or 0)
+    return response
+
+
+def _fetch_media(request, bucket, bucket_name, object_key, key_hash, byte_range, expires_at):
+    """serve_media after auth + bucket resolution: transform, then stream (or hand off to nginx)."""
+    # Optional image transform (?w=&h=&fit=&fmt=&q=) — served from the derivative cache.
+    try:
+        transform = parse_transform(request.GET)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if transform and byte_range:
+        return Response({"error": "range cannot be combined with image transforms"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
     # Fetch from MinIO
     try:
         client = _get_minio_client_for_bucket(bucket)
         if not client:
             return Response({"error": "MinIO not available"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        obj = client.get_object(bucket_name, object_key)
+        fetch_from, fetch_bucket, fetch_key = bucket, bucket_name, object_key
+        if transform:
+            store = get_client(DERIVATIVE_STORE.endpoint, DERIVATIVE_STORE.access_key, DERIVATIVE_STORE.secret_key)
+            try:
+                fetch_key = ensure_derivative(client, bucket_name, object_key, transform, store)
+                client, fetch_from, fetch_bucket = store, DERIVATIVE_STORE, DERIVATIVE_STORE.bucket_name
+            except DerivativeTimeout as e:
+                return Response({"error": str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+            except (ValueError, OSError) as e:
+                # Not an image / unsupported format / source too large.
+                return Response({"error": f"Cannot transform image: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ip = request.META.get('HTTP_X_FORWARDED_FOR', request.META.get('REMOTE_ADDR', ''))
+        if _media_accel_enabled(request):
+            if metering.should_log():
+                logger.info(
+                    "Media access: key=%s bucket=%s object=%s product=%s ip=%s size=accel",
+                    key_hash, bucket_name, object_key, bucket.product_name, ip,
+                )
+            return _media_accel_response(fetch_from, fetch_bucket, fetch_key, byte_range, expires_at)
+
+        if byte_range:
+            obj = client.get_object(fetch_bucket, fetch_key, offset=byte_range[0], length=byte_range[1])
+        else:
+            obj = client.get_object(fetch_bucket, fetch_key)
         content_type = obj.headers.get('Content-Type', 'application/octet-stream')
         data = obj.read()
         obj.close()
         obj.release_conn()
 
-        # Log access: who (api_key hash), what (bucket/key), when, from where
-        ip = request.META.get('HTTP_X_FORWARDED_FOR', request.META.get('REMOTE_ADDR', ''))
-        key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:12]
-        logger.info(
-            "Media access: key=%s bucket=%s object=%s product=%s ip=%s size=%d",
-            key_hash, bucket_name, object_key, bucket.product.name, ip, len(data),
-        )
+        # Sampled detail: who (api_key hash / 'signed'), what (bucket/key), when, from where
+        if metering.should_log():
+            logger.info(
+                "Media access: key=%s bucket=%s object=%s product=%s ip=%s size=%d",
+                key_hash, bucket_name, object_key, bucket.product_name, ip, len(data),
+            )
 
         response = StreamingHttpResponse(
             io.BytesIO(data),
             content_type=content_type,
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
         )
         response['Content-Length'] = len(data)
-        # Cache for 1 day — browsers cache, reducing proxy load
-        response['Cache-Control'] = 'public, max-age=86400'
+        if byte_range and obj.headers.get('Content-Range'):
+            response['Content-Range'] = obj.headers.get('Content-Range')
+        response['Cache-Control'] = _media_cache_control(expires_at)
         if hasattr(obj, 'etag') and obj.etag:
             response['ETag'] = obj.etag
         return response
@@ -672,4 +861,3 @@ def serve_media(request, bucket_name, object_key):
             return Response({"error": "Object not found"}, status=status.HTTP_404_NOT_FOUND)
         logger.error("Media gateway: fetch failed for %s/%s: %s", bucket_name, object_key, e)
         return Response({"error": f"Media fetch failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
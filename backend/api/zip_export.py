@@ -0,0 +1,146 @@
+"""Streaming ZIP of a bucket folder, built on the fly from MinIO.
+
+  * keys come from a streaming recursive listing (no up-front walk);
+  * NIDHI_ZIP_PREFETCH objects are fetched concurrently ahead of the writer, each into a bounded
+    queue of 1 MiB chunks, so memory is capped at about PREFETCH x QUEUE_CHUNKS MiB whatever the
+    folder size, and a slow client stalls the fetchers instead of filling memory;
+  * zipfile writes to a non-seekable sink (local headers + data descriptors, Zip64 for large
+    entries); the generator yields whatever the sink holds after each chunk, so the first bytes
+    leave before the second object is fetched. No temp files.
+
+Entries are stored, not deflated, by default: bucket media is mostly compressed already and
+deflate would make the export CPU-bound (?compress=1 turns it on).
+"""
+import os
+import queue
+import logging
+import threading
+import zipfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+PREFETCH = int(os.environ.get('NIDHI_ZIP_PREFETCH', '4'))
+QUEUE_CHUNKS = 8
+_DONE = object()
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)  # earliest date a ZIP entry can carry
+
+
+class _Sink:
+    """Write-only, non-seekable file object collecting zipfile output between yields."""
+
+    def __init__(self):
+        self._parts = []
+        self._offset = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class _Fetch:
+    """One object being read from MinIO into a bounded chunk queue by a worker thread."""
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+
+    def run(self, client, bucket_name, stop):
+        response = None
+        try:
+            response = client.get_object(bucket_name, self.obj.object_name)
+            for chunk in response.stream(CHUNK_SIZE):
+                if not self._put(chunk, stop):
+                    return
+            self._put(_DONE, stop)
+        except Exception as e:
+            self._put(e, stop)
+        finally:
+            if response is not None:
+                response.close()
+                response.release_conn()
+
+    def _put(self, item, stop):
+        while not stop.is_set():
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self.chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+def _entry_name(key, prefix):
+    return key[len(prefix):] if prefix else key
+
+
+def stream_zip(client, bucket_name, prefix, compress=False):
+    """Yield a ZIP archive of every object under `prefix` (paths relative to it)."""
+    objects = (obj for obj in client.list_objects(bucket_name, prefix=prefix or None, recursive=True)
+               if not obj.object_name.endswith('/'))
+    sink = _Sink()
+    stop = threading.Event()
+    method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    pending = []
+
+    def schedule(pool):
+        while len(pending) < PREFETCH:
+            obj = next(objects, None)
+            if obj is None:
+                return
+            fetch = _Fetch(obj)
+            pool.submit(fetch.run, client, bucket_name, stop)
+            pending.append(fetch)
+
+    pool = ThreadPoolExecutor(max_workers=PREFETCH, thread_name_prefix='nidhi-zip')
+    try:
+        with zipfile.ZipFile(sink, mode='w', compression=method, allowZip64=True) as archive:
+            schedule(pool)
+            while pending:
+                fetch = pending.pop(0)
+                schedule(pool)
+                mtime = (fetch.obj.last_modified or datetime.now()).timetuple()[:6]
+                info = zipfile.ZipInfo(_entry_name(fetch.obj.object_name, prefix),
+                                       date_time=max(mtime, _ZIP_EPOCH))
+                info.compress_type = method
+                info.file_size = fetch.obj.size or 0
+                with archive.open(info, mode='w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as entry:
+                    for chunk in fetch:
+                        entry.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+        yield sink.drain()  # last data descriptor + central directory
+    except GeneratorExit:
+        logger.info("ZIP export of %s/%s: client went away", bucket_name, prefix)
+        raise
+    except Exception as e:
+        # Headers are long gone: all we can do is cut the archive short (the client sees a bad ZIP).
+        logger.error("ZIP export of %s/%s failed: %s", bucket_name, prefix, e)
+        raise
+    finally:
+        stop.set()
+        pool.shutdown(wait=False)
@@ -39,6 +39,35 @@ app.conf.beat_schedule = {
         'task': 'api.tasks.check_stale_heartbeats',
         'schedule': crontab(minute=15),  # every hour at :15
     },
+    'prune-media-usage-rollups-daily': {
+        # Hourly media-gateway rollups are only needed for recent drill-down; daily rows stay.
+        'task': 'api.tasks.prune_media_usage_rollups',
+        'schedule': crontab(minute=45, hour=3),  # 03:45 every day
+    },
+    'reconcile-object-indexes-every-6-hours': {
+        # Object index is event-driven; this full pass repairs anything the webhook missed.
+        'task': 'api.tasks.reconcile_object_indexes',
+        'schedule': crontab(minute=20, hour='*/6'),
+    },
+    'purge-query-job-results-hourly': {
+        # Spooled Studio query-job results outlive their TTL: drop them from MinIO.
+        'task': 'api.tasks.purge_query_results',
+        'schedule': crontab(minute=35),  # every hour at :35
+    },
+    'abort-stale-upload-sessions-hourly': {
+        # Resumable uploads nobody finished: free their multipart parts in MinIO.
+        'task': 'api.tasks.abort_stale_upload_sessions',
+        'schedule': crontab(minute=50),  # every hour at :50
+    },
+    'collect-query-stats-every-5-minutes': {
+        # pg_stat_statements deltas per server for the slow-query insights API (api.query_stats).
+        'task': 'api.tasks.collect_query_stats',
+        'schedule': crontab(minute='*/5'),
+    },
+    'prune-query-stats-daily': {
+        'task': 'api.tasks.prune_query_stats',
+        'schedule': crontab(minute=55, hour=3),  # 03:55 every day
+    },
     'replicate-new-nova-prod-to-dev-weekly': {
         'task': 'api.tasks.replicate_prod_to_dev',
         # Assuming we need to pass instance IDs. For automation, we'll need to fetch them dynamically,
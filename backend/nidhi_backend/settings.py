@@ -175,6 +175,14 @@ CORS_ALLOW_HEADERS = [
     'x-user-college-id', # <-- ADD THIS LINE
 ]
 
+# Shared cache (Studio schema catalogs). Redis is already in the stack for Celery; use another db.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('NIDHI_CACHE_URL', 'redis://redis:6379/1'),
+    }
+}
+
 # Celery Configuration Options
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
@@ -193,3 +201,25 @@ NIDHI_REGISTRATION_TOKEN = os.environ.get("NIDHI_REGISTRATION_TOKEN", "super_sec
 
 # Nidhi App Auto-Provision API Key
 NIDHI_APP_API_KEY = os.environ.get("NIDHI_APP_API_KEY", "super_secret_app_api_key_123")
+
+# Media gateway signed URLs (HMAC). Falls back to NIDHI_APP_API_KEY so apps can sign offline
+# with the secret they already hold.
+NIDHI_MEDIA_SIGNING_KEY = os.environ.get("NIDHI_MEDIA_SIGNING_KEY", "")
+
+# Set in the uvicorn `media-gateway` process: /api/media/ is served by the async gateway
+# (api.media_views) instead of the sync DRF view.
+NIDHI_ASYNC_MEDIA_GATEWAY = os.environ.get("NIDHI_ASYNC_MEDIA_GATEWAY", "") in ("1", "true", "True")
+
+# Media gateway transfer mode: "proxy" (Python streams the bytes) or "accel" (Django authenticates,
+# nginx streams from MinIO via X-Accel-Redirect; only for requests nginx marks with X-Nidhi-Accel).
+NIDHI_MEDIA_GATEWAY_MODE = os.environ.get("NIDHI_MEDIA_GATEWAY_MODE", "proxy")
+# Shared secret nginx sends as X-Nidhi-Accel on the media location. Empty = accel mode stays off.
+NIDHI_MEDIA_ACCEL_SECRET = os.environ.get("NIDHI_MEDIA_ACCEL_SECRET", "")
+NIDHI_MEDIA_ACCEL_LOCATION = os.environ.get("NIDHI_MEDIA_ACCEL_LOCATION", "/_nidhi_media/")
+# MinIO endpoint as nginx reaches it; presigned URLs are signed for this host. Empty = MINIO_ENDPOINT.
+NIDHI_MEDIA_ACCEL_MINIO_ENDPOINT = os.environ.get("NIDHI_MEDIA_ACCEL_MINIO_ENDPOINT", "")
+# Base URL browsers use to reach MinIO for presigned POST uploads (e.g. https://s3.example.com).
+# Empty = http://<bucket endpoint>.
+NIDHI_MINIO_PUBLIC_URL = os.environ.get("NIDHI_MINIO_PUBLIC_URL", "")
+# Shared secret MinIO's webhook notification target sends (MINIO_NOTIFY_WEBHOOK_AUTH_TOKEN_NIDHI).
+NIDHI_MINIO_WEBHOOK_TOKEN = os.environ.get("NIDHI_MINIO_WEBHOOK_TOKEN", "")
@@ -0,0 +1,692 @@
+"""
+Bucket Studio (bucket_views) tests — TESTING_STRATEGY #13.
+
+MinIO is NEVER reached: `get_bucket_client` is patched with FakeMinio, an in-memory bucket whose
+list_objects honours prefix / recursive (delimiter "/") / start_after like ListObjectsV2.
+
+Covers:
+  * list_bucket_objects pagination (cursor), one-level delimiter listing and NDJSON streaming,
+    plus the unchanged legacy response when no pagination params are given.
+  * build_tree (indexed) output and the lazy /tree/ endpoint: one delimiter listing per expand.
+  * folder rename as a background StorageJob (Celery is eager in tests): completion, resume after
+    copy failures, rollback, and the destination-exists / overlapping-job conflicts.
+  * delete-multiple: files in DeleteObjects batches, folders as tracked delete jobs.
+  * resumable upload sessions: parts streamed to (mock) presigned UploadPart URLs, checksums,
+    resume after a failed part, complete / abort, and the private minio multipart signatures.
+  * presigned POST grants (Studio + app API key) and the completion callback's verification.
+  * bucket relocation with copy_objects: streamed + verified copy, final sync, endpoint switch.
+  * object index: reconciliation, MinIO webhook events (ordering, tombstones, totals), index-served tree,
+    usage and prefix search.
+  * folder ZIP export: signed link, streamed archive contents, bounded prefetch.
+"""
+import io
+import json
+import base64
+import hashlib
+import zipfile
+from datetime import datetime, timezone
+from unittest import mock
+
+import httpx
+import pytest
+from django.contrib.auth.models import User
+from minio.datatypes import Object
+from minio.deleteobjects import DeleteError
+from minio.error import S3Error
+from rest_framework.test import APIClient
+
+from api import uploads
+from api.bucket_views import build_tree, tree_level
+from api.models import DirectUpload, Product, StorageBucket, StorageJob, UploadSession
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeMinio:
+    def __init__(self, keys):
+        self.objects = {key: b"x" * (i + 1) for i, key in enumerate(keys)}
+        self.list_calls = 0
+        self.fail_copy = set()    # source keys whose copy raises
+        self.fail_delete = set()  # keys DeleteObjects reports as errors
+        self.delete_requests = 0
+        self.content_types = {}
+        self.mtimes = {}
+        self.buckets = {"studio-bucket"}
+        self.corrupt = set()  # keys whose GET body is altered (checksum failure on the target)
+
+    def bucket_exists(self, bucket_name):
+        return bucket_name in self.buckets
+
+    def make_bucket(self, bucket_name):
+        self.buckets.add(bucket_name)
+
+    def get_object(self, bucket_name, object_name):
+        data = self.objects[object_name]
+        body = io.BytesIO(data[:-1] + b"?" if object_name in self.corrupt else data)
+        body.headers = {"Content-Type": self.content_types.get(object_name, "application/octet-stream")}
+        body.release_conn = lambda: None
+        body.stream = lambda amt: iter(lambda: body.read(amt), b"")
+        return body
+
+    def put_object(self, bucket_name, object_name, data, length, content_type=None, part_size=0, **kwargs):
+        self.objects[object_name] = data.read(length)
+        self.content_types[object_name] = content_type
+        self.mtimes[object_name] = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+    def copy_object(self, bucket_name, object_name, source):
+        if source.object_name in self.fail_copy:
+            raise RuntimeError("SlowDown")
+        self.objects[object_name] = self.objects[source.object_name]
+
+    def remove_object(self, bucket_name, object_name):
+        self.objects.pop(object_name, None)
+
+    # -- multipart (upload sessions) --
+    def _create_multipart_upload(self, bucket_name, object_name, headers):
+        self.uploads = getattr(self, "uploads", {})
+        self.uploads["up-1"] = {"key": object_name, "parts": {}}
+        return "up-1"
+
+    def get_presigned_url(self, method, bucket_name, object_name, expires=None, extra_query_params=None):
+        query = "&".join(f"{k}={v}" for k, v in (extra_query_params or {}).items())
+        return f"http://minio.test/{bucket_name}/{object_name}?{query}"
+
+    def _complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        stored = self.uploads.pop(upload_id)["parts"]
+        self.objects[object_name] = b"".join(stored[p.part_number] for p in parts)
+        return mock.Mock(etag='"final-etag"')
+
+    def _abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        self.uploads.pop(upload_id)
+
+    # -- presigned POST --
+    def presigned_post_policy(self, policy):
+        self.policy = policy
+        return {"policy": "cG9saWN5", "x-amz-signature": "sig"}
+
+    def stat_object(self, bucket_name, object_name):
+        if object_name not in self.objects:
+            raise S3Error(None, "NoSuchKey", "missing", object_name, "req", "host")
+        return mock.Mock(size=len(self.objects[object_name]), etag='"e1"',
+                         content_type=self.content_types.get(object_name, "application/octet-stream"),
+                         last_modified=self.mtimes.get(object_name, datetime(2026, 1, 1, tzinfo=timezone.utc)))
+
+    def remove_objects(self, bucket_name, delete_object_list):
+        self.delete_requests += 1
+        for obj in delete_object_list:
+            if obj.name in self.fail_delete:
+                yield DeleteError("AccessDenied", "denied", obj.name, None)
+            else:
+                self.objects.pop(obj.name, None)
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, start_after=None, **kwargs):
+        self.list_calls += 1
+        prefix = prefix or ""
+        seen_dirs = set()
+        for key in sorted(self.objects):
+            if not key.startswith(prefix) or (start_after and key <= start_after):
+                continue
+            rest = key[len(prefix):]
+            if not recursive and "/" in rest:
+                folder = prefix + rest.split("/", 1)[0] + "/"
+                if folder not in seen_dirs and not (start_after and folder <= start_after):
+                    seen_dirs.add(folder)
+                    yield Object(bucket_name, folder)
+                continue
+            yield Object(bucket_name, key, size=len(self.objects[key]),
+                         etag='"%s"' % hashlib.md5(self.objects[key]).hexdigest(),
+                         last_modified=self.mtimes.get(key, datetime(2026, 1, 1, tzinfo=timezone.utc)))
+
+
+@pytest.fixture
+def bucket():
+    product = Product.objects.create(name="studio-prod")
+    return StorageBucket.objects.create(
+        product=product, bucket_name="studio-bucket", access_key="ak", secret_key="sk",
+        endpoint="localhost:9000", created_by_sso_id="t", status="available",
+    )
+
+
+@pytest.fixture
+def api():
+    user = User.objects.create_user(username="fe-studio", password="pw")
+    user.role = "founding_engineer"
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+class _patch_client:
+    """Patch get_bucket_client for the views and for the storage-job runner
+    (and, for relocations, the target endpoint's client)."""
+
+    def __init__(self, fake, target=None):
+        self._patches = [mock.patch(target, return_value=fake) for target in
+                         ("api.bucket_views.get_bucket_client", "api.storage_jobs.get_bucket_client",
+                          "api.storage.get_bucket_client")]
+        if target is not None:
+            self._patches.append(mock.patch("api.storage_jobs.get_client", return_value=target))
+
+    def __enter__(self):
+        for patch in self._patches:
+            patch.start()
+
+    def __exit__(self, *exc):
+        for patch in self._patches:
+            patch.stop()
+
+
+KEYS = ["a.txt", "b.txt", "docs/1.md", "docs/2.md", "docs/deep/3.md", "img/x.png", "z.txt"]
+
+
+# ---------------------------------------------------------------------------
+# list_bucket_objects
+# ---------------------------------------------------------------------------
+def test_listing_pages_one_level_with_cursor(bucket, api):
+    fake = FakeMinio(KEYS)
+    url = f"/api/buckets/{bucket.id}/objects/"
+    names, cursor = [], None
+    with _patch_client(fake):
+        for _ in range(5):
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            body = api.get(url, params).json()
+            names += [o["name"] for o in body["objects"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+    # Folders are single entries and are not repeated across page boundaries.
+    assert names == ["a.txt", "b.txt", "docs/", "img/", "z.txt"]
+
+
+def test_listing_recursive_page_and_bad_params(bucket, api):
+    fake = FakeMinio(KEYS)
+    url = f"/api/buckets/{bucket.id}/objects/"
+    with _patch_client(fake):
+        body = api.get(url, {"prefix": "docs/", "recursive": "true", "limit": 2}).json()
+        assert [o["name"] for o in body["objects"]] == ["docs/1.md", "docs/2.md"]
+        rest = api.get(url, {"prefix": "docs/", "recursive": "true", "limit": 2,
+                             "cursor": body["next_cursor"]}).json()
+        assert [o["name"] for o in rest["objects"]] == ["docs/deep/3.md"]
+        assert rest["next_cursor"] is None
+        assert api.get(url, {"limit": 0}).status_code == 400
+        assert api.get(url, {"prefix": "img/", "cursor": body["next_cursor"]}).status_code == 400
+
+
+def test_listing_ndjson_streams_and_legacy_shape_unchanged(bucket, api):
+    fake = FakeMinio(KEYS)
+    url = f"/api/buckets/{bucket.id}/objects/"
+    with _patch_client(fake):
+        resp = api.get(url, {"output": "ndjson", "recursive": "true", "limit": 3})
+        lines = [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+        legacy = api.get(url).json()
+
+    assert resp["Content-Type"] == "application/x-ndjson"
+    assert [line["name"] for line in lines[:3]] == ["a.txt", "b.txt", "docs/1.md"]
+    assert lines[3]["next_cursor"]
+    assert isinstance(legacy, list) and [o["name"] for o in legacy] == ["a.txt", "b.txt", "docs/", "img/", "z.txt"]
+
+
+# ---------------------------------------------------------------------------
+# Folder tree
+# ---------------------------------------------------------------------------
+def _entries(keys):
+    return [{"name": k, "size": 0 if k.endswith("/") else 10, "last_modified": None, "is_dir": False}
+            for k in keys]
+
+
+def test_build_tree_nests_without_duplicates():
+    tree = build_tree(_entries(["docs/", "docs/1.md", "docs/deep/3.md", "docs/2.md", "a.txt"]))
+    docs = tree["children"][0]
+    assert [c["name"] for c in tree["children"]] == ["docs", "a.txt"]
+    assert [c["name"] for c in docs["children"]] == ["1.md", "deep", "2.md"]
+    assert docs["children"][1]["children"][0]["path"] == "docs/deep/3.md"
+
+
+def test_build_tree_scales_linearly_with_wide_folders():
+    keys = [f"wide/{i:06d}.png" for i in range(50000)]
+    tree = build_tree(_entries(keys))
+    assert len(tree["children"][0]["children"]) == 50000
+
+
+def test_tree_level_summarises_one_listed_level():
+    entries = _entries(["docs/", "docs/1.md", "docs/deep/", "docs/img/"])
+    level = tree_level(entries, "docs/", file_limit=10)
+    folders = [c for c in level["children"] if c["type"] == "directory"]
+    files = [c for c in level["children"] if c["type"] == "file"]
+    assert [(f["path"], f["object_count"], f["total_size"], f["children"]) for f in folders] == [
+        ("docs/deep/", None, None, None), ("docs/img/", None, None, None)]
+    assert [f["path"] for f in files] == ["docs/1.md"]
+    assert (level["object_count"], level["total_size"], level["truncated"]) == (1, 10, False)
+    assert tree_level(_entries(["a", "b", "c"]), "", scan_limit=2)["truncated"] is True
+
+
+def test_tree_endpoint_expands_one_level(bucket, api):
+    fake = FakeMinio(KEYS)
+    with _patch_client(fake), mock.patch.object(fake, "list_objects", wraps=fake.list_objects) as listing:
+        root = api.get(f"/api/buckets/{bucket.id}/tree/").json()
+        docs = api.get(f"/api/buckets/{bucket.id}/tree/", {"prefix": "docs"}).json()
+    assert [c["name"] for c in root["children"]] == ["docs", "img", "a.txt", "b.txt", "z.txt"]
+    assert root["children"][0]["object_count"] is None  # no index: no subtree scan
+    assert [c["path"] for c in docs["children"]] == ["docs/deep/", "docs/1.md", "docs/2.md"]
+    assert all(call.kwargs["recursive"] is False for call in listing.call_args_list)
+
+
+# ---------------------------------------------------------------------------
+# Folder move jobs
+# ---------------------------------------------------------------------------
+def _rename(api, bucket, old, new):
+    return api.post(f"/api/buckets/{bucket.id}/rename/", {"object_name": old, "new_object_name": new}, format="json")
+
+
+def test_folder_rename_runs_move_job(bucket, api):
+    fake = FakeMinio(KEYS)
+    with _patch_client(fake):
+        resp = _rename(api, bucket, "docs/", "notes")
+    job = resp.json()["job"]
+    assert resp.status_code == 202
+    assert (job["status"], job["phase"], job["total"], job["processed"]) == ("completed", "done", 3, 3)
+    assert sorted(k for k in fake.objects if k.startswith(("docs/", "notes/"))) == [
+        "notes/1.md", "notes/2.md", "notes/deep/3.md"]
+
+
+def test_folder_move_resumes_after_copy_failure(bucket, api):
+    fake = FakeMinio(KEYS)
+    fake.fail_copy = {"docs/2.md"}
+    with _patch_client(fake):
+        job = _rename(api, bucket, "docs/", "notes/").json()["job"]
+        # Nothing deleted while a copy is missing; the failure is journaled per key.
+        assert job["status"] == "failed" and job["phase"] == "copy"
+        assert [e["key"] for e in job["errors"]] == ["docs/2.md"]
+        assert "docs/2.md" in fake.objects and "docs/1.md" in fake.objects
+        # Overlapping work is refused while the job is unresolved.
+        assert _rename(api, bucket, "docs/deep/", "other/").status_code == 409
+
+        fake.fail_copy = set()
+        resumed = api.post(f"/api/buckets/{bucket.id}/jobs/{job['id']}/resume/").json()["job"]
+    assert resumed["status"] == "completed"
+    assert not any(k.startswith("docs/") for k in fake.objects)
+    assert fake.objects["notes/2.md"]
+
+
+def test_folder_move_only_deletes_sources_that_were_copied(bucket, api):
+    fake = FakeMinio(KEYS)
+    copy_object = fake.copy_object
+
+    def copy_while_app_writes(bucket_name, object_name, source):
+        copy_object(bucket_name, object_name, source)
+        if source.object_name == "docs/deep/3.md":  # the copy phase's last key
+            fake.objects["docs/0-late.md"] = b"new"  # sorts before the cursor: never copied
+            fake.objects["docs/1.md"] = b"overwritten after its copy"
+            fake.mtimes["docs/1.md"] = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    fake.copy_object = copy_while_app_writes
+
+    with _patch_client(fake):
+        job = _rename(api, bucket, "docs/", "notes/").json()["job"]
+    assert job["status"] == "completed" and job["params"]["left_in_source"] == 2
+    assert sorted(k for k in fake.objects if k.startswith("docs/")) == ["docs/0-late.md", "docs/1.md"]
+    assert fake.objects["docs/1.md"] == b"overwritten after its copy"
+    assert sorted(k for k in fake.objects if k.startswith("notes/")) == ["notes/1.md", "notes/2.md", "notes/deep/3.md"]
+
+
+def test_folder_move_rollback_and_destination_conflict(bucket, api):
+    fake = FakeMinio(KEYS)
+    fake.fail_copy = {"docs/deep/3.md"}
+    with _patch_client(fake):
+        assert _rename(api, bucket, "docs/", "img/").status_code == 409
+        assert _rename(api, bucket, "docs/", "docs/sub/").status_code == 400
+        job = _rename(api, bucket, "docs/", "notes/").json()["job"]
+        rolled = api.post(f"/api/buckets/{bucket.id}/jobs/{job['id']}/rollback/").json()["job"]
+        detail = api.get(f"/api/buckets/{bucket.id}/jobs/{job['id']}/").json()
+        again = api.post(f"/api/buckets/{bucket.id}/jobs/{job['id']}/rollback/")
+    assert rolled["status"] == "rolled_back" and detail["stalled"] is False
+    assert again.status_code == 409
+    assert not any(k.startswith("notes/") for k in fake.objects)
+    assert sorted(k for k in fake.objects if k.startswith("docs/")) == ["docs/1.md", "docs/2.md", "docs/deep/3.md"]
+    assert StorageJob.objects.filter(bucket=bucket).count() == 1
+
+
+# ---------------------------------------------------------------------------
+# delete-multiple
+# ---------------------------------------------------------------------------
+def test_delete_multiple_batches_files_and_runs_folder_jobs(bucket, api):
+    wide = [f"big/{i:05d}.bin" for i in range(2500)]
+    fake = FakeMinio(KEYS + wide)
+    fake.fail_delete = {"b.txt", "big/01234.bin"}
+    url = f"/api/buckets/{bucket.id}/delete-multiple/"
+    with _patch_client(fake):
+        resp = api.post(url, {"object_names": ["a.txt", "b.txt", "big/"]}, format="json")
+        body = resp.json()
+        job = body["jobs"][0]
+        assert resp.status_code == 202
+        assert body["deleted"] == ["a.txt"] and body["errors"][0]["object"] == "b.txt"
+        # 1 request for the two files + 3 for the 2500 folder keys, not one per object.
+        assert fake.delete_requests == 4
+        assert (job["status"], job["total"], job["processed"], job["failed"]) == ("failed", 2500, 2499, 1)
+        assert job["errors"] == [{"key": "big/01234.bin", "error": "AccessDenied: denied"}]
+
+        fake.fail_delete = set()
+        resumed = api.post(f"/api/buckets/{bucket.id}/jobs/{job['id']}/resume/").json()["job"]
+    assert resumed["status"] == "completed"
+    assert not any(k.startswith("big/") for k in fake.objects)
+
+
+# ---------------------------------------------------------------------------
+# Resumable upload sessions
+# ---------------------------------------------------------------------------
+@pytest.fixture
+def minio_parts(monkeypatch):
+    """Route the part PUTs to a MockTransport that stores the bytes on the FakeMinio upload."""
+    state = {"fake": None, "fail": set(), "requests": []}
+
+    def handler(request):
+        params = dict(request.url.params)
+        body = request.read()
+        state["requests"].append((int(params["partNumber"]), len(body), request.headers.get("Content-MD5")))
+        if int(params["partNumber"]) in state["fail"]:
+            return httpx.Response(500, content=b"<Error><Code>InternalError</Code></Error>")
+        state["fake"].uploads[params["uploadId"]]["parts"][int(params["partNumber"])] = body
+        return httpx.Response(200, headers={"ETag": '"%s"' % hashlib.md5(body).hexdigest()})
+
+    monkeypatch.setattr(uploads, "_http", httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(uploads, "MIN_PART_SIZE", 4)
+    monkeypatch.setattr(uploads, "STREAM_CHUNK", 3)
+    return state
+
+
+def _put_part(api, url, data, **headers):
+    return api.put(url, data=data, content_type="application/octet-stream", **headers)
+
+
+def test_upload_session_resumes_and_completes(bucket, api, minio_parts):
+    fake = FakeMinio([])
+    minio_parts["fake"] = fake
+    minio_parts["fail"] = {2}
+    base = f"/api/buckets/{bucket.id}/uploads/"
+    with _patch_client(fake):
+        session = api.post(base, {"object_name": "videos/big.bin", "part_size": 8, "total_size": 20},
+                           format="json").json()
+        url = f"{base}{session['id']}/"
+        md5 = base64.b64encode(hashlib.md5(b"AAAAAAAA").digest()).decode()
+        first = _put_part(api, f"{url}parts/1/", b"AAAAAAAA", HTTP_CONTENT_MD5=md5)
+        assert first.status_code == 200 and first.json()["sha256"] == hashlib.sha256(b"AAAAAAAA").hexdigest()
+        assert _put_part(api, f"{url}parts/2/", b"BBBBBBBB").status_code == 502
+        assert _put_part(api, f"{url}parts/3/", b"CCCC").status_code == 200
+        # Completing with a gap is refused; the session tells the client which parts it has.
+        assert api.post(f"{url}complete/").status_code == 400
+        assert [p["part_number"] for p in api.get(url).json()["parts"]] == [1, 3]
+
+        minio_parts["fail"] = set()
+        assert _put_part(api, f"{url}parts/2/", b"BBBBBBBB").status_code == 200
+        done = api.post(f"{url}complete/").json()
+        again = api.post(f"{url}complete/")
+
+    assert (done["status"], done["etag"]) == ("completed", "final-etag")
+    assert again.status_code == 409
+    assert fake.objects["videos/big.bin"] == b"AAAAAAAABBBBBBBBCCCC"
+    assert minio_parts["requests"][0] == (1, 8, md5)
+
+
+def test_upload_part_checks_sha256_size_and_abort(bucket, api, minio_parts):
+    fake = FakeMinio([])
+    minio_parts["fake"] = fake
+    base = f"/api/buckets/{bucket.id}/uploads/"
+    with _patch_client(fake):
+        session = api.post(base, {"object_name": "a.bin", "part_size": 8}, format="json").json()
+        url = f"{base}{session['id']}/"
+        good = hashlib.sha256(b"12345678").hexdigest()
+        assert _put_part(api, f"{url}parts/1/", b"12345678", HTTP_X_CONTENT_SHA256=good).status_code == 200
+        bad = _put_part(api, f"{url}parts/1/", b"1234567X", HTTP_X_CONTENT_SHA256=good)
+        assert bad.status_code == 400 and "checksum" in bad.json()["error"]
+        assert api.get(url).json()["parts"] == []  # MinIO holds the bad bytes: part must be re-sent
+        assert _put_part(api, f"{url}parts/2/", b"123456789").status_code == 400  # > part_size
+        assert api.post(base, {"object_name": "b.bin", "part_size": 1}, format="json").status_code == 400
+        aborted = api.delete(url).json()
+        assert _put_part(api, f"{url}parts/1/", b"12345678").status_code == 409
+
+    assert aborted["status"] == "aborted" and fake.uploads == {}
+    assert UploadSession.objects.get(id=session["id"]).status == "aborted"
+
+
+def test_minio_multipart_signatures():
+    """uploads._Multipart calls private Minio methods: fail here, not in production, if they change."""
+    import inspect
+    from minio import Minio
+
+    expected = {
+        "_create_multipart_upload": ["bucket_name", "object_name", "headers"],
+        "_complete_multipart_upload": ["bucket_name", "object_name", "upload_id", "parts"],
+        "_abort_multipart_upload": ["bucket_name", "object_name", "upload_id"],
+    }
+    for name, positional in expected.items():
+        params = list(inspect.signature(getattr(Minio, name)).parameters.values())[1:]
+        assert [p.name for p in params if p.default is inspect.Parameter.empty] == positional, name
+        assert [p.name for p in inspect.signature(getattr(FakeMinio, name)).parameters.values()][1:] == positional
+    assert [p.name for p in inspect.signature(uploads.Part).parameters.values()][:2] == ["part_number", "etag"]
+
+
+# ---------------------------------------------------------------------------
+# Presigned POST (direct-to-MinIO) uploads
+# ---------------------------------------------------------------------------
+def _direct_upload(fake, key, data, content_type):
+    """An object as MinIO holds it after a browser POST made now."""
+    fake.objects[key] = data
+    fake.content_types[key] = content_type
+    fake.mtimes[key] = datetime.now(timezone.utc)
+
+
+def test_presigned_post_grant_and_completion(bucket, api):
+    fake = FakeMinio([])
+    with _patch_client(fake):
+        resp = api.post(f"/api/buckets/{bucket.id}/presigned-post/",
+                        {"key_prefix": "avatars/", "max_size": 10, "content_type": "image/"}, format="json")
+        grant = resp.json()
+        assert resp.status_code == 201
+        assert grant["url"] == "http://localhost:9000/studio-bucket"
+        assert grant["fields"]["x-amz-signature"] == "sig"
+        prefix = f"avatars/{grant['id']}/"
+        assert grant["key_prefix"] == prefix and fake.policy._conditions["starts-with"]["key"] == prefix
+        assert fake.policy._lower_limit == 1 and fake.policy._upper_limit == 10
+
+        done_url = f"/api/direct-uploads/{grant['id']}/complete/"
+        anon = APIClient()
+        assert anon.post(done_url, {"object_name": "avatars/x.png"}, format="json").status_code == 400
+        assert anon.post(done_url, {"object_name": prefix + "x.png"}, format="json").status_code == 404
+
+        _direct_upload(fake, prefix + "x.png", b"png", "image/png")
+        done = anon.post(done_url, {"object_name": prefix + "x.png"}, format="json").json()
+        again = anon.post(done_url, {"object_name": prefix + "x.png"}, format="json")
+        other = anon.post(done_url, {"object_name": prefix + "y.png"}, format="json")
+    assert (done["status"], done["size"], done["etag"]) == ("completed", 3, "e1")
+    assert again.status_code == 200 and other.status_code == 409
+
+
+def test_presigned_post_rejects_out_of_policy_object_and_bad_key(bucket, api, settings):
+    settings.NIDHI_APP_API_KEY = "app-key"
+    fake = FakeMinio([])
+    with _patch_client(fake):
+        assert api.post("/api/storage/presigned-post/", {"bucket_name": "studio-bucket"},
+                        format="json").status_code == 401
+        app = APIClient(HTTP_AUTHORIZATION="Bearer app-key")
+        grant = app.post("/api/storage/presigned-post/",
+                         {"bucket_name": "studio-bucket", "content_type": "image/png", "max_size": 100},
+                         format="json").json()
+        assert grant["key_prefix"] == f"uploads/{grant['id']}/"
+        assert fake.policy._conditions["eq"]["Content-Type"] == "image/png"
+
+        key = grant["key_prefix"] + "doc.pdf"
+        _direct_upload(fake, key, b"%PDF", "application/pdf")
+        resp = app.post(f"/api/direct-uploads/{grant['id']}/complete/", {"object_name": key}, format="json")
+        bad = api.post(f"/api/buckets/{bucket.id}/presigned-post/", {"key_prefix": "a/../b/"}, format="json")
+        whole_bucket = api.post(f"/api/buckets/{bucket.id}/presigned-post/", {"key_prefix": "//"}, format="json")
+    assert resp.status_code == 422 and key not in fake.objects
+    assert bad.status_code == 400
+    assert whole_bucket.status_code == 400 and not DirectUpload.objects.filter(key_prefix="").exists()
+
+
+def test_presigned_post_grant_cannot_claim_or_delete_existing_objects(bucket, api):
+    fake = FakeMinio(["avatars/alice.png"])  # someone else's object, written long before
+    fake.content_types["avatars/alice.png"] = "text/plain"  # out of the next grant's policy
+    with _patch_client(fake):
+        first = api.post(f"/api/buckets/{bucket.id}/presigned-post/", {"key_prefix": "avatars/"}, format="json").json()
+        second = api.post(f"/api/buckets/{bucket.id}/presigned-post/",
+                          {"key_prefix": "avatars/", "content_type": "image/"}, format="json").json()
+        done_url = f"/api/direct-uploads/{second['id']}/complete/"
+        _direct_upload(fake, first["key_prefix"] + "a.png", b"png", "image/png")
+        shared = APIClient().post(done_url, {"object_name": "avatars/alice.png"}, format="json")
+        sibling = APIClient().post(done_url, {"object_name": first["key_prefix"] + "a.png"}, format="json")
+
+        # An old object under the grant's own prefix (not written through its policy) is left alone too.
+        fake.objects[second["key_prefix"] + "old.txt"] = b"old"
+        old = APIClient().post(done_url, {"object_name": second["key_prefix"] + "old.txt"}, format="json")
+    assert first["key_prefix"] != second["key_prefix"]
+    assert shared.status_code == 400 and sibling.status_code == 400
+    assert old.status_code == 409 and "before this upload grant" in old.json()["error"]
+    assert {"avatars/alice.png", first["key_prefix"] + "a.png", second["key_prefix"] + "old.txt"} <= set(fake.objects)
+    assert DirectUpload.objects.get(id=second["id"]).status == "issued"
+
+
+# ---------------------------------------------------------------------------
+# Relocation with object copy
+# ---------------------------------------------------------------------------
+def test_relocation_copies_verifies_syncs_and_switches(bucket, api):
+    source, target = FakeMinio(KEYS), FakeMinio([])
+    target.objects["stale/gone.txt"] = b"old"   # deleted on the source during the copy
+    source.corrupt = {"img/x.png"}
+    url = f"/api/buckets/{bucket.id}/relocate/"
+    with _patch_client(source, target):
+        assert api.patch(url, {"endpoint": "new-minio:9000", "copy_objects": True},
+                         format="json").status_code == 409   # target not empty
+        resp = api.patch(url, {"endpoint": "new-minio:9000", "copy_objects": True, "allow_existing": True},
+                         format="json")
+        job = resp.json()["job"]
+        assert resp.status_code == 202
+        assert (job["status"], job["phase"], job["failed"]) == ("failed", "copy", 1)
+        assert "checksum mismatch" in job["errors"][0]["error"]
+        bucket.refresh_from_db()
+        assert bucket.endpoint == "localhost:9000"   # not switched while objects are missing
+
+        source.corrupt = set()
+        source.objects["late.txt"] = b"written during copy"
+        resumed = api.post(f"/api/buckets/{bucket.id}/jobs/{job['id']}/resume/").json()["job"]
+
+    bucket.refresh_from_db()
+    assert (resumed["status"], resumed["phase"]) == ("completed", "done")
+    assert bucket.endpoint == "new-minio:9000"
+    assert target.objects == source.objects
+
+
+def test_diff_listings_merges_sorted_listings():
+    from api.storage_jobs import diff_listings
+    source, target = FakeMinio(["a", "b", "c"]), FakeMinio([])
+    target.objects = {"b": source.objects["b"], "c": b"changed", "d": b"extra"}
+    assert [(k, action) for k, action, _ in diff_listings(source, target, "studio-bucket")] == [
+        ("a", "copy"), ("b", "skip"), ("c", "copy"), ("d", "extra")]
+
+
+# ---------------------------------------------------------------------------
+# Object index
+# ---------------------------------------------------------------------------
+def _event(name, key, size=0, sequencer="0000000000000001", bucket_name="studio-bucket"):
+    return {"eventName": name, "eventTime": "2026-10-01T10:00:00.000Z",
+            "s3": {"bucket": {"name": bucket_name},
+                   "object": {"key": key, "size": size, "eTag": "e", "contentType": "image/png",
+                              "sequencer": sequencer}}}
+
+
+def test_object_index_reconciles_and_follows_events(bucket, api, settings):
+    settings.NIDHI_MINIO_WEBHOOK_TOKEN = "hook"
+    fake = FakeMinio(KEYS + ["docs/deep/"])
+    fake.set_bucket_notification = mock.Mock()
+    base = f"/api/buckets/{bucket.id}/"
+    with _patch_client(fake):
+        assert api.get(f"{base}search/").status_code == 409
+        usage = api.post(f"{base}index/").json()
+    # Folder markers are indexed (empty folders show up) but not counted.
+    assert (usage["object_count"], usage["total_size"]) == (7, sum(range(1, 8)))
+    assert fake.set_bucket_notification.called
+
+    hook = APIClient()
+    url = "/api/storage/events/"
+    assert hook.post(url, {"Records": []}, format="json").status_code == 401
+    records = [
+        _event("s3:ObjectCreated:Put", "img/new+logo.png", 100, "0000000000000005"),
+        _event("s3:ObjectCreated:Put", "img/new+logo.png", 50, "0000000000000003"),   # late, older
+        _event("s3:ObjectRemoved:Delete", "a.txt", sequencer="0000000000000009"),
+        _event("s3:ObjectCreated:Put", "x", 1, bucket_name="not-indexed"),
+    ]
+    resp = hook.post(url, {"Records": records}, format="json", HTTP_AUTHORIZATION="Bearer hook")
+    assert resp.json()["changed"] == 2
+
+    with _patch_client(FakeMinio([])):   # nothing below may list MinIO
+        usage = api.get(f"{base}index/").json()
+        found = api.get(f"{base}search/", {"prefix": "img/", "limit": 1}).json()
+        more = api.get(f"{base}search/", {"prefix": "img/", "after": found["next_after"]}).json()
+        tree = api.get(f"{base}tree/", {"prefix": "docs"}).json()
+    assert (usage["object_count"], usage["total_size"]) == (7, sum(range(1, 8)) - 1 + 100)
+    assert [o["name"] for o in found["objects"] + more["objects"]] == ["img/new logo.png", "img/x.png"]
+    assert found["objects"][0]["size"] == 100
+    assert tree["source"] == "index"
+    assert [(c["path"], c.get("object_count")) for c in tree["children"]] == [
+        ("docs/deep/", 1), ("docs/1.md", None), ("docs/2.md", None)]
+    assert tree["object_count"] == 3
+
+
+def test_object_index_tombstones_ignore_late_creates(bucket):
+    from api.object_index import apply_event, reconcile, search
+    from api.models import ObjectIndex, StorageObject
+    reconcile(bucket, FakeMinio(["a"]))
+    index = ObjectIndex.objects.get(bucket=bucket)
+
+    assert apply_event(bucket.id, _event("s3:ObjectRemoved:Delete", "a", sequencer="0000000000000009"))
+    assert not apply_event(bucket.id, _event("s3:ObjectCreated:Put", "a", 5, "0000000000000004"))
+    # Removal delivered before the creation it follows: the tombstone comes first.
+    assert not apply_event(bucket.id, _event("s3:ObjectRemoved:Delete", "b", sequencer="0000000000000007"))
+    assert not apply_event(bucket.id, _event("s3:ObjectCreated:Put", "b", 5, "0000000000000006"))
+    index.refresh_from_db()
+    assert (index.object_count, index.total_size) == (0, 0)
+    assert search(bucket) == [] and StorageObject.objects.filter(deleted=True).count() == 2
+
+    assert apply_event(bucket.id, _event("s3:ObjectCreated:Put", "b", 5, "000000000000000A"))  # re-upload
+    index.refresh_from_db()
+    assert (index.object_count, index.total_size) == (1, 5)
+
+    stats = reconcile(bucket, FakeMinio(["b"]))
+    assert stats["objects"] == 1 and not StorageObject.objects.filter(deleted=True).exists()
+
+
+def test_reconcile_repairs_missed_events(bucket):
+    from api.object_index import reconcile
+    from api.models import StorageObject
+    fake = FakeMinio(["a", "b", "c"])
+    reconcile(bucket, fake)
+    fake.objects.pop("b")
+    fake.objects["a"] = b"changed!"
+    fake.objects["d"] = b"new"
+    stats = reconcile(bucket, fake)
+    rows = {o.key: o.size for o in StorageObject.objects.filter(bucket=bucket)}
+    assert rows == {"a": 8, "c": 3, "d": 3}
+    assert (stats["upserted"], stats["deleted"], stats["objects"]) == (2, 1, 3)
+
+
+# ---------------------------------------------------------------------------
+# Folder ZIP export
+# ---------------------------------------------------------------------------
+def test_folder_archive_streams_zip(bucket, api, monkeypatch):
+    from api import zip_export
+    monkeypatch.setattr(zip_export, "CHUNK_SIZE", 4)
+    monkeypatch.setattr(zip_export, "PREFETCH", 2)
+    fake = FakeMinio(KEYS + ["docs/deep/"])
+    fake.objects["docs/big.bin"] = bytes(range(256)) * 40
+    with _patch_client(fake):
+        link = api.post(f"/api/buckets/{bucket.id}/archive/", {"prefix": "docs"}, format="json").json()
+        resp = APIClient().get(f"/api/{link['path']}")
+        chunks = list(resp.streaming_content)
+        bad = APIClient().get(f"/api/{link['path'][:-3]}x/")
+
+    assert resp["Content-Disposition"] == 'attachment; filename="docs.zip"'
+    assert len(chunks) > 10   # streamed piecewise, not built in one go
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.namelist() == ["1.md", "2.md", "big.bin", "deep/3.md"]
+    assert archive.read("big.bin") == fake.objects["docs/big.bin"]
+    assert archive.read("deep/3.md") == fake.objects["docs/deep/3.md"]
+    assert bad.status_code == 403
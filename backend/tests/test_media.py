@@ -0,0 +1,467 @@
+"""
+Media gateway tests — TESTING_STRATEGY #13.
+
+MinIO is NEVER reached: the pooled client returned by api.storage is replaced by a
+MagicMock, so we only assert what the gateway asks MinIO for and what it returns.
+
+Covers:
+  * StorageBucket config is cached per process and dropped when the bucket is saved.
+  * /api/media/<bucket>/<key> serves the object through the cached config (no DB hit).
+  * SDK-minted signed URLs verify at the gateway; tampered/expired ones are rejected.
+  * Image transforms render once per source version into the derivative bucket and are then
+    served from it; signed URLs cover the transform params, decompression bombs are a 400 and
+    slow renders a 504.
+  * The async (ASGI) gateway streams the presigned MinIO response with the same auth/headers.
+  * accel mode hands nginx-fronted requests off via X-Accel-Redirect instead of proxying bytes.
+  * Gateway usage is metered into hour/day MediaUsageRollup rows and exposed per product.
+"""
+import io
+import os
+import time
+import threading
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from urllib.parse import urlparse
+
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import AsyncClient, override_settings
+from rest_framework.test import APIClient
+
+import nidhi_sdk.media as media_sdk
+from api import image_derivatives, media_views, metering, storage
+from api.media_signing import canonical_transform, compute_media_signature, verify_media_signature
+from api.models import MediaUsageRollup, Product, StorageBucket
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _clear_bucket_cache():
+    storage.invalidate_bucket()
+    yield
+    storage.invalidate_bucket()
+
+
+@pytest.fixture(autouse=True)
+def _quiet_metering():
+    """No background flush threads in tests; each test starts with empty counters."""
+    metering._take_counters()
+    with mock.patch.object(metering, "_ensure_flusher"):
+        yield
+    metering._take_counters()
+
+
+def _make_bucket(name="reader-production-media", status="available"):
+    product = Product.objects.create(name=f"prod-{name}")
+    return StorageBucket.objects.create(
+        product=product, bucket_name=name, access_key="ak", secret_key="sk",
+        endpoint="localhost:9000", created_by_sso_id="t", status=status,
+    )
+
+
+def _fake_object(data=b"png-bytes", content_type="image/png"):
+    obj = mock.MagicMock()
+    obj.headers = {"Content-Type": content_type}
+    obj.read.return_value = data
+    obj.stream.return_value = iter([data])
+    obj.etag = None
+    return obj
+
+
+# ---------------------------------------------------------------------------
+# Bucket config / client cache
+# ---------------------------------------------------------------------------
+def test_bucket_config_is_cached_and_invalidated_on_save():
+    bucket = _make_bucket()
+    first = storage.get_bucket_config(bucket.bucket_name)
+    assert first.secret_key == "sk"
+    assert first.internal_endpoint == storage.MINIO_ENDPOINT
+
+    # Cached: a direct UPDATE (no signal) is not seen until invalidation.
+    StorageBucket.objects.filter(id=bucket.id).update(endpoint="10.0.0.9:9000")
+    assert storage.get_bucket_config(bucket.bucket_name).endpoint == "localhost:9000"
+
+    # A model save (relocate_bucket / admin) drops the entry immediately.
+    bucket.refresh_from_db()
+    bucket.save()
+    assert storage.get_bucket_config(bucket.bucket_name).endpoint == "10.0.0.9:9000"
+
+
+def test_client_pool_reuses_clients_per_credentials():
+    a = storage.get_client("minio:9000", "ak", "sk")
+    b = storage.get_client("minio:9000", "ak", "sk")
+    c = storage.get_client("minio:9000", "ak", "other")
+    assert a is b
+    assert a is not c
+
+
+def test_client_pool_evicts_clients_a_bucket_no_longer_uses():
+    bucket = _make_bucket()
+    old = storage.get_bucket_client(bucket)
+    storage.get_client("10.0.0.9:9000", "ak", "sk")  # e.g. a relocation's target
+    bucket.status = "relocating"
+    bucket.save()
+    assert storage.get_bucket_client(bucket) is old  # same credentials and endpoint: kept
+
+    bucket.secret_key = "rotated"
+    bucket.save()
+    assert ("10.0.0.9:9000", "ak", "sk") not in storage._clients
+    assert (storage.MINIO_ENDPOINT, "ak", "sk") not in storage._clients
+    assert storage.get_bucket_client(bucket) is not old
+
+    bucket.delete()
+    assert not any(key[1:] == ("ak", "rotated") for key in storage._clients)
+
+
+# ---------------------------------------------------------------------------
+# serve_media
+# ---------------------------------------------------------------------------
+@override_settings(NIDHI_APP_API_KEY="test-api-key")
+def test_serve_media_streams_object_with_api_key():
+    bucket = _make_bucket()
+    client = mock.MagicMock()
+    client.get_object.return_value = _fake_object()
+
+    with mock.patch("api.views.get_client", return_value=client):
+        resp = APIClient().get(
+            f"/api/media/{bucket.bucket_name}/pages/p1.png?api_key=test-api-key")
+
+    assert resp.status_code == 200
+    assert b"".join(resp.streaming_content) == b"png-bytes"
+    assert client.get_object.call_args[0][:2] == (bucket.bucket_name, "pages/p1.png")
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key")
+def test_serve_media_rejects_bad_key_and_unknown_bucket():
+    api = APIClient()
+    assert api.get("/api/media/nope/x.png?api_key=wrong").status_code == 401
+    assert api.get("/api/media/nope/x.png?api_key=test-api-key").status_code == 404
+
+
+# ---------------------------------------------------------------------------
+# Signed URLs
+# ---------------------------------------------------------------------------
+SDK_ENV = {
+    "NIDHI_DEV_SERVER_URL": "http://nidhi.test:8001",
+    "MEDIA_BUCKET_NAME": "reader-production-media",
+    "NIDHI_APP_API_KEY": "test-api-key",
+}
+
+
+def _sdk_url(key, **kwargs):
+    with mock.patch.dict(os.environ, SDK_ENV, clear=True):
+        url = media_sdk.get_nidhi_media_url(key, **kwargs)
+    parsed = urlparse(url)
+    return f"{parsed.path}?{parsed.query}"
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key", NIDHI_MEDIA_SIGNING_KEY="")
+def test_sdk_signature_matches_gateway():
+    expires = int(time.time()) + 60
+    with mock.patch.dict(os.environ, SDK_ENV, clear=True):
+        sdk_sig = media_sdk.sign_media_url("b", "a/b.png", expires, "0-99")
+    assert sdk_sig == compute_media_signature("b", "a/b.png", expires, "0-99")
+    assert verify_media_signature("b", "a/b.png", str(expires), "0-99", sdk_sig) == (True, "")
+    assert verify_media_signature("b", "a/c.png", str(expires), "0-99", sdk_sig)[0] is False
+    assert verify_media_signature("b", "a/b.png", str(expires), "0-99", sdk_sig,
+                                  now=expires + 1) == (False, "expired")
+
+
+def test_sdk_signed_url_is_stable_and_has_no_api_key():
+    first = _sdk_url("pages/p1.png")
+    assert "api_key" not in first and "sig=" in first
+    assert first == _sdk_url("pages/p1.png")
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key", NIDHI_MEDIA_SIGNING_KEY="")
+def test_serve_media_accepts_signed_url_and_range():
+    bucket = _make_bucket()
+    client = mock.MagicMock()
+    obj = _fake_object(data=b"0123")
+    obj.headers["Content-Range"] = "bytes 0-3/10"
+    client.get_object.return_value = obj
+
+    with mock.patch("api.views.get_client", return_value=client):
+        resp = APIClient().get(_sdk_url("pages/p1.png", byte_range="0-3"))
+        tampered = APIClient().get(_sdk_url("pages/p1.png").replace("p1.png", "p2.png"))
+
+    assert resp.status_code == 206
+    assert resp["Content-Range"] == "bytes 0-3/10"
+    assert client.get_object.call_args.kwargs == {"offset": 0, "length": 4}
+    assert "max-age=" in resp["Cache-Control"]
+    assert tampered.status_code == 403
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key", NIDHI_MEDIA_SIGNING_KEY="",
+                   NIDHI_MEDIA_GATEWAY_MODE="accel", NIDHI_MEDIA_ACCEL_MINIO_ENDPOINT="172.20.0.1:9000",
+                   NIDHI_MEDIA_ACCEL_SECRET="nginx-secret")
+def test_serve_media_accel_mode_hands_transfer_to_nginx():
+    bucket = _make_bucket()
+    client = mock.MagicMock()
+    client.get_presigned_url.return_value = (
+        "http://172.20.0.1:9000/reader-production-media/pages/p%201.png?X-Amz-Signature=abc")
+    client.get_object.return_value = _fake_object()
+    url = _sdk_url("pages/p 1.png", byte_range="10-19")
+
+    with mock.patch("api.views.get_client", return_value=client) as get_client:
+        resp = APIClient().get(url, HTTP_X_NIDHI_ACCEL="nginx-secret")
+        direct = APIClient().get(url)
+        forged = APIClient().get(url, HTTP_X_NIDHI_ACCEL="1")
+
+    assert resp.status_code == 200 and resp.content == b""
+    assert resp["X-Accel-Redirect"] == "/_nidhi_media/"
+    assert resp["X-Nidhi-Upstream-Uri"] == "/reader-production-media/pages/p%201.png?X-Amz-Signature=abc"
+    assert resp["X-Nidhi-Upstream-Range"] == "bytes=10-19"
+    assert "Content-Type" not in resp and "max-age=" in resp["Cache-Control"]
+    assert get_client.call_args_list[1][0] == ("172.20.0.1:9000", "ak", "sk")
+    assert client.get_presigned_url.call_args[0][:3] == ("GET", bucket.bucket_name, "pages/p 1.png")
+    # Without nginx's secret the bytes are still proxied by Django (no presigned URL leaks).
+    for proxied in (direct, forged):
+        assert proxied.status_code == 206 and "X-Accel-Redirect" not in proxied
+        assert "X-Nidhi-Upstream-Uri" not in proxied
+    assert client.get_object.call_count == 2
+
+
+# ---------------------------------------------------------------------------
+# Image derivatives
+# ---------------------------------------------------------------------------
+def _png(size=(400, 200)):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGBA", size, (255, 0, 0, 255)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_parse_transform_validates_params():
+    assert image_derivatives.parse_transform({}) is None
+    spec = image_derivatives.parse_transform({"w": "100", "fmt": "jpg"})
+    assert (spec.width, spec.height, spec.fit, spec.fmt) == (100, None, "inside", "jpeg")
+    assert spec.derivative_key("media", "a/b.png", "e1") == "media/w100-h0-inside-q80/e1/a/b.png.jpeg"
+    for bad in ({"w": "0"}, {"w": "abc"}, {"fit": "cover", "w": "10"}, {"fmt": "gif"}):
+        with pytest.raises(ValueError):
+            image_derivatives.parse_transform(bad)
+
+
+def test_render_cover_resizes_and_reencodes():
+    from PIL import Image
+    spec = image_derivatives.parse_transform({"w": "50", "h": "50", "fit": "cover", "fmt": "jpeg"})
+    data, content_type = image_derivatives.render(_png(), spec)
+    assert content_type == "image/jpeg"
+    assert Image.open(io.BytesIO(data)).size == (50, 50)
+
+
+def test_render_rejects_decompression_bombs():
+    from PIL import Image
+    spec = image_derivatives.parse_transform({"w": "50"})
+    with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000), pytest.raises(ValueError, match="too many pixels"):
+        image_derivatives.render(_png(), spec)  # 80k pixels > 2 x MAX_IMAGE_PIXELS
+
+
+def test_ensure_derivative_timeout_is_not_an_oserror():
+    from minio.error import S3Error
+    release = threading.Event()
+    client, store = mock.MagicMock(), mock.MagicMock()
+    client.stat_object.return_value = mock.Mock(etag='"v1"')
+    store.stat_object.side_effect = S3Error(None, "NoSuchKey", "missing", "k", "req", "host")
+    client.get_object.side_effect = lambda *a, **kw: release.wait(5) and _fake_object(data=_png())
+    spec = image_derivatives.parse_transform({"w": "10"})
+    try:
+        with mock.patch.object(image_derivatives, "DERIVATIVE_TIMEOUT", 0.05), \
+                pytest.raises(image_derivatives.DerivativeTimeout) as raised:
+            image_derivatives.ensure_derivative(client, "b", "slow.png", spec, store)
+        assert not isinstance(raised.value, OSError)
+    finally:
+        release.set()
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key", NIDHI_MEDIA_SIGNING_KEY="")
+def test_signed_url_covers_transform_params():
+    bucket = _make_bucket()
+    url = _sdk_url("pages/p1.png", transform={"w": 100, "fmt": "webp", "bogus": 1})
+    assert "w=100&fmt=webp" in url and "bogus" not in url
+    query = dict(pair.split("=") for pair in urlparse(url).query.split("&"))
+    assert canonical_transform(query) == "w=100&fmt=webp"
+    assert verify_media_signature(bucket.bucket_name, "pages/p1.png", query["expires"], "", query["sig"],
+                                  transform="w=100&fmt=webp") == (True, "")
+
+    client = mock.MagicMock()
+    with mock.patch("api.views.get_client", return_value=client), \
+            mock.patch("api.views.ensure_derivative", return_value="_derivatives/x") as ensure:
+        client.get_object.return_value = _fake_object(content_type="image/webp")
+        assert APIClient().get(url).status_code == 200
+        for tampered in (url.replace("w=100", "w=4000"), url + "&q=1", url.replace("&w=100&fmt=webp", "")):
+            assert APIClient().get(tampered).status_code == 403
+    assert ensure.call_count == 1
+
+    with mock.patch("api.views.get_client", return_value=client), \
+            mock.patch("api.views.ensure_derivative", side_effect=image_derivatives.DerivativeTimeout("slow")):
+        assert APIClient().get(url).status_code == 504
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key")
+def test_serve_media_generates_derivative_once_then_serves_cache():
+    from minio.error import S3Error
+    bucket = _make_bucket()
+    source = {"etag": '"v1"'}
+    stored = {}
+    client = mock.MagicMock()
+
+    def stat_object(bucket_name, key):
+        if bucket_name == bucket.bucket_name and key == "pages/p1.png":
+            return mock.Mock(etag=source["etag"])
+        if bucket_name != image_derivatives.STORE.bucket_name or key not in stored:
+            raise S3Error(None, "NoSuchKey", "missing", key, "req", "host")
+
+    def get_object(bucket_name, key, **kwargs):
+        if (bucket_name, key) == (bucket.bucket_name, "pages/p1.png"):
+            obj = _fake_object(data=_png())
+            obj.headers["Content-Length"] = "100"
+            return obj
+        assert bucket_name == image_derivatives.STORE.bucket_name
+        return _fake_object(data=stored[key], content_type="image/webp")
+
+    def put_object(bucket_name, key, data, length, content_type):
+        assert bucket_name == image_derivatives.STORE.bucket_name  # never the tenant's bucket
+        stored[key] = data.read()
+
+    client.stat_object.side_effect = stat_object
+    client.get_object.side_effect = get_object
+    client.put_object.side_effect = put_object
+
+    url = f"/api/media/{bucket.bucket_name}/pages/p1.png?api_key=test-api-key&w=100&fmt=webp"
+    with mock.patch("api.views.get_client", return_value=client):
+        first = APIClient().get(url)
+        second = APIClient().get(url)
+        source["etag"] = '"v2"'  # overwritten in place
+        third = APIClient().get(url)
+
+    assert first.status_code == 200 and second.status_code == 200 and third.status_code == 200
+    assert list(stored) == [f"{bucket.bucket_name}/w100-h0-inside-q80/v1/pages/p1.png.webp",
+                            f"{bucket.bucket_name}/w100-h0-inside-q80/v2/pages/p1.png.webp"]
+    assert client.put_object.call_count == 2
+    assert first["Content-Type"] == "image/webp"
+
+
+# ---------------------------------------------------------------------------
+# Async gateway
+# ---------------------------------------------------------------------------
+def _async_get(url, upstream_handler, minio_client):
+    """Run one request through serve_media_async with MinIO's HTTP side mocked by httpx."""
+    async def run():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(upstream_handler))
+        with mock.patch("api.media_views.get_client", return_value=minio_client), \
+                mock.patch("api.media_views._http_client", return_value=http):
+            resp = await AsyncClient().get(url)
+            body = b"".join([c async for c in resp.streaming_content]) if resp.streaming else resp.content
+        await http.aclose()
+        return resp, body
+    return async_to_sync(run)()
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key", NIDHI_MEDIA_SIGNING_KEY="")
+def test_async_gateway_streams_presigned_object_with_range():
+    bucket = _make_bucket()
+    minio_client = mock.MagicMock()
+    minio_client.get_presigned_url.return_value = "http://minio:9000/reader-production-media/pages/p1.png?X-Amz-Signature=x"
+    seen = {}
+
+    def upstream(request):
+        seen["range"] = request.headers.get("Range")
+        return httpx.Response(206, stream=httpx.ByteStream(b"0123"), headers={
+            "Content-Type": "image/png", "Content-Range": "bytes 0-3/10", "ETag": '"abc"'})
+
+    url = _sdk_url("pages/p1.png", byte_range="0-3").replace("/api/media/", "/api/media-stream/")
+    resp, body = _async_get(url, upstream, minio_client)
+
+    assert resp.status_code == 206 and body == b"0123"
+    assert seen["range"] == "bytes=0-3"
+    assert resp["Content-Range"] == "bytes 0-3/10" and resp["ETag"] == '"abc"'
+    assert "max-age=" in resp["Cache-Control"]
+    assert minio_client.get_presigned_url.call_args[0][:3] == ("GET", bucket.bucket_name, "pages/p1.png")
+
+
+@override_settings(NIDHI_APP_API_KEY="test-api-key")
+def test_async_gateway_auth_and_upstream_errors():
+    _make_bucket()
+    minio_client = mock.MagicMock()
+    minio_client.get_presigned_url.return_value = "http://minio:9000/x"
+    base = "/api/media-stream/reader-production-media/missing.png"
+
+    resp, _ = _async_get(f"{base}?api_key=wrong", lambda r: httpx.Response(200), minio_client)
+    assert resp.status_code == 401
+    resp, _ = _async_get(f"{base}?api_key=test-api-key", lambda r: httpx.Response(404), minio_client)
+    assert resp.status_code == 404
+    with mock.patch.object(media_views, "MAX_STREAMS", 0):
+        resp, _ = _async_get(f"{base}?api_key=test-api-key", lambda r: httpx.Response(200), minio_client)
+    assert resp.status_code == 503
+    assert media_views._active_streams == 0
+
+
+# ---------------------------------------------------------------------------
+# Metering
+# ---------------------------------------------------------------------------
+@override_settings(NIDHI_APP_API_KEY="test-api-key")
+def test_gateway_usage_is_metered_into_hour_and_day_rollups():
+    bucket = _make_bucket()
+    client = mock.MagicMock()
+    client.get_object.return_value = _fake_object(data=b"12345")
+
+    with mock.patch("api.views.get_client", return_value=client):
+        APIClient().get(f"/api/media/{bucket.bucket_name}/a.png?api_key=test-api-key")
+        APIClient().get(f"/api/media/{bucket.bucket_name}/a.png?api_key=test-api-key")
+    client.get_object.side_effect = Exception("NoSuchKey")
+    with mock.patch("api.views.get_client", return_value=client):
+        APIClient().get(f"/api/media/{bucket.bucket_name}/b.png?api_key=test-api-key")
+
+    assert metering.flush() == 2
+    # A second process flushing into the same period increments the existing rows.
+    metering.record(bucket.bucket_name, bucket.product_id, metering.api_key_hash("test-api-key"), 200, 7)
+    metering.flush()
+
+    day = MediaUsageRollup.objects.get(granularity="day")
+    hour = MediaUsageRollup.objects.get(granularity="hour")
+    assert (day.requests, day.bytes, day.status_2xx, day.status_4xx) == (4, 17, 3, 1)
+    assert (hour.requests, hour.bytes) == (4, 17)
+    assert day.product_id == bucket.product_id and day.key_hash == metering.api_key_hash("test-api-key")
+
+
+def test_usage_is_counted_in_the_hour_it_was_served_and_flushed_by_a_timer():
+    bucket = _make_bucket()
+    served_at = datetime(2026, 10, 1, 23, 59, 59, tzinfo=dt_timezone.utc).timestamp()
+    with mock.patch.object(metering.time, "time", return_value=served_at):
+        metering.record(bucket.bucket_name, bucket.product_id, "signed", 200, 10)
+
+    class Stop(Exception):
+        pass
+
+    # The timer flushes without any further request; the period is the one the request was served in.
+    with mock.patch.object(metering.time, "sleep", side_effect=[None, Stop()]), \
+            mock.patch.object(metering, "close_old_connections"), pytest.raises(Stop):
+        metering._flush_periodically()
+    rows = {r.granularity: r.period_start for r in MediaUsageRollup.objects.all()}
+    assert rows == {"hour": datetime(2026, 10, 1, 23, tzinfo=dt_timezone.utc),
+                    "day": datetime(2026, 10, 1, tzinfo=dt_timezone.utc)}
+
+
+def test_product_bandwidth_api_reads_rollups():
+    bucket = _make_bucket()
+    metering.record(bucket.bucket_name, bucket.product_id, "signed", 200, 1000)
+    metering.record(bucket.bucket_name, bucket.product_id, "abc", 206, 24)
+    metering.flush()
+
+    user = User.objects.create_user(username="fe-bw", password="pw")
+    user.role = "founding_engineer"
+    api = APIClient()
+    api.force_authenticate(user=user)
+
+    resp = api.get(f"/api/products/{bucket.product_id}/bandwidth/")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["totals"]["bytes"] == 1024 and body["totals"]["requests"] == 2
+    assert len(body["series"]) == 1
+    assert body["buckets"][0]["bucket_name"] == bucket.bucket_name
+    assert api.get(f"/api/products/{bucket.product_id}/bandwidth/?granularity=hour").json()["totals"]["bytes"] == 1024
+    assert api.get(f"/api/products/{bucket.product_id}/bandwidth/?granularity=week").status_code == 400
@@ -0,0 +1,258 @@
+"""
+pg_stat_statements insights (api.query_stats) tests — TESTING_STRATEGY #13.
+
+No server is reached: `psycopg2.connect` returns FakeStatsConn, which answers the collector's
+queries from a mutable list of pg_stat_statements rows, so each test can advance the counters
+between two collections.
+
+Covers:
+  * the first collection only records the baseline; later ones store per-interval deltas mapped
+    to the owning DatabaseInstance, with texts fetched for the kept statements only.
+  * statements beyond the per-interval top-N fold into one row per database (exact totals).
+  * resets: pg_stat_statements_info.stats_reset changes, calls going backwards (eviction).
+  * Postgres 12 column names, collection errors kept on the snapshot, retention pruning.
+  * the per-server and per-instance top-N APIs.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import psycopg2
+import pytest
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import query_stats
+from api.models import DatabaseInstance, DatabaseServer, Product, QueryStatDelta, QueryStatSnapshot
+from api.tasks import collect_query_stats, prune_query_stats
+
+pytestmark = pytest.mark.django_db
+
+RESET_AT = datetime(2026, 10, 1, tzinfo=dt_timezone.utc)
+
+
+class FakeStatsCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.executed.append((query, params))
+        stats = self.conn.stats
+        if "server_version_num" in query:
+            self._rows = [(stats.version,)]
+        elif "pg_stat_statements_info" in query:
+            self._rows = [(stats.reset_at,)]
+        elif "pg_stat_statements(false)" in query:
+            self._rows = [(s["dbid"], 10, s["queryid"], s["datname"], "app", s["calls"], s["total_ms"], s["rows"],
+                           s["hit"], s["read"]) for s in stats.rows]
+        elif "left(s.query" in query:
+            wanted = set(params[1])
+            self._rows = [(s["queryid"], s["query"]) for s in stats.rows if s["queryid"] in wanted]
+        else:
+            self._rows = []
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class FakeStatsConn:
+    autocommit = False
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.executed = []
+
+    def cursor(self):
+        return FakeStatsCursor(self)
+
+    def close(self):
+        pass
+
+
+class FakeStats:
+    """A server's pg_stat_statements: `rows` hold cumulative counters tests can advance."""
+
+    def __init__(self):
+        self.version = 160002
+        self.reset_at = RESET_AT
+        self.rows = []
+        self.connections = []
+        self.fail = None
+
+    def add(self, queryid, datname, calls, total_ms, query=None, rows=0, hit=0, read=0):
+        dbid = {"shop_db": 16384, "blog_db": 16385}.get(datname, 1)
+        for s in self.rows:
+            if s["queryid"] == queryid and s["datname"] == datname:
+                s.update(calls=s["calls"] + calls, total_ms=s["total_ms"] + total_ms, rows=s["rows"] + rows,
+                         hit=s["hit"] + hit, read=s["read"] + read)
+                return
+        self.rows.append({"dbid": dbid, "queryid": queryid, "datname": datname, "calls": calls,
+                          "total_ms": total_ms, "rows": rows, "hit": hit, "read": read,
+                          "query": query or f"SELECT /* {queryid} */ 1"})
+
+    def __call__(self, **kwargs):
+        assert kwargs["host"] == "stats.db.local" and kwargs["dbname"] == "postgres"
+        if self.fail:
+            raise self.fail
+        conn = FakeStatsConn(self)
+        self.connections.append(conn)
+        return conn
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    fake = FakeStats()
+    monkeypatch.setattr(psycopg2, "connect", fake)
+    return fake
+
+
+@pytest.fixture
+def server():
+    return DatabaseServer.objects.create(
+        name="stats-srv", host="stats.db.local", port=5442, root_user="postgres",
+        root_password="root-pw", environment_type="production", is_active=True,
+    )
+
+
+@pytest.fixture
+def shop(server):
+    product = Product.objects.create(name="shop")
+    return DatabaseInstance.objects.create(server=server, product=product, db_name="shop_db", db_user="shop_user",
+                                           status="available", created_by_sso_id="t")
+
+
+@pytest.fixture
+def api():
+    user = User.objects.create_user(username="fe-query-stats", password="pw")
+    user.role = "founding_engineer"
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def test_collection_stores_deltas_against_the_previous_snapshot(stats, server, shop):
+    stats.add(1, "shop_db", calls=100, total_ms=5000.0, rows=100, hit=900, read=100)
+    stats.add(2, "blog_db", calls=10, total_ms=10.0)
+    assert query_stats.collect(server) == 0  # baseline only: these counters cover all of history
+    snapshot = QueryStatSnapshot.objects.get(server=server)
+    assert snapshot.counters["16384:10:1"] == [100, 5000.0, 100, 900, 100]
+
+    stats.add(1, "shop_db", calls=50, total_ms=2500.0, rows=50, hit=450, read=50, query="SELECT * FROM orders")
+    stats.add(3, "shop_db", calls=5, total_ms=1.0)  # new statement: counted from zero
+    assert query_stats.collect(server) == 2  # blog_db's statement saw no calls
+    rows = {d.queryid: d for d in QueryStatDelta.objects.all()}
+    assert rows[1].calls == 50 and rows[1].total_ms == 2500.0 and rows[1].shared_blks_read == 50
+    assert rows[1].instance == shop and rows[1].username == "app" and rows[1].query.startswith("SELECT /* 1 */")
+    assert rows[3].calls == 5
+    assert rows[1].period_start == snapshot.taken_at
+
+    texts = [p for conn in stats.connections for q, p in conn.executed if "left(s.query" in q]
+    assert sorted(texts[-1][1]) == [1, 3]  # texts only for the statements kept
+
+
+def test_statements_beyond_the_top_n_fold_into_one_row_per_database(monkeypatch, stats, server, shop):
+    monkeypatch.setattr(query_stats, "TOP_PER_INTERVAL", 2)
+    query_stats.collect(server)
+    for queryid, ms in ((1, 900.0), (2, 800.0), (3, 30.0), (4, 20.0)):
+        stats.add(queryid, "shop_db", calls=1, total_ms=ms)
+    stats.add(5, "blog_db", calls=3, total_ms=5.0)
+    query_stats.collect(server)
+
+    kept = QueryStatDelta.objects.exclude(queryid=None)
+    assert sorted(kept.values_list("queryid", flat=True)) == [1, 2]
+    other = {d.database: d for d in QueryStatDelta.objects.filter(queryid=None)}
+    assert (other["shop_db"].calls, other["shop_db"].total_ms) == (2, 50.0)
+    assert other["shop_db"].instance == shop and other["blog_db"].instance is None
+    assert sum(QueryStatDelta.objects.values_list("total_ms", flat=True)) == 1755.0
+
+
+def test_resets_count_from_zero(stats, server):
+    stats.add(1, "shop_db", calls=100, total_ms=100.0)
+    stats.add(2, "shop_db", calls=100, total_ms=100.0)
+    query_stats.collect(server)
+
+    stats.rows[1].update(calls=4, total_ms=8.0)  # evicted and re-added: calls went backwards
+    stats.add(1, "shop_db", calls=1, total_ms=1.0)
+    query_stats.collect(server)
+    assert dict(QueryStatDelta.objects.values_list("queryid", "calls")) == {1: 1, 2: 4}
+
+    QueryStatDelta.objects.all().delete()
+    stats.reset_at = RESET_AT + timedelta(days=1)
+    stats.rows = []
+    stats.add(1, "shop_db", calls=7, total_ms=7.0)
+    query_stats.collect(server)
+    assert dict(QueryStatDelta.objects.values_list("queryid", "calls")) == {1: 7}
+
+
+def test_postgres_12_column_names(stats, server):
+    stats.version = 120015
+    query_stats.collect(server)
+    queries = [q for q, _ in stats.connections[0].executed]
+    counters = next(q for q in queries if "pg_stat_statements(false)" in q)
+    assert "s.total_time AS total_ms" in counters and "toplevel" not in counters
+    assert not any("pg_stat_statements_info" in q for q in queries)
+
+
+def test_collection_errors_are_kept_on_the_snapshot(stats, server):
+    stats.fail = psycopg2.errors.ObjectNotInPrerequisiteState(
+        "pg_stat_statements must be loaded via shared_preload_libraries")
+    collect_query_stats.delay()  # eager: fans out to the server task
+    snapshot = QueryStatSnapshot.objects.get(server=server)
+    assert "shared_preload_libraries" in snapshot.error and snapshot.counters == {}
+
+    stats.fail = None
+    stats.add(1, "shop_db", calls=10, total_ms=10.0)
+    query_stats.collect(server)  # first successful run after failures: still only a baseline
+    assert not QueryStatDelta.objects.exists()
+    assert QueryStatSnapshot.objects.get(server=server).error == ""
+
+
+def _delta(server, instance, database, queryid, calls, total_ms, minutes_ago=10, **extra):
+    end = timezone.now() - timedelta(minutes=minutes_ago)
+    return QueryStatDelta.objects.create(
+        server=server, instance=instance, database=database, username="app", queryid=queryid,
+        query=f"SELECT {queryid}", period_start=end - timedelta(minutes=5), period_end=end,
+        calls=calls, total_ms=total_ms, **extra)
+
+
+def test_top_n_apis_rank_databases_and_statements(api, server, shop):
+    _delta(server, shop, "shop_db", 1, calls=10, total_ms=600.0, shared_blks_hit=90, shared_blks_read=10)
+    _delta(server, shop, "shop_db", 1, calls=10, total_ms=200.0, minutes_ago=15)
+    _delta(server, shop, "shop_db", None, calls=100, total_ms=100.0)
+    _delta(server, None, "blog_db", 7, calls=1000, total_ms=100.0)
+    _delta(server, shop, "shop_db", 2, calls=1, total_ms=99999.0, minutes_ago=60 * 48)  # outside the window
+
+    body = api.get(f"/api/servers/{server.id}/query-stats/").json()
+    assert body["totals"]["total_ms"] == 1000.0 and body["totals"]["calls"] == 1120
+    assert [(d["database"], d["share"]) for d in body["databases"]] == [("shop_db", 0.9), ("blog_db", 0.1)]
+    assert body["databases"][0]["product"] == "shop"
+    top = body["statements"][0]
+    assert (top["queryid"], top["calls"], top["total_ms"], top["mean_ms"], top["share"]) == (1, 20, 800.0, 40.0, 0.8)
+    assert top["hit_ratio"] == 0.9 and top["instance_id"] == str(shop.id)
+    assert [s["queryid"] for s in body["statements"]] == [1, 7]  # the folded remainder is not a statement
+
+    body = api.get(f"/api/servers/{server.id}/query-stats/", {"order_by": "calls", "limit": 1}).json()
+    assert [s["queryid"] for s in body["statements"]] == [7]
+
+    body = api.get(f"/api/instances/{shop.id}/query-stats/").json()
+    assert body["totals"]["total_ms"] == 900.0 and [s["queryid"] for s in body["statements"]] == [1]
+
+    assert api.get(f"/api/servers/{server.id}/query-stats/", {"order_by": "bogus"}).status_code == 400
+    assert api.get(f"/api/servers/{server.id}/query-stats/", {"since": "yesterday"}).status_code == 400
+
+
+def test_prune_drops_deltas_past_retention(monkeypatch, server, shop):
+    _delta(server, shop, "shop_db", 1, calls=1, total_ms=1.0, minutes_ago=60 * 24 * 20)
+    _delta(server, shop, "shop_db", 1, calls=1, total_ms=1.0)
+    monkeypatch.setattr(query_stats, "RETENTION_DAYS", 14)
+    assert prune_query_stats() == 1
+    assert QueryStatDelta.objects.count() == 1
@@ -0,0 +1,1135 @@
+"""
+Database Studio (studio_views) tests — TESTING_STRATEGY #13.
+
+No tenant Postgres is ever reached: `psycopg2.connect` is replaced by FakePg, which hands out
+FakePgConn objects answering queries from a list of (substring, rows) rules and recording every
+statement. Instances point at a dummy host, never at nidhi-db / nidhi-main_db.
+
+Covers:
+  * the per-instance connection pool: reuse across requests, per-server cap (waiting, stealing
+    another instance's idle connection, PoolExhausted -> 503), idle eviction, health check on
+    checkout, session reset after arbitrary SQL, and invalidation on server / instance changes.
+  * schema catalog: built in one query, cached per instance, revalidated by the catalog
+    version (rebuilt on DDL, kept otherwise), served by tables / schema / table browsing.
+  * table browsing: keyset pages with signed cursors, sort on indexed columns only, typed
+    filters compiled to parameters.
+  * execute_query: named server-side cursor in a READ ONLY transaction, batched fetches, row /
+    byte caps reported as truncation, NDJSON and columnar streaming, the data-safety guard.
+  * EXPLAIN profiler: read-only, rolled back, plan tree with exclusive times, hottest nodes and
+    findings (seq scans of large tables, disk spills, misestimates).
+  * health report: one query, bloat estimates from pg_stats widths, findings ranked by severity
+    and size (invalid / unused indexes, bloat, dead tuples, seq-scan-heavy tables, cache hits).
+  * exports: CSV through COPY (plain / gzip) behind a signed link or into a bucket, the
+    SELECT ... LIMIT 0 probe, Parquet / Arrow through pyarrow when it is installed.
+  * database download: pg_dump's stdout streamed behind a signed link (no temp file), the
+    password in the child's environment only, errors before the first byte, client disconnects.
+  * query jobs: role timeouts, rows spooled to a (fake) MinIO as gzip'd column-major pages,
+    paged results, bounded status long-poll, cancellation via pg_cancel_backend, statement
+    timeouts, result purge.
+"""
+import gzip
+import io
+import json
+import time
+from datetime import timedelta
+from unittest import mock
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+from psycopg2 import sql as psycopg_sql
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import studio_pool, studio_query, query_jobs, schema_catalog, studio_export, db_dump, db_health
+from api.models import AuditLog, DatabaseServer, DatabaseInstance, Product, QueryJob, StorageBucket
+
+pytestmark = pytest.mark.django_db
+
+DUMMY_HOST = "studio.db.local"
+DUMMY_PORT = 5442
+
+
+def render_query(q):
+    """psycopg2.sql composition -> SQL text, without a server (identifiers double-quoted)."""
+    if isinstance(q, str):
+        return q
+    if isinstance(q, psycopg_sql.Composed):
+        return "".join(render_query(part) for part in q)
+    if isinstance(q, psycopg_sql.SQL):
+        return q.string
+    if isinstance(q, psycopg_sql.Identifier):
+        return ".".join(f'"{name}"' for name in q.strings)
+    if isinstance(q, psycopg_sql.Literal):
+        return repr(q.wrapped)
+    return str(q)
+
+
+class FakePgCursor:
+    def __init__(self, conn, name=None, tuples=False):
+        self.conn = conn
+        self.name = name
+        self.tuples = tuples
+        self.description = None
+        self._rows = []
+
+    def execute(self, query, params=None):
+        query = render_query(query)
+        self.conn.executed.append((query, params))
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        for needle, rows in self.conn.pg.rules:
+            if needle in query:
+                self._rows = list(rows() if callable(rows) else rows)
+                break
+        else:
+            self._rows = []
+        self.description = [mock.Mock(name=k) for k in self._rows[0]] if self._rows else None
+        if self.description:
+            for column, key in zip(self.description, self._rows[0]):
+                column.name = key
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def copy_expert(self, query, file, size=8192):
+        """COPY ... TO STDOUT (FORMAT csv, HEADER): the rows of the first rule matching the query."""
+        self.execute(query)
+        rows, self._rows = self._rows, []
+        if rows:
+            file.write(",".join(rows[0]) + "\n")
+        for row in rows:
+            file.write(",".join("" if v is None else str(v) for v in row.values()) + "\n")
+        self.rowcount = len(rows)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return [tuple(r.values()) for r in rows] if self.tuples else rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        self.conn.fetches.append(len(rows))
+        return [tuple(r.values()) for r in rows] if self.tuples else rows
+
+    def close(self):
+        pass
+
+
+class FakePgConn:
+    def __init__(self, pg, kwargs):
+        self.pg = pg
+        self.kwargs = kwargs
+        self.executed = []
+        self.closed = 0
+        self.broken = False
+        self.autocommit = False
+        self.rollbacks = 0
+        self.fetches = []
+        self.cursor_names = []
+
+    def cursor(self, name=None, cursor_factory=None):
+        self.cursor_names.append(name)
+        return FakePgCursor(self, name=name, tuples=cursor_factory is psycopg2.extensions.cursor)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePg:
+    """Stand-in for psycopg2.connect; `rules` = [(substring of the SQL, rows)], first match wins."""
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.connections = []
+
+    def __call__(self, **kwargs):
+        assert kwargs["host"] == DUMMY_HOST, "Studio tests must only dial the dummy host"
+        conn = FakePgConn(self, kwargs)
+        self.connections.append(conn)
+        return conn
+
+
+@pytest.fixture(autouse=True)
+def _empty_pool(monkeypatch):
+    studio_pool.invalidate()
+    studio_pool._open.clear()
+    cache.clear()
+    monkeypatch.setattr(studio_pool, "_start_reaper", lambda: None)
+    yield
+    studio_pool.invalidate()
+    studio_pool._open.clear()
+
+
+def _table(name, columns=()):
+    return {"name": name, "kind": "table", "row_estimate": 0, "total_bytes": 8192, "table_bytes": 0,
+            "columns": list(columns), "indexes": [], "foreign_keys": []}
+
+
+def _catalog_rules(version, tables):
+    """FakePg rules answering schema_catalog's CATALOG_SQL and VERSION_SQL."""
+    return [
+        ("json_agg(t ORDER BY t.name)", lambda: [{"version": version, "tables": json.loads(json.dumps(tables))}]),
+        ("AS version", [{"version": version}]),
+    ]
+
+
+@pytest.fixture
+def pg(monkeypatch):
+    fake = FakePg(_catalog_rules("v1", [_table("orders"), _table("users")]))
+    monkeypatch.setattr(psycopg2, "connect", fake)
+    return fake
+
+
+@pytest.fixture
+def server():
+    return DatabaseServer.objects.create(
+        name="studio-srv", host=DUMMY_HOST, port=DUMMY_PORT, root_user="postgres",
+        root_password="root-pw", environment_type="development", is_active=True,
+    )
+
+
+def _instance(server, db_name="shop_db"):
+    product, _ = Product.objects.get_or_create(name="studio-product")
+    return DatabaseInstance.objects.create(
+        server=server, product=product, db_name=db_name, db_user=f"{db_name}_user",
+        created_by_sso_id="tester", status="available",
+    )
+
+
+@pytest.fixture
+def instance(server):
+    return _instance(server)
+
+
+@pytest.fixture
+def api():
+    user = User.objects.create_user(username="fe-db-studio", password="pw")
+    user.role = "founding_engineer"
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+# ---------------------------------------------------------------------------
+# Connection pool
+# ---------------------------------------------------------------------------
+def test_studio_requests_reuse_one_pooled_connection(api, monkeypatch, pg, instance):
+    monkeypatch.setattr(schema_catalog, "TRUST_SECONDS", 0)  # every call revalidates over the pool
+    for _ in range(3):
+        response = api.get(f"/api/instances/{instance.id}/studio/tables/")
+        assert response.status_code == 200
+        assert response.json()["tables"] == ["orders", "users"]
+
+    assert len(pg.connections) == 1
+    assert pg.connections[0].kwargs["dbname"] == "shop_db"
+    assert pg.connections[0].closed == 0
+    assert studio_pool.stats() == {f"{DUMMY_HOST}:{DUMMY_PORT}": {"open": 1, "idle": 1}}
+
+
+def test_pool_caps_connections_per_server(monkeypatch, pg, server):
+    monkeypatch.setattr(studio_pool, "MAX_PER_SERVER", 1)
+    first, second = _instance(server, "a_db"), _instance(server, "b_db")
+
+    held = studio_pool.acquire(first)
+    with pytest.raises(studio_pool.PoolExhausted):
+        studio_pool.acquire(second, timeout=0)
+    studio_pool.release(held)
+
+    # At the cap, the idle connection of another instance on the same server makes room.
+    other = studio_pool.acquire(second, timeout=0)
+    assert pg.connections[0].closed == 1
+    assert other.conn.kwargs["dbname"] == "b_db"
+    studio_pool.release(other)
+    assert studio_pool.stats()[f"{DUMMY_HOST}:{DUMMY_PORT}"]["open"] == 1
+
+
+def test_exhausted_pool_answers_503(api, monkeypatch, pg, instance):
+    monkeypatch.setattr(studio_pool, "MAX_PER_SERVER", 1)
+    monkeypatch.setattr(studio_pool, "CHECKOUT_TIMEOUT", 0)
+    held = studio_pool.acquire(_instance(instance.server, "busy_db"))
+
+    response = api.get(f"/api/instances/{instance.id}/studio/tables/")
+    assert response.status_code == 503
+    assert "busy" in response.json()["error"]
+    studio_pool.release(held)
+
+
+def test_idle_connections_are_evicted(monkeypatch, pg, instance):
+    studio_pool.release(studio_pool.acquire(instance))
+    monkeypatch.setattr(studio_pool, "IDLE_TIMEOUT", 0.0)
+    time.sleep(0.01)
+
+    studio_pool.release(studio_pool.acquire(instance))
+    assert [c.closed for c in pg.connections] == [1, 0]
+
+
+def test_dead_connection_is_replaced_on_checkout(monkeypatch, pg, instance):
+    studio_pool.release(studio_pool.acquire(instance))
+    pg.connections[0].broken = True
+    monkeypatch.setattr(studio_pool, "PING_AFTER", 0.0)
+    time.sleep(0.01)
+
+    pooled = studio_pool.acquire(instance)
+    assert pooled.conn is pg.connections[1]
+    assert pg.connections[0].closed == 1
+    studio_pool.release(pooled)
+    assert studio_pool.stats()[f"{DUMMY_HOST}:{DUMMY_PORT}"] == {"open": 1, "idle": 1}
+
+
+def test_connection_error_inside_request_discards_the_connection(pg, instance):
+    with pytest.raises(psycopg2.OperationalError):
+        with studio_pool.connection(instance) as conn:
+            conn.broken = True
+            conn.cursor().execute("SELECT 1")
+    assert pg.connections[0].closed == 1
+    assert studio_pool.stats()[f"{DUMMY_HOST}:{DUMMY_PORT}"]["open"] == 0
+
+
+def test_execute_query_resets_the_session_before_pooling(api, pg, instance):
+    pg.rules.append(("SET search_path", []))
+    response = api.post(f"/api/instances/{instance.id}/studio/query/",
+                        {"query": "SET search_path TO audit"}, format="json")
+    assert response.status_code == 200
+
+    conn = pg.connections[0]
+    assert conn.executed[-1][0] == "DISCARD ALL"
+    assert conn.autocommit is False and conn.closed == 0
+
+
+def test_credential_or_server_change_invalidates_pooled_connections(pg, instance):
+    studio_pool.release(studio_pool.acquire(instance))
+    server = instance.server
+    server.root_password = "rotated-pw"
+    server.save()
+    assert pg.connections[0].closed == 1
+
+    held = studio_pool.acquire(DatabaseInstance.objects.select_related("server").get(pk=instance.pk))
+    assert held.conn.kwargs["password"] == "rotated-pw"
+    instance.status = "stopped"
+    instance.save()
+    studio_pool.release(held)  # checked out across the change: retired, not pooled
+    assert pg.connections[1].closed == 1
+    assert studio_pool.stats()[f"{DUMMY_HOST}:{DUMMY_PORT}"]["open"] == 0
+
+
+def test_pool_does_not_reuse_connections_opened_with_stale_credentials(pg, instance):
+    studio_pool.release(studio_pool.acquire(instance))
+    # Changed by another worker: no signal here, but the instance now resolves differently.
+    DatabaseServer.objects.filter(pk=instance.server_id).update(root_user="admin")
+    fresh = DatabaseInstance.objects.select_related("server").get(pk=instance.pk)
+
+    pooled = studio_pool.acquire(fresh)
+    assert pooled.conn.kwargs["user"] == "admin"
+    assert pg.connections[0].closed == 1
+    studio_pool.release(pooled)
+
+
+# ---------------------------------------------------------------------------
+# Schema catalog
+# ---------------------------------------------------------------------------
+def _catalog_queries(pg):
+    executed = [q for conn in pg.connections for q, _ in conn.executed]
+    return (sum("json_agg(t ORDER BY t.name)" in q for q in executed),
+            sum("json_agg" not in q and "AS version" in q for q in executed))
+
+
+def test_schema_catalog_is_cached_until_the_catalog_version_changes(api, monkeypatch, pg, instance):
+    monkeypatch.setattr(schema_catalog, "TRUST_SECONDS", 0)
+    url = f"/api/instances/{instance.id}/studio/schema/"
+
+    body = api.get(url).json()
+    assert [t["name"] for t in body["tables"]] == ["orders", "users"]
+    assert body["version"] == "v1" and body["tables"][0]["primary_key"] == []
+    assert _catalog_queries(pg) == (1, 0)
+
+    api.get(url)
+    api.get(f"/api/instances/{instance.id}/studio/tables/")
+    assert _catalog_queries(pg) == (1, 2)  # version unchanged: served from the cache
+
+    pg.rules[:2] = _catalog_rules("v2", [_table("orders"), _table("users"), _table("refunds")])
+    assert api.get(url).json()["version"] == "v2"
+    assert _catalog_queries(pg) == (2, 3)
+
+    assert api.get(url, {"refresh": "1"}).status_code == 200
+    assert _catalog_queries(pg) == (3, 3)
+
+
+def test_schema_catalog_trust_window_and_stats_refresh(api, monkeypatch, pg, instance):
+    url = f"/api/instances/{instance.id}/studio/tables/"
+    api.get(url)
+    api.get(url)
+    assert _catalog_queries(pg) == (1, 0)  # within NIDHI_CATALOG_TRUST_SECONDS: no query at all
+
+    monkeypatch.setattr(schema_catalog, "TRUST_SECONDS", 0)
+    monkeypatch.setattr(schema_catalog, "STATS_MAX_AGE", 0)
+    api.get(url)
+    assert _catalog_queries(pg) == (2, 0)  # row estimates / sizes too old: rebuilt without a version check
+
+
+def test_schema_catalog_survives_a_cache_outage(api, monkeypatch, pg, instance):
+    def down(*args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(schema_catalog.cache, "get", down)
+    monkeypatch.setattr(schema_catalog.cache, "set", down)
+    for _ in range(2):
+        response = api.get(f"/api/instances/{instance.id}/studio/tables/")
+        assert response.status_code == 200 and response.json()["tables"] == ["orders", "users"]
+    assert _catalog_queries(pg) == (2, 0)
+
+
+def test_table_dropped_behind_the_cached_catalog_answers_409(api, pg, instance):
+    def gone():
+        raise psycopg2.errors.UndefinedTable('relation "orders" does not exist')
+
+    pg.rules[:0] = [*ORDERS_CATALOG, ('FROM "orders"', gone)]
+    response = api.get(f"/api/instances/{instance.id}/studio/tables/orders/")
+    assert response.status_code == 409
+    assert cache.get(schema_catalog._key(instance)) is None
+
+    assert api.get(f"/api/instances/{instance.id}/studio/tables/missing/").status_code == 404
+
+
+# ---------------------------------------------------------------------------
+# Table browsing
+# ---------------------------------------------------------------------------
+ORDERS_COLUMNS = [
+    {"name": "id", "type": "integer", "category": "N", "not_null": True, "pk_position": 1, "indexed": True},
+    {"name": "status", "type": "text", "category": "S", "not_null": False, "pk_position": None, "indexed": False},
+    {"name": "total", "type": "numeric(10,2)", "category": "N", "not_null": False, "pk_position": None,
+     "indexed": True},
+]
+
+
+ORDERS_CATALOG = _catalog_rules("v1", [_table("orders", ORDERS_COLUMNS)])
+
+
+def _orders_page(ids):
+    return [{"id": i, "status": "paid", "total": None, "__nidhi_k0": str(i)} for i in ids]
+
+
+def test_table_pages_follow_the_primary_key_with_signed_cursors(api, pg, instance):
+    pages = [_orders_page([1, 2, 3]), _orders_page([4])]
+    pg.rules[:0] = [*ORDERS_CATALOG, ('FROM "orders"', lambda: pages.pop(0))]
+    url = f"/api/instances/{instance.id}/studio/tables/orders/"
+
+    first = api.get(url, {"limit": 2}).json()
+    assert [r["id"] for r in first["rows"]] == [1, 2]
+    assert "__nidhi_k0" not in first["rows"][0]
+    assert first["primary_keys"] == ["id"] and first["sortable"] == ["id", "total"]
+    assert first["has_more"] is True
+
+    second = api.get(url, {"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [r["id"] for r in second["rows"]] == [4]
+    assert second["has_more"] is False and second["next_cursor"] is None
+
+    query, params = pg.connections[0].executed[-1]
+    assert query == ('SELECT *, "id"::text AS "__nidhi_k0" FROM "orders" WHERE "id" > %s::integer '
+                     'ORDER BY "id" LIMIT 3')
+    assert params == ["2"]
+
+
+def test_table_sort_and_filters_compile_to_typed_parameters(api, pg, instance):
+    pg.rules[:0] = [*ORDERS_CATALOG, ('FROM "orders"', [])]
+    response = api.get(f"/api/instances/{instance.id}/studio/tables/orders/",
+                       {"sort": "-total", "filter": ["status:in:paid,refunded", "total:gte:10.5"]})
+    assert response.status_code == 200
+    assert response.json()["sort"] == "-total"
+
+    query, params = pg.connections[0].executed[-1]
+    assert query == ('SELECT *, "total"::text AS "__nidhi_k0", "id"::text AS "__nidhi_k1" FROM "orders" '
+                     'WHERE "status" = ANY(%s::text[]) AND "total" >= %s::numeric(10,2) '
+                     'ORDER BY "total" DESC, "id" DESC LIMIT 101')
+    assert params == [["paid", "refunded"], "10.5"]
+
+
+@pytest.mark.parametrize("params, message", [
+    ({"sort": "status"}, "not indexed"),
+    ({"filter": "nope:eq:1"}, "Unknown filter column"),
+    ({"filter": "total:like:1%"}, "only applies to text columns"),
+    ({"cursor": "forged"}, "Invalid cursor"),
+    ({"limit": 5000}, "limit must be between"),
+])
+def test_table_browse_rejects_bad_requests(api, pg, instance, params, message):
+    pg.rules[:0] = [*ORDERS_CATALOG]
+    response = api.get(f"/api/instances/{instance.id}/studio/tables/orders/", params)
+    assert response.status_code == 400
+    assert message in response.json()["error"]
+
+
+def test_table_cursor_is_bound_to_its_sort(api, pg, instance):
+    pg.rules[:0] = [*ORDERS_CATALOG, ('FROM "orders"', lambda: _orders_page([1, 2]))]
+    url = f"/api/instances/{instance.id}/studio/tables/orders/"
+    token = api.get(url, {"limit": 1}).json()["next_cursor"]
+
+    response = api.get(url, {"limit": 1, "sort": "-total", "cursor": token})
+    assert response.status_code == 400
+    assert "does not belong" in response.json()["error"]
+
+
+def test_views_without_row_ids_get_an_unkeyed_first_page(api, pg, instance):
+    view = {**_table("order_totals", ORDERS_COLUMNS[1:]), "kind": "view"}
+    pg.rules[:0] = [*_catalog_rules("v1", [view]),
+                    ('FROM "order_totals"', lambda: [{"status": "paid", "total": 1}] * 3)]
+    url = f"/api/instances/{instance.id}/studio/tables/order_totals/"
+
+    body = api.get(url, {"limit": 2, "filter": "status:eq:paid"}).json()
+    assert len(body["rows"]) == 2 and body["has_more"] is True and body["next_cursor"] is None
+    query, params = pg.connections[0].executed[-1]
+    assert query == 'SELECT * FROM "order_totals" WHERE "status" = %s::text LIMIT 3' and params == ["paid"]
+
+    response = api.get(url, {"cursor": "anything"})
+    assert response.status_code == 400 and "no primary key" in response.json()["error"]
+    assert cache.get(schema_catalog._key(instance)) is not None  # not mistaken for a schema change
+
+
+# ---------------------------------------------------------------------------
+# execute_query
+# ---------------------------------------------------------------------------
+def _events(n):
+    return [{"id": i, "kind": "click"} for i in range(n)]
+
+
+def test_execute_query_fetches_in_batches_through_a_named_cursor(api, monkeypatch, pg, instance):
+    monkeypatch.setattr(studio_query, "BATCH_SIZE", 2)
+    pg.rules.insert(0, ("FROM events", _events(5)))
+    response = api.post(f"/api/instances/{instance.id}/studio/query/",
+                        {"query": "SELECT * FROM events;"}, format="json")
+    body = response.json()
+    assert response.status_code == 200
+    assert body["columns"] == ["id", "kind"]
+    assert body["rows"][4] == {"id": 4, "kind": "click"}
+    assert body["truncated"] is False and body["row_count"] == 5
+
+    conn = pg.connections[0]
+    assert conn.executed[0][0] == "SET TRANSACTION READ ONLY"
+    assert conn.executed[1] == ("SELECT set_config('statement_timeout', %s, true)", ("30000",))
+    assert conn.executed[2][0] == "SELECT * FROM events"
+    assert any(name and name.startswith("nidhi_studio_") for name in conn.cursor_names)
+    assert conn.fetches == [2, 2, 1, 0]
+
+
+def test_execute_query_caps_rows_and_bytes(api, monkeypatch, pg, instance):
+    pg.rules.insert(0, ("FROM events", _events(50)))
+    url = f"/api/instances/{instance.id}/studio/query/"
+
+    monkeypatch.setattr(studio_query, "MAX_ROWS", 10)
+    body = api.post(url, {"query": "SELECT * FROM events"}, format="json").json()
+    assert (len(body["rows"]), body["truncated"], body["truncated_by"]) == (10, True, "rows")
+    assert "truncated at 10 rows" in body["message"]
+
+    monkeypatch.setattr(studio_query, "MAX_BYTES", 100)
+    body = api.post(url, {"query": "SELECT * FROM events"}, format="json").json()
+    assert body["truncated_by"] == "bytes"
+    assert sum(len(studio_query.dumps([r["id"], r["kind"]])) + 1 for r in body["rows"]) <= 100
+
+
+@pytest.mark.parametrize("output", ["ndjson", "columnar"])
+def test_execute_query_streams_results(api, monkeypatch, pg, instance, output):
+    monkeypatch.setattr(studio_query, "BATCH_SIZE", 2)
+    monkeypatch.setattr(studio_query, "MAX_ROWS", 3)
+    pg.rules.insert(0, ("FROM events", _events(5)))
+    response = api.post(f"/api/instances/{instance.id}/studio/query/",
+                        {"query": "SELECT * FROM events", "output": output}, format="json")
+    assert response["Content-Type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    assert lines[0] == {"columns": ["id", "kind"]}
+    if output == "ndjson":
+        assert lines[1:4] == [[0, "click"], [1, "click"], [2, "click"]]
+    else:
+        assert lines[1:3] == [{"data": [[0, 1], ["click", "click"]]}, {"data": [[2], ["click"]]}]
+    assert lines[-1] == {"done": True, "row_count": 3, "truncated": True, "truncated_by": "rows"}
+    # The connection went back to the pool once the stream ended.
+    assert studio_pool.stats()[f"{DUMMY_HOST}:{DUMMY_PORT}"] == {"open": 1, "idle": 1}
+
+
+def test_execute_query_reports_sql_errors_before_streaming(api, pg, instance):
+    pg.rules.insert(0, ("FROM missing", lambda: (_ for _ in ()).throw(
+        psycopg2.errors.UndefinedTable('relation "missing" does not exist'))))
+    response = api.post(f"/api/instances/{instance.id}/studio/query/",
+                        {"query": "SELECT * FROM missing", "output": "ndjson"}, format="json")
+    assert response.status_code == 400
+    assert "does not exist" in response.json()["error"]
+    assert studio_pool.stats()[f"{DUMMY_HOST}:{DUMMY_PORT}"] == {"open": 1, "idle": 1}
+
+
+def test_execute_query_guard_blocks_mutating_sql(api, pg, instance):
+    response = api.post(f"/api/instances/{instance.id}/studio/query/",
+                        {"query": "drop table orders"}, format="json")
+    assert response.status_code == 403
+    assert AuditLog.objects.filter(success=False, detail__startswith="REJECTED").count() == 1
+    assert pg.connections == []
+
+
+# ---------------------------------------------------------------------------
+# EXPLAIN profiler
+# ---------------------------------------------------------------------------
+ORDERS_PLAN = [{
+    "Planning Time": 0.5, "Execution Time": 100.0,
+    "Plan": {
+        "Node Type": "Sort", "Plan Rows": 50, "Actual Rows": 4000, "Actual Loops": 1, "Actual Total Time": 100.0,
+        "Sort Method": "external merge", "Sort Space Type": "Disk", "Sort Space Used": 9000,
+        "Shared Hit Blocks": 10, "Temp Written Blocks": 1125,
+        "Plans": [{
+            "Node Type": "Hash Join", "Join Type": "Inner", "Parent Relationship": "Outer", "Plan Rows": 50,
+            "Actual Rows": 4000, "Actual Loops": 1, "Actual Total Time": 70.0, "Hash Cond": "(o.user_id = u.id)",
+            "Shared Hit Blocks": 10,
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "orders", "Alias": "o", "Parent Relationship": "Outer",
+                 "Plan Rows": 4000, "Actual Rows": 4000, "Actual Loops": 1, "Actual Total Time": 60.0,
+                 "Filter": "(status = 'paid'::text)", "Rows Removed by Filter": 496000, "Shared Hit Blocks": 8},
+                {"Node Type": "Hash", "Parent Relationship": "Inner", "Plan Rows": 1, "Actual Rows": 300,
+                 "Actual Loops": 1, "Actual Total Time": 5.0, "Hash Batches": 1, "Shared Hit Blocks": 2,
+                 "Plans": [
+                     {"Node Type": "Index Scan", "Relation Name": "users", "Index Name": "users_pkey",
+                      "Parent Relationship": "Outer", "Plan Rows": 1, "Actual Rows": 300, "Actual Loops": 1,
+                      "Actual Total Time": 4.0, "Shared Hit Blocks": 2},
+                 ]},
+            ],
+        }],
+    },
+}]
+EXPLAIN_SQL = "SELECT * FROM orders o JOIN users u ON o.user_id = u.id WHERE status = 'paid' ORDER BY u.name"
+
+
+def test_explain_profiles_the_query_read_only_and_rolls_back(api, pg, instance):
+    orders = dict(_table("orders", ORDERS_COLUMNS), row_estimate=500000)
+    pg.rules[:2] = _catalog_rules("v1", [orders, _table("users")])
+    pg.rules.insert(0, ("EXPLAIN (ANALYZE", [{"QUERY PLAN": ORDERS_PLAN}]))
+
+    response = api.post(f"/api/instances/{instance.id}/studio/explain/", {"query": EXPLAIN_SQL + ";"}, format="json")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["execution_ms"] == 100.0 and body["raw"] == ORDERS_PLAN
+
+    sort = body["plan"]
+    join = sort["children"][0]
+    scan, hash_node = join["children"]
+    assert (sort["self_ms"], join["self_ms"], scan["self_ms"], hash_node["self_ms"]) == (30.0, 5.0, 60.0, 1.0)
+    assert [h["node"] for h in body["hottest"]] == [scan["id"], sort["id"], join["id"], hash_node["children"][0]["id"],
+                                                     hash_node["id"]]
+    assert scan["hot"] and scan["self_percent"] == 60.0
+
+    findings = [(f["node"], f["kind"]) for f in body["findings"]]
+    assert findings == [(sort["id"], "disk_spill"), (sort["id"], "misestimate"), (join["id"], "misestimate"),
+                        (scan["id"], "seq_scan"), (hash_node["id"], "misestimate"),
+                        (hash_node["children"][0]["id"], "misestimate")]
+    assert "~500000 rows" in body["findings"][3]["message"] and "496000 rows" in body["findings"][3]["message"]
+    assert "9000 kB" in body["findings"][0]["message"]
+    assert "disk_spill" not in join["findings"]  # temp blocks are counted on the node that wrote them
+
+    conn = pg.connections[0]
+    statements = [q for q, _ in conn.executed]
+    explain_at = next(i for i, q in enumerate(statements) if q.startswith("EXPLAIN"))
+    assert statements[explain_at - 2:explain_at + 1] == [
+        "SET TRANSACTION READ ONLY",
+        "SELECT set_config('statement_timeout', %s, true)",
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + EXPLAIN_SQL,
+    ]
+    assert statements[-1] == "DISCARD ALL" and conn.rollbacks >= 2
+    assert AuditLog.objects.filter(detail__startswith="EXPLAIN ANALYZE executed").count() == 1
+
+
+def test_explain_rejects_statements_it_cannot_profile(api, pg, instance):
+    url = f"/api/instances/{instance.id}/studio/explain/"
+    response = api.post(url, {"query": "SHOW work_mem"}, format="json")
+    assert response.status_code == 400 and "can be profiled" in response.json()["error"]
+
+    assert api.post(url, {"query": "DELETE FROM orders"}, format="json").status_code == 403
+    assert not any(q.startswith("EXPLAIN") for conn in pg.connections for q, _ in conn.executed)
+
+
+# ---------------------------------------------------------------------------
+# Exports
+# ---------------------------------------------------------------------------
+MIB = 1024 * 1024
+
+
+def _health_table(name, **stats):
+    table = {"schema": "public", "name": name, "row_estimate": 1000, "pages": 1, "live_tuples": 1000,
+             "dead_tuples": 0, "seq_scan": 0, "seq_tup_read": 0, "idx_scan": 10, "inserts": 1000, "updates": 0,
+             "hot_updates": 0, "deletes": 0, "modified_since_analyze": 0, "last_vacuum": None,
+             "last_autovacuum": None, "last_analyze": None, "last_autoanalyze": "2026-10-01T00:00:00+00:00",
+             "heap_blks_read": 0, "heap_blks_hit": 0, "idx_blks_read": 0, "idx_blks_hit": 0,
+             "total_bytes": 8192, "table_bytes": 8192, "index_bytes": 0, "fillfactor": 100,
+             "column_count": 2, "stats_columns": 2, "row_width": 36}
+    table.update(stats)
+    return table
+
+
+def _health_index(name, table, **stats):
+    index = {"schema": "public", "table": table, "name": name, "idx_scan": 5, "idx_tup_read": 5, "idx_tup_fetch": 5,
+             "idx_blks_read": 0, "idx_blks_hit": 0, "bytes": 16384, "tuples": 1000, "method": "btree",
+             "unique": False, "primary": False, "valid": True, "backs_constraint": False, "fillfactor": 90,
+             "plain_columns": True, "key_width": 4, "stats_columns": 1, "column_count": 1,
+             "definition": f"CREATE INDEX {name} ON public.{table} USING btree (id)"}
+    index.update(stats)
+    return index
+
+
+HEALTH_ROW = {
+    "block_size": 8192,
+    "database": {"size_bytes": 900 * MIB, "blks_read": 50000, "blks_hit": 950000, "xact_commit": 10,
+                 "xact_rollback": 0, "temp_files": 0, "temp_bytes": 0, "deadlocks": 0, "stats_reset": None},
+    "tables": [
+        # 1M rows of 68 bytes (24 + 36 aligned to 40 + 4) fill 8326 pages of 8168 usable bytes; 400 MiB on disk.
+        _health_table("events", row_estimate=1000000, live_tuples=1000000, dead_tuples=400000,
+                      seq_scan=50, idx_scan=3, seq_tup_read=50000000, table_bytes=400 * MIB, total_bytes=500 * MIB),
+        _health_table("orders", total_bytes=64 * MIB, table_bytes=60 * MIB, row_estimate=900000, live_tuples=900000),
+        _health_table("staging", last_autoanalyze=None, row_estimate=-1, row_width=None, stats_columns=0),
+    ],
+    "indexes": [
+        _health_index("events_pkey", "events", primary=True, unique=True, backs_constraint=True, idx_scan=0,
+                      bytes=40 * MIB, tuples=1000000),
+        _health_index("events_kind", "events", idx_scan=0, bytes=30 * MIB, tuples=1000000),
+        _health_index("orders_broken", "orders", valid=False, bytes=MIB),
+        _health_index("orders_lower_email", "orders", plain_columns=False, idx_scan=0, bytes=512 * 1024),
+    ],
+}
+
+
+def test_health_report_ranks_findings_by_severity_and_size():
+    report = db_health.report(json.loads(json.dumps(HEALTH_ROW)))
+    events = report["tables"][0]
+    assert events["bloat"]["expected_bytes"] == 8326 * 8192
+    assert events["bloat"]["bloat_ratio"] == 0.837 and events["dead_tuple_ratio"] == 0.4
+    assert report["tables"][2]["bloat"] is None  # never analyzed: no estimate
+    assert report["indexes"][3]["bloat"] is None  # expression index
+    assert report["database"]["cache_hit_ratio"] == 0.95
+
+    assert [(f["severity"], f["kind"], f["object"]) for f in report["findings"]] == [
+        ("critical", "invalid_index", "orders_broken"),
+        ("warning", "low_cache_hit", None),
+        ("warning", "table_bloat", "events"),
+        ("warning", "dead_tuples", "events"),
+        ("warning", "seq_scan_heavy", "events"),
+        ("warning", "index_bloat", "events_pkey"),
+        ("info", "unused_index", "events_kind"),  # ~7.7 MiB of bloat: under the threshold; the pkey is never "unused"
+        ("info", "never_analyzed", "staging"),
+    ]
+    assert "1000000 rows each" in report["findings"][4]["message"]
+
+
+def test_health_endpoint_answers_from_one_query(api, pg, instance):
+    pg.rules.insert(0, ("pg_stat_user_tables", lambda: [json.loads(json.dumps(HEALTH_ROW))]))
+    response = api.get(f"/api/instances/{instance.id}/studio/health/")
+    assert response.status_code == 200
+    assert response.json()["findings"][0]["kind"] == "invalid_index"
+    assert [q for q, _ in pg.connections[0].executed] == [db_health.HEALTH_SQL]
+
+
+def _export_rules(pg, rows):
+    pg.rules[:0] = [("LIMIT 0", rows[:1]), ("COPY (", rows), ("AS nidhi_export", rows)]
+
+
+def _download(api, url, body):
+    created = api.post(url, body, format="json")
+    assert created.status_code == 201, created.content
+    return created.json(), api.get("/api/" + created.json()["path"])
+
+
+def test_csv_export_streams_copy_output_through_a_signed_link(api, pg, instance):
+    _export_rules(pg, [{"id": 1, "status": "paid"}, {"id": 2, "status": None}])
+    url = f"/api/instances/{instance.id}/studio/export/"
+
+    link, response = _download(api, url, {"table": "orders"})
+    assert link["filename"] == "orders.csv"
+    assert response.status_code == 200 and response["Content-Type"] == "text/csv"
+    assert response["Content-Disposition"] == 'attachment; filename="orders.csv"'
+    assert b"".join(response.streaming_content) == b"id,status\n1,paid\n2,\n"
+
+    conn = pg.connections[0]
+    statements = [q for q, _ in conn.executed]
+    assert statements[:4] == [
+        "SET TRANSACTION READ ONLY",
+        "SELECT set_config('statement_timeout', %s, true), set_config('TimeZone', 'UTC', true), "
+        "set_config('DateStyle', 'ISO', true)",
+        'SELECT * FROM (SELECT * FROM "orders") AS nidhi_export LIMIT 0',
+        'COPY (SELECT * FROM "orders") TO STDOUT WITH (FORMAT csv, HEADER true)',
+    ]
+    assert statements[-1] == "DISCARD ALL" and not conn.closed  # back in the pool, session reset
+    assert AuditLog.objects.filter(detail="EXPORT csv/none: table orders").count() == 1
+
+    link, response = _download(api, url, {"query": "SELECT id FROM orders;", "compression": "gzip"})
+    assert link["filename"] == f"{instance.db_name}-query.csv.gz" and response["Content-Type"] == "application/gzip"
+    assert gzip.decompress(b"".join(response.streaming_content)) == b"id,status\n1,paid\n2,\n"
+    assert 'COPY (SELECT id FROM orders) TO STDOUT' in pg.connections[0].executed[-2][0]
+
+
+def test_export_into_a_bucket_uploads_the_stream(api, monkeypatch, pg, spool, instance):
+    from api import studio_views
+    monkeypatch.setattr(studio_views, "get_bucket_client", lambda bucket: spool)
+    bucket = StorageBucket.objects.create(
+        product=instance.product, bucket_name="exports-bucket", access_key="ak", secret_key="sk",
+        endpoint="localhost:9000", created_by_sso_id="t", status="available",
+    )
+    _export_rules(pg, [{"id": i, "status": "paid"} for i in range(1000)])
+
+    response = api.post(f"/api/instances/{instance.id}/studio/export/",
+                        {"table": "orders", "bucket_id": str(bucket.id), "key": "reports/orders.csv"}, format="json")
+    assert response.status_code == 201
+    body = response.json()
+    assert body["key"] == "reports/orders.csv" and body["row_count"] == 1000 and body["columns"] == ["id", "status"]
+    data = spool.objects["reports/orders.csv"]
+    assert body["size"] == len(data) and data.count(b"\n") == 1001
+    assert spool.content_types["reports/orders.csv"] == "text/csv"
+
+
+def test_export_rejects_bad_requests(api, pg, instance):
+    url = f"/api/instances/{instance.id}/studio/export/"
+    assert api.post(url, {}, format="json").status_code == 400
+    assert api.post(url, {"table": "orders", "query": "SELECT 1"}, format="json").status_code == 400
+    assert api.post(url, {"query": "DELETE FROM orders"}, format="json").status_code == 403
+    response = api.post(url, {"table": "orders", "format": "xlsx"}, format="json")
+    assert response.status_code == 400 and "format must be one of" in response.json()["error"]
+    response = api.post(url, {"table": "orders", "compression": "lz4"}, format="json")
+    assert response.status_code == 400 and "compression must be one of" in response.json()["error"]
+    assert api.get("/api/studio/exports/forged/").status_code == 403
+
+    pg.rules[:0] = [("LIMIT 0", _raise(psycopg2.errors.UndefinedColumn('column "nope" does not exist')))]
+    _, response = _download(api, url, {"query": "SELECT nope FROM orders"})
+    assert response.status_code == 400 and "nope" in response.json()["error"]
+    assert not any(q.startswith("COPY") for conn in pg.connections for q, _ in conn.executed)
+
+
+@pytest.mark.skipif(studio_export.pa is not None, reason="pyarrow is installed")
+def test_columnar_export_without_pyarrow_answers_501(api, pg, instance):
+    response = api.post(f"/api/instances/{instance.id}/studio/export/", {"table": "orders", "format": "parquet"},
+                        format="json")
+    assert response.status_code == 501 and "pyarrow" in response.json()["error"]
+
+
+def test_parquet_export_parses_copy_output_into_row_groups(api, monkeypatch, pg, instance):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(studio_export, "BLOCK_SIZE", 64)
+    _export_rules(pg, [{"id": i, "status": "paid" if i % 2 else None} for i in range(40)])
+    types = {"id": 23, "status": 25}  # int4, text
+    original = FakePgCursor.execute
+
+    def execute(self, query, params=None):
+        original(self, query, params)
+        for column in self.description or []:
+            column.type_code = types.get(column.name)
+    monkeypatch.setattr(FakePgCursor, "execute", execute)
+
+    _, response = _download(api, f"/api/instances/{instance.id}/studio/export/", {"table": "orders", "format": "parquet"})
+    data = b"".join(response.streaming_content)
+    table = pq.read_table(io.BytesIO(data))
+    assert str(table.schema.field("id").type) == "int32"
+    assert table.column("id").to_pylist() == list(range(40))
+    assert table.column("status").to_pylist()[:3] == [None, "paid", None]
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups > 1
+
+
+def test_columnar_export_sends_temporal_columns_as_integers(api, monkeypatch, pg, spool, instance):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from api import studio_views
+    monkeypatch.setattr(studio_views, "get_bucket_client", lambda bucket: spool)
+    # What COPY sends for the encoded SELECT: 'infinity'::timestamptz is int8 max, 44 BC is day -735160.
+    _export_rules(pg, [{"at": 9223372036854775807, "day": -735160, "n": "NaN"},
+                       {"at": 1792413296789012, "day": 20745, "n": "1.25"}])
+    types = {"at": 1184, "day": 1082, "n": 1700}  # timestamptz, date, numeric
+    original = FakePgCursor.execute
+
+    def execute(self, query, params=None):
+        original(self, query, params)
+        for column in self.description or []:
+            column.type_code = types.get(column.name)
+    monkeypatch.setattr(FakePgCursor, "execute", execute)
+
+    url = f"/api/instances/{instance.id}/studio/export/"
+    _, response = _download(api, url, {"table": "orders", "format": "parquet"})
+    table = pq.read_table(io.BytesIO(b"".join(response.streaming_content)))
+    assert [str(t) for t in table.schema.types] == ["timestamp[us, tz=UTC]", "date32[day]", "string"]
+    assert table.column("at").cast("int64").to_pylist() == [9223372036854775807, 1792413296789012]
+    assert table.column("n").to_pylist() == ["NaN", "1.25"]
+    copy = next(q for q, _ in pg.connections[0].executed if q.startswith("COPY"))
+    assert "(extract(epoch FROM \"c0\") * 1000000)::int8" in copy and "\"c1\" - DATE '1970-01-01'" in copy
+    assert 'AS nidhi_export ("c0", "c1", "c2")' in copy and '"c2" FROM' in copy
+
+    # A value that still does not convert is an error, not a short file.
+    bucket = StorageBucket.objects.create(
+        product=instance.product, bucket_name="exports-bucket", access_key="ak", secret_key="sk",
+        endpoint="localhost:9000", created_by_sso_id="t", status="available",
+    )
+    pg.rules[:0] = [("COPY (", [{"at": "soon", "day": 1, "n": "1"}])]
+    response = api.post(url, {"table": "orders", "format": "arrow", "bucket_id": str(bucket.id)}, format="json")
+    assert response.status_code == 422 and "Cannot convert the result to arrow" in response.json()["error"]
+
+
+# ---------------------------------------------------------------------------
+# Database download
+# ---------------------------------------------------------------------------
+class FakeDumpProcess:
+    """Stands in for the pg_dump child: canned stdout / stderr and exit code."""
+
+    def __init__(self, stdout=b"", stderr=b"", returncode=0):
+        self.stdout = io.BytesIO(stdout)
+        self.stderr = io.BytesIO(stderr)
+        self.returncode = None
+        self._exit = returncode
+        self.killed = False
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self.returncode = -9 if self.killed else self._exit
+        return self.returncode
+
+    def kill(self):
+        self.killed = True
+
+
+class FakePgDump:
+    """subprocess.Popen for db_dump: records each command and environment, returns `process`."""
+
+    def __init__(self):
+        self.calls = []
+        self.process = FakeDumpProcess()
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append({"cmd": cmd, "env": kwargs["env"]})
+        return self.process
+
+
+@pytest.fixture
+def pg_dump(monkeypatch):
+    fake = FakePgDump()
+    monkeypatch.setattr(db_dump.subprocess, "Popen", fake)
+    return fake
+
+
+def test_database_download_streams_pg_dump_through_a_signed_link(api, monkeypatch, pg_dump, instance):
+    monkeypatch.setattr(db_dump, "CHUNK_SIZE", 4)
+    monkeypatch.delenv("PGPASSWORD", raising=False)
+    script = b"-- PostgreSQL database dump\nCREATE TABLE orders ();\n"
+    pg_dump.process = FakeDumpProcess(stdout=script)
+    url = f"/api/instances/{instance.id}/studio/download/"
+
+    link, response = _download(api, url, {"format": "plain"})
+    assert link["filename"] == f"{instance.db_name}_backup.sql"
+    assert response.status_code == 200 and response["Content-Type"] == "application/sql"
+    assert response["Content-Disposition"] == f'attachment; filename="{instance.db_name}_backup.sql"'
+    assert b"".join(response.streaming_content) == script
+
+    call = pg_dump.calls[0]
+    assert call["cmd"][call["cmd"].index("-F") + 1] == "p" and call["cmd"][call["cmd"].index("-Z") + 1] == "0"
+    assert "-f" not in call["cmd"] and "--no-password" in call["cmd"]
+    assert call["env"]["PGPASSWORD"] == instance.server.root_password
+    assert "PGPASSWORD" not in db_dump.os.environ  # never set process-wide
+    assert AuditLog.objects.filter(action="backup_db", detail="Studio download (plain/none)").count() == 1
+
+    pg_dump.process = FakeDumpProcess(stdout=b"PGDMP...")
+    link, response = _download(api, url, {"format": "custom"})
+    assert link["filename"] == f"{instance.db_name}_backup.dump"
+    assert b"".join(response.streaming_content) == b"PGDMP..."
+    cmd = pg_dump.calls[1]["cmd"]
+    assert cmd[cmd.index("-F") + 1] == "c" and cmd[cmd.index("-Z") + 1] == str(db_dump.GZIP_LEVEL)
+
+    pg_dump.process = FakeDumpProcess(stdout=script)
+    response = api.get(url, {"dump_format": "plain"})  # direct GET for API clients
+    assert response.status_code == 200 and b"".join(response.streaming_content) == script
+
+
+def test_database_download_zstd_compresses_the_stream(api, pg_dump, instance):
+    zstandard = pytest.importorskip("zstandard")
+    pg_dump.process = FakeDumpProcess(stdout=b"CREATE TABLE orders ();\n" * 100)
+    link, response = _download(api, f"/api/instances/{instance.id}/studio/download/",
+                               {"format": "plain", "compression": "zstd"})
+    assert link["filename"].endswith(".sql.zst") and response["Content-Type"] == "application/zstd"
+    data = b"".join(response.streaming_content)
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(data) == b"CREATE TABLE orders ();\n" * 100
+
+
+def test_database_download_failures(api, pg_dump, instance):
+    url = f"/api/instances/{instance.id}/studio/download/"
+    response = api.post(url, {"format": "custom", "compression": "zstd"}, format="json")
+    assert response.status_code == 400 and "compression for custom" in response.json()["error"]
+    assert api.get("/api/studio/dumps/forged/").status_code == 403
+
+    # Nothing written yet: still a JSON error.
+    pg_dump.process = FakeDumpProcess(stderr=b"pg_dump: error: password authentication failed\n", returncode=1)
+    _, response = _download(api, url, {})
+    assert response.status_code == 502 and "password authentication failed" in response.json()["error"]
+
+    # Failure mid-stream aborts the response instead of ending it cleanly.
+    pg_dump.process = FakeDumpProcess(stdout=b"-- partial", stderr=b"lost connection\n", returncode=1)
+    _, response = _download(api, url, {})
+    with pytest.raises(db_dump.DumpError):
+        b"".join(response.streaming_content)
+
+
+def test_database_download_kills_pg_dump_when_the_client_goes_away(api, monkeypatch, pg_dump, instance):
+    monkeypatch.setattr(db_dump, "CHUNK_SIZE", 4)
+    pg_dump.process = FakeDumpProcess(stdout=b"x" * 64)
+    _, response = _download(api, f"/api/instances/{instance.id}/studio/download/", {})
+    content = iter(response.streaming_content)
+    next(content)
+    response.close()
+    assert pg_dump.process.killed and pg_dump.process.returncode == -9
+
+
+# ---------------------------------------------------------------------------
+# Query jobs
+# ---------------------------------------------------------------------------
+class FakeSpool:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, bucket_name, key, data, length, content_type=None, part_size=None):
+        if length == -1:  # streamed, multipart
+            self.objects[key] = b"".join(iter(lambda: data.read(part_size), b""))
+        else:
+            self.objects[key] = data.read()
+            assert len(self.objects[key]) == length
+        self.content_types = dict(getattr(self, "content_types", {}), **{key: content_type})
+        return mock.Mock(etag=f"etag-{key}")
+
+    def get_object(self, bucket_name, key):
+        body = io.BytesIO(self.objects[key])
+        body.release_conn = lambda: None
+        return body
+
+    def remove_objects(self, bucket_name, delete_objects):
+        for obj in delete_objects:
+            self.objects.pop(obj.name)
+        return iter([])
+
+
+@pytest.fixture
+def spool(monkeypatch):
+    fake = FakeSpool()
+    monkeypatch.setattr(query_jobs, "_spool_client", lambda: fake)
+    return fake
+
+
+def _raise(error):
+    def rows():
+        raise error
+    return rows
+
+
+def test_query_job_spools_pages_and_serves_them(api, monkeypatch, pg, spool, instance):
+    monkeypatch.setattr(query_jobs, "PAGE_ROWS", 2)
+    pg.rules[:0] = [("pg_backend_pid", [{"pid": 4242}]), ("FROM events", _events(5))]
+    response = api.post(f"/api/instances/{instance.id}/studio/query-jobs/",
+                        {"query": "SELECT * FROM events", "timeout": 5}, format="json")
+    assert response.status_code == 202
+    job = response.json()
+    # Celery is eager in tests: the job already ran.
+    assert job["status"] == "succeeded"
+    assert (job["row_count"], job["page_count"], job["timeout_ms"]) == (5, 3, 5000)
+    assert sorted(spool.objects) == [f"query-jobs/{job['id']}/0000{n}.json.gz" for n in (1, 2, 3)]
+
+    conn = pg.connections[0]
+    assert ("SELECT set_config('statement_timeout', %s, true)", ("5000",)) in conn.executed
+
+    url = f"/api/instances/{instance.id}/studio/query-jobs/{job['id']}/results/"
+    page = api.get(url, {"page": 2}).json()
+    assert page["rows"] == [{"id": 2, "kind": "click"}, {"id": 3, "kind": "click"}]
+    assert (page["next_page"], api.get(url, {"page": 3}).json()["next_page"]) == (3, None)
+    assert api.get(url, {"page": 4}).status_code == 404
+
+    details = list(AuditLog.objects.filter(detail__startswith=f"QUERY JOB {job['id']}").values_list("detail", flat=True))
+    assert any("submitted" in d for d in details) and any("succeeded: 5 rows" in d for d in details)
+
+
+def test_query_job_timeout_depends_on_role(monkeypatch):
+    monkeypatch.setattr(query_jobs, "ROLE_TIMEOUTS_MS", query_jobs._parse_timeouts("founding_engineer=600,default=60"))
+    assert query_jobs.timeout_for("founding_engineer") == 600000
+    assert query_jobs.timeout_for("employee") == 60000
+    assert query_jobs.timeout_for("employee", requested_seconds=3600) == 60000
+    with pytest.raises(query_jobs.QueryJobError):
+        query_jobs.timeout_for("employee", requested_seconds="soon")
+
+
+def test_query_job_statement_timeout_fails_the_job(api, pg, spool, instance):
+    pg.rules[:0] = [("pg_backend_pid", [{"pid": 4242}]),
+                    ("FROM events", _raise(psycopg2.errors.QueryCanceled("canceling statement due to statement timeout")))]
+    job = api.post(f"/api/instances/{instance.id}/studio/query-jobs/",
+                   {"query": "SELECT * FROM events"}, format="json").json()
+    assert job["status"] == "failed"
+    assert "statement timeout" in job["error"]
+    assert api.get(f"/api/instances/{instance.id}/studio/query-jobs/{job['id']}/results/").status_code == 409
+
+
+def test_cancel_running_query_job_signals_its_backend(api, pg, instance):
+    job = QueryJob.objects.create(instance=instance, query="SELECT pg_sleep(600)", timeout_ms=900000,
+                                  status="running", backend_pid=4242, submitted_by="fe")
+    response = api.post(f"/api/instances/{instance.id}/studio/query-jobs/{job.id}/cancel/")
+    assert response.status_code == 200
+    assert response.json()["cancel_requested"] is True
+
+    query, params = pg.connections[0].executed[-1]
+    assert "pg_cancel_backend(pid)" in query and params == (4242, "shop_db")
+
+
+def test_query_job_cancelled_mid_query_is_recorded_as_cancelled(pg, spool, instance):
+    job = QueryJob.objects.create(instance=instance, query="SELECT * FROM events", timeout_ms=900000)
+
+    def cancelled_by_someone_else():
+        QueryJob.objects.filter(id=job.id).update(cancel_requested=True)
+        raise psycopg2.errors.QueryCanceled("canceling statement due to user request")
+
+    pg.rules[:0] = [("pg_backend_pid", [{"pid": 4242}]), ("FROM events", cancelled_by_someone_else)]
+    assert query_jobs.run(job.id) == "cancelled"
+    job.refresh_from_db()
+    assert job.backend_pid == 4242 and job.finished_at is not None
+
+
+def test_cancel_queued_query_job_never_runs_it(api, pg, spool, instance):
+    job = QueryJob.objects.create(instance=instance, query="SELECT 1", timeout_ms=1000)
+    api.post(f"/api/instances/{instance.id}/studio/query-jobs/{job.id}/cancel/")
+    assert query_jobs.run(job.id) == "cancelled"
+    assert pg.connections == []
+
+
+def test_query_job_status_long_poll_is_bounded(api, monkeypatch, instance):
+    from api import studio_views
+    job = QueryJob.objects.create(instance=instance, query="SELECT 1", timeout_ms=1000, status="running")
+    url = f"/api/instances/{instance.id}/studio/query-jobs/{job.id}/"
+    clock = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+        if len(sleeps) == 3:
+            QueryJob.objects.filter(id=job.id).update(status="succeeded")
+    monkeypatch.setattr(studio_views.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(studio_views.time, "sleep", sleep)
+
+    assert api.get(url, {"status": "running", "wait": 10}).json()["status"] == "succeeded"
+    assert len(sleeps) == 3
+    assert api.get(url, {"status": "queued"}).json()["status"] == "succeeded"  # already changed: no wait
+    assert len(sleeps) == 3
+
+    QueryJob.objects.filter(id=job.id).update(status="running")
+    assert api.get(url, {"status": "running", "wait": 3600}).json()["status"] == "running"
+    assert len(sleeps) == 3 + studio_views.LONG_POLL_SECONDS  # capped, then answered unchanged
+    assert api.get(url, {"status": "running", "wait": "soon"}).status_code == 400
+
+
+def test_purge_expires_old_query_job_results(api, pg, spool, instance):
+    pg.rules[:0] = [("pg_backend_pid", [{"pid": 4242}]), ("FROM events", _events(3))]
+    job = query_jobs.submit(instance, "SELECT * FROM events", submitted_by="fe", role="founding_engineer")
+    assert query_jobs.purge_expired() == 0
+
+    QueryJob.objects.filter(id=job.id).update(finished_at=timezone.now() - timedelta(days=2))
+    assert query_jobs.purge_expired() == 1
+    assert spool.objects == {}
+    response = api.get(f"/api/instances/{instance.id}/studio/query-jobs/{job.id}/results/")
+    assert response.status_code == 410
@@ -12,6 +12,8 @@ const BucketStudio = () => {
   const { showToast } = useToast();
   const showConfirm = useConfirm();
   const [objects, setObjects] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [bucketInfo, setBucketInfo] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -35,19 +37,6 @@ const BucketStudio = () => {
     fetchTree();
   }, [id]);
 
-  useEffect(() => {
-    if (treeData && expandedFolders.size === 0) {
-      const firstLevel = treeData.children || [];
-      if (firstLevel.length > 0) {
-        const autoExpand = new Set();
-        firstLevel.forEach(child => {
-          if (child.type === 'directory') autoExpand.add(child.name);
-        });
-        setExpandedFolders(autoExpand);
-      }
-    }
-  }, [treeData]);
-
   useEffect(() => {
     if (contextMenu) {
       const close = () => setContextMenu(null);
@@ -79,15 +68,22 @@ const BucketStudio = () => {
     }
   };
 
-  const fetchObjects = async () => {
-    setLoading(true);
-    setError(null);
+  const OBJECTS_PAGE_SIZE = 500;
+
+  // Paginated listing: the first page replaces the list, "Load more" appends the next one.
+  const fetchObjects = async (cursor = null) => {
+    if (cursor) {
+      setLoadingMore(true);
+    } else {
+      setLoading(true);
+      setError(null);
+    }
     try {
       const token = localStorage.getItem('sso_token');
-      const url = currentPrefix 
-        ? `/nidhi-api/buckets/${id}/objects/?prefix=${encodeURIComponent(currentPrefix)}`
-        : `/nidhi-api/buckets/${id}/objects/`;
-      const res = await fetch(url, {
+      const params = new URLSearchParams({ limit: OBJECTS_PAGE_SIZE });
+      if (currentPrefix) params.set('prefix', currentPrefix);
+      if (cursor) params.set('cursor', cursor);
+      const res = await fetch(`/nidhi-api/buckets/${id}/objects/?${params}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       if (!res.ok) {
@@ -95,18 +91,74 @@ const BucketStudio = () => {
         throw new Error(errData.error || "Failed to fetch objects");
       }
       const data = await res.json();
-      setObjects(data);
+      setObjects(prev => (cursor ? [...prev, ...data.objects] : data.objects));
+      setNextCursor(data.next_cursor);
     } catch (err) {
       setError("Failed to fetch objects: " + err.message);
-      setObjects([]);
+      if (!cursor) setObjects([]);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
+  // Large files go through a resumable upload session: parts are sent one by one and a retry
+  // (same file, same page or after a reload) only re-sends the parts the server doesn't have.
+  const uploadInParts = async (file) => {
+    const token = localStorage.getItem('sso_token');
+    const headers = { 'Authorization': `Bearer ${token}` };
+    const base = `/nidhi-api/buckets/${id}/uploads/`;
+    const resumeKey = `nidhi-upload:${id}:${file.name}:${file.size}:${file.lastModified}`;
+
+    let session = null;
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+      const res = await fetch(`${base}${savedId}/`, { headers });
+      if (res.ok) session = await res.json();
+      if (session && session.status !== 'active') session = null;
+    }
+    if (!session) {
+      const res = await fetch(base, {
+        method: 'POST',
+        headers: { ...headers, 'Content-Type': 'application/json' },
+        body: JSON.stringify({ object_name: file.name, content_type: file.type, total_size: file.size })
+      });
+      session = await res.json();
+      if (!res.ok) throw new Error(session.error);
+      localStorage.setItem(resumeKey, session.id);
+    }
+
+    const have = new Set((session.parts || []).map((p) => p.part_number));
+    const count = Math.max(1, Math.ceil(file.size / session.part_size));
+    for (let n = 1; n <= count; n++) {
+      if (have.has(n)) continue;
+      const part = file.slice((n - 1) * session.part_size, n * session.part_size);
+      const res = await fetch(`${base}${session.id}/parts/${n}/`, {
+        method: 'PUT',
+        headers: { ...headers, 'Content-Type': 'application/octet-stream' },
+        body: part
+      });
+      if (!res.ok) { const d = await res.json(); throw new Error(`part ${n}/${count}: ${d.error}`); }
+    }
+    const res = await fetch(`${base}${session.id}/complete/`, { method: 'POST', headers });
+    if (!res.ok) { const d = await res.json(); throw new Error(d.error); }
+    localStorage.removeItem(resumeKey);
+  };
+
   const handleUpload = async (file) => {
     if (!file) return;
-    
+    if (file.size > 64 * 1024 * 1024) {
+      try {
+        await uploadInParts(file);
+        fetchObjects();
+        fetchTree();
+        showToast('File uploaded successfully', 'success');
+      } catch (err) {
+        showToast('Upload failed (retry to resume): ' + err.message, 'error');
+      }
+      return;
+    }
+
     const formData = new FormData();
     formData.append('file', file);
     formData.append('object_name', file.name);
@@ -147,6 +199,23 @@ const BucketStudio = () => {
     }
   };
 
+  // The archive streams straight to disk: get a short-lived signed link and navigate to it.
+  const handleFolderDownload = async (prefix) => {
+    try {
+      const token = localStorage.getItem('sso_token');
+      const res = await fetch(`/nidhi-api/buckets/${id}/archive/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+        body: JSON.stringify({ prefix })
+      });
+      const d = await res.json();
+      if (!res.ok) throw new Error(d.error);
+      window.location.assign(`/nidhi-api/${d.path}`);
+    } catch (err) {
+      showToast('Download failed: ' + err.message, 'error');
+    }
+  };
+
   const handleDelete = async (objectName) => {
     const ok = await showConfirm(`Delete ${objectName}?`);
     if (!ok) return;
@@ -224,13 +293,37 @@ const BucketStudio = () => {
         headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
         body: JSON.stringify({ object_name: oldName, new_object_name: newName })
       });
-      if (!res.ok) { const d = await res.json(); throw new Error(d.error); }
+      const d = await res.json();
+      if (!res.ok) throw new Error(d.error);
       setRenamingItem(null);
+      if (res.status === 202 && d.job) {
+        showToast('Moving folder in the background…', 'success');
+        const job = await pollStorageJob(d.job.id);
+        if (job.status !== 'completed') {
+          throw new Error(`${job.failed} object(s) failed; resume or roll back job ${job.id}`);
+        }
+      }
       fetchObjects();
       fetchTree();
-      showToast('Folder created', 'success');
+      showToast('Renamed successfully', 'success');
     } catch (err) {
-      showToast('Folder creation failed: ' + err.message, 'error');
+      fetchObjects();
+      fetchTree();
+      showToast('Rename failed: ' + err.message, 'error');
+    }
+  };
+
+  // Folder moves/deletes run as server-side jobs; poll until the job leaves pending/running.
+  const pollStorageJob = async (jobId) => {
+    const token = localStorage.getItem('sso_token');
+    for (;;) {
+      const res = await fetch(`/nidhi-api/buckets/${id}/jobs/${jobId}/`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      const job = await res.json();
+      if (!res.ok) throw new Error(job.error);
+      if (job.status !== 'pending' && job.status !== 'running') return job;
+      await new Promise((resolve) => setTimeout(resolve, 1500));
     }
   };
 
@@ -245,12 +338,22 @@ const BucketStudio = () => {
         headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
         body: JSON.stringify({ object_names: Array.from(selectedItems) })
       });
-      if (!res.ok) { const d = await res.json(); throw new Error(d.error); }
+      const d = await res.json();
+      if (!res.ok) throw new Error(d.error);
       setSelectedItems(new Set());
+      let failed = d.errors.length;
+      if (d.jobs && d.jobs.length) {
+        showToast('Deleting folders in the background…', 'success');
+        const jobs = await Promise.all(d.jobs.map((job) => pollStorageJob(job.id)));
+        failed += jobs.reduce((sum, job) => sum + job.failed, 0);
+      }
       fetchObjects();
       fetchTree();
+      if (failed) throw new Error(`${failed} object(s) could not be deleted`);
       showToast('Deleted successfully', 'success');
     } catch (err) {
+      fetchObjects();
+      fetchTree();
       showToast('Delete failed: ' + err.message, 'error');
     }
   };
@@ -270,16 +373,37 @@ const BucketStudio = () => {
     setContextMenu(null);
   };
 
+  // Folder tree is loaded one level at a time (GET /tree/?prefix=); a folder's children are
+  // null until it is first expanded.
+  const fetchTreeLevel = async (prefix) => {
+    const token = localStorage.getItem('sso_token');
+    const res = await fetch(`/nidhi-api/buckets/${id}/tree/?prefix=${encodeURIComponent(prefix)}`, {
+      headers: { 'Authorization': `Bearer ${token}` }
+    });
+    return res.ok ? res.json() : null;
+  };
+
+  const insertTreeChildren = (node, path, children) => {
+    if (node.path === path) return { ...node, children };
+    if (!node.children) return node;
+    return {
+      ...node,
+      children: node.children.map(c => (c.type === 'directory' && path.startsWith(c.path) ? insertTreeChildren(c, path, children) : c)),
+    };
+  };
+
   const fetchTree = async () => {
     setTreeLoading(true);
     try {
-      const token = localStorage.getItem('sso_token');
-      const res = await fetch(`/nidhi-api/buckets/${id}/objects/?recursive=true`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
-      if (res.ok) {
-        const data = await res.json();
-        setTreeData(data);
+      let root = await fetchTreeLevel('');
+      if (root) {
+        // Re-open folders that were expanded before the refresh, parents first.
+        const openPaths = [...expandedFolders].sort((a, b) => a.length - b.length);
+        for (const path of openPaths) {
+          const level = await fetchTreeLevel(path);
+          if (level) root = insertTreeChildren(root, path, level.children);
+        }
+        setTreeData(root);
       }
     } catch (err) {
       console.error('Failed to fetch tree:', err);
@@ -288,16 +412,25 @@ const BucketStudio = () => {
     }
   };
 
-  const toggleFolder = (name) => {
+  const toggleFolder = async (folder) => {
+    const opening = !expandedFolders.has(folder.path);
     setExpandedFolders(prev => {
       const next = new Set(prev);
-      if (next.has(name)) {
-        next.delete(name);
+      if (next.has(folder.path)) {
+        next.delete(folder.path);
       } else {
-        next.add(name);
+        next.add(folder.path);
       }
       return next;
     });
+    if (opening && folder.children == null) {
+      try {
+        const level = await fetchTreeLevel(folder.path);
+        if (level) setTreeData(prev => insertTreeChildren(prev, folder.path, level.children));
+      } catch (err) {
+        console.error('Failed to expand folder:', err);
+      }
+    }
   };
 
   const handleTreeFolderClick = (prefix) => {
@@ -315,8 +448,8 @@ const BucketStudio = () => {
       <div>
         {node.children && node.children.map((child, idx) => {
           const isDir = child.type === 'directory';
-          const isExpanded = expandedFolders.has(child.name);
-          const childPrefix = child.name.endsWith('/') ? child.name : `${child.name}/`;
+          const isExpanded = isDir && expandedFolders.has(child.path);
+          const childPrefix = child.path;
           const isActive = isDir && currentPrefix === childPrefix;
           const isRenaming = renamingItem === (isDir ? childPrefix : child.path);
           const childPath = isDir ? childPrefix : child.path;
@@ -346,7 +479,7 @@ const BucketStudio = () => {
                   className={`flex items-center gap-1 px-2 py-1 cursor-pointer rounded text-sm transition-colors ${isSelected ? 'bg-indigo-50 dark:bg-indigo-900/20' : isActive ? 'bg-indigo-100 dark:bg-indigo-900/30 text-indigo-700 dark:text-indigo-300' : 'text-slate-700 dark:text-slate-300 hover:bg-slate-100 dark:hover:bg-slate-700/50'}`}
                   style={{ paddingLeft: `${depth * 16 + 8}px` }}
                   onContextMenu={(e) => handleContextMenu(e, childPath)}
-                  onClick={() => { toggleFolder(child.name); handleTreeFolderClick(childPrefix); }}
+                  onClick={() => { toggleFolder(child); handleTreeFolderClick(childPrefix); }}
                 >
                   <div className="flex items-center gap-0.5 shrink-0" onClick={(e) => e.stopPropagation()}>
                     <div className={`w-3.5 h-3.5 flex items-center justify-center rounded border cursor-pointer transition-colors ${isSelected ? 'bg-indigo-600 border-indigo-600 text-white' : 'border-slate-400 dark:border-slate-500 hover:border-indigo-500'}`} onClick={(e) => toggleSelection(childPath, e)}>
@@ -358,6 +491,9 @@ const BucketStudio = () => {
                   </span>
                   <Folder className={`w-4 h-4 shrink-0 ${isActive ? 'text-indigo-500' : 'text-amber-500'}`} />
                   <span className="truncate ml-1">{child.name.replace('/', '')}</span>
+                  {child.object_count != null && (
+                    <span className="ml-auto shrink-0 text-xs text-slate-400" title={`${child.total_size} bytes`}>{child.object_count}</span>
+                  )}
                 </div>
                 {isExpanded && child.children && (
                   <TreeView node={child} depth={depth + 1} />
@@ -592,6 +728,17 @@ const BucketStudio = () => {
                 </tbody>
               </table>
             )}
+            {!loading && !error && nextCursor && (
+              <div className="p-4 text-center">
+                <button
+                  onClick={() => fetchObjects(nextCursor)}
+                  disabled={loadingMore}
+                  className="px-4 py-2 text-sm bg-slate-100 dark:bg-slate-700 text-slate-600 dark:text-slate-300 rounded hover:bg-slate-200 dark:hover:bg-slate-600 transition disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -609,6 +756,14 @@ const BucketStudio = () => {
               <Download className="w-4 h-4" /> Download
             </button>
           )}
+          {contextMenu.path.endsWith('/') && (
+            <button
+              onClick={() => { handleFolderDownload(contextMenu.path); setContextMenu(null); }}
+              className="w-full flex items-center gap-3 px-3 py-2 text-sm text-slate-700 dark:text-slate-300 hover:bg-slate-100 dark:hover:bg-slate-700 transition-colors"
+            >
+              <Download className="w-4 h-4" /> Download ZIP
+            </button>
+          )}
           <button
             onClick={() => startRename(contextMenu.path)}
             className="w-full flex items-center gap-3 px-3 py-2 text-sm text-slate-700 dark:text-slate-300 hover:bg-slate-100 dark:hover:bg-slate-700 transition-colors"
@@ -1,25 +1,32 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { Database, Table, ArrowLeft, RefreshCw, LayoutGrid, Terminal, Plus, Trash2, X, Download, Upload } from 'lucide-react';
+import { Database, Table, ArrowLeft, RefreshCw, LayoutGrid, Terminal, Plus, Trash2, X, Download, Upload, Activity, HeartPulse } from 'lucide-react';
 import { ThemeToggle } from '../contexts/ThemeContext';
 import { Logo } from '../components/Logo';
 import { useToast } from '../components/Toast';
 import { useConfirm } from '../components/ConfirmDialog';
 
+const formatBytes = (b) => b == null ? '—' : b >= 1048576 ? `${(b / 1048576).toFixed(1)} MiB` : `${Math.round(b / 1024)} KiB`;
+
 const DatabaseStudio = () => {
   const { id } = useParams();
   const navigate = useNavigate();
   const [tables, setTables] = useState([]);
   const [selectedTable, setSelectedTable] = useState(null);
-  const [tableData, setTableData] = useState({ columns: [], rows: [], primary_keys: [] });
+  const [tableData, setTableData] = useState({ columns: [], rows: [], primary_keys: [], sortable: [], sort: null, next_cursor: null });
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loadingTables, setLoadingTables] = useState(true);
   const [loadingData, setLoadingData] = useState(false);
   const [error, setError] = useState(null);
   
-  const [activeTab, setActiveTab] = useState('tables'); // tables | sql
+  const [activeTab, setActiveTab] = useState('tables'); // tables | sql | health
   const [sqlQuery, setSqlQuery] = useState('');
   const [sqlResults, setSqlResults] = useState(null);
   const [executingSql, setExecutingSql] = useState(false);
+  const [sqlProfile, setSqlProfile] = useState(null);
+  const [profilingSql, setProfilingSql] = useState(false);
+  const [health, setHealth] = useState(null);
+  const [loadingHealth, setLoadingHealth] = useState(false);
 
   // Modals state
   const [showCreateTableModal, setShowCreateTableModal] = useState(false);
@@ -55,26 +62,49 @@ const DatabaseStudio = () => {
     }
   };
 
-  const fetchTableData = async (tableName) => {
-    setSelectedTable(tableName);
-    setLoadingData(true);
+  // Keyset pages: `sort` is "col" / "-col" (indexed columns only); `cursor` continues the listing.
+  const fetchTableData = async (tableName, { sort = null, cursor = null } = {}) => {
+    const params = new URLSearchParams();
+    if (sort) params.set('sort', sort);
+    if (cursor) params.set('cursor', cursor);
+    if (cursor) {
+      setLoadingMore(true);
+    } else {
+      setSelectedTable(tableName);
+      setLoadingData(true);
+    }
     setError(null);
     try {
       const token = localStorage.getItem('sso_token');
-      const res = await fetch(`/nidhi-api/instances/${id}/studio/tables/${tableName}/`, {
+      const res = await fetch(`/nidhi-api/instances/${id}/studio/tables/${tableName}/?${params}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       if (!res.ok) throw new Error(await res.text());
       const data = await res.json();
-      setTableData({ columns: data.columns || [], rows: data.rows || [], primary_keys: data.primary_keys || [] });
+      setTableData(prev => ({
+        columns: data.columns || [],
+        rows: cursor ? [...prev.rows, ...(data.rows || [])] : (data.rows || []),
+        primary_keys: data.primary_keys || [],
+        sortable: data.sortable || [],
+        sort: data.sort || null,
+        next_cursor: data.next_cursor || null,
+        has_more: !!data.has_more,
+      }));
     } catch (err) {
       setError("Failed to fetch table data: " + err.message);
-      setTableData({ columns: [], rows: [], primary_keys: [] });
+      if (!cursor) setTableData({ columns: [], rows: [], primary_keys: [], sortable: [], sort: null, next_cursor: null });
     } finally {
       setLoadingData(false);
+      setLoadingMore(false);
     }
   };
 
+  const toggleSort = (col) => {
+    if (!tableData.sortable?.includes(col)) return;
+    const next = tableData.sort === col ? `-${col}` : tableData.sort === `-${col}` ? null : col;
+    fetchTableData(selectedTable, { sort: next });
+  };
+
   const executeRawQuery = async (queryStr) => {
     const token = localStorage.getItem('sso_token');
     const res = await fetch(`/nidhi-api/instances/${id}/studio/query/`, {
@@ -92,11 +122,74 @@ const DatabaseStudio = () => {
     return await res.json();
   };
 
+  // The export streams straight to disk: get a short-lived signed link and navigate to it.
+  const handleExportTable = async (format) => {
+    try {
+      const token = localStorage.getItem('sso_token');
+      const res = await fetch(`/nidhi-api/instances/${id}/studio/export/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+        body: JSON.stringify({ table: selectedTable, format })
+      });
+      const d = await res.json();
+      if (!res.ok) throw new Error(d.error);
+      window.location.assign(`/nidhi-api/${d.path}`);
+    } catch (err) {
+      showToast('Export failed: ' + err.message, 'error');
+    }
+  };
+
+  const fetchHealth = async () => {
+    setActiveTab('health');
+    setLoadingHealth(true);
+    setError(null);
+    try {
+      const token = localStorage.getItem('sso_token');
+      const res = await fetch(`/nidhi-api/instances/${id}/studio/health/`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      const d = await res.json();
+      if (!res.ok) throw new Error(d.error);
+      setHealth(d);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoadingHealth(false);
+    }
+  };
+
+  const handleProfileSql = async () => {
+    if (!sqlQuery.trim()) return;
+    setProfilingSql(true);
+    setError(null);
+    setSqlResults(null);
+    setSqlProfile(null);
+    try {
+      const token = localStorage.getItem('sso_token');
+      const res = await fetch(`/nidhi-api/instances/${id}/studio/explain/`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`
+        },
+        body: JSON.stringify({ query: sqlQuery })
+      });
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.error || "Profiling failed");
+      setSqlProfile(data);
+    } catch (err) {
+      setError("Profile Error: " + err.message);
+    } finally {
+      setProfilingSql(false);
+    }
+  };
+
   const handleExecuteSql = async () => {
     if (!sqlQuery.trim()) return;
     setExecutingSql(true);
     setError(null);
     setSqlResults(null);
+    setSqlProfile(null);
     try {
       const data = await executeRawQuery(sqlQuery);
       setSqlResults(data);
@@ -162,33 +255,18 @@ const DatabaseStudio = () => {
     }
   };
 
-  const handleDownloadBackup = async () => {
+  const handleDownloadBackup = async (format = 'plain') => {
     try {
       const token = localStorage.getItem('sso_token');
       const res = await fetch(`/nidhi-api/instances/${id}/studio/download/`, {
-        headers: { 'Authorization': `Bearer ${token}` }
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+        body: JSON.stringify({ format, compression: 'gzip' })
       });
-      if (!res.ok) {
-        const data = await res.json();
-        throw new Error(data.error || 'Download failed');
-      }
-      
-      const blob = await res.blob();
-      const url = window.URL.createObjectURL(blob);
-      const a = document.createElement('a');
-      a.href = url;
-      // Get filename from Content-Disposition if possible, or fallback
-      const contentDisposition = res.headers.get('Content-Disposition');
-      let filename = 'backup.sql';
-      if (contentDisposition) {
-        const match = contentDisposition.match(/filename="?([^"]+)"?/);
-        if (match && match[1]) filename = match[1];
-      }
-      a.download = filename;
-      document.body.appendChild(a);
-      a.click();
-      window.URL.revokeObjectURL(url);
-      document.body.removeChild(a);
+      const d = await res.json();
+      if (!res.ok) throw new Error(d.error || 'Download failed');
+      // Signed link: the browser streams pg_dump's output straight to disk.
+      window.location.assign(`/nidhi-api/${d.path}`);
     } catch (err) {
       showToast("Failed to download backup: " + err.message, 'error');
     }
@@ -241,11 +319,19 @@ const DatabaseStudio = () => {
         </div>
         <div className="flex items-center gap-4">
           <button 
-            onClick={handleDownloadBackup}
+            onClick={() => handleDownloadBackup('plain')}
+            title="Plain SQL script (.sql.gz), restore with psql"
             className="flex items-center gap-2 text-sm font-medium text-slate-600 hover:text-slate-900 dark:text-slate-300 dark:hover:text-white transition bg-slate-100 hover:bg-slate-200 dark:bg-slate-800 dark:hover:bg-slate-700 px-3 py-1.5 rounded-lg border border-slate-200 dark:border-slate-700"
           >
             <Download className="w-4 h-4" /> Download Backup
           </button>
+          <button 
+            onClick={() => handleDownloadBackup('custom')}
+            title="pg_restore archive (.dump)"
+            className="flex items-center gap-2 text-sm font-medium text-slate-600 hover:text-slate-900 dark:text-slate-300 dark:hover:text-white transition bg-slate-100 hover:bg-slate-200 dark:bg-slate-800 dark:hover:bg-slate-700 px-3 py-1.5 rounded-lg border border-slate-200 dark:border-slate-700"
+          >
+            <Download className="w-4 h-4" /> .dump
+          </button>
           <button 
             onClick={() => setShowMigrateModal(true)}
             className="flex items-center gap-2 text-sm font-medium text-indigo-600 hover:text-indigo-700 dark:text-indigo-400 dark:hover:text-indigo-300 transition bg-indigo-50 hover:bg-indigo-100 dark:bg-indigo-900/30 dark:hover:bg-indigo-900/50 px-3 py-1.5 rounded-lg border border-indigo-200 dark:border-indigo-800"
@@ -319,9 +405,67 @@ const DatabaseStudio = () => {
             >
               <Terminal className="w-4 h-4" /> SQL Editor
             </button>
+            <button
+              onClick={fetchHealth}
+              className={`px-4 py-2 text-sm font-medium border-b-2 transition-colors flex items-center gap-2 ${activeTab === 'health' ? 'border-[#98FF98] text-[#22c55e] dark:text-[#98FF98]' : 'border-transparent text-slate-500 hover:text-slate-700 dark:hover:text-slate-300'}`}
+            >
+              <HeartPulse className="w-4 h-4" /> Health
+            </button>
           </div>
 
-          {activeTab === 'tables' ? (
+          {activeTab === 'health' ? (
+            <div className="flex-1 overflow-auto p-6 space-y-6 text-sm">
+              {loadingHealth || !health ? (
+                <div className="text-slate-500 text-center">Collecting statistics...</div>
+              ) : (
+                <>
+                  <div className="flex items-center gap-6 text-slate-500">
+                    <span>Size {formatBytes(health.database.size_bytes)}</span>
+                    <span>Cache hit {health.database.cache_hit_ratio == null ? '—' : `${(health.database.cache_hit_ratio * 100).toFixed(2)}%`}</span>
+                    <span>Stats since {health.database.stats_reset || 'server start'}</span>
+                    <button onClick={fetchHealth} className="ml-auto flex items-center gap-1 hover:text-slate-700 dark:hover:text-slate-300">
+                      <RefreshCw className="w-4 h-4" /> Refresh
+                    </button>
+                  </div>
+                  <div>
+                    <div className="text-xs font-bold text-slate-500 uppercase tracking-wider mb-2">Findings</div>
+                    {health.findings.length === 0 ? (
+                      <div className="text-slate-500 italic">Nothing to report.</div>
+                    ) : health.findings.map((f, i) => (
+                      <div key={i} className="mb-1 text-slate-700 dark:text-slate-300">
+                        <span className={`font-mono text-xs px-1.5 py-0.5 rounded mr-2 ${f.severity === 'critical' ? 'bg-red-100 dark:bg-red-900/40 text-red-700 dark:text-red-300' : f.severity === 'warning' ? 'bg-amber-100 dark:bg-amber-900/40 text-amber-700 dark:text-amber-300' : 'bg-slate-100 dark:bg-slate-800 text-slate-600 dark:text-slate-400'}`}>{f.kind}</span>
+                        {f.object && <span className="font-mono mr-1">{f.object}:</span>}{f.message}
+                      </div>
+                    ))}
+                  </div>
+                  <div className="border border-slate-200 dark:border-slate-700 rounded-lg overflow-hidden">
+                    <table className="w-full text-left text-xs text-slate-600 dark:text-slate-300">
+                      <thead className="uppercase bg-slate-100 dark:bg-slate-800/80 text-slate-500">
+                        <tr>
+                          {['Table', 'Size', 'Live', 'Dead', 'Bloat (est.)', 'Seq / idx scans', 'Cache hit'].map(h => (
+                            <th key={h} className="px-3 py-2 font-semibold">{h}</th>
+                          ))}
+                        </tr>
+                      </thead>
+                      <tbody>
+                        {health.tables.map(t => (
+                          <tr key={`${t.schema}.${t.name}`} className="border-t border-slate-200 dark:border-slate-800">
+                            <td className="px-3 py-1.5 font-mono">{t.name}</td>
+                            <td className="px-3 py-1.5">{formatBytes(t.total_bytes)}</td>
+                            <td className="px-3 py-1.5">{t.live_tuples}</td>
+                            <td className="px-3 py-1.5">{t.dead_tuples}</td>
+                            <td className="px-3 py-1.5">{t.bloat ? `${formatBytes(t.bloat.bloat_bytes)} (${Math.round(t.bloat.bloat_ratio * 100)}%)` : '—'}</td>
+                            <td className="px-3 py-1.5">{t.seq_scan} / {t.idx_scan}</td>
+                            <td className="px-3 py-1.5">{t.heap_hit_ratio == null ? '—' : `${(t.heap_hit_ratio * 100).toFixed(1)}%`}</td>
+                          </tr>
+                        ))}
+                      </tbody>
+                    </table>
+                  </div>
+                </>
+              )}
+            </div>
+          ) : activeTab === 'tables' ? (
             !selectedTable ? (
               <div className="flex-1 flex flex-col items-center justify-center text-slate-400">
                 <LayoutGrid className="w-16 h-16 mb-4 opacity-20" />
@@ -336,9 +480,22 @@ const DatabaseStudio = () => {
                       {selectedTable}
                     </h2>
                     <div className="text-xs text-slate-500 bg-slate-100 dark:bg-slate-800 px-2 py-1 rounded-full">
-                      {tableData.rows.length} rows
+                      {tableData.rows.length}{tableData.has_more ? '+' : ''} rows
                     </div>
                   </div>
+                  <div className="flex items-center gap-2">
+                  <button
+                    onClick={() => handleExportTable('csv')}
+                    className="flex items-center gap-2 bg-slate-200 dark:bg-slate-800 hover:bg-slate-300 dark:hover:bg-slate-700 px-3 py-1.5 rounded-lg text-sm font-medium transition"
+                  >
+                    <Download className="w-4 h-4" /> CSV
+                  </button>
+                  <button
+                    onClick={() => handleExportTable('parquet')}
+                    className="flex items-center gap-2 bg-slate-200 dark:bg-slate-800 hover:bg-slate-300 dark:hover:bg-slate-700 px-3 py-1.5 rounded-lg text-sm font-medium transition"
+                  >
+                    <Download className="w-4 h-4" /> Parquet
+                  </button>
                   <button 
                     onClick={() => {
                       // Init empty form based on columns
@@ -351,6 +508,7 @@ const DatabaseStudio = () => {
                   >
                     <Plus className="w-4 h-4" /> Insert Row
                   </button>
+                  </div>
                 </div>
                 
                 <div className="flex-1 overflow-auto bg-slate-50 dark:bg-[#0B1120]">
@@ -366,10 +524,12 @@ const DatabaseStudio = () => {
                       <thead className="text-xs uppercase bg-slate-100 dark:bg-slate-800/80 text-slate-500 dark:text-slate-400 sticky top-0 z-10 shadow-sm backdrop-blur-md">
                         <tr>
                           {tableData.columns.map(col => (
-                            <th key={col} className="px-4 py-3 font-semibold whitespace-nowrap border-b border-slate-200 dark:border-slate-700">
+                            <th key={col} onClick={() => toggleSort(col)} className={`px-4 py-3 font-semibold whitespace-nowrap border-b border-slate-200 dark:border-slate-700 ${tableData.sortable?.includes(col) ? 'cursor-pointer hover:text-slate-700 dark:hover:text-slate-200' : ''}`}>
                               <span className="flex items-center gap-1">
                                 {col}
                                 {tableData.primary_keys?.includes(col) && <span title="Primary Key" className="text-yellow-500 text-[10px]">PK</span>}
+                                {tableData.sort === col && <span className="text-[10px]">▲</span>}
+                                {tableData.sort === `-${col}` && <span className="text-[10px]">▼</span>}
                               </span>
                             </th>
                           ))}
@@ -398,6 +558,22 @@ const DatabaseStudio = () => {
                       </tbody>
                     </table>
                   )}
+                  {!loadingData && tableData.has_more && !tableData.next_cursor && (
+                    <div className="p-4 text-center text-xs text-slate-500">
+                      Only the first page is shown: this relation has no primary key to page by. Use the SQL editor for the rest.
+                    </div>
+                  )}
+                  {!loadingData && tableData.next_cursor && (
+                    <div className="p-4 text-center">
+                      <button
+                        onClick={() => fetchTableData(selectedTable, { sort: tableData.sort, cursor: tableData.next_cursor })}
+                        disabled={loadingMore}
+                        className="text-sm px-4 py-1.5 rounded-lg bg-slate-200 dark:bg-slate-800 hover:bg-slate-300 dark:hover:bg-slate-700 transition disabled:opacity-50"
+                      >
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                      </button>
+                    </div>
+                  )}
                 </div>
               </div>
             )
@@ -406,6 +582,16 @@ const DatabaseStudio = () => {
               <div className="flex-none bg-white dark:bg-slate-900 border border-slate-300 dark:border-slate-800 rounded-xl overflow-hidden flex flex-col shadow-sm">
                 <div className="p-2 border-b border-slate-300 dark:border-slate-800 bg-slate-100 dark:bg-slate-800/50 flex justify-between items-center">
                   <span className="text-xs font-bold text-slate-500 uppercase tracking-wider pl-2">Query Editor</span>
+                  <div className="flex items-center gap-2">
+                  <button
+                    onClick={handleProfileSql}
+                    disabled={profilingSql || executingSql || !sqlQuery.trim()}
+                    title="EXPLAIN (ANALYZE, BUFFERS) in a rolled-back read-only transaction"
+                    className="px-4 py-1.5 bg-slate-200 dark:bg-slate-700 hover:bg-slate-300 dark:hover:bg-slate-600 disabled:opacity-50 text-slate-800 dark:text-slate-100 text-sm font-semibold rounded-md transition flex items-center gap-2"
+                  >
+                    {profilingSql ? <RefreshCw className="w-4 h-4 animate-spin" /> : <Activity className="w-4 h-4" />}
+                    Profile
+                  </button>
                   <button 
                     onClick={handleExecuteSql}
                     disabled={executingSql || !sqlQuery.trim()}
@@ -414,6 +600,7 @@ const DatabaseStudio = () => {
                     {executingSql ? <RefreshCw className="w-4 h-4 animate-spin" /> : <Terminal className="w-4 h-4" />}
                     Execute
                   </button>
+                  </div>
                 </div>
                 <textarea
                   value={sqlQuery}
@@ -429,7 +616,32 @@ const DatabaseStudio = () => {
                   <span className="text-xs font-bold text-slate-500 uppercase tracking-wider">Results</span>
                 </div>
                 <div className="flex-1 overflow-auto bg-slate-50 dark:bg-[#0B1120] p-4">
-                  {sqlResults ? (
+                  {sqlProfile ? (
+                    <div className="space-y-4 text-sm">
+                      <div className="text-slate-500">
+                        Planning {sqlProfile.planning_ms} ms · Execution {sqlProfile.execution_ms} ms
+                      </div>
+                      <div>
+                        <div className="text-xs font-bold text-slate-500 uppercase tracking-wider mb-2">Findings</div>
+                        {sqlProfile.findings.length === 0 ? (
+                          <div className="text-slate-500 italic">No seq scans of large tables, spills or misestimates.</div>
+                        ) : sqlProfile.findings.map((f, i) => (
+                          <div key={i} className="mb-1 text-slate-700 dark:text-slate-300">
+                            <span className="font-mono text-xs px-1.5 py-0.5 rounded bg-amber-100 dark:bg-amber-900/40 text-amber-700 dark:text-amber-300 mr-2">{f.kind}</span>
+                            #{f.node} {f.node_type}: {f.message}
+                          </div>
+                        ))}
+                      </div>
+                      <div>
+                        <div className="text-xs font-bold text-slate-500 uppercase tracking-wider mb-2">Hottest nodes</div>
+                        {sqlProfile.hottest.map(h => (
+                          <div key={h.node} className="font-mono text-xs text-slate-700 dark:text-slate-300">
+                            #{h.node} {h.node_type}{h.relation ? ` on ${h.relation}` : ''} — {h.self_ms} ms ({h.self_percent}%)
+                          </div>
+                        ))}
+                      </div>
+                    </div>
+                  ) : sqlResults ? (
                     <div>
                       {sqlResults.message && (
                         <div className="text-sm text-[#22c55e] dark:text-[#98FF98] mb-4 font-medium flex items-center gap-2">
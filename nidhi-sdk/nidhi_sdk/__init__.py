@@ -1,4 +1,5 @@
-from .fastapi import get_nidhi_storage_client, upload_file_to_nidhi, delete_file_from_nidhi, get_nidhi_database_url, get_nidhi_media_url
+from .fastapi import get_nidhi_storage_client, upload_file_to_nidhi, delete_file_from_nidhi, get_nidhi_database_url
+from .media import get_nidhi_media_url, sign_media_url
 from .django import inject_nidhi_storage, inject_nidhi_database
 from .telegram import send_telegram_alert
 from .database import get_database_fingerprint, send_heartbeat
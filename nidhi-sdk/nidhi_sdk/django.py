@@ -2,25 +2,7 @@ import os
 import dj_database_url
 
 from .telegram import send_telegram_alert
-
-
-def get_nidhi_media_url(object_key: str) -> str:
-    """
-    Returns a URL that serves media through Nidhi's media gateway.
-    MinIO is NEVER exposed directly. Every media request goes through
-    Nidhi's /api/media/ endpoint which validates access and logs usage.
-    """
-    nidhi_url = os.environ.get('NIDHI_DEV_SERVER_URL', '')
-    bucket = os.environ.get('MEDIA_BUCKET_NAME', '')
-    api_key = os.environ.get('NIDHI_APP_API_KEY', '')
-
-    if not nidhi_url or not bucket:
-        raise RuntimeError(
-            "NIDHI_DEV_SERVER_URL or MEDIA_BUCKET_NAME not set. "
-            "App must be provisioned by Nidhi."
-        )
-
-    return f"{nidhi_url.rstrip('/')}/api/media/{bucket}/{object_key}?api_key={api_key}"
+from .media import get_nidhi_media_url  # noqa: F401  (backwards-compatible import path)
 
 
 def inject_nidhi_storage(settings_module_locals: dict) -> None:
@@ -6,30 +6,8 @@ try:
 except ImportError:
     Minio = None
 
-
-def get_nidhi_media_url(object_key: str) -> str:
-    """
-    Returns a URL that serves media through Nidhi's media gateway.
-    The URL is authenticated (includes API key) and safe for browser use.
-
-    MinIO is NEVER exposed directly. Every media request goes through
-    Nidhi's /api/media/ endpoint which validates access and logs usage.
-
-    Usage:
-        url = get_nidhi_media_url("books/atomic-habits/pages/page1.png")
-        # Returns: "http://100.83.65.7:8001/api/media/granth-production-media/books/...?api_key=..."
-    """
-    nidhi_url = os.environ.get('NIDHI_DEV_SERVER_URL', '')
-    bucket = os.environ.get('MEDIA_BUCKET_NAME', '')
-    api_key = os.environ.get('NIDHI_APP_API_KEY', '')
-
-    if not nidhi_url or not bucket:
-        raise RuntimeError(
-            "NIDHI_DEV_SERVER_URL or MEDIA_BUCKET_NAME not set. "
-            "App must be provisioned by Nidhi."
-        )
-
-    return f"{nidhi_url.rstrip('/')}/api/media/{bucket}/{object_key}?api_key={api_key}"
+# Re-exported for backwards compatibility (`from nidhi_sdk.fastapi import get_nidhi_media_url`).
+from .media import get_nidhi_media_url
 
 
 def get_nidhi_storage_client():
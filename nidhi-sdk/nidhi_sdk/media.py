@@ -0,0 +1,99 @@
+"""Nidhi SDK — media gateway URLs.
+
+    from nidhi_sdk.media import get_nidhi_media_url, sign_media_url
+
+URLs are signed offline (HMAC-SHA256, no call to Nidhi) and expire, so the app secret never ends up
+in a browser URL and the URL can be cached by CDNs/proxies until it expires. The algorithm must
+stay byte-for-byte identical to backend/api/media_signing.py.
+"""
+import os
+import time
+import hmac
+import base64
+import hashlib
+from urllib.parse import quote, urlencode
+
+__all__ = ["get_nidhi_media_url", "sign_media_url"]
+
+# Default lifetime of a signed media URL (seconds).
+DEFAULT_MEDIA_URL_TTL = int(os.environ.get("NIDHI_MEDIA_URL_TTL", "86400"))
+
+
+def _signing_key() -> bytes:
+    key = os.environ.get("NIDHI_MEDIA_SIGNING_KEY") or os.environ.get("NIDHI_APP_API_KEY", "")
+    if not key:
+        raise RuntimeError(
+            "NIDHI_MEDIA_SIGNING_KEY / NIDHI_APP_API_KEY not set. App must be provisioned by Nidhi."
+        )
+    return key.encode()
+
+
+def _stable_expiry(ttl: int, now: float) -> int:
+    """Expiry rounded to a ttl-sized window, so every call inside the window returns the SAME URL
+    (cache-friendly). The URL stays valid for between ttl and 2*ttl seconds."""
+    return (int(now) // ttl + 2) * ttl
+
+
+# Image transform params, in the order they are signed.
+TRANSFORM_PARAMS = ("w", "h", "fit", "fmt", "q")
+
+
+def _transform_params(transform: dict) -> dict:
+    transform = transform or {}
+    return {name: transform[name] for name in TRANSFORM_PARAMS if transform.get(name) not in (None, "")}
+
+
+def sign_media_url(bucket: str, object_key: str, expires: int, byte_range: str = "",
+                   transform: dict = None) -> str:
+    """Return the b64url HMAC-SHA256 signature for bucket/object_key/expires/range[/transform]."""
+    message = f"{bucket}\n{object_key}\n{expires}\n{byte_range or ''}"
+    signed_transform = "&".join(f"{name}={value}" for name, value in _transform_params(transform).items())
+    if signed_transform:
+        message += f"\n{signed_transform}"
+    message = message.encode()
+    digest = hmac.new(_signing_key(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def get_nidhi_media_url(object_key: str, expires_in: int = None, byte_range: str = "",
+                        signed: bool = True, transform: dict = None) -> str:
+    """
+    Returns a URL that serves media through Nidhi's media gateway.
+
+    By default the URL is signed and expires `expires_in` to 2x`expires_in` seconds from now
+    (NIDHI_MEDIA_URL_TTL, default 1 day; see _stable_expiry). `byte_range` ("start-end",
+    inclusive) restricts it to part of the object.
+    signed=False returns the legacy `?api_key=` URL.
+
+    `transform` asks the gateway for a cached image derivative, e.g.
+    {"w": 320, "h": 240, "fit": "cover", "fmt": "webp", "q": 80}. It is part of the signature,
+    so a signed URL cannot be edited into other derivatives.
+
+    Usage:
+        url = get_nidhi_media_url("books/atomic-habits/pages/page1.png")
+        # "http://100.83.65.7:8001/api/media/granth-production-media/books/...?expires=...&sig=..."
+        thumb = get_nidhi_media_url("books/atomic-habits/pages/page1.png", transform={"w": 200})
+    """
+    nidhi_url = os.environ.get('NIDHI_DEV_SERVER_URL', '')
+    bucket = os.environ.get('MEDIA_BUCKET_NAME', '')
+
+    if not nidhi_url or not bucket:
+        raise RuntimeError(
+            "NIDHI_DEV_SERVER_URL or MEDIA_BUCKET_NAME not set. "
+            "App must be provisioned by Nidhi."
+        )
+
+    base = f"{nidhi_url.rstrip('/')}/api/media/{bucket}/{quote(object_key, safe='/')}"
+    transform = _transform_params(transform)
+    transform_qs = urlencode(transform)
+    if not signed:
+        url = f"{base}?api_key={os.environ.get('NIDHI_APP_API_KEY', '')}"
+        return f"{url}&{transform_qs}" if transform_qs else url
+
+    expires = _stable_expiry(expires_in or DEFAULT_MEDIA_URL_TTL, time.time())
+    params = {"expires": expires}
+    if byte_range:
+        params["range"] = byte_range
+    params["sig"] = sign_media_url(bucket, object_key, expires, byte_range, transform)
+    url = f"{base}?{urlencode(params)}"
+    return f"{url}&{transform_qs}" if transform_qs else url
@@ -2,7 +2,7 @@ from setuptools import setup, find_packages
 
 setup(
     name='nidhi_sdk',
-    version='0.3.0',
+    version='0.4.0',
     description='Nidhi Storage & DB SDK — unified infrastructure client for FastAPI and Django',
     author='Aadisheshu',
     author_email='safacts001@gmail.com',